@@ -16,7 +16,7 @@ from traceback import format_exc
 from bunch import Bunch
 
 # gevent
-from gevent import sleep
+from gevent import sleep, spawn
 
 # Redis
 import redis
@@ -40,12 +40,15 @@ FILE_DESCR_CLOSED_IN_ANOTHER_GREENLET = "Error while reading from socket: (9, 'F
 # We use textual messages because some error may have codes whereas different won't.
 EXPECTED_CONNECTION_ERRORS = [REMOTE_END_CLOSED_SOCKET, FILE_DESCR_CLOSED_IN_ANOTHER_GREENLET]
 
-NEEDS_TMP_KEY = [v for k,v in TOPICS.items() if k in(
+# Messages of these types are sent to work queues from which exactly one client reads each message, topic -> msg_type
+NEEDS_WORK_QUEUE = {v:k for k,v in TOPICS.items() if k in(
     MESSAGE_TYPE.TO_PARALLEL_ANY,
-)]
+)}
 
-CODE_RENAMED = 10
-CODE_NO_SUCH_FROM_KEY = 11
+# ################################################################################################################################
+
+def get_queue_key(msg_type):
+    return 'zato:broker{}:queue'.format(KEYS[msg_type])
 
 # ################################################################################################################################
 
@@ -83,6 +86,89 @@ class BrokerClientAPI(object):
 
 # ################################################################################################################################
 
+class _QueueConsumerThread(object):
+    """ Reads messages off a work queue. Each message is popped atomically so it is received by one consumer only,
+    with messages that are already waiting in the queue read in batches.
+    """
+    def __init__(self, kvdb, queue_key, callback, batch_size=BROKER.QUEUE_BATCH_SIZE,
+            block_timeout=BROKER.QUEUE_BLOCK_TIMEOUT):
+        self.kvdb = kvdb
+        self.queue_key = queue_key
+        self.callback = callback
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self.keep_running = ZATO_NONE
+        self.connect_sleep_time = 1
+
+    def get_batch(self):
+
+        # Block until there is at least one message ..
+        item = self.kvdb.conn.brpop(self.queue_key, self.block_timeout)
+        if not item:
+            return []
+
+        if self.batch_size == 1:
+            return [item[1]]
+
+        # .. and take whatever else is waiting, up to the batch size. The oldest messages are at the list's tail
+        # and LRANGE returns them in reverse order of their arrival, hence reversed.
+        pipeline = self.kvdb.conn.pipeline()
+        pipeline.lrange(self.queue_key, -(self.batch_size - 1), -1)
+        pipeline.ltrim(self.queue_key, 0, -self.batch_size)
+        rest, _ = pipeline.execute()
+
+        return [item[1]] + list(reversed(rest))
+
+    def handle_batch(self, batch, _time=time.time):
+        now = _time()
+
+        for item in batch:
+
+            # Each message is handled on its own so that an invalid one does not affect the rest of its batch
+            try:
+                self.handle_item(item, now)
+            except Exception:
+                logger.warn('Could not handle broker message `%r` from `%s`, e:`%s`', item, self.queue_key, format_exc())
+
+    def handle_item(self, item, now):
+        if isinstance(item, bytes):
+            item = item.decode('utf8')
+
+        # Each message is prefixed with the time after which no one should handle it anymore
+        expires_at, data = item.split(':', 1)
+
+        if float(expires_at) < now:
+            logger.info('Skipping expired broker message `%s`', data)
+            return
+
+        payload = Bunch(loads(data))
+
+        if has_debug:
+            logger.debug('Got broker message payload `%s`', payload)
+
+        spawn(self.callback, payload)
+
+    def run(self):
+
+        # We're in a new thread and we can initialize the KVDB connection now.
+        self.kvdb.init()
+        self.keep_running = True
+
+        while self.keep_running:
+            try:
+                self.handle_batch(self.get_batch())
+            except redis.ConnectionError:
+                logger.warn('Redis connection error, will retry after %ss.\n%s', self.connect_sleep_time, format_exc())
+                sleep(self.connect_sleep_time)
+            except Exception:
+                logger.warn('Could not handle messages from `%s`, e:`%s`', self.queue_key, format_exc())
+
+    def close(self):
+        self.keep_running = False
+        self.kvdb.close()
+
+# ################################################################################################################################
+
 def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
 
     # Imported here so it's guaranteed to be monkey-patched using gevent.monkey.patch_all by whoever called us
@@ -164,15 +250,9 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
         1) and 2) are straightforward, a message is being published on a topic,
            off which it is read by broker client(s).
 
-        3) needs more work - the actual message is added to Redis and what is really
-           being published is a Redis key it's been stored under. The first client
-           to read it will be the one to handle it.
-
-           Yup, it means the messages are sent across to all of the clients
-           and the winning one is the one that picked up the Redis message; it's not
-           that bad as it may seem, there will be at most as many clients as there
-           are servers in the cluster and truth to be told, Zero MQ < 3.x also would
-           do client-side PUB/SUB filtering and it did scale nicely.
+        3) is sent to a work queue - a Redis list from which clients pop messages
+           atomically, which means that each message is received by exactly one client.
+           Messages that are not received within their expiration time are skipped.
         """
         def __init__(self, kvdb, client_type, topic_callbacks, initial_lua_programs):
             self.kvdb = kvdb
@@ -186,13 +266,27 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
             logger.debug('Starting broker client, host:`%s`, port:`%s`, name:`%s`, topics:`%s`',
                 self.kvdb.config.host, self.kvdb.config.port, self.name, sorted(self.topic_callbacks))
 
+            # Topics backed by work queues are not subscribed to, they have their own consumers instead
+            pub_sub_callbacks = {}
+            self.queue_consumers = []
+
+            for topic, callback in self.topic_callbacks.items():
+                if topic in NEEDS_WORK_QUEUE:
+                    queue_key = get_queue_key(NEEDS_WORK_QUEUE[topic])
+                    self.queue_consumers.append(_QueueConsumerThread(self.kvdb.copy(), queue_key, callback))
+                else:
+                    pub_sub_callbacks[topic] = callback
+
             self.pub_client = _ClientThread(self.kvdb.copy(), 'pub', self.name)
-            self.sub_client = _ClientThread(self.kvdb.copy(), 'sub', self.name, self.topic_callbacks, self.on_message)
+            self.sub_client = _ClientThread(self.kvdb.copy(), 'sub', self.name, pub_sub_callbacks, self.on_message)
 
             start_new_thread(self.pub_client.run, ())
             start_new_thread(self.sub_client.run, ())
 
-            for client in(self.pub_client, self.sub_client):
+            for consumer in self.queue_consumers:
+                start_new_thread(consumer.run, ())
+
+            for client in [self.pub_client, self.sub_client] + self.queue_consumers:
                 while client.keep_running == ZATO_NONE:
                     time.sleep(0.01)
                 self.ready = True
@@ -213,13 +307,8 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
                 logger.error(error_msg, msg, format_exc())
                 raise
             else:
-                topic = TOPICS[msg_type]
-                key = broker_msg = 'zato:broker{}:{}'.format(KEYS[msg_type], new_cid())
-
-                self.kvdb.conn.set(key, str(msg))
-                self.kvdb.conn.expire(key, expiration)  # In seconds
-
-                self.pub_client.publish(topic, broker_msg)
+                # A single command enqueues the message along with its expiration time
+                self.kvdb.conn.lpush(get_queue_key(msg_type), '{}:{}'.format(time.time() + expiration, msg))
 
         def on_message(self, msg):
             if has_debug:
@@ -227,25 +316,9 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
 
             if msg.type == 'message':
 
-                # Replace payload with stuff read off the KVDB in case this is where the actual message happens to reside.
-                if msg.channel in NEEDS_TMP_KEY:
-                    tmp_key = '{}.tmp'.format(msg.data)
-
-                    if self.lua_container.run_lua('zato.rename_if_exists', [msg.data, tmp_key]) == CODE_NO_SUCH_FROM_KEY:
-                        payload = None
-                    else:
-                        payload = self.kvdb.conn.get(tmp_key)
-                        self.kvdb.conn.delete(tmp_key)  # Note that it would've expired anyway
-                        if not payload:
-                            logger.info('No KVDB payload for key `%s` (already expired?)', tmp_key)
-                        else:
-                            if isinstance(payload, bytes):
-                                payload = payload
-                            payload = loads(payload)
-                else:
-                    if isinstance(msg.data, bytes):
-                        msg.data = msg.data
-                    payload = loads(msg.data)
+                if isinstance(msg.data, bytes):
+                    msg.data = msg.data
+                payload = loads(msg.data)
 
                 if payload:
                     payload = Bunch(payload)
@@ -264,6 +337,9 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
                 client.keep_running = False
                 client.kvdb.close()
 
+            for consumer in self.queue_consumers:
+                consumer.close()
+
     client = _BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs)
     start_new_thread(client.run, ())
 
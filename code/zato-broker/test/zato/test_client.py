@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# gevent
+from gevent import sleep
+
+# Zato
+from zato.broker.client import _QueueConsumerThread
+from zato.common.json_internal import dumps
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_queue_key = 'zato:broker:test:queue'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Pipeline(object):
+    """ Queues up LRANGE and LTRIM calls the way a Redis pipeline would.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.commands = []
+
+    def lrange(self, key, start, end):
+        self.commands.append((self.conn.lrange, key, start, end))
+
+    def ltrim(self, key, start, end):
+        self.commands.append((self.conn.ltrim, key, start, end))
+
+    def execute(self):
+        return [command[0](*command[1:]) for command in self.commands]
+
+# ################################################################################################################################
+
+class _Conn(object):
+    """ Keeps a Redis list in RAM, with the same semantics of indexes as in Redis.
+    """
+    def __init__(self):
+        self.items = []
+
+    def _slice(self, start, end):
+        size = len(self.items)
+        start = max(start + size if start < 0 else start, 0)
+        end = end + size if end < 0 else end
+        return start, end + 1
+
+    def lpush(self, key, value):
+        self.items.insert(0, value)
+
+    def brpop(self, key, timeout):
+        if self.items:
+            return key, self.items.pop()
+
+    def lrange(self, key, start, end):
+        start, end = self._slice(start, end)
+        return self.items[start:end]
+
+    def ltrim(self, key, start, end):
+        start, end = self._slice(start, end)
+        self.items = self.items[start:end]
+        return True
+
+    def pipeline(self):
+        return _Pipeline(self)
+
+# ################################################################################################################################
+
+class _KVDB(object):
+    def __init__(self):
+        self.conn = _Conn()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class QueueConsumerTestCase(TestCase):
+
+    def setUp(self):
+        self.kvdb = _KVDB()
+        self.received = []
+
+    def get_consumer(self, batch_size):
+        return _QueueConsumerThread(self.kvdb, _queue_key, self.received.append, batch_size, 1)
+
+    def push(self, data, expires_at=9999999999):
+        self.kvdb.conn.lpush(_queue_key, '{}:{}'.format(expires_at, dumps(data) if isinstance(data, dict) else data))
+
+    def handle_batch(self, consumer, batch, now=1000):
+        consumer.handle_batch(batch, _time=lambda: now)
+
+        # Callbacks run in their own greenlets
+        sleep(0)
+
+# ################################################################################################################################
+
+    def test_get_batch(self):
+        for idx in range(5):
+            self.push({'idx': idx})
+
+        consumer = self.get_consumer(3)
+
+        # Messages are read oldest first, with no more than a batch at a time ..
+        self.handle_batch(consumer, consumer.get_batch())
+        self.assertListEqual([elem.idx for elem in self.received], [0, 1, 2])
+
+        # .. and the ones that did not fit in a batch are still in the queue.
+        self.handle_batch(consumer, consumer.get_batch())
+        self.assertListEqual([elem.idx for elem in self.received], [0, 1, 2, 3, 4])
+
+        self.assertListEqual(consumer.get_batch(), [])
+
+# ################################################################################################################################
+
+    def test_get_batch_single_message(self):
+        for idx in range(2):
+            self.push({'idx': idx})
+
+        consumer = self.get_consumer(1)
+
+        self.assertEqual(len(consumer.get_batch()), 1)
+        self.assertEqual(len(self.kvdb.conn.items), 1)
+
+# ################################################################################################################################
+
+    def test_expired_message(self):
+        self.push({'idx': 0}, expires_at=999)
+        self.push({'idx': 1}, expires_at=1001)
+
+        consumer = self.get_consumer(10)
+        self.handle_batch(consumer, consumer.get_batch(), now=1000)
+
+        self.assertListEqual([elem.idx for elem in self.received], [1])
+
+# ################################################################################################################################
+
+    def test_poison_messages(self):
+        self.push({'idx': 0})
+        self.kvdb.conn.lpush(_queue_key, 'no-expiration-time')
+        self.push('{"invalid-json"')
+        self.kvdb.conn.lpush(_queue_key, b'\xff\xfe')
+        self.push('[1, 2, 3]')
+        self.push({'idx': 1})
+
+        consumer = self.get_consumer(10)
+        self.handle_batch(consumer, consumer.get_batch())
+
+        # Messages that could not be handled did not stop the other ones in the same batch
+        self.assertListEqual([elem.idx for elem in self.received], [0, 1])
+
+# ################################################################################################################################
+# ################################################################################################################################
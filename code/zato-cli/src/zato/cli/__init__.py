@@ -349,6 +349,7 @@ command_imports = (
     ('sso_login', 'zato.cli.sso.Login'),
     ('sso_logout', 'zato.cli.sso.Logout'),
     ('sso_lock_user', 'zato.cli.sso.LockUser'),
+    ('sso_rebuild_search_index', 'zato.cli.sso.RebuildSearchIndex'),
     ('sso_reset_totp_key', 'zato.cli.sso.ResetTOTPKey'),
     ('sso_reset_user_password', 'zato.cli.sso.ResetUserPassword'),
     ('sso_unlock_user', 'zato.cli.sso.UnlockUser'),
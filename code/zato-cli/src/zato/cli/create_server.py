@@ -115,7 +115,6 @@ http_server_header=Zato
 zeromq_connect_sleep=0.1
 aws_host=
 use_soap_envelope=True
-fifo_response_buffer_size=0.2 # In MB
 jwt_secret=zato+secret://zato.server_conf.misc.jwt_secret
 enforce_service_invokes=False
 return_tracebacks=True
@@ -125,12 +124,15 @@ return_json_schema_errors=False
 sftp_genkey_command=dropbearkey
 posix_ipc_skip_platform=darwin
 service_invoker_allow_internal=
+rate_limiting_exact_lease_size=0 # How many requests at a time exact rate limiting reserves in ODB, 0 = one per request
 
 [http]
 methods_allowed=GET, POST, DELETE, PUT, PATCH, HEAD, OPTIONS
+url_match_cache_size=10000
 
 [stats]
 expire_after=168 # In hours, 168 = 7 days = 1 week
+flush_interval=2 # In seconds
 
 [kvdb]
 host={{kvdb_host}}
@@ -213,6 +215,7 @@ log_if_wsx_deliv_server_not_found=False
 data_prefix_len=2048
 data_prefix_short_len=64
 sk_server_table_columns=6, 15, 8, 6, 17, 75
+publish_many_chunk_size=1000
 
 [pubsub_meta_topic]
 enabled=True
@@ -264,6 +267,10 @@ size=0.1 # In MB
 
 [logging]
 http_access_log_ignore=
+http_access_log_buffer_size=10000
+http_access_log_batch_size=100
+http_access_log_flush_interval=1.0
+http_access_log_on_full=drop
 
 [greenify]
 #/path/to/oracle/instantclient_19_3/libclntsh.so.19.1=True
@@ -380,6 +387,8 @@ inform_if_not_approved=True
 
 [session]
 expiry=60 # In minutes
+cache_ttl=10 # In seconds, for how long verified sessions are cached in RAM, 0 = no cache
+renew_flush_interval=5 # In seconds, how often renewals of cached sessions are saved in ODB
 
 [password]
 expiry=730 # In days, 365 days * 2 years = 730 days
@@ -452,6 +461,7 @@ reject_email=zato, admin, root, system, sso
 [search]
 default_page_size=50
 max_page_size=100
+count_limit=1000
 '''
 
 # ################################################################################################################################
@@ -369,6 +369,25 @@ class ResetTOTPKey(SSOCommand):
 
 # ################################################################################################################################
 
+class RebuildSearchIndex(SSOCommand):
+    """ Builds from scratch the index that users are looked up by substrings of their names through. Environments created
+    before the index was added need to run this command after an upgrade, until which substring searches do not use the index.
+    """
+    user_required = False
+
+    opts = [
+        {'name': '--batch-size', 'help': 'How many users to index in each transaction', 'type': int, 'default': 1000},
+    ]
+
+    def _on_sso_command(self, args, user, user_api):
+        # type: (Namespace, SSOUser, UserAPI)
+
+        # The index's table was already created, if needed, when user_api was configured
+        total = user_api.rebuild_search_index(args.batch_size)
+        self.logger.info('Indexed %d user(s)', total)
+
+# ################################################################################################################################
+
 class CreateODB(ZatoCommand):
     """ Creates a new Zato SSO ODB (Operational Database)
     """
@@ -378,9 +397,9 @@ class CreateODB(ZatoCommand):
         # type: (Namespace)
 
         # Zato
-        from zato.common.odb.model.sso import _SSOAttr, _SSOSession, _SSOUser, Base as SSOModelBase
+        from zato.common.odb.model.sso import _SSOAttr, _SSOSession, _SSOUser, _SSOUserSearch, Base as SSOModelBase
 
-        _sso_tables = [_SSOAttr.__table__, _SSOSession.__table__, _SSOUser.__table__]
+        _sso_tables = [_SSOAttr.__table__, _SSOSession.__table__, _SSOUser.__table__, _SSOUserSearch.__table__]
 
         engine = self._get_engine(args)
         SSOModelBase.metadata.create_all(engine, tables=_sso_tables)
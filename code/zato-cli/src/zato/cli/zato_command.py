@@ -444,6 +444,15 @@ class CommandStore(object):
         sso_reset_user_password.set_defaults(command='sso_reset_user_password')
         self.add_opts(sso_reset_user_password, sso_mod.ResetUserPassword.opts)
 
+        #
+        # rebuild-search-index
+        #
+        sso_rebuild_search_index = sso_subs.add_parser(
+            'rebuild-search-index', description=sso_mod.RebuildSearchIndex.__doc__, parents=[base_parser])
+        sso_rebuild_search_index.add_argument('path', help='Path to a Zato server')
+        sso_rebuild_search_index.set_defaults(command='sso_rebuild_search_index')
+        self.add_opts(sso_rebuild_search_index, sso_mod.RebuildSearchIndex.opts)
+
         #
         # create-odb
         #
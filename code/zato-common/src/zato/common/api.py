@@ -471,8 +471,6 @@ class KVDB(Attrs):
     LOCK_FANOUT_PATTERN = '{}fanout:{{}}'.format(LOCK_PREFIX)
     LOCK_PARALLEL_EXEC_PATTERN = '{}parallel-exec:{{}}'.format(LOCK_PREFIX)
 
-    LOCK_ASYNC_INVOKE_WITH_TARGET_PATTERN = '{}async-invoke-with-pattern:{{}}:{{}}'.format(LOCK_PREFIX)
-
     TRANSLATION = 'zato:kvdb:data-dict:translation'
     TRANSLATION_ID = TRANSLATION + ':id'
 
@@ -506,9 +504,6 @@ class KVDB(Attrs):
     PARALLEL_EXEC_COUNTER_PATTERN = 'zato:parallel-exec:counter:{}'
     PARALLEL_EXEC_DATA_PATTERN = 'zato:parallel-exec:data:{}'
 
-    ASYNC_INVOKE_PROCESSED_FLAG_PATTERN = 'zato:async-invoke-with-pattern:processed:{}:{}'
-    ASYNC_INVOKE_PROCESSED_FLAG = '1'
-
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -523,6 +518,9 @@ class SCHEDULER:
         DELETE = 'delete'
         INACTIVATE = 'inactivate'
 
+    # How many jobs due at the same time at most will be sent to servers in a single broker message
+    DISPATCH_BATCH_SIZE = 100
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -602,6 +600,8 @@ class DELIVERY_CALLBACK_INVOKER(Attrs):
 
 class BROKER:
     DEFAULT_EXPIRATION = 15 # In seconds
+    QUEUE_BATCH_SIZE = 100  # How many messages at most to read off a work queue in one go
+    QUEUE_BLOCK_TIMEOUT = 1 # In seconds, how long to block waiting for new messages in a work queue
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -619,6 +619,9 @@ class HTTP_SOAP:
 
     UNUSED_MARKER = 'unused'
 
+    # How many matched URL paths to keep in each worker's cache by default
+    URL_MATCH_CACHE_SIZE = 10000
+
     class ACCEPT:
         ANY = '*/*'
         ANY_INTERNAL = 'haany'
@@ -801,6 +804,7 @@ class PUBSUB:
         INTERNAL_ENDPOINT_NAME = 'zato.pubsub.default.internal.endpoint'
         ON_NO_SUBS_PUB = 'accept'
         SK_OPAQUE = ('deliver_to_sk', 'reply_to_sk')
+        PUBLISH_MANY_CHUNK_SIZE = 1000
 
     class SERVICE_SUBSCRIBER:
         NAME = 'zato.pubsub.service.endpoint'
@@ -1427,6 +1431,9 @@ class FILE_TRANSFER:
     class DEFAULT:
         FILE_PATTERNS = '*'
         ENCODING = 'utf-8'
+        STREAM_BATCH_SIZE = 1000
+        CALLBACK_CONCURRENCY = 10
+        CALLBACK_TIMEOUT = 300 # In seconds
 
     class SOURCE_TYPE:
         LOCAL = NameId('Local', 'local')
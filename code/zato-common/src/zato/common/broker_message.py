@@ -75,6 +75,7 @@ class SCHEDULER(Constants):
     DELETE = ValueConstant('')
     EXECUTE = ValueConstant('')
     JOB_EXECUTED = ValueConstant('')
+    JOBS_EXECUTED = ValueConstant('')
 
 class ZMQ_SOCKET(Constants):
     code_start = 100200
@@ -506,6 +507,8 @@ class SSO(Constants):
     LINK_AUTH_CREATE = ValueConstant('')
     LINK_AUTH_DELETE = ValueConstant('')
 
+    SESSION_INVALIDATE = ValueConstant('')
+
 code_to_name = {}
 
 # To prevent 'RuntimeError: dictionary changed size during iteration'
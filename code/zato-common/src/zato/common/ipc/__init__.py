@@ -34,7 +34,6 @@ class Request(object):
         self.request_id = request_id or 'ipc.{}'.format(new_cid())
         self.target_pid = None
         self.reply_to_tag = ''
-        self.reply_to_fifo = ''
         self.in_reply_to = ''
         self.creation_time_utc = datetime.utcnow()
 
@@ -58,7 +57,10 @@ class IPCBase(object):
     def __init__(self, name, pid):
         self.name = name
         self.pid = pid
-        self.ctx = zmq.Context()
+
+        # All the IPC objects in a process share the same context, which is a thread-safe object
+        # that is created lazily and re-created, if needed, in processes forked from the one that created it.
+        self.ctx = zmq.Context.instance()
         spawn_greenlet(self.set_up_sockets)
         self.keep_running = True
         self.logger = get_logger_for_class(self.__class__)
@@ -101,7 +103,8 @@ class IPCEndpoint(IPCBase):
 
     def close(self):
         self.keep_running = False
+
+        # Only our own socket is closed, the context may be still in use by other IPC objects
         self.socket.close()
-        self.ctx.term()
 
 # ################################################################################################################################
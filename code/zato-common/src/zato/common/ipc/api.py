@@ -9,31 +9,22 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
-import errno
 import logging
-import os
-import stat
-import tempfile
-from datetime import datetime, timedelta
-from fcntl import fcntl
-from io import StringIO
 from traceback import format_exc
-from uuid import uuid4
 
 # gevent
-from gevent import sleep
+from gevent import sleep, Timeout
+from gevent.event import AsyncResult
 
 # pyrapidjson
 from rapidjson import loads
 
-# Python 2/3 compatibility
-from builtins import bytes
-
 # Zato
 from zato.common.api import IPC
 from zato.common.ipc.publisher import Publisher
+from zato.common.ipc.reply import ReplyReceiver, ReplySender
 from zato.common.ipc.subscriber import Subscriber
-from zato.common.util.api import spawn_greenlet
+from zato.common.util.api import new_cid, spawn_greenlet
 from zato.common.util.file_system import fs_safe_name
 
 # ################################################################################################################################
@@ -42,14 +33,6 @@ logger = logging.getLogger(__name__)
 
 # ################################################################################################################################
 
-fifo_create_mode = stat.S_IRUSR | stat.S_IWUSR
-fifo_ignore_err = errno.EAGAIN, errno.EWOULDBLOCK
-
-# On Linux, this is F_LINUX_SPECIFIC_BASE (1024) + 7
-_F_SETPIPE_SZ = 1031
-
-# ################################################################################################################################
-
 class IPCAPI(object):
     """ API through which IPC is performed.
     """
@@ -58,7 +41,10 @@ class IPCAPI(object):
         self.on_message_callback = on_message_callback
         self.pid = pid
         self.pid_publishers = {} # Target PID -> Publisher object connected to that target PID's subscriber socket
+        self.reply_senders = {}  # Reply-to tag -> ReplySender object connected to the requesting process's reply socket
+        self.pending_replies = {} # Request ID -> AsyncResult to set once a response to that request arrives
         self.subscriber = None
+        self.reply_receiver = None
 
 # ################################################################################################################################
 
@@ -66,9 +52,18 @@ class IPCAPI(object):
     def get_endpoint_name(cluster_name, server_name, target_pid):
         return fs_safe_name('{}-{}-{}'.format(cluster_name, server_name, target_pid))
 
+# ################################################################################################################################
+
+    @staticmethod
+    def get_reply_endpoint_name(name):
+        return '{}-reply'.format(name)
+
 # ################################################################################################################################
 
     def run(self):
+        self.reply_receiver = ReplyReceiver(self.on_reply, self.get_reply_endpoint_name(self.name), self.pid)
+        spawn_greenlet(self.reply_receiver.serve_forever)
+
         self.subscriber = Subscriber(self.on_message_callback, self.name, self.pid)
         spawn_greenlet(self.subscriber.serve_forever)
 
@@ -77,8 +72,12 @@ class IPCAPI(object):
     def close(self):
         if self.subscriber:
             self.subscriber.close()
+        if self.reply_receiver:
+            self.reply_receiver.close()
         for publisher in self.pid_publishers.values():
             publisher.close()
+        for reply_sender in self.reply_senders.values():
+            reply_sender.close()
 
 # ################################################################################################################################
 
@@ -106,87 +105,81 @@ class IPCAPI(object):
 
 # ################################################################################################################################
 
-    def _get_response(self, fifo, buffer_size, read_size=21, fifo_ignore_err=fifo_ignore_err, empty=('', b'', None)):
+    def _get_reply_sender(self, reply_to_tag):
 
-        try:
-            buff = StringIO()
-            data = object() # Use a sentinel because '' or None are expected from os.read
+        reply_sender = self.reply_senders.get(reply_to_tag)
 
-            # The most common use-case for IPC are publish/subscribe messages and the most
-            # common response is this: 'zs;{"r": {"r": null}}'
-            # which is 21 bytes.
+        # We have not replied to that process yet so we need to connect to it first ..
+        if not reply_sender:
+            reply_sender = ReplySender(self.get_reply_endpoint_name(reply_to_tag), self.pid)
 
-            while data not in empty:
-                data = os.read(fifo, read_size)
-                buff.write(data.decode('utf8') if isinstance(data, bytes) else data)
+            # .. unless another greenlet connected in the meantime, in which case we keep the older socket.
+            existing = self.reply_senders.setdefault(reply_to_tag, reply_sender)
+            if existing is not reply_sender:
+                reply_sender.close()
+                reply_sender = existing
 
-            response = buff.getvalue()
+        return reply_sender
 
-            status = response[:IPC.STATUS.LENGTH]
-            response = response[IPC.STATUS.LENGTH+1:] # Add 1 to account for the separator
-            is_success = status == IPC.STATUS.SUCCESS
+# ################################################################################################################################
 
-            if is_success:
-                response = loads(response) if response else ''
+    def send_reply(self, reply_to_tag, request_id, status, data):
+        """ Sends a response to a request received from another process, reusing the connection to that process if it exists.
+        """
+        self._get_reply_sender(reply_to_tag).send_reply(request_id, status, data)
+
+# ################################################################################################################################
+
+    def on_reply(self, request_id, status, data):
+        """ Invoked for each response to a request published by our own process. Wakes up the greenlet waiting for it.
+        """
+        result = self.pending_replies.pop(request_id, None) # type: AsyncResult
+
+        # No one is waiting for this response, e.g. because the request timed out already
+        if not result:
+            logger.info('Ignoring IPC response to an unknown request `%s`', request_id)
+            return
 
-            buff.close()
+        is_success = status == IPC.STATUS.SUCCESS
 
-            return is_success, response
+        if is_success:
+            data = loads(data) if data else ''
 
-        except OSError as e:
-            if e.errno not in fifo_ignore_err:
-                raise
+        result.set((is_success, data))
 
 # ################################################################################################################################
 
-    def invoke_by_pid(self, service, payload, cluster_name, server_name, target_pid,
-        fifo_response_buffer_size, timeout=90, is_async=False):
+    def invoke_by_pid(self, service, payload, cluster_name, server_name, target_pid, timeout=90, is_async=False,
+        action=IPC.ACTION.INVOKE_SERVICE):
         """ Invokes a service through IPC, synchronously or in background. If target_pid is an exact PID then this one worker
-        process will be invoked if it exists at all.
+        process will be invoked if it exists at all. With action set to IPC.ACTION.INVOKE_WORKER_STORE, service is the name
+        of a worker store's method to invoke instead.
         """
-        # Create a FIFO pipe to receive replies to come through
-        fifo_path = os.path.join(tempfile.tempdir, 'zato-ipc-fifo-{}'.format(uuid4().hex))
-        os.mkfifo(fifo_path, fifo_create_mode)
-
         try:
             publisher = self._get_pid_publisher(cluster_name, server_name, target_pid)
-            publisher.publish(payload, service, target_pid, reply_to_fifo=fifo_path)
 
             # Async = we do not need to wait for any response
             if is_async:
+                publisher.publish(payload, service, target_pid, action)
                 return
 
-            is_success, response = False, None
+            # Responses to all of our requests arrive through the same socket so each one needs an ID to be matched by
+            request_id = 'ipc.{}'.format(new_cid())
+            result = AsyncResult()
+            self.pending_replies[request_id] = result
 
             try:
+                publisher.publish(payload, service, target_pid, action, reply_to_tag=self.name, request_id=request_id)
+                return result.get(timeout=timeout)
 
-                # Open the pipe for reading ..
-                fifo_fd = os.open(fifo_path, os.O_RDONLY|os.O_NONBLOCK)
-                fcntl(fifo_fd, _F_SETPIPE_SZ, 1000000)
-
-                # .. and wait for response ..
-                now = datetime.utcnow()
-                until = now + timedelta(seconds=timeout)
-
-                while now < until:
-                    sleep(0.05)
-                    is_success, response = self._get_response(fifo_fd, fifo_response_buffer_size)
-                    if response:
-                        break
-                    else:
-                        now = datetime.utcnow()
-
-            except Exception:
-                logger.warn('Exception in IPC FIFO, e:`%s`', format_exc())
+            except Timeout:
+                logger.warn('IPC response timeout (%ss), service:`%s`, target_pid:`%s`', timeout, service, target_pid)
+                return False, None
 
             finally:
-                os.close(fifo_fd)
-
-            return is_success, response
+                self.pending_replies.pop(request_id, None)
 
         except Exception:
             logger.warn(format_exc())
-        finally:
-            os.remove(fifo_path)
 
 # ################################################################################################################################
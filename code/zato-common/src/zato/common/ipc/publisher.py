@@ -20,14 +20,15 @@ class Publisher(IPCEndpoint):
     socket_method = 'connect'
     socket_type = 'pub'
 
-    def publish(self, payload, service='', target_pid=None, action=IPC.ACTION.INVOKE_SERVICE, reply_to_fifo=None):
-        request = Request(self.name, self.pid)
+    def publish(self, payload, service='', target_pid=None, action=IPC.ACTION.INVOKE_SERVICE, reply_to_tag='',
+        request_id=None):
+        request = Request(self.name, self.pid, request_id=request_id)
 
         request.payload = payload
         request.service = service
         request.action = action
         request.target_pid = target_pid
-        request.reply_to_fifo = reply_to_fifo
+        request.reply_to_tag = reply_to_tag
 
         self.socket.send_pyobj(request)
 
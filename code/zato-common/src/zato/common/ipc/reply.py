@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from errno import ENOTSOCK
+from traceback import format_exc
+
+# ZeroMQ
+import zmq.green as zmq
+
+# Zato
+from zato.common.ipc import IPCEndpoint
+
+# ################################################################################################################################
+
+class ReplySender(IPCEndpoint):
+    """ Sends responses to IPC requests back to the process that published them. Each response is a multipart message
+    of request ID, status and data so no additional framing or parsing is needed on the receiving side.
+    """
+    socket_method = 'connect'
+    socket_type = 'push'
+
+    def send_reply(self, request_id, status, data):
+        self.socket.send_multipart([
+            request_id.encode('utf8'),
+            status.encode('utf8'),
+            data if isinstance(data, bytes) else data.encode('utf8')
+        ])
+
+# ################################################################################################################################
+
+class ReplyReceiver(IPCEndpoint):
+    """ Listens for responses to IPC requests published by the current process, invoking a callback for each one received.
+    """
+    socket_method = 'bind'
+    socket_type = 'pull'
+
+    def __init__(self, on_reply_callback, *args, **kwargs):
+        self.on_reply_callback = on_reply_callback
+        super(ReplyReceiver, self).__init__(*args, **kwargs)
+
+    def serve_forever(self):
+
+        while self.keep_running:
+            try:
+                request_id, status, data = self.socket.recv_multipart()
+                self.on_reply_callback(request_id.decode('utf8'), status.decode('utf8'), data.decode('utf8'))
+            except zmq.ZMQError as e:
+                if e.errno == ENOTSOCK:
+                    self.logger.debug('Stopping IPC reply socket `%s` (ENOTSOCK)', self.name)
+                    self.keep_running = False
+            except Exception:
+                self.logger.warn('Error in IPC reply receiver, e:`%s`', format_exc())
+
+# ################################################################################################################################
@@ -127,6 +127,29 @@ class _SSOUser(Base):
 
 # ################################################################################################################################
 
+class _SSOUserSearch(Base):
+    """ An index of tokens, i.e. short substrings, of each user's names. Looking up users by substrings of their names
+    goes through this table instead of a full scan of zato_sso_user with LIKE '%...%' conditions.
+    """
+    __tablename__ = 'zato_sso_user_search'
+    __table_args__ = (
+        Index('zato_us_tok_idx', 'name_type', 'token', 'user_id', unique=True),
+        Index('zato_us_usr_idx', 'user_id', unique=False),
+    {})
+
+    # Not exposed publicly, used only because SQLAlchemy requires a PK
+    id = Column(Integer, Sequence('zato_sso_us_seq'), primary_key=True)
+
+    # Which name this token is from, e.g. display_name or last_name
+    name_type = Column(String(20), nullable=False)
+
+    # An upper-cased substring of the name
+    token = Column(String(20), nullable=False)
+
+    user_id = Column(Integer, ForeignKey('zato_sso_user.id', ondelete='CASCADE'), nullable=False)
+
+# ################################################################################################################################
+
 class _SSOUserGroup(Base):
     """ An N:N mapping of users to their groups.
     """
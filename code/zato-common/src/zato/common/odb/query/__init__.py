@@ -10,20 +10,25 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import logging
+from datetime import datetime
 from functools import wraps
 
 # Bunch
 from bunch import bunchify
 
+# dateutil
+from dateutil.parser import parse as dt_parse
+
 # SQLAlchemy
-from sqlalchemy import and_, func, not_, or_
+from sqlalchemy import and_, func, literal_column, not_, or_, select, UniqueConstraint
 from sqlalchemy.orm import aliased
 from sqlalchemy.sql.expression import case
+from sqlalchemy.sql.operators import asc_op, desc_op
 
 # Zato
 from zato.common.api import CACHE, DEFAULT_HTTP_PING_METHOD, DEFAULT_HTTP_POOL_SIZE, GENERIC, HTTP_SOAP_SERIALIZATION_TYPE, \
      PARAMS_PRIORITY, PUBSUB, URL_PARAMS_PRIORITY
-from zato.common.json_internal import loads
+from zato.common.json_internal import dumps, loads
 from zato.common.odb.model import AWSS3, APIKeySecurity, AWSSecurity, Cache, CacheBuiltin, CacheMemcached, CassandraConn, \
      CassandraQuery, ChannelAMQP, ChannelWebSocket, ChannelWMQ, ChannelZMQ, Cluster, ConnDefAMQP, ConnDefWMQ, \
      CronStyleJob, ElasticSearch, HTTPBasicAuth, HTTPSOAP, IMAP, IntervalBasedJob, Job, JSONPointer, JWT, \
@@ -43,6 +48,7 @@ logger = logging.getLogger(__name__)
 
 _not_given = object()
 _no_page_limit = 2 ** 24 # ~16.7 million results, tops
+_stream_page_size = 1000
 _gen_attr = GENERIC.ATTR_NAME
 
 # ################################################################################################################################
@@ -53,8 +59,138 @@ def count(session, q):
 
 # ################################################################################################################################
 
+def capped_count(session, q, count_limit):
+    """ Counts rows of a query but stops after count_limit of them, which is much cheaper than a full count
+    for large tables. Returns the count and a flag indicating whether there are more rows than the limit.
+    """
+    _q = q.statement.with_only_columns([literal_column('1')]).order_by(None).limit(count_limit + 1).alias()
+    total = session.execute(select([func.count()]).select_from(_q)).scalar()
+
+    return min(total, count_limit), total > count_limit
+
+# ################################################################################################################################
+
+def _is_unique_column(column):
+    """ Returns True if a given table column is unique on its own, i.e. it is a primary key, it has a unique flag
+    or there is a single-column unique constraint or index for it.
+    """
+    if column.primary_key or column.unique:
+        return True
+
+    for item in list(column.table.constraints) + list(column.table.indexes):
+        if isinstance(item, UniqueConstraint) or getattr(item, 'unique', False):
+            if [elem.key for elem in item.columns] == [column.key]:
+                return True
+
+    return False
+
+# ################################################################################################################################
+
+def get_key_columns(q):
+    """ Returns columns that pages of a query can be selected by, along with a flag indicating whether the query
+    is in descending order. The first column is the one that the query is ordered by first. If it is not unique,
+    the primary key of its table is the second one, to tell apart rows that have the same value of the first column.
+    Returns an empty list if the query is not ordered or if it is ordered by something else than a table column.
+    """
+    order_by = q._order_by
+    if not order_by:
+        return [], False
+
+    column = order_by[0]
+    modifier = getattr(column, 'modifier', None)
+    is_desc = modifier is desc_op
+
+    if modifier is asc_op or is_desc:
+        column = column.element
+
+    # Expressions and labels cannot be used as keys
+    if getattr(column, 'table', None) is None or not hasattr(column, 'primary_key'):
+        return [], False
+
+    if _is_unique_column(column):
+        return [column], is_desc
+
+    primary_key = list(column.table.primary_key.columns)
+    if len(primary_key) != 1:
+        return [], False
+
+    return [column, primary_key[0]], is_desc
+
+# ################################################################################################################################
+
+def get_key_condition(key_columns, is_desc, after):
+    """ Returns a WHERE condition matching rows that come after a given key in the order of key columns.
+    """
+    compare = (lambda column, value: column < value) if is_desc else (lambda column, value: column > value)
+
+    # A unique column is a key on its own ..
+    if len(key_columns) == 1:
+        return compare(key_columns[0], after)
+
+    # .. otherwise, the key consists of the column's value and the primary key of the row.
+    column, primary_key = key_columns
+    value, pk_value = parse_compound_key(column, after)
+
+    return or_(compare(column, value), and_(column == value, compare(primary_key, pk_value)))
+
+# ################################################################################################################################
+
+def get_key(row, key_columns):
+    """ Returns a key that the next page begins after, given the last row of the current one, or None if the row
+    does not have all of the key columns.
+    """
+    values = []
+
+    for column in key_columns:
+        value = getattr(row, column.key, _not_given)
+        if value is _not_given:
+            return None
+        values.append(value)
+
+    if len(values) == 1:
+        return values[0]
+
+    value, pk_value = values
+
+    if isinstance(value, datetime):
+        value = value.isoformat()
+
+    return dumps([value, pk_value])
+
+# ################################################################################################################################
+
+def parse_compound_key(column, key):
+    """ Parses a key produced by get_key for a non-unique column and its primary key.
+    """
+    try:
+        value, pk_value = loads(key)
+    except Exception:
+        raise ValueError('Invalid key `{}`'.format(key))
+
+    # Timestamps are kept as strings in keys
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+
+    if python_type is datetime and value is not None:
+        value = dt_parse(value)
+
+    return value, pk_value
+
+# ################################################################################################################################
+
 class _SearchWrapper(object):
     """ Wraps results in pagination and/or filters out objects by their name or other attributes.
+
+    Pages are selected either by their numbers (cur_page) or by a key that the previous page ended with (after),
+    in which case there is no need to read and discard rows of all the previous pages. If the column that the query
+    is ordered by first is unique, keys are its values. Otherwise, they also contain primary keys of rows,
+    which are then added to the query's ORDER BY, so that rows with the same value of the column are not skipped
+    at page boundaries.
+
+    The total number of results may be skipped (needs_total) or capped (count_limit), and if possible,
+    it is worked out from the results themselves rather than with a separate COUNT query.
     """
     def __init__(self, q, default_page_size=_no_page_limit, **config):
 
@@ -75,18 +211,66 @@ class _SearchWrapper(object):
 
             q = q.filter(filter_op(*filters))
 
-        # Total number of results
-        total_q = q.statement.with_only_columns([func.count()]).order_by(None)
-        self.total = q.session.execute(total_q).scalar()
+        self.total = None
+        self.total_is_approximate = False
+        self.has_next_page = False
+        self.next_after = None
+
+        after = config.get('after')
+        needs_total = config.get('needs_total', True)
+        count_limit = config.get('count_limit')
 
         # Pagination
         page_size = config.get('page_size', default_page_size)
         cur_page = config.get('cur_page', 0)
 
+        key_columns, is_key_desc = get_key_columns(q)
+
+        # Rows with the same value of a non-unique column are ordered by their primary keys,
+        # in the same direction, so that each one has a well-defined place in the results.
+        if len(key_columns) > 1:
+            primary_key = key_columns[1]
+            q = q.order_by(primary_key.desc() if is_key_desc else primary_key)
+
+        filtered_q = q
+
+        if after is not None:
+            if not key_columns:
+                raise ValueError('Pagination by keys requires a query ordered by a table column `{}`'.format(q))
+
+            cur_page = 0
+            q = q.filter(get_key_condition(key_columns, is_key_desc, after))
+
         slice_from = cur_page * page_size
-        slice_to = slice_from + page_size
 
-        self.q = q.slice(slice_from, slice_to)
+        # Read one row more than needed to learn if there is a next page
+        self.q = q.slice(slice_from, slice_from + page_size + 1)
+        result = self.q.all()
+
+        self.has_next_page = len(result) > page_size
+        self.result = result[:page_size]
+
+        # This lets callers continue with keys no matter how they requested the current page
+        if self.has_next_page and key_columns:
+            self.next_after = get_key(self.result[-1], key_columns)
+
+        if needs_total:
+
+            # If this is the last page and it is not an empty one past the end of results, we know how many results
+            # there are without counting them, unless the page is a keyed one because then we do not know
+            # how many results there were before it.
+            if after is None and not self.has_next_page and (self.result or not cur_page):
+                self.total = slice_from + len(self.result)
+            else:
+                self._set_total(filtered_q, count_limit)
+
+# ################################################################################################################################
+
+    def _set_total(self, q, count_limit):
+        if count_limit:
+            self.total, self.total_is_approximate = capped_count(q.session, q, count_limit)
+        else:
+            self.total = count(q.session, q)
 
 # ################################################################################################################################
 
@@ -103,7 +287,11 @@ def query_wrapper(func):
         needs_columns = args[-1]
 
         tool = _SearchWrapper(func(*args), **kwargs)
-        result = _SearchResults(tool.q, tool.q.all(), tool.q.statement.columns, tool.total)
+        result = _SearchResults(tool.q, tool.result, tool.q.statement.columns, tool.total)
+        result.has_next_page = tool.has_next_page
+        result.next_after = tool.next_after
+        result.total_is_approximate = tool.total_is_approximate
+        result.is_keyset = kwargs.get('after') is not None
 
         if needs_columns:
             return result, result.columns
@@ -114,6 +302,31 @@ def query_wrapper(func):
 
 # ################################################################################################################################
 
+def iter_query_results(func, *args, **config):
+    """ Yields all the results of a query function decorated with query_wrapper, e.g. for exports, reading them in pages
+    by keys, which means that they are never all held in memory at once, that no page needs an OFFSET and that
+    no COUNT query is issued. Positional arguments are those of the query function itself, with needs_columns
+    as the last one being False, and the query needs to be ordered by a table column.
+    """
+    config.setdefault('page_size', _stream_page_size)
+    config['needs_total'] = False
+
+    while True:
+        result = func(*args, **config)
+
+        for item in result.result:
+            yield item
+
+        if not result.has_next_page:
+            return
+
+        if result.next_after is None:
+            raise ValueError('Iterating over results requires a query ordered by a table column `{}`'.format(result.q))
+
+        config['after'] = result.next_after
+
+# ################################################################################################################################
+
 def bunch_maker(func):
     """ Turns SQLAlchemy rows into bunch instances, taking opaque elements into account.
     """
@@ -41,6 +41,29 @@ EndpointTopicTable = PubSubEndpointTopic.__table__
 
 _initialized=PUBSUB.DELIVERY_STATUS.INITIALIZED
 
+# How many bind parameters a single multi-row INSERT may use at most, by SQL dialect, so as to stay below each database's limits
+_max_params_by_dialect = {
+    'mssql': 2000,
+    'oracle': 30000,
+    'sqlite': 999,
+}
+_max_params_default = 30000
+
+# ################################################################################################################################
+
+def _get_chunks(session, rows, _max_params_by_dialect=_max_params_by_dialect, _max_params_default=_max_params_default):
+    """ Splits rows to be inserted into chunks small enough for each to be inserted with a single multi-row INSERT.
+    """
+    if not rows:
+        return []
+
+    max_params = _max_params_by_dialect.get(session.bind.dialect.name, _max_params_default)
+
+    # Each row needs as many bind parameters as it has columns
+    chunk_size = max(1, max_params // len(rows[0]))
+
+    return [rows[idx:idx+chunk_size] for idx in range(0, len(rows), chunk_size)]
+
 # ################################################################################################################################
 
 def _sql_publish_with_retry(session, cid, cluster_id, topic_id, subscriptions_by_topic, gd_msg_list, now):
@@ -113,7 +136,8 @@ def sql_publish_with_retry(*args):
 def _insert_topic_messages(session, msg_list):
     """ A low-level implementation for insert_topic_messages.
     """
-    session.execute(MsgInsert().values(msg_list))
+    for chunk in _get_chunks(session, msg_list):
+        session.execute(MsgInsert().values(chunk))
 
 # ################################################################################################################################
 
@@ -141,7 +165,8 @@ def insert_topic_messages(session, cid, msg_list):
 def _insert_queue_messages(session, queue_msgs):
     """ A low-level call to enqueue messages.
     """
-    session.execute(EnqueuedMsgInsert().values(queue_msgs))
+    for chunk in _get_chunks(session, queue_msgs):
+        session.execute(EnqueuedMsgInsert().values(chunk))
 
 # ################################################################################################################################
 
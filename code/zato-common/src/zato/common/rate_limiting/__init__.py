@@ -22,7 +22,7 @@ from netaddr import IPNetwork
 from sqlalchemy import and_
 
 # Zato
-from zato.common.rate_limiting.common import Const, DefinitionItem, ObjectInfo
+from zato.common.rate_limiting.common import Const, DefinitionItem, NetworkIndex, ObjectInfo
 from zato.common.rate_limiting.limiter import Approximate, Exact, RateLimitStateDelete, RateLimitStateTable
 
 # Python 2/3 compatibility
@@ -142,7 +142,7 @@ class DefinitionParser(object):
 class RateLimiting(object):
     """ Main API for the management of rate limiting functionality.
     """
-    __slots__ = 'parser', 'config_store', 'lock', 'sql_session_func', 'global_lock_func', 'cluster_id'
+    __slots__ = 'parser', 'config_store', 'lock', 'sql_session_func', 'global_lock_func', 'cluster_id', 'exact_lease_size'
 
     def __init__(self):
         self.parser = DefinitionParser() # type: DefinitionParser
@@ -152,6 +152,9 @@ class RateLimiting(object):
         self.sql_session_func = None     # type: Callable
         self.cluster_id = None           # type: int
 
+        # If greater than zero, exact rate limiting reserves that many requests from ODB at a time, see Exact for details
+        self.exact_lease_size = 0        # type: int
+
 # ################################################################################################################################
 
     def _get_config_key(self, object_type, object_name):
@@ -186,12 +189,17 @@ class RateLimiting(object):
         else:
             has_from_any = False
 
-        config = Exact(self.cluster_id, self.sql_session_func) if is_exact else Approximate(self.cluster_id) # type: BaseLimiter
+        if is_exact:
+            config = Exact(self.cluster_id, self.sql_session_func, self.exact_lease_size) # type: BaseLimiter
+        else:
+            config = Approximate(self.cluster_id) # type: BaseLimiter
+
         config.is_active = object_dict['is_active']
         config.is_exact = is_exact
         config.api = self
         config.object_info = info
         config.definition = parsed
+        config.network_index = NetworkIndex(parsed)
         config.parent_type = object_dict['parent_type']
         config.parent_name = object_dict['parent_name']
 
@@ -72,3 +72,94 @@ class DefinitionItem(object):
 
 # ################################################################################################################################
 # ################################################################################################################################
+
+class NetworkIndex(object):
+    """ A binary trie of network prefixes built out of a rate limiting definition. Returns the same definition item
+    that a line-by-line scan of the definition would, i.e. the first line whose network contains an input address,
+    but in time proportional to the address length rather than to the number of lines.
+    """
+    __slots__ = 'roots', 'from_any'
+
+    # Address version -> number of bits in an address
+    address_bits = {
+        4: 32,
+        6: 128,
+    }
+
+    def __init__(self, definition):
+        # type: (list)
+
+        # Each node is a list of [zero-bit child, one-bit child, (line index, definition item) or None]
+        self.roots = {
+            4: [None, None, None],
+            6: [None, None, None],
+        }
+
+        # A catch-all * line, if there is any
+        self.from_any = None # type: DefinitionItem
+
+        for idx, item in enumerate(definition): # type: int, DefinitionItem
+
+            # Nothing after a catch-all line can ever be matched so we can stop here
+            if item.from_ == Const.from_any:
+                self.from_any = item
+                break
+
+            self._add(idx, item)
+
+# ################################################################################################################################
+
+    def _add(self, idx, item):
+        # type: (int, DefinitionItem)
+
+        network = item.from_
+        bits = self.address_bits[network.version]
+        value = network.first
+        node = self.roots[network.version]
+
+        for bit_idx in range(network.prefixlen):
+            bit = (value >> (bits - 1 - bit_idx)) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, None]
+            node = child
+
+        # If the same network is already in the index, it is the earlier line that takes precedence
+        if node[2] is None:
+            node[2] = (idx, item)
+
+# ################################################################################################################################
+
+    def get(self, address):
+        """ Returns a definition item matching the input address, which must be an IPAddress object, or None if there is none.
+        """
+        # type: (object) -> DefinitionItem
+
+        bits = self.address_bits[address.version]
+        value = address.value
+        node = self.roots[address.version]
+        found = node[2]
+
+        # Go down the trie collecting all the networks that contain the address, i.e. all of its prefixes,
+        # and keep the one that was defined first.
+        for bit_idx in range(bits):
+            node = node[(value >> (bits - 1 - bit_idx)) & 1]
+
+            if node is None:
+                break
+
+            current = node[2]
+            if current is not None:
+                if found is None or current[0] < found[0]:
+                    found = current
+
+        # A network matched. Note that it must have been defined before a catch-all line, if any,
+        # because nothing after a catch-all line is in the index.
+        if found:
+            return found[1]
+
+        # No network matched so we can only return the catch-all line, or None if there is none
+        return self.from_any
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -9,6 +9,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
+from collections import OrderedDict
 from contextlib import closing
 from copy import deepcopy
 from datetime import datetime
@@ -19,6 +20,9 @@ from gevent.lock import RLock
 # netaddr
 from netaddr import IPAddress
 
+# SQLAlchemy
+from sqlalchemy.exc import IntegrityError
+
 # Zato
 from zato.common.odb.model import RateLimitState
 from zato.common.odb.query.rate_limiting import current_period_list, current_state as current_state_query
@@ -38,10 +42,11 @@ if typing.TYPE_CHECKING:
     from typing import Callable
 
     # Zato
-    from zato.common.rate_limiting.common import ObjectInfo
+    from zato.common.rate_limiting.common import NetworkIndex, ObjectInfo
 
     # For pyflakes
     Callable = Callable
+    NetworkIndex = NetworkIndex
     ObjectInfo = ObjectInfo
 
 
@@ -60,7 +65,10 @@ class BaseLimiter(object):
     __slots__ = 'current_idx', 'lock', 'api', 'object_info', 'definition', 'has_from_any', 'from_any_rate', 'from_any_unit', \
         'is_limit_reached', 'ip_address_cache', 'current_period_func', 'by_period', 'parent_type', 'parent_name', \
         'is_exact', 'from_any_object_id', 'from_any_object_type', 'from_any_object_name', 'cluster_id', 'is_active', \
-        'invocation_no'
+        'invocation_no', 'network_index'
+
+    # How many input addresses to keep along with their matching definition items
+    ip_address_cache_size = 10000
 
     initial_state = {
         'requests': 0,
@@ -82,7 +90,8 @@ class BaseLimiter(object):
         self.has_from_any = None   # type: bool
         self.from_any_rate = None  # type: int
         self.from_any_unit = None  # type: unicode
-        self.ip_address_cache = {} # type: dict
+        self.ip_address_cache = OrderedDict() # type: OrderedDict
+        self.network_index = None             # type: NetworkIndex
         self.by_period = {}        # type: dict
         self.parent_type = None    # type: unicode
         self.parent_name = None    # type: unicode
@@ -112,10 +121,6 @@ class BaseLimiter(object):
         """
         with self.lock:
 
-            # First, periodically clear out the IP cache to limit its size to 1,000 items
-            if len(self.ip_address_cache) >= 1000:
-                self.ip_address_cache.clear()
-
             now = datetime.utcnow()
             current_minute = self._get_current_minute(now)
             current_hour = self._get_current_hour(now)
@@ -161,23 +166,22 @@ class BaseLimiter(object):
 
 # ################################################################################################################################
 
-    def _get_rate_config_by_from(self, orig_from, _from_any=Const.from_any):
+    def _get_rate_config_by_from(self, orig_from):
         # type: (unicode, unicode) -> DefinitionItem
 
-        from_ = self.ip_address_cache.setdefault(orig_from, IPAddress(orig_from)) # type: IPAddress
-        found = None
+        cache = self.ip_address_cache
 
-        for line in self.definition: # type: DefinitionItem
+        # Most recently used addresses are kept at the end of the cache ..
+        if orig_from in cache:
+            found = cache.pop(orig_from)
+        else:
+            found = self.network_index.get(IPAddress(orig_from))
 
-            # A catch-all * pattern
-            if line.from_ == _from_any:
-                found = line
-                break
+            # .. which is why it is the first one that is removed if the cache is full.
+            if len(cache) >= self.ip_address_cache_size:
+                cache.popitem(False)
 
-            # A network match
-            elif from_ in line.from_:
-                found = line
-                break
+        cache[orig_from] = found
 
         # We did not match any line from configuration
         if not found:
@@ -232,7 +236,7 @@ class BaseLimiter(object):
         # Get current period, e.g. current day, hour or minute
         current_period_func = self.current_period_func[unit]
         current_period = current_period_func(now)
-        current_state = self._get_current_state(current_period, network_found)
+        current_state = self._get_current_state(current_period, network_found, rate)
 
         # Unless we are allowed to have any rate ..
         if rate != _rate_any:
@@ -303,7 +307,7 @@ class Approximate(BaseLimiter):
 
 # ################################################################################################################################
 
-    def _get_current_state(self, current_period, network_found):
+    def _get_current_state(self, current_period, network_found, *ignored):
         # type: (unicode, unicode) -> dict
 
         # Get or create a dictionary of requests information for current period
@@ -325,11 +329,20 @@ class Approximate(BaseLimiter):
 # ################################################################################################################################
 
 class Exact(BaseLimiter):
-
-    def __init__(self, cluster_id, sql_session_func):
-        # type: (int, Callable)
+    """ A rate limiter that keeps its state in ODB. By default, each request is checked and stored in ODB individually.
+    If lease_size is set, each server reserves blocks of that many requests from ODB and spends them locally,
+    which means that the cluster-wide limit is never exceeded but a server may reject a request
+    while up to lease_size requests, per each of the other servers, are still unused.
+    """
+    def __init__(self, cluster_id, sql_session_func, lease_size=0):
+        # type: (int, Callable, int)
         super(Exact, self).__init__(cluster_id)
         self.sql_session_func = sql_session_func
+        self.lease_size = lease_size
+
+        # (Period, network) -> requests reserved by this server and not used yet, along with information
+        # about the last request, in the same format that self.initial_state uses.
+        self.leases = {} # type: dict
 
 # ################################################################################################################################
 
@@ -345,8 +358,30 @@ class Exact(BaseLimiter):
 
 # ################################################################################################################################
 
-    def _get_current_state(self, current_period, network_found):
-        # type: (unicode, unicode) -> dict
+    def _new_state_item(self, current_period, network_found, cid, orig_from, now):
+        # type: (unicode, unicode, unicode, unicode, datetime) -> RateLimitState
+
+        item = RateLimitState()
+        item.cluster_id = self.cluster_id
+        item.object_type = self.object_info.type_
+        item.object_id = self.object_info.id
+        item.requests = 0
+        item.period = current_period
+        item.network = network_found
+        item.last_cid = cid
+        item.last_from = orig_from
+        item.last_network = network_found
+        item.last_request_time_utc = now
+
+        return item
+
+# ################################################################################################################################
+
+    def _get_current_state(self, current_period, network_found, rate):
+        # type: (unicode, unicode, object) -> dict
+
+        if self.lease_size:
+            return self._get_leased_state(current_period, network_found, rate)
 
         current_state = deepcopy(self.initial_state) # type: dict
 
@@ -362,6 +397,9 @@ class Exact(BaseLimiter):
 
     def _set_new_state(self, current_state, cid, orig_from, network_found, now, current_period):
 
+        if self.lease_size:
+            return self._set_new_leased_state(current_state, cid, orig_from, network_found, now)
+
         # We just need a string representation of this object
         network_found = str(network_found)
 
@@ -373,23 +411,116 @@ class Exact(BaseLimiter):
                 item.last_from = orig_from
                 item.last_request_time_utc = now
             else:
-                item = RateLimitState()
-                item.cluster_id = self.cluster_id
-                item.object_type = self.object_info.type_
-                item.object_id = self.object_info.id
-                item.requests = 0
-                item.period = current_period
-                item.network = network_found
-                item.last_cid = cid
-                item.last_from = orig_from
-                item.last_network = network_found
-                item.last_request_time_utc = now
+                item = self._new_state_item(current_period, network_found, cid, orig_from, now)
 
             item.requests += 1
 
             session.add(item)
             session.commit()
 
+# ################################################################################################################################
+
+    def _reserve_lease(self, current_period, network_found, rate, lease):
+        """ Reserves in ODB a new block of requests for the input period and network, returning the number of requests
+        actually reserved, which may be fewer than self.lease_size, or even zero, if the rate limit is close to being reached.
+        Returns None if nothing could be reserved because of concurrent updates from other servers.
+        """
+        # type: (unicode, unicode, object, dict) -> int
+
+        network_found = str(network_found)
+
+        for _ in range(2):
+            with closing(self.sql_session_func()) as session:
+                try:
+                    item = current_state_query(session, self.cluster_id, self.object_info.type_, self.object_info.id,
+                        current_period, network_found).\
+                        with_for_update().\
+                        first()
+
+                    if not item:
+                        item = self._new_state_item(current_period, network_found, lease['last_cid'] or '',
+                            lease['last_from'] or '', datetime.utcnow())
+
+                    if rate == Const.rate_any:
+                        reserved = self.lease_size
+                    else:
+                        reserved = max(0, min(self.lease_size, rate - item.requests))
+
+                    if reserved:
+                        item.requests += reserved
+                        session.add(item)
+
+                    session.commit()
+
+                    return reserved
+
+                # Another server created the same row in the meantime, which means that we can try again with it
+                except IntegrityError:
+                    session.rollback()
+
+# ################################################################################################################################
+
+    def _discard_ended_leases(self, current_period):
+        """ Discards leases from periods of the same unit as the input one, e.g. previous minutes, that have already ended.
+        Leases of other units, e.g. hours, are kept because they may be still in use. Nothing is given back to ODB
+        because requests from a period that has ended cannot be used by anyone anyway.
+        """
+        # type: (unicode)
+
+        # The first character of each period is its unit
+        unit = current_period[0]
+
+        for key in list(iterkeys(self.leases)):
+            period = key[0] # type: unicode
+            if period[0] == unit and period < current_period:
+                del self.leases[key]
+
+# ################################################################################################################################
+
+    def _get_leased_state(self, current_period, network_found, rate):
+        # type: (unicode, unicode, object) -> dict
+
+        key = (current_period, str(network_found))
+        lease = self.leases.get(key)
+
+        # This is the first request in a new period ..
+        if lease is None:
+
+            # .. so any leases from the previous ones are no longer needed ..
+            self._discard_ended_leases(current_period)
+
+            # .. and we start a new one.
+            lease = self.leases[key] = deepcopy(self.initial_state)
+            lease['remaining'] = 0
+            lease['is_exhausted'] = False
+
+        # We need more requests from ODB, unless we already know that there are none left in this period.
+        # Requests reserved in a period are never given back to ODB while that period lasts, which means that
+        # once the limit is reached, it stays reached until a new period, and a new lease, begins.
+        if not lease['remaining'] and not lease['is_exhausted']:
+            reserved = self._reserve_lease(current_period, network_found, rate, lease)
+            lease['remaining'] = reserved or 0
+            lease['is_exhausted'] = reserved == 0
+
+        # Our caller compares requests with the rate to decide if the limit has been reached,
+        # so if there is nothing left in the lease, we indicate that the limit has been reached.
+        if lease['remaining']:
+            lease['requests'] = 0
+        else:
+            lease['requests'] = rate
+
+        return lease
+
+# ################################################################################################################################
+
+    def _set_new_leased_state(self, current_state, cid, orig_from, network_found, now):
+        if current_state['remaining']:
+            current_state['remaining'] -= 1
+        current_state['last_cid'] = cid
+        current_state['last_request_time_utc'] = now.isoformat()
+        current_state['last_from'] = orig_from
+        current_state['last_network'] = str(network_found)
+
 # ################################################################################################################################
 
     def _get_current_periods(self):
@@ -400,6 +531,12 @@ class Exact(BaseLimiter):
 # ################################################################################################################################
 
     def _delete_periods(self, to_delete):
+
+        # Leases from periods that are being deleted will not be needed anymore
+        for key in list(iterkeys(self.leases)):
+            if key[0] in to_delete:
+                del self.leases[key]
+
         with closing(self.sql_session_func()) as session:
             session.execute(RateLimitStateDelete().where(
                 RateLimitStateTable.c.period.in_(to_delete)
@@ -11,6 +11,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 # ################################################################################################################################
 
 _search_attrs = 'num_pages', 'cur_page', 'prev_page', 'next_page', 'has_prev_page', 'has_next_page', 'page_size', 'total'
+_keyset_attrs = _search_attrs + ('next_after', 'total_is_approximate')
 
 # ################################################################################################################################
 
@@ -28,6 +29,11 @@ class SearchResults(object):
         self.has_next_page = False
         self.page_size = None # type: int
 
+        # Used only with pagination by keys or capped counts
+        self.is_keyset = False
+        self.next_after = None
+        self.total_is_approximate = False
+
 # ################################################################################################################################
 
     def __iter__(self):
@@ -44,6 +50,26 @@ class SearchResults(object):
 
     def set_data(self, cur_page, page_size):
 
+        self.page_size = page_size
+
+        # Pages selected by keys have no numbers at all ..
+        if self.is_keyset:
+            self.num_pages = None
+            self.cur_page = None
+            self.prev_page = None
+            self.next_page = None
+            self.has_prev_page = True
+            return
+
+        # .. and without a total we only know if there is a next page, not how many of them there are.
+        if self.total is None:
+            self.num_pages = None
+            self.cur_page = cur_page + 1
+            self.prev_page = self.cur_page - 1 if self.cur_page > 1 else 0
+            self.next_page = self.cur_page + 1 if self.has_next_page else None
+            self.has_prev_page = self.prev_page >= 1
+            return
+
         num_pages, rest = divmod(self.total, page_size)
 
         # Apparently there are some results in rest that did not fit a full page
@@ -53,16 +79,24 @@ class SearchResults(object):
         self.num_pages = num_pages
         self.cur_page = cur_page + 1 # Adding 1 because, again, the external API is 1-indexed
         self.prev_page = self.cur_page - 1 if self.cur_page > 1 else 0
-        self.next_page = self.cur_page + 1 if self.cur_page < self.num_pages else None
         self.has_prev_page = self.prev_page >= 1
-        self.has_next_page = bool(self.next_page and self.next_page <= self.num_pages) or False
-        self.page_size = page_size
+
+        # A capped total may not reach past the current page even if there are more results
+        if self.total_is_approximate:
+            self.next_page = self.cur_page + 1 if self.has_next_page else None
+        else:
+            self.next_page = self.cur_page + 1 if self.cur_page < self.num_pages else None
+            self.has_next_page = bool(self.next_page and self.next_page <= self.num_pages) or False
 
 # ################################################################################################################################
 
-    def to_dict(self, _search_attrs=_search_attrs):
+    def to_dict(self, _search_attrs=_search_attrs, _keyset_attrs=_keyset_attrs):
         out = {}
-        for name in _search_attrs:
+
+        # Attributes related to keys and capped counts are returned only if they are in use
+        uses_keyset = self.is_keyset or self.next_after is not None or self.total_is_approximate
+
+        for name in (_keyset_attrs if uses_keyset else _search_attrs):
             out[name] = getattr(self, name, None)
         return out
 
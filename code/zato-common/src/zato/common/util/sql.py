@@ -44,7 +44,7 @@ _max_page_size = _default_page_size * 5
 # but the underlying PyMySQL library returns only a string rather than an integer code.
 _deadlock_code = 'Deadlock found when trying to get lock'
 
-_zato_opaque_skip_attrs=set(['needs_details', 'paginate', 'cur_page', 'query'])
+_zato_opaque_skip_attrs=set(['needs_details', 'paginate', 'cur_page', 'query', 'after', 'needs_total'])
 
 # ################################################################################################################################
 
@@ -74,6 +74,19 @@ def search(search_func, config, filter_by, session=None, cluster_id=None, *args,
         'filter_op': kwargs.get('filter_op')
     }
 
+    # A page may start right after the last key of the previous one rather than at a given page number
+    after = config.get('after')
+    if after:
+        kwargs['after'] = after
+
+    # Counting all the results may be skipped or capped
+    if config.get('needs_total') is False:
+        kwargs['needs_total'] = False
+
+    count_limit = config.get('count_limit')
+    if count_limit:
+        kwargs['count_limit'] = count_limit
+
     query = config.get('query')
     if query:
         query = query.strip().split()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from unittest import TestCase
+
+# gevent
+from gevent import sleep, spawn
+
+# Zato
+from zato.common.api import IPC
+from zato.common.ipc.api import IPCAPI
+from zato.common.json_internal import dumps
+from zato.common.util.api import new_cid
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_cluster_name = 'my.cluster'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Worker(object):
+    """ A process that responds to IPC requests, standing in for a server's worker.
+    """
+    def __init__(self, server_name, pid):
+        self.received = []
+        self.response_status = IPC.STATUS.SUCCESS
+        self.needs_response = True
+        self.api = IPCAPI(IPCAPI.get_endpoint_name(_cluster_name, server_name, pid), self.on_message, pid)
+
+    def on_message(self, msg):
+        self.received.append(msg)
+
+        if self.needs_response and msg.reply_to_tag:
+            response = dumps({'service': msg.service, 'payload': msg.payload})
+            self.api.send_reply(msg.reply_to_tag, msg.request_id, self.response_status, response)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class IPCTestCase(TestCase):
+
+    def setUp(self):
+
+        # Sockets are files in a temporary directory so each test needs names of its own
+        self.server_name = 'server.{}'.format(new_cid())
+
+        self.worker = _Worker(self.server_name, 2)
+        self.worker.api.run()
+
+        self.api = IPCAPI('{}-caller'.format(self.server_name), None, 1)
+        self.api.run()
+
+        # Let all the sockets bind
+        sleep(0.1)
+
+    def tearDown(self):
+        for api in self.api, self.worker.api:
+            api.close()
+
+            # Remove the socket files that were bound to
+            for endpoint in api.subscriber, api.reply_receiver:
+                address = endpoint.address.replace('ipc://', '')
+                if os.path.exists(address):
+                    os.remove(address)
+
+    def invoke(self, payload, timeout=2, is_async=False):
+        return self.api.invoke_by_pid('my.service', payload, _cluster_name, self.server_name, 2, timeout, is_async)
+
+# ################################################################################################################################
+
+    def test_invoke_success(self):
+
+        is_success, response = self.invoke({'a': 1})
+
+        self.assertTrue(is_success)
+        self.assertDictEqual(response, {'service': 'my.service', 'payload': {'a': 1}})
+        self.assertDictEqual(self.api.pending_replies, {})
+
+        # The request carried all that was needed to reply to it
+        msg = self.worker.received[0]
+        self.assertEqual(msg.reply_to_tag, self.api.name)
+        self.assertEqual(msg.target_pid, 2)
+
+# ################################################################################################################################
+
+    def test_invoke_failure(self):
+
+        self.worker.response_status = IPC.STATUS.FAILURE
+        is_success, response = self.invoke({'a': 1})
+
+        # Responses to failed requests are not parsed
+        self.assertFalse(is_success)
+        self.assertIn('my.service', response)
+
+# ################################################################################################################################
+
+    def test_invoke_timeout(self):
+
+        self.worker.needs_response = False
+
+        self.assertTupleEqual(self.invoke({'a': 1}, timeout=0.2), (False, None))
+        self.assertDictEqual(self.api.pending_replies, {})
+
+# ################################################################################################################################
+
+    def test_invoke_async(self):
+
+        self.assertIsNone(self.invoke({'a': 1}, is_async=True))
+        sleep(0.1)
+
+        msg = self.worker.received[0]
+        self.assertEqual(msg.reply_to_tag, '')
+        self.assertDictEqual(msg.payload, {'a': 1})
+
+# ################################################################################################################################
+
+    def test_concurrent_requests(self):
+
+        # Each response is matched with its own request even though all of them arrive through the same socket
+        greenlets = [spawn(self.invoke, {'idx': idx}) for idx in range(10)]
+
+        for idx, greenlet in enumerate(greenlets):
+            is_success, response = greenlet.get()
+            self.assertTrue(is_success)
+            self.assertDictEqual(response['payload'], {'idx': idx})
+
+        # A single connection was used to send all the responses
+        self.assertListEqual(list(self.worker.api.reply_senders), [self.api.name])
+
+# ################################################################################################################################
+
+    def test_unknown_reply_is_ignored(self):
+
+        self.api.on_reply('ipc.unknown', IPC.STATUS.SUCCESS, '{}')
+        self.assertDictEqual(self.api.pending_replies, {})
+
+# ################################################################################################################################
+
+    def test_shared_context(self):
+
+        self.invoke({'a': 1})
+
+        reply_sender = self.worker.api.reply_senders[self.api.name]
+        publisher = self.api.pid_publishers[2]
+
+        # All the IPC objects in a process share one context ..
+        self.assertIs(reply_sender.ctx, publisher.ctx)
+        self.assertIs(reply_sender.ctx, self.api.subscriber.ctx)
+        self.assertIs(reply_sender.ctx, self.worker.api.reply_receiver.ctx)
+
+        # .. which is why closing one of them does not affect the others.
+        reply_sender.close()
+        del self.worker.api.reply_senders[self.api.name]
+
+        is_success, _ = self.invoke({'a': 2})
+        self.assertTrue(is_success)
+
+# ################################################################################################################################
+# ################################################################################################################################
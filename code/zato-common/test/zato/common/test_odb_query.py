@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+# SQLAlchemy
+from sqlalchemy import Column, create_engine, DateTime, event, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.common.odb.query import _SearchWrapper, capped_count, get_key_columns, iter_query_results, query_wrapper
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+Base = declarative_base()
+
+class _Item(Base):
+    __tablename__ = 'test_item'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(191), nullable=False, unique=True)
+    priority = Column(Integer, nullable=False)
+    creation_time = Column(DateTime, nullable=False)
+
+@query_wrapper
+def _item_list(session, is_ordered, needs_columns=False):
+    q = session.query(_Item)
+    return q.order_by(_Item.priority) if is_ordered else q
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SearchWrapperTestCase(TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+        self.statements = []
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, *ignored):
+            self.statements.append((statement, parameters))
+
+        # There are only three distinct priorities and creation times so pages are bound to end
+        # in the middle of rows that have the same values in these columns.
+        start = datetime(2020, 1, 2, 3, 4, 5)
+
+        for idx in range(1, 21):
+            self.session.add(_Item(id=idx, name='item.{:02}'.format(idx), priority=idx % 3,
+                creation_time=start + timedelta(seconds=idx % 3)))
+
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+# ################################################################################################################################
+
+    def get_all_pages(self, q, page_size, **config):
+        """ Reads all the pages of a query by keys, returning IDs of the rows found on each page.
+        """
+        pages = []
+        after = None
+
+        while True:
+            wrapper = _SearchWrapper(q, page_size=page_size, after=after, **config)
+            pages.append([elem.id for elem in wrapper.result])
+
+            if not wrapper.has_next_page:
+                return pages
+
+            after = wrapper.next_after
+
+# ################################################################################################################################
+
+    def test_get_key_columns(self):
+
+        q = self.session.query(_Item).order_by(_Item.name)
+        self.assertEqual([elem.key for elem in get_key_columns(q)[0]], ['name'])
+        self.assertFalse(get_key_columns(q)[1])
+
+        q = self.session.query(_Item).order_by(_Item.priority.desc())
+        self.assertEqual([elem.key for elem in get_key_columns(q)[0]], ['priority', 'id'])
+        self.assertTrue(get_key_columns(q)[1])
+
+        q = self.session.query(_Item)
+        self.assertEqual(get_key_columns(q), ([], False))
+
+# ################################################################################################################################
+
+    def test_keyset_unique_column(self):
+        q = self.session.query(_Item).order_by(_Item.name)
+        pages = self.get_all_pages(q, 7)
+
+        self.assertListEqual(pages, [list(range(1, 8)), list(range(8, 15)), list(range(15, 21))])
+
+# ################################################################################################################################
+
+    def test_keyset_non_unique_column(self):
+        q = self.session.query(_Item).order_by(_Item.priority)
+        pages = self.get_all_pages(q, 4)
+
+        # Each row is returned exactly once, with rows of the same priority ordered by their IDs
+        expected = sorted(range(1, 21), key=lambda idx: (idx % 3, idx))
+        self.assertListEqual(sum(pages, []), expected)
+        self.assertListEqual([len(elem) for elem in pages], [4, 4, 4, 4, 4])
+
+# ################################################################################################################################
+
+    def test_keyset_non_unique_column_desc(self):
+        q = self.session.query(_Item).order_by(_Item.priority.desc())
+        pages = self.get_all_pages(q, 3)
+
+        expected = sorted(range(1, 21), key=lambda idx: (-(idx % 3), -idx))
+        self.assertListEqual(sum(pages, []), expected)
+
+# ################################################################################################################################
+
+    def test_keyset_non_unique_datetime_column(self):
+        q = self.session.query(_Item.id, _Item.creation_time).order_by(_Item.creation_time)
+        pages = self.get_all_pages(q, 6)
+
+        expected = sorted(range(1, 21), key=lambda idx: (idx % 3, idx))
+        self.assertListEqual(sum(pages, []), expected)
+
+# ################################################################################################################################
+
+    def test_keyset_after_page_number(self):
+
+        # Clients may switch from page numbers to keys at any point
+        q = self.session.query(_Item).order_by(_Item.priority)
+        expected = sorted(range(1, 21), key=lambda idx: (idx % 3, idx))
+
+        wrapper = _SearchWrapper(q, page_size=5, cur_page=1)
+        self.assertListEqual([elem.id for elem in wrapper.result], expected[5:10])
+
+        wrapper = _SearchWrapper(q, page_size=5, after=wrapper.next_after)
+        self.assertListEqual([elem.id for elem in wrapper.result], expected[10:15])
+
+# ################################################################################################################################
+
+    def test_keyset_requires_key_columns(self):
+        q = self.session.query(_Item)
+
+        with self.assertRaises(ValueError):
+            _SearchWrapper(q, page_size=5, after='abc')
+
+# ################################################################################################################################
+
+    def test_keyset_invalid_compound_key(self):
+        q = self.session.query(_Item).order_by(_Item.priority)
+
+        with self.assertRaises(ValueError):
+            _SearchWrapper(q, page_size=5, after='abc')
+
+# ################################################################################################################################
+
+    def test_total_from_last_page(self):
+        q = self.session.query(_Item).order_by(_Item.name)
+        wrapper = _SearchWrapper(q, page_size=7, cur_page=2)
+
+        self.assertEqual(wrapper.total, 20)
+        self.assertFalse(wrapper.has_next_page)
+        self.assertIsNone(wrapper.next_after)
+
+# ################################################################################################################################
+
+    def test_total_capped(self):
+        q = self.session.query(_Item).order_by(_Item.name)
+        wrapper = _SearchWrapper(q, page_size=5, count_limit=10)
+
+        self.assertEqual(wrapper.total, 10)
+        self.assertTrue(wrapper.total_is_approximate)
+
+    def test_total_not_needed(self):
+        q = self.session.query(_Item).order_by(_Item.name)
+        wrapper = _SearchWrapper(q, page_size=5, needs_total=False)
+
+        self.assertIsNone(wrapper.total)
+        self.assertTrue(wrapper.has_next_page)
+
+# ################################################################################################################################
+
+    def test_capped_count(self):
+        q = self.session.query(_Item)
+
+        self.assertEqual(capped_count(self.session, q, 5), (5, True))
+        self.assertEqual(capped_count(self.session, q, 20), (20, False))
+        self.assertEqual(capped_count(self.session, q, 50), (20, False))
+        self.assertEqual(capped_count(self.session, q.filter(_Item.priority == 0), 50), (6, False))
+
+# ################################################################################################################################
+
+    def test_iter_query_results(self):
+        del self.statements[:]
+        result = iter_query_results(_item_list, self.session, True, False, page_size=6)
+
+        # All the rows are returned ..
+        expected = sorted(range(1, 21), key=lambda idx: (idx % 3, idx))
+        self.assertListEqual([elem.id for elem in result], expected)
+
+        # .. one page per query, with no rows skipped by an OFFSET and with no COUNT.
+        self.assertEqual(len(self.statements), 4)
+
+        for statement, parameters in self.statements:
+            self.assertTrue(statement.endswith('LIMIT ? OFFSET ?'))
+            self.assertEqual(parameters[-1], 0)
+            self.assertNotIn('count(', statement)
+
+# ################################################################################################################################
+
+    def test_iter_query_results_requires_key_columns(self):
+        result = iter_query_results(_item_list, self.session, False, False, page_size=6)
+
+        with self.assertRaises(ValueError):
+            list(result)
+
+# ################################################################################################################################
+# ################################################################################################################################
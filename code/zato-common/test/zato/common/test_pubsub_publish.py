@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.common.exception import BadRequest
+from zato.common.odb.model import PubSubMessage
+from zato.common.odb.query.pubsub.publish import _get_chunks, insert_topic_messages
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _get_session(dialect_name):
+    return Bunch(bind=Bunch(dialect=Bunch(name=dialect_name)))
+
+# ################################################################################################################################
+
+def _get_rows(how_many, columns=3):
+    return [dict(('col{}'.format(col_idx), row_idx) for col_idx in range(columns)) for row_idx in range(how_many)]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class GetChunksTestCase(TestCase):
+
+    def get_chunk_sizes(self, how_many, columns=3, dialect_name='sqlite'):
+        return [len(chunk) for chunk in _get_chunks(_get_session(dialect_name), _get_rows(how_many, columns))]
+
+# ################################################################################################################################
+
+    def test_no_rows(self):
+        self.assertListEqual(_get_chunks(_get_session('sqlite'), []), [])
+
+# ################################################################################################################################
+
+    def test_chunk_boundaries(self):
+
+        # With three columns per row, 999 // 3 = 333 rows fit in a single SQLite INSERT
+        self.assertListEqual(self.get_chunk_sizes(1), [1])
+        self.assertListEqual(self.get_chunk_sizes(332), [332])
+        self.assertListEqual(self.get_chunk_sizes(333), [333])
+        self.assertListEqual(self.get_chunk_sizes(334), [333, 1])
+        self.assertListEqual(self.get_chunk_sizes(666), [333, 333])
+        self.assertListEqual(self.get_chunk_sizes(667), [333, 333, 1])
+
+# ################################################################################################################################
+
+    def test_rows_are_kept_in_order(self):
+        rows = _get_rows(1000)
+        chunks = _get_chunks(_get_session('sqlite'), rows)
+
+        self.assertListEqual([row for chunk in chunks for row in chunk], rows)
+
+# ################################################################################################################################
+
+    def test_limits_by_dialect(self):
+        self.assertListEqual(self.get_chunk_sizes(1000, 10, 'sqlite'), [99] * 10 + [10])
+        self.assertListEqual(self.get_chunk_sizes(1000, 10, 'mssql'), [200] * 5)
+        self.assertListEqual(self.get_chunk_sizes(5000, 10, 'oracle'), [3000, 2000])
+        self.assertListEqual(self.get_chunk_sizes(5000, 10, 'postgresql'), [3000, 2000])
+
+# ################################################################################################################################
+
+    def test_row_wider_than_limit(self):
+
+        # Each row is inserted on its own if it alone needs more parameters than the limit is
+        self.assertListEqual(self.get_chunk_sizes(3, 1500), [1, 1, 1])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class InsertTopicMessagesTestCase(TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        PubSubMessage.__table__.create(engine)
+
+        self.session = sessionmaker(bind=engine)()
+        self.inserts = []
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, *ignored):
+            if statement.startswith('INSERT'):
+                self.inserts.append(len(parameters))
+
+    def tearDown(self):
+        self.session.close()
+
+    def get_msg_list(self, how_many):
+        out = []
+
+        for idx in range(how_many):
+            out.append({
+                'pub_msg_id': 'msg.{}'.format(idx),
+                'pub_pattern_matched': 'pub=/*',
+                'pub_time': 1.0,
+                'data': 'data.{}'.format(idx),
+                'data_prefix': 'data',
+                'data_prefix_short': 'data',
+                'size': 6,
+                'published_by_id': 1,
+                'cluster_id': 1,
+            })
+
+        return out
+
+    def get_count(self):
+        return self.session.query(PubSubMessage).count()
+
+# ################################################################################################################################
+
+    def test_insert_in_chunks(self):
+
+        insert_topic_messages(self.session, 'my.cid', self.get_msg_list(250))
+        self.session.commit()
+
+        # Each message has 9 columns so each INSERT could have up to 999 // 9 = 111 rows
+        self.assertListEqual(self.inserts, [111 * 9, 111 * 9, 28 * 9])
+        self.assertEqual(self.get_count(), 250)
+
+# ################################################################################################################################
+
+    def test_insert_partial_failure(self):
+
+        # A duplicate message ID in the last chunk ..
+        msg_list = self.get_msg_list(250)
+        msg_list[-1]['pub_msg_id'] = msg_list[0]['pub_msg_id']
+
+        # Unlike other databases, SQLite does not report which index was violated so this may be a plain IntegrityError too
+        self.assertRaises((BadRequest, IntegrityError), insert_topic_messages, self.session, 'my.cid', msg_list)
+        self.assertEqual(len(self.inserts), 3)
+
+        # .. means that chunks inserted before it are rolled back together with it, since all of them are in one transaction.
+        self.session.rollback()
+        self.assertEqual(self.get_count(), 0)
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from datetime import datetime
+from unittest import TestCase
+
+# netaddr
+from netaddr import IPAddress
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Zato
+from zato.common.odb.model import RateLimitState
+from zato.common.rate_limiting import DefinitionParser
+from zato.common.rate_limiting.common import Const, NetworkIndex, ObjectInfo, RateLimitReached
+from zato.common.rate_limiting.limiter import Exact
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+definition = """
+10.0.0.0/8      = 100/m
+10.1.0.0/16     = 200/m
+10.1.2.3        = 300/m
+192.168.0.0/24  = 400/m
+2001:db8::/32   = 500/m
+2001:db8:1::/48 = 600/m
+"""
+
+_now = datetime(2020, 1, 2, 3, 4, 5)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class NetworkIndexTestCase(TestCase):
+
+    def get_index(self, definition):
+        return NetworkIndex(DefinitionParser().parse(definition, 1, 'my.type', 'my.name'))
+
+    def get_rate(self, index, address):
+        item = index.get(IPAddress(address))
+        return item.rate if item else None
+
+# ################################################################################################################################
+
+    def test_first_line_matches(self):
+        index = self.get_index(definition)
+
+        # 10.0.0.0/8 is defined first so it is the one returned even if the more specific networks also match
+        self.assertEquals(self.get_rate(index, '10.1.2.3'), 100)
+        self.assertEquals(self.get_rate(index, '10.2.3.4'), 100)
+        self.assertEquals(self.get_rate(index, '192.168.0.1'), 400)
+        self.assertEquals(self.get_rate(index, '2001:db8:1::1'), 500)
+
+# ################################################################################################################################
+
+    def test_more_specific_first(self):
+        index = self.get_index("""
+            10.1.2.3    = 300/m
+            10.1.0.0/16 = 200/m
+            10.0.0.0/8  = 100/m
+            *           = 1/m
+            192.168.0.1 = 400/m
+        """)
+
+        self.assertEquals(self.get_rate(index, '10.1.2.3'), 300)
+        self.assertEquals(self.get_rate(index, '10.1.2.4'), 200)
+        self.assertEquals(self.get_rate(index, '10.2.0.1'), 100)
+
+        # Lines after a catch-all one are never matched
+        self.assertEquals(self.get_rate(index, '192.168.0.1'), 1)
+        self.assertEquals(self.get_rate(index, '::1'), 1)
+
+# ################################################################################################################################
+
+    def test_no_match(self):
+        index = self.get_index(definition)
+
+        self.assertIsNone(self.get_rate(index, '11.0.0.1'))
+        self.assertIsNone(self.get_rate(index, '192.168.1.1'))
+        self.assertIsNone(self.get_rate(index, '2001:db9::1'))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Exact(Exact):
+    """ Keeps track of how many times blocks of requests were reserved in ODB.
+    """
+    def __init__(self, *args, **kwargs):
+        super(_Exact, self).__init__(*args, **kwargs)
+        self.reserve_calls = 0
+
+    def _reserve_lease(self, *args, **kwargs):
+        self.reserve_calls += 1
+        return super(_Exact, self)._reserve_lease(*args, **kwargs)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ExactLeaseTestCase(TestCase):
+
+    def setUp(self):
+
+        # All the limiters share the same in-RAM database, as servers in a cluster share ODB
+        engine = create_engine('sqlite://', connect_args={'check_same_thread':False}, poolclass=StaticPool)
+        RateLimitState.__table__.create(engine)
+
+        self.sql_session_func = sessionmaker(bind=engine)
+
+    def get_limiter(self, rate, lease_size):
+
+        object_info = ObjectInfo()
+        object_info.type_ = 'my.type'
+        object_info.id = 1
+        object_info.name = 'my.name'
+
+        limiter = _Exact(1, self.sql_session_func, lease_size)
+        limiter.object_info = object_info
+        limiter.from_any_rate = rate
+
+        return limiter
+
+    def check_limit(self, limiter, now=_now, unit=Const.Unit.minute, network='127.0.0.1'):
+        """ Returns True if a request was allowed and False otherwise.
+        """
+        try:
+            limiter._check_limit('my.cid', network, Const.from_any, limiter.from_any_rate, unit,
+                None, None, None, _utcnow=lambda: now)
+        except RateLimitReached:
+            return False
+        else:
+            return True
+
+    def get_odb_requests(self, period='m.2020-01-02T03:04'):
+        session = self.sql_session_func()
+        try:
+            return session.query(RateLimitState.requests).filter(RateLimitState.period==period).scalar()
+        finally:
+            session.close()
+
+# ################################################################################################################################
+
+    def test_exhausted_lease_is_cached(self):
+        limiter = self.get_limiter(10, 4)
+
+        results = [self.check_limit(limiter) for _ in range(15)]
+
+        self.assertListEqual(results, [True] * 10 + [False] * 5)
+        self.assertEqual(self.get_odb_requests(), 10)
+
+        # Blocks of 4, 4 and 2 requests were reserved, after which ODB was asked once more only to learn that
+        # the limit was reached. Requests after that were rejected without looking up ODB again.
+        self.assertEqual(limiter.reserve_calls, 4)
+
+# ################################################################################################################################
+
+    def test_exhausted_lease_new_period(self):
+        limiter = self.get_limiter(2, 2)
+
+        results = [self.check_limit(limiter) for _ in range(3)]
+        self.assertListEqual(results, [True, True, False])
+
+        # A new period begins with a new lease, which means that requests are allowed again
+        next_minute = datetime(2020, 1, 2, 3, 5, 5)
+        results = [self.check_limit(limiter, next_minute) for _ in range(3)]
+
+        self.assertListEqual(results, [True, True, False])
+        self.assertEqual(self.get_odb_requests('m.2020-01-02T03:05'), 2)
+        self.assertEqual(limiter.reserve_calls, 4)
+
+# ################################################################################################################################
+
+    def test_cluster_wide_limit(self):
+        rate = 25
+        limiters = [self.get_limiter(rate, lease_size) for lease_size in (1, 3, 4, 10)]
+
+        allowed = 0
+
+        # Each limiter stands for a different server and requests reach them in turn
+        for _ in range(20):
+            for limiter in limiters:
+                if self.check_limit(limiter):
+                    allowed += 1
+
+        # No matter how the leases were divided among servers, they did not allow more than the limit in total
+        self.assertLessEqual(allowed, rate)
+        self.assertEqual(self.get_odb_requests(), rate)
+
+        # Each server knows that there is nothing left, without having to ask ODB about it.
+        for limiter in limiters:
+            reserve_calls = limiter.reserve_calls
+            self.assertFalse(self.check_limit(limiter))
+            self.assertEqual(limiter.reserve_calls, reserve_calls)
+
+# ################################################################################################################################
+
+    def test_ended_leases_are_discarded(self):
+        limiter = self.get_limiter(10, 4)
+
+        self.assertTrue(self.check_limit(limiter))
+        self.assertEqual(self.get_odb_requests(), 4)
+
+        # Requests reserved in a period that has already ended are dropped locally, without giving them back to ODB
+        self.check_limit(limiter, datetime(2020, 1, 2, 3, 5, 5))
+        self.assertEqual(self.get_odb_requests(), 4)
+        self.assertListEqual(sorted(key[0] for key in limiter.leases), ['m.2020-01-02T03:05'])
+
+# ################################################################################################################################
+
+    def test_leases_of_other_units_are_kept(self):
+        limiter = self.get_limiter(1, 4)
+
+        # An hourly limit is used up ..
+        self.assertTrue(self.check_limit(limiter, unit=Const.Unit.hour, network='10.0.0.1'))
+        self.assertFalse(self.check_limit(limiter, unit=Const.Unit.hour, network='10.0.0.1'))
+        reserve_calls = limiter.reserve_calls
+
+        # .. and a new minute starting for a per-minute limit ..
+        self.check_limit(limiter, datetime(2020, 1, 2, 3, 5, 5))
+
+        # .. does not make the hourly lease forget that it is exhausted.
+        self.assertFalse(self.check_limit(limiter, datetime(2020, 1, 2, 3, 5, 6), Const.Unit.hour, '10.0.0.1'))
+        self.assertEqual(limiter.reserve_calls, reserve_calls + 1)
+        self.assertIn('h.2020-01-02T03', [key[0] for key in limiter.leases])
+
+# ################################################################################################################################
+# ################################################################################################################################
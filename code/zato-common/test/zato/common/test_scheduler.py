@@ -9,7 +9,6 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
-import time
 from datetime import datetime, timedelta
 from random import choice, seed
 from unittest import TestCase
@@ -24,7 +23,7 @@ from crontab import CronTab
 from dateutil.parser import parse
 
 # gevent
-from gevent import sleep, spawn
+from gevent import sleep
 
 # mock
 from mock import patch
@@ -103,47 +102,6 @@ class IntervalTestCase(TestCase):
 
 class JobTestCase(TestCase):
 
-    def setUp(self):
-
-        class _datetime(datetime):
-
-            class datetime:
-                @staticmethod
-                def utcnow():
-                    return self.now
-
-            @staticmethod
-            def timedelta(*args, **kwargs):
-                return timedelta(*args, **kwargs)
-
-        self._datetime = _datetime
-
-    def check_ctx(self, ctx, job, interval_in_seconds, max_repeats, idx, cb_kwargs,
-            len_runs_ctx, job_type=SCHEDULER.JOB_TYPE.INTERVAL_BASED):
-
-        self.assertEquals(ctx['name'], job.name)
-        self.assertEquals(ctx['max_repeats'], job.max_repeats)
-        self.assertDictEqual(ctx['cb_kwargs'], job.cb_kwargs)
-
-        if job_type == SCHEDULER.JOB_TYPE.INTERVAL_BASED:
-            self.assertEquals(ctx['interval_in_seconds'], interval_in_seconds)
-        else:
-            self.assertEquals(ctx['cron_definition'], DEFAULT_CRON_DEFINITION)
-
-        self.assertEquals(ctx['max_repeats'], max_repeats)
-        self.assertEquals(ctx['current_run'], idx)
-        self.assertDictEqual(ctx['cb_kwargs'], cb_kwargs)
-
-        func = self.assertFalse if idx < len_runs_ctx else self.assertTrue
-        func(ctx['max_repeats_reached'])
-
-        # Don't check an exact time. Simply parse it out and confirm it's in the past.
-        start_time = parse(ctx['start_time'])
-        now = datetime.utcnow()
-        self.assertTrue(start_time < now, 'start_time:`{}` is not less than now:`{}`'.format(start_time, now))
-
-        self.assertTrue(is_like_cid(ctx['cid']))
-
     def test_clone(self):
 
         interval = Interval(seconds=5)
@@ -219,143 +177,69 @@ class JobTestCase(TestCase):
 
             self.assertDictEqual(ctx, expected)
 
-    def test_main_loop_keep_running_false(self):
+    def test_on_run(self):
 
         job = get_job()
-        job.keep_running = False
-
-        self.assertTrue(job.main_loop())
-        self.assertFalse(job.keep_running)
-        self.assertFalse(job.max_repeats_reached)
 
-        self.assertEquals(job.current_run, 0)
+        job.on_run()
+        job.on_run()
 
-    def test_main_loop_max_repeats_reached(self):
+        self.assertTrue(job.keep_running)
+        self.assertFalse(job.max_repeats_reached)
+        self.assertEquals(job.current_run, 2)
 
-        runs_ctx = []
+    def test_on_run_max_repeats_reached(self):
 
-        def callback(ctx):
-            runs_ctx.append(ctx)
+        data = {'job':None, 'called':0}
 
-        cb_kwargs = {
-            rand_string():rand_string(),
-            rand_string():rand_string()
-        }
+        def on_max_repeats_reached_cb(job):
+            data['job'] = job
+            data['called'] += 1
 
-        interval_in_seconds = 0.01
         max_repeats = choice(range(2, 5))
 
-        job = get_job(interval_in_seconds=interval_in_seconds, max_repeats=max_repeats)
-        job.callback = callback
-        job.cb_kwargs = cb_kwargs
-
-        self.assertTrue(job.main_loop())
-        sleep(0.2)
+        job = get_job(max_repeats=max_repeats)
+        job.on_max_repeats_reached_cb = on_max_repeats_reached_cb
 
-        len_runs_ctx = len(runs_ctx)
-        self.assertEquals(len_runs_ctx, max_repeats)
+        for x in range(max_repeats):
+            self.assertTrue(job.keep_running)
+            job.on_run()
 
         self.assertFalse(job.keep_running)
-        self.assertIs(job.callback, callback)
-
-        for idx, ctx in enumerate(runs_ctx, 1):
-            self.check_ctx(ctx, job, interval_in_seconds, max_repeats, idx, cb_kwargs, len_runs_ctx)
-
-    def test_main_loop_sleep_spawn_called(self):
-
-        wait_time = 0.2
-        sleep_time = rand_int()
-
-        now_values = [parse('2019-12-23 22:19:03'), parse('2021-05-13 17:35:48')]
-
-        sleep_history = []
-        spawn_history = []
-        sleep_time_history = []
-
-        def sleep(value):
-            if value != wait_time:
-                sleep_history.append(value)
-
-        def spawn(*args, **kwargs):
-            spawn_history.append([args, kwargs])
-
-        def get_sleep_time(*args, **kwargs):
-            sleep_time_history.append(args[1])
-            return sleep_time
-
-        with patch('gevent.sleep', sleep):
-            with patch('zato.scheduler.backend.Job._spawn', spawn):
-                with patch('zato.scheduler.backend.Job.get_sleep_time', get_sleep_time):
-                    for now in now_values:
-                        self.now = now
-                        with patch('zato.scheduler.backend.datetime', self._datetime):
-                            for job_type in SCHEDULER.JOB_TYPE.CRON_STYLE, SCHEDULER.JOB_TYPE.INTERVAL_BASED:
-
-                                max_repeats = choice(range(2, 5))
-
-                                cb_kwargs = {
-                                    rand_string():rand_string(),
-                                    rand_string():rand_string()
-                                }
-
-                                interval = Interval(seconds=sleep_time) if job_type == SCHEDULER.JOB_TYPE.INTERVAL_BASED \
-                                    else CronTab(DEFAULT_CRON_DEFINITION)
-
-                                job = Job(rand_int(), rand_string(), job_type, interval, max_repeats=max_repeats)
-
-                                if job.type == SCHEDULER.JOB_TYPE.CRON_STYLE:
-                                    job.cron_definition = DEFAULT_CRON_DEFINITION
-
-                                job.cb_kwargs = cb_kwargs
-                                job.start_time = datetime.utcnow()
-                                job.callback = dummy_callback
-
-                                self.assertTrue(job.main_loop())
-                                time.sleep(0.5)
-
-                                self.assertEquals(max_repeats, len(sleep_history))
-                                self.assertEquals(max_repeats, len(spawn_history))
-
-                                for item in sleep_history:
-                                    self.assertEquals(sleep_time, item)
-
-                                for idx, (callback, ctx_dict) in enumerate(spawn_history, 1):
-                                    self.assertEquals(2, len(callback))
-                                    callback = callback[1]
-                                    self.check_ctx(
-                                        ctx_dict['ctx'], job, sleep_time, max_repeats, idx, cb_kwargs, len(spawn_history), job_type)
-                                    self.assertIs(callback, dummy_callback)
-
-                                del sleep_history[:]
-                                del spawn_history[:]
+        self.assertTrue(job.max_repeats_reached)
+        self.assertTrue(job.max_repeats_reached_at <= datetime.utcnow())
+        self.assertEquals(job.current_run, max_repeats)
 
-                            for item in sleep_time_history:
-                                self.assertEquals(item, now)
+        self.assertIs(data['job'], job)
+        self.assertEquals(data['called'], 1)
 
-                            del sleep_time_history[:]
+    def test_get_next_run_time_interval_based(self):
 
-    def test_run(self):
+        run_time = parse('2019-12-23 22:19:03')
+        job = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=5), run_time)
 
-        data = {'main_loop_called':False, 'sleep': False}
+        # The next run is computed off the previous one's scheduled time, not the time it was dispatched at
+        now = parse('2019-12-23 22:19:03.350')
+        self.assertEquals(job.get_next_run_time(run_time, now), parse('2019-12-23 22:19:08'))
 
-        def main_loop():
-            data['main_loop_called'] = True
+        # Runs missed because the scheduler fell behind are skipped
+        now = parse('2019-12-23 22:19:21.500')
+        self.assertEquals(job.get_next_run_time(run_time, now), parse('2019-12-23 22:19:23'))
 
-        def sleep(value):
-            data['sleep'] = value # Should not be executed if start_time is None
+        # The same if now is exactly at the boundary of a missed run
+        now = parse('2019-12-23 22:19:23')
+        self.assertEquals(job.get_next_run_time(run_time, now), parse('2019-12-23 22:19:28'))
 
-        start_time = datetime.utcnow() + timedelta(seconds=1.2)
+    def test_get_next_run_time_cron_style(self):
 
-        with patch('gevent.sleep', sleep):
+        run_time = parse('2015-11-27 19:13:00')
+        job = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.CRON_STYLE, CronTab(DEFAULT_CRON_DEFINITION), run_time)
 
-            job = get_job()
-            job.main_loop = main_loop
-            job.start_time = start_time
+        now = parse('2015-11-27 19:13:00.250')
+        self.assertEquals(job.get_next_run_time(run_time, now), parse('2015-11-27 19:14:00'))
 
-            job.run()
-
-            self.assertTrue(data['main_loop_called'])
-            self.assertEquals(data['sleep'], 1)
+        now = parse('2015-11-27 19:16:37.274')
+        self.assertEquals(job.get_next_run_time(run_time, now), parse('2015-11-27 19:17:00'))
 
     def test_hash_eq(self):
         job1 = get_job(name='a')
@@ -402,39 +286,17 @@ class JobStartTimeTestCase(TestCase):
         expected = parse(expected)
 
         interval = 1 # Days
-        data = {'start_time':[], 'now':[]}
-
-        def wait_iter_cb(start_time, now, *ignored):
-            data['start_time'].append(start_time)
-            data['now'].append(now)
 
         with patch('zato.scheduler.backend.datetime', self._datetime):
 
             interval = Interval(days=interval)
             job = Job(rand_int(), rand_string(), SCHEDULER.JOB_TYPE.INTERVAL_BASED, start_time=start_time, interval=interval)
-            job.wait_iter_cb = wait_iter_cb
-            job.wait_sleep_time = 0.1
 
             self.assertEquals(job.start_time, expected)
             self.assertTrue(job.keep_running)
             self.assertFalse(job.max_repeats_reached)
             self.assertIs(job.max_repeats_reached_at, None)
 
-            spawn(job.run)
-            sleep(0.2)
-
-            len_start_time = len(data['start_time'])
-            len_now = len(data['now'])
-
-            self.assertNotEquals(len_start_time, 0)
-            self.assertNotEquals(len_now, 0)
-
-            for item in data['start_time']:
-                self.assertEquals(expected, item)
-
-            for item in data['now']:
-                self.assertEquals(self.now, item)
-
     def test_get_start_time_result_in_future(self):
         self.check_get_start_time('2017-03-20 19:11:37', '2017-03-21 15:11:37', '2017-03-21 19:11:37')
 
@@ -456,6 +318,23 @@ class JobStartTimeTestCase(TestCase):
             self.assertEquals(job.max_repeats_reached_at, expected)
             self.assertFalse(job.start_time)
 
+    def test_get_start_time_now_equal_to_run_time(self):
+        self.check_get_start_time('2017-03-20 19:11:37', '2017-03-22 19:11:37', '2017-03-22 19:11:37')
+
+    def test_get_start_time_short_interval_long_ago(self):
+        start_time = parse('2017-03-20 19:11:23.789')
+        self.now = parse('2019-05-13 05:19:37.150')
+
+        with patch('zato.scheduler.backend.datetime', self._datetime):
+
+            interval = Interval(seconds=7)
+            job = Job(rand_int(), rand_string(), SCHEDULER.JOB_TYPE.INTERVAL_BASED, start_time=start_time, interval=interval)
+
+            # There were 9,669,671 runs between start_time and now, the next one is at 05:19:40
+            self.assertEquals(job.start_time, parse('2019-05-13 05:19:40'))
+            self.assertTrue(job.keep_running)
+            self.assertFalse(job.max_repeats_reached)
+
 class SchedulerTestCase(TestCase):
 
     def test_create(self):
@@ -468,11 +347,11 @@ class SchedulerTestCase(TestCase):
         def job_run(*ignored):
             pass
 
-        def spawn(scheduler_instance, func):
-            self.assertIs(func, job_run)
+        def schedule(scheduler_instance, job, run_time):
+            self.assertIs(run_time, job.start_time)
             data['spawned_jobs'] += 1
 
-        with patch('zato.scheduler.backend.Scheduler._spawn', spawn):
+        with patch('zato.scheduler.backend.Scheduler._schedule', schedule):
 
             scheduler = Scheduler(get_scheduler_config(), None)
             scheduler.lock = RLock()
@@ -582,13 +461,11 @@ class SchedulerTestCase(TestCase):
     def test_on_max_repeats_reached(self):
 
         test_wait_time = 0.5
-        job_sleep_time = 0.02
         job_max_repeats = 3
 
         data = {'job':None, 'called':0}
 
         job = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=0.1), max_repeats=job_max_repeats)
-        job.wait_sleep_time = job_sleep_time
 
         # Just to make sure it's inactive by default.
         self.assertTrue(job.is_active)
@@ -626,11 +503,14 @@ class SchedulerTestCase(TestCase):
         job_sleep_time = 10
         job_max_repeats = 30
 
-        job1 = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=0.1), max_repeats=job_max_repeats)
-        job1.wait_sleep_time = job_sleep_time
+        # The jobs will not be due until long after the test completes
+        start_time = datetime.utcnow() + timedelta(seconds=job_sleep_time)
+
+        job1 = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=0.1), start_time,
+            max_repeats=job_max_repeats)
 
-        job2 = Job(rand_int(), 'b', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=0.1), max_repeats=job_max_repeats)
-        job2.wait_sleep_time = job_sleep_time
+        job2 = Job(rand_int(), 'b', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=0.1), start_time,
+            max_repeats=job_max_repeats)
 
         scheduler = Scheduler(get_scheduler_config(), None)
         scheduler.lock = RLock()
@@ -654,62 +534,52 @@ class SchedulerTestCase(TestCase):
         # 1+2+1 = 4
         self.assertEquals(scheduler.lock.called, 4)
 
-    def test_job_greenlets(self):
-
-        data = {'spawned':[], 'stopped': []}
+    def test_job_heap(self):
 
-        class FakeGreenlet(object):
-            def __init__(_self, run):
-                _self.run = _self._run = run
+        data = {'ctx':[]}
 
-            def kill(_self, *args, **kwargs):
-                data['stopped'].append([_self, args, kwargs])
+        def on_job_executed(ctx, *ignored):
+            data['ctx'].append(ctx)
 
-        def spawn(scheduler_instance, job, *args, **kwargs):
-            g = FakeGreenlet(job)
-            data['spawned'].append(g)
-            return g
+        start_time = datetime.utcnow() + timedelta(seconds=10)
 
-        with patch('zato.scheduler.backend.Scheduler._spawn', spawn):
+        job1 = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=5), start_time)
+        job2 = Job(rand_int(), 'b', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=5), start_time)
 
-            test_wait_time = 0.5
-            job_sleep_time = 10
-            job_max_repeats = 30
+        scheduler = Scheduler(get_scheduler_config(), None)
+        scheduler.on_job_executed = on_job_executed
 
-            job1 = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=0.1), max_repeats=job_max_repeats)
-            job1.wait_sleep_time = job_sleep_time
+        scheduler.create(job1)
+        scheduler.create(job2)
 
-            job2 = Job(rand_int(), 'b', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=0.1), max_repeats=job_max_repeats)
-            job2.wait_sleep_time = job_sleep_time
+        self.assertEquals(len(scheduler.job_heap), 2)
 
-            scheduler = Scheduler(get_scheduler_config(), None)
-            scheduler.lock = RLock()
-            scheduler.iter_cb = iter_cb
-            scheduler.iter_cb_args = (scheduler, datetime.utcnow() + timedelta(seconds=test_wait_time))
+        scheduler.unschedule(job1)
 
-            scheduler.create(job1)
-            scheduler.create(job2)
-            scheduler.run()
+        self.assertFalse(job1.keep_running)
+        self.assertTrue(job2.keep_running)
 
-            self.assertEquals(scheduler.job_greenlets[job1.name]._run, job1.run)
-            self.assertEquals(scheduler.job_greenlets[job2.name]._run, job2.run)
+        # Nothing is due yet
+        scheduler.dispatch(start_time - timedelta(seconds=1))
+        sleep(0.1)
 
-            self.assertTrue(job1.keep_running)
-            self.assertTrue(job2.keep_running)
+        self.assertEquals(data['ctx'], [])
+        self.assertEquals(len(scheduler.job_heap), 2)
 
-            scheduler.unschedule(job1)
+        # Both jobs are due but job1 is skipped because it was unscheduled
+        scheduler.dispatch(start_time)
+        sleep(0.1)
 
-            self.assertFalse(job1.keep_running)
-            self.assertTrue(job2.keep_running)
+        self.assertEquals(len(data['ctx']), 1)
+        self.assertEquals(data['ctx'][0]['name'], 'b')
+        self.assertEquals(data['ctx'][0]['current_run'], 1)
 
-            self.assertNotIn(job1.name, scheduler.job_greenlets)
-            self.assertEquals(scheduler.job_greenlets[job2.name]._run, job2.run)
+        # Only job2 is scheduled again, exactly one interval after its previous run
+        self.assertEquals(len(scheduler.job_heap), 1)
 
-            self.assertEquals(len(data['stopped']), 1)
-            g, args, kwargs = data['stopped'][0]
-            self.assertIs(g.run.im_func, job1.run.im_func) # That's how we know it was job1 deleted not job2
-            self.assertIs(args, ())
-            self.assertDictEqual(kwargs, {'timeout':2.0, 'block':False})
+        run_time, _, job = scheduler.job_heap[0]
+        self.assertIs(job, job2)
+        self.assertEquals(run_time, start_time + timedelta(seconds=5))
 
     def test_edit(self):
 
@@ -722,7 +592,6 @@ class SchedulerTestCase(TestCase):
         start_time = datetime.utcnow()
         test_wait_time = 0.5
         job_interval1, job_interval2 = 2, 3
-        job_sleep_time = 10
         job_max_repeats1, job_max_repeats2 = 20, 30
 
         scheduler = Scheduler(get_scheduler_config(), None)
@@ -731,15 +600,14 @@ class SchedulerTestCase(TestCase):
         scheduler.iter_cb_args = (scheduler, datetime.utcnow() + timedelta(seconds=test_wait_time))
 
         def check(scheduler, job, label):
-            self.assertIn(job.name, scheduler.job_greenlets)
-            self.assertIn(job, scheduler.jobs)
-
-            self.assertEquals(1, len(scheduler.job_greenlets))
+            self.assertIn(job.name, scheduler.jobs)
             self.assertEquals(1, len(scheduler.jobs))
 
-            self.assertIs(job.run.im_func, scheduler.job_greenlets.values()[0]._run.im_func)
+            clone = list(scheduler.jobs.values())[0]
 
-            clone = list(scheduler.jobs)[0]
+            # Older versions of the job may still be in the heap but only the current one will be executed
+            scheduled = [elem[2] for elem in scheduler.job_heap if scheduler.jobs.get(elem[2].name) is elem[2]]
+            self.assertEquals(scheduled, [clone])
 
             for name in 'name', 'interval', 'cb_kwargs', 'max_repeats', 'is_active':
                 expected = getattr(job, name)
@@ -765,12 +633,10 @@ class SchedulerTestCase(TestCase):
         job1 = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=job_interval1), start_time, max_repeats=job_max_repeats1)
         job1.callback = callback
         job1.on_max_repeats_reached_cb = on_max_repeats_reached_cb
-        job1.wait_sleep_time = job_sleep_time
 
         job2 = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=job_interval2), start_time, max_repeats=job_max_repeats2)
         job2.callback = callback
         job2.on_max_repeats_reached_cb = on_max_repeats_reached_cb
-        job2.wait_sleep_time = job_sleep_time
 
         scheduler.run()
         scheduler.create(job1)
@@ -799,11 +665,9 @@ class SchedulerTestCase(TestCase):
             data['runs'].append(ctx)
 
         test_wait_time = 0.5
-        job_sleep_time = 0.1
         job_max_repeats = 10
 
         job = Job(rand_int(), 'a', SCHEDULER.JOB_TYPE.INTERVAL_BASED, Interval(seconds=0.1), max_repeats=job_max_repeats)
-        job.wait_sleep_time = job_sleep_time
         job.get_context = get_context
 
         scheduler = Scheduler(get_scheduler_config(), None)
@@ -819,3 +683,35 @@ class SchedulerTestCase(TestCase):
 
         for idx, item in enumerate(data['runs']):
             self.assertEquals(data['ctx'][idx], item)
+
+    def test_on_jobs_executed_cb(self):
+
+        data = {'batches':[], 'unscheduled':[]}
+
+        def on_jobs_executed_cb(ctx_list):
+            data['batches'].append(ctx_list)
+
+        def on_job_executed_cb(ctx):
+            raise Exception('Should not be called when there is a callback for batches')
+
+        def unschedule_by_name(name):
+            data['unscheduled'].append(name)
+
+        config = get_scheduler_config()
+        config.on_job_executed_cb = on_job_executed_cb
+        config.on_jobs_executed_cb = on_jobs_executed_cb
+
+        scheduler = Scheduler(config, None)
+        scheduler.unschedule_by_name = unschedule_by_name
+
+        ctx_list = [
+            {'name': 'a', 'type':SCHEDULER.JOB_TYPE.INTERVAL_BASED},
+            {'name': 'b', 'type':SCHEDULER.JOB_TYPE.ONE_TIME},
+            {'name': 'c', 'type':SCHEDULER.JOB_TYPE.CRON_STYLE},
+        ]
+
+        scheduler.on_jobs_executed(ctx_list)
+
+        # All the jobs were handed over to the callback in one call and only the one-time one was unscheduled
+        self.assertEquals(data['batches'], [ctx_list])
+        self.assertEquals(data['unscheduled'], ['b'])
@@ -21,6 +21,7 @@ from lxml import etree
 # Zato
 from zato.common.api import ParsingException, soap_body_xpath, zato_path
 from zato.common.util.api import util_api
+from zato.common.util.search import SearchResults
 from zato.common.py23_ import maxint
 from zato.common.test.tls_material import ca_cert
 
@@ -129,3 +130,36 @@ class TestAPIKeyUsername(TestCase):
         config = Bunch(username='x-aaa')
         util_api.update_apikey_username_to_channel(config)
         self.assertEquals(config.username, 'HTTP_X_AAA')
+
+# ################################################################################################################################
+
+class SearchResultsTestCase(TestCase):
+
+    def test_set_data_total(self):
+        result = SearchResults(None, [], [], 25)
+        result.set_data(1, 10)
+
+        self.assertDictEqual(result.to_dict(), {
+            'num_pages': 3, 'cur_page': 2, 'prev_page': 1, 'next_page': 3, 'has_prev_page': True, 'has_next_page': True,
+            'page_size': 10, 'total': 25})
+
+    def test_set_data_no_total(self):
+        result = SearchResults(None, [], [], None)
+        result.has_next_page = True
+        result.next_after = 'abc'
+        result.set_data(0, 10)
+
+        self.assertDictEqual(result.to_dict(), {
+            'num_pages': None, 'cur_page': 1, 'prev_page': 0, 'next_page': 2, 'has_prev_page': False, 'has_next_page': True,
+            'page_size': 10, 'total': None, 'next_after': 'abc', 'total_is_approximate': False})
+
+    def test_set_data_keyset_approximate_total(self):
+        result = SearchResults(None, [], [], 100)
+        result.is_keyset = True
+        result.total_is_approximate = True
+        result.has_next_page = False
+        result.set_data(0, 10)
+
+        self.assertDictEqual(result.to_dict(), {
+            'num_pages': None, 'cur_page': None, 'prev_page': None, 'next_page': None, 'has_prev_page': True,
+            'has_next_page': False, 'page_size': 10, 'total': 100, 'next_after': None, 'total_is_approximate': True})
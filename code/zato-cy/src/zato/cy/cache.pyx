@@ -24,10 +24,10 @@ from arrow import Arrow
 from cpython.dict cimport PyDict_Contains, PyDict_DelItem, PyDict_GetItem, PyDict_Items, PyDict_Keys, PyDict_SetItem, \
     PyDict_Values
 from cpython.int cimport PyInt_AS_LONG,  PyInt_FromLong, PyInt_GetMax
-from cpython.list cimport PyList_GET_SIZE, PyList_Insert, PyList_SetSlice
-from cpython.object cimport Py_EQ, PyObject, PyObject_RichCompareBool
-from cpython.sequence cimport PySequence_ITEM
+from cpython.mem cimport PyMem_Free, PyMem_Malloc
+from cpython.object cimport PyObject
 from libc.stdint cimport uint64_t
+from libc.string cimport memset
 from posix.time cimport timeval, timezone, gettimeofday
 
 # gevent
@@ -61,6 +61,9 @@ class CACHE:
     DEFAULT_SIZE = _COMMON_CACHE.DEFAULT.MAX_SIZE
     MAX_ITEM_SIZE = _COMMON_CACHE.DEFAULT.MAX_ITEM_SIZE
 
+    # Minimum number of slots in the sequence tree used to compute positions of keys
+    MIN_SEQ_TREE_SIZE = 1024
+
 # ################################################################################################################################
 
 class KeyExpiredError(KeyError):
@@ -125,6 +128,14 @@ cdef class Entry:
         public object last_write_http
         public object prev_write_http
 
+        # Neighbours in the cache's LRU list - _prev is closer to the head (most recently used),
+        # _next is closer to the tail (least recently used).
+        Entry _prev
+        Entry _next
+
+        # Sequence number of the last time this entry was promoted to the head of the LRU list
+        long long _seq
+
     cpdef dict to_dict(self):
         return {
             'key': self.key,
@@ -207,7 +218,6 @@ cdef class Cache(object):
         public bint extend_expiry_on_get
         public bint extend_expiry_on_set
         public dict _data
-        public list _index
         public uint64_t misses
         public uint64_t hits
         public uint64_t set_ops
@@ -218,9 +228,26 @@ cdef class Cache(object):
         public object default_get # A singleton indicating that no default value was given for self.get
         public dict _regex_cache
 
+        # Most and least recently used entries - the LRU list is intrusive, i.e. entries point to each other
+        # so that promoting, evicting and deleting them are all O(1) operations.
+        Entry _head
+        Entry _tail
+
+        # A Fenwick tree over sequence numbers of entries - each live entry has exactly one sequence number
+        # and a key's position in the cache is the number of entries whose sequence numbers are greater than its own,
+        # which the tree lets us compute in O(log n) rather than by walking the LRU list.
+        long long *_seq_tree
+        Py_ssize_t _seq_tree_size
+        long long _seq_next
+
     def __cinit__(self):
         self._data = {}
-        self._index = []
+        self._head = None
+        self._tail = None
+        self._seq_tree = NULL
+        self._seq_tree_size = 0
+        self._seq_next = 0
+        self._reset_seq_tree(CACHE.MIN_SEQ_TREE_SIZE)
         self.hits_per_position = {}
         self._expired_on_op = []
         self.hits = 0
@@ -229,6 +256,9 @@ cdef class Cache(object):
         self.get_ops = 0
         self._regex_cache = {}
 
+    def __dealloc__(self):
+        PyMem_Free(self._seq_tree)
+
     def __init__(self, max_size=None, max_item_size=None, extend_expiry_on_get=True, extend_expiry_on_set=True, lock=None):
         self._lock = lock or RLock()
         self.default_get = object()
@@ -274,7 +304,7 @@ cdef class Cache(object):
 
     def __len__(self):
         with self._lock:
-            return PyList_GET_SIZE(self._index)
+            return len(self._data)
 
 # ################################################################################################################################
 
@@ -292,7 +322,7 @@ cdef class Cache(object):
 
     cpdef list keys_by_position(self):
         with self._lock:
-            return list(self._index)
+            return self._keys_by_position()
 
 # ################################################################################################################################
 
@@ -322,10 +352,11 @@ cdef class Cache(object):
 
     def get_slice(self, start, stop, step):
         with self._lock:
-            for key in self._index[start:stop:step]:
-                entry = self._data[key]
+            keys = self._keys_by_position()
+            for position in range(len(keys))[start:stop:step]:
+                entry = self._data[keys[position]]
                 as_dict = entry.to_dict()
-                as_dict['position'] = self._get_index(key)
+                as_dict['position'] = position
                 yield as_dict
 
 # ################################################################################################################################
@@ -336,7 +367,9 @@ cdef class Cache(object):
         # The attributes cleared below must be kept in sync with the ones from __cinit__.
         with self._lock:
             self._data.clear()
-            self._index[:] = []
+            self._head = None
+            self._tail = None
+            self._reset_seq_tree(CACHE.MIN_SEQ_TREE_SIZE)
             self.hits_per_position.clear()
             self._expired_on_op[:] = []
             self.hits = 0
@@ -354,10 +387,10 @@ cdef class Cache(object):
             return
         else:
             # We run under self.lock so at this point we know that the key was valid
-            # and _remove_from_index_by_idx is safe to call.
+            # and _unlink is safe to call.
             out = entry.value
             del self._data[key]
-            self._remove_from_index_by_idx(self._get_index(key))
+            self._unlink(entry)
 
             return out
 
@@ -601,38 +634,142 @@ cdef class Cache(object):
 
 # ################################################################################################################################
 
-    cdef inline long _get_index(self, object key):
-        """ C-only version of self.get_position that will always return a long - must be called only
-        if key is known to be in self._index or self._data and only with self._lock held.
+    cdef inline void _seq_tree_add(self, long long seq, long long delta):
+        """ Adds delta to the sequence tree's slot for seq. Must be called with self._lock held.
+        """
+        while seq < self._seq_tree_size:
+            self._seq_tree[seq] += delta
+            seq += seq & -seq
+
+# ################################################################################################################################
+
+    cdef inline long long _seq_tree_sum(self, long long seq):
+        """ Returns the number of live entries whose sequence numbers are lower than or equal to seq.
+        Must be called with self._lock held.
         """
-        cdef Py_ssize_t index_idx = 0
-        cdef Py_ssize_t cache_size = PyList_GET_SIZE(self._index)
-        cdef bint index_key_eq
+        cdef long long out = 0
 
-        while index_idx < cache_size:
-            if PyObject_RichCompareBool(PySequence_ITEM(self._index, index_idx), <object>key, Py_EQ):
-                return index_idx
-            index_idx += 1
+        while seq > 0:
+            out += self._seq_tree[seq]
+            seq -= seq & -seq
+
+        return out
 
 # ################################################################################################################################
 
-    cpdef object index(self, object key):
-        """ Returns position the key given on input currently holds or None if key is not found.
+    cdef _reset_seq_tree(self, Py_ssize_t size):
+        """ Allocates a new, empty, sequence tree with room for size sequence numbers. Must be called with self._lock held.
         """
-        with self._lock:
-            if PyDict_Contains(self._data, key):
-                return self._get_index(key)
+        cdef long long *seq_tree = <long long *>PyMem_Malloc(size * sizeof(long long))
+
+        if not seq_tree:
+            raise MemoryError()
+
+        memset(seq_tree, 0, size * sizeof(long long))
+
+        PyMem_Free(self._seq_tree)
+        self._seq_tree = seq_tree
+        self._seq_tree_size = size
+
+        # Slot 0 is never used by the tree
+        self._seq_next = 1
 
 # ################################################################################################################################
 
-    cdef inline object _remove_from_index_by_idx(self, long idx):
-        """ Remove object from from index by its position - this is what listremove in Objects/listobject.c does
-        and we use the same technique because there is no public PyList_Remove function. Returns the removed key.
+    cdef _renumber(self):
+        """ Called when all sequence numbers have been used up - assigns new numbers to all entries, from the least recently
+        to the most recently used one, in a new tree twice as big as the number of entries. This runs at most once per
+        as many promotions as there are entries in the cache, which keeps promotions O(1) amortised.
+        Must be called with self._lock held.
         """
-        cdef object index_key = PySequence_ITEM(self._index, idx)
-        PyList_SetSlice(self._index, idx, idx+1, <object>NULL)
+        cdef Entry entry = self._tail
+        cdef Py_ssize_t size = len(self._data) * 2
+
+        if size < CACHE.MIN_SEQ_TREE_SIZE:
+            size = CACHE.MIN_SEQ_TREE_SIZE
+
+        self._reset_seq_tree(size)
+
+        while entry is not None:
+            entry._seq = self._seq_next
+            self._seq_tree_add(entry._seq, 1)
+            self._seq_next += 1
+            entry = entry._prev
+
+# ################################################################################################################################
+
+    cdef inline _push_head(self, Entry entry):
+        """ Makes entry the most recently used one. The entry must not be linked already. Must be called with self._lock held.
+        """
+        # Make room for a new sequence number if there is none left - this needs to be done before the entry is linked
+        # because _renumber assigns new sequence numbers to all the linked entries.
+        if self._seq_next == self._seq_tree_size:
+            self._renumber()
+
+        entry._prev = None
+        entry._next = self._head
+
+        if self._head is not None:
+            self._head._prev = entry
+        else:
+            self._tail = entry
+
+        self._head = entry
 
-        return index_key
+        entry._seq = self._seq_next
+        self._seq_tree_add(entry._seq, 1)
+        self._seq_next += 1
+
+# ################################################################################################################################
+
+    cdef inline void _unlink(self, Entry entry):
+        """ Removes entry from the LRU list. Must be called with self._lock held.
+        """
+        if entry._prev is not None:
+            entry._prev._next = entry._next
+        else:
+            self._head = entry._next
+
+        if entry._next is not None:
+            entry._next._prev = entry._prev
+        else:
+            self._tail = entry._prev
+
+        entry._prev = None
+        entry._next = None
+
+        self._seq_tree_add(entry._seq, -1)
+
+# ################################################################################################################################
+
+    cdef inline long _get_index(self, Entry entry):
+        """ C-only version of self.index that will always return a long - must be called only
+        with an entry known to be in self._data and only with self._lock held.
+        """
+        return len(self._data) - self._seq_tree_sum(entry._seq)
+
+# ################################################################################################################################
+
+    cdef list _keys_by_position(self):
+        """ Returns all keys, from the most recently to the least recently used one. Must be called with self._lock held.
+        """
+        cdef list out = []
+        cdef Entry entry = self._head
+
+        while entry is not None:
+            out.append(entry.key)
+            entry = entry._next
+
+        return out
+
+# ################################################################################################################################
+
+    cpdef object index(self, object key):
+        """ Returns position the key given on input currently holds or None if key is not found.
+        """
+        with self._lock:
+            if PyDict_Contains(self._data, key):
+                return self._get_index(<Entry>PyDict_GetItem(self._data, key))
 
 # ################################################################################################################################
 
@@ -657,12 +794,10 @@ cdef class Cache(object):
 
         cdef object out = None
         cdef Entry entry
+        cdef Entry evicted
         cdef double _now
         cdef double _orig_now = 0.0
-        cdef Py_ssize_t cache_size = PyList_GET_SIZE(self._index)
-        cdef Py_ssize_t index_idx
-        cdef bint old_key_eq
-        cdef long hits_per_position
+        cdef Py_ssize_t cache_size = len(self._data)
         cdef long len_value
 
         # If multiple processes synchronize contents of their caches, the one that originally added the keys
@@ -723,7 +858,9 @@ cdef class Cache(object):
 
             # Make sure there is room for the new key
             if cache_size == self.max_size:
-                PyDict_DelItem(self._data, self._index.pop())
+                evicted = self._tail
+                self._unlink(evicted)
+                PyDict_DelItem(self._data, evicted.key)
 
             # Actually insert entry
             entry = Entry()
@@ -739,7 +876,7 @@ cdef class Cache(object):
             entry.set_metadata()
 
             PyDict_SetItem(self._data, key, entry)
-            PyList_Insert(self._index, 0, key)
+            self._push_head(entry)
 
         # If any output dict for metadata was passed in by reference, set its requires items.
         if meta_ref is not None:
@@ -1075,8 +1212,6 @@ cdef class Cache(object):
         cdef object _item
         cdef Entry entry
         cdef Py_ssize_t index_idx
-        cdef Py_ssize_t cache_size
-        cdef object index_key
         cdef double _now = self._get_timestamp()
 
         try:
@@ -1105,7 +1240,7 @@ cdef class Cache(object):
             self.hits += 1
 
             # Current position of that key in index
-            index_idx = self._get_index(key)
+            index_idx = self._get_index(entry)
 
             # We have the key's position so we can now update per-position counter
             # to be able to offer statistics on how often a key is found at a given position.
@@ -1113,11 +1248,10 @@ cdef class Cache(object):
             hits_per_position += 1
             PyDict_SetItem(self.hits_per_position, index_idx, PyInt_FromLong(hits_per_position))
 
-            # Remove key from index
-            index_key = self._remove_from_index_by_idx(index_idx)
-
-            # Now insert the key back at the head position.
-            PyList_Insert(self._index, 0, index_key)
+            # Move the entry to the head position unless it is already there.
+            if entry is not self._head:
+                self._unlink(entry)
+                self._push_head(entry)
 
             # Update last/prev access information + hits
             entry.prev_read = entry.last_read
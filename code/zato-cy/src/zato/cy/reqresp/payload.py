@@ -11,6 +11,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
+from collections.abc import Iterator
 from copy import deepcopy
 from logging import getLogger
 from operator import getitem
@@ -26,7 +27,7 @@ from zato.common.api import DATA_FORMAT
 from zato.common.odb.api import WritableKeyedTuple
 
 # Zato - Cython
-from zato.simpleio import CySimpleIO, SIODefinition
+from zato.simpleio import CySimpleIO, SIODefinition, StreamedOutput
 
 # Python 2/3 compatibility
 from past.builtins import unicode as past_unicode
@@ -62,10 +63,13 @@ class SimpleIOPayload(object):
     cid         = cy.declare(cy.object, visibility='public') # type: past_unicode
     data_format = cy.declare(cy.object, visibility='public') # type: past_unicode
 
-    # One of the two will be used to produce a response
+    # One of the two will be used to produce a response ..
     user_attrs_dict = cy.declare(dict, visibility='public') # type: dict
     user_attrs_list = cy.declare(list, visibility='public') # type: list
 
+    # .. unless the response is to be streamed out of an iterator.
+    user_attrs_iter = cy.declare(cy.object, visibility='public') # type: object
+
     # This is used by Zato internal services only
     zato_meta = cy.declare(cy.object, visibility='public') # type: object
 
@@ -79,6 +83,7 @@ class SimpleIOPayload(object):
         self.data_format = data_format
         self.user_attrs_dict = {}
         self.user_attrs_list = []
+        self.user_attrs_iter = None
         self.zato_meta = None
 
 # ################################################################################################################################
@@ -169,6 +174,7 @@ class SimpleIOPayload(object):
         # First, clear out what was potentially set earlier
         self.user_attrs_dict.clear()
         self.user_attrs_list[:] = []
+        self.user_attrs_iter = None
 
         value = self._preprocess_payload_attrs(value)
         is_dict:cy.bint = isinstance(value, dict)
@@ -182,7 +188,13 @@ class SimpleIOPayload(object):
             if hasattr(value, 'to_zato'):
                 value = value.to_zato()
 
-            if isinstance(value, (list, tuple)):
+            # Iterators, e.g. generators, are not read until the response is being serialised
+            # which lets it be streamed to a client without keeping all of it in memory.
+            if isinstance(value, Iterator):
+                self.user_attrs_iter = value
+                self.output_repeated = True
+
+            elif isinstance(value, (list, tuple)):
                 for item in value:
                     self.user_attrs_list.append(self._extract_payload_attrs(item))
             else:
@@ -198,6 +210,19 @@ class SimpleIOPayload(object):
             if force_dict_serialisation:
                 serialize = True
 
+        if self.user_attrs_iter is not None:
+
+            # Only responses serialised to strings, and without metadata, can be streamed ..
+            if serialize and self.data_format != DATA_FORMAT_DICT and not self.zato_meta:
+                return StreamedOutput(self.sio.get_output_stream(
+                    map(self._extract_payload_attrs, self.user_attrs_iter), self.data_format))
+
+            # .. otherwise, all of the items need to be read now.
+            else:
+                for item in self.user_attrs_iter:
+                    self.user_attrs_list.append(self._extract_payload_attrs(item))
+                self.user_attrs_iter = None
+
         # If data format is DICT, we force serialisation to that format
         # unless overridden on input.
         value = self.user_attrs_list if self.output_repeated else self.user_attrs_dict
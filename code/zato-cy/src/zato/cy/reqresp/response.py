@@ -28,6 +28,9 @@ from sqlalchemy.util import KeyedTuple
 from zato.common.api import simple_types, ZATO_OK
 from zato.cy.reqresp.payload import SimpleIOPayload
 
+# Zato - Cython
+from zato.simpleio import StreamedOutput
+
 # Python 2/3 compatibility
 from past.builtins import unicode as past_unicode
 
@@ -45,7 +48,7 @@ logger = getLogger('zato')
 
 # ################################################################################################################################
 
-direct_payload:tuple = simple_types + (EtreeElement, ObjectifiedElement)
+direct_payload:tuple = simple_types + (EtreeElement, ObjectifiedElement, StreamedOutput)
 
 # ################################################################################################################################
 # ################################################################################################################################
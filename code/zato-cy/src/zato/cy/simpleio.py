@@ -13,11 +13,12 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 # stdlib
 import types
 from builtins import bool as stdlib_bool
+from collections.abc import Iterator
 from copy import deepcopy
 from csv import DictWriter, reader as csv_reader
 from datetime import date as stdlib_date, datetime as stdlib_datetime
 from decimal import Decimal as decimal_Decimal
-from io import StringIO
+from io import BytesIO, StringIO
 from json import JSONEncoder
 from itertools import chain
 from logging import getLogger
@@ -31,7 +32,7 @@ import cython as cy
 from dateutil.parser import parse as dt_parse
 
 # lxml
-from lxml.etree import _Element as EtreeElementClass, Element, SubElement, tostring as etree_to_string, XPath
+from lxml.etree import _Element as EtreeElementClass, Element, SubElement, tostring as etree_to_string, xmlfile, XPath
 
 # Zato
 from zato.common.api import APISPEC, DATA_FORMAT, ZATO_NONE
@@ -60,6 +61,9 @@ _list_like = (list, tuple)
 # Default value added for backward-compatibility with SimpleIO definitions created before the rewrite in Cython.
 backward_compat_default_value = ''
 
+# Streamed output is buffered until it reaches this many characters, which are then returned as a single chunk
+stream_chunk_size = 65536
+
 prefix_optional = '-'
 
 # Dictionaries that map our own CSV parameters to stdlib's ones
@@ -149,6 +153,33 @@ class ServiceInput(Bunch):
 
 # ################################################################################################################################
 
+@cy.cclass
+class StreamedOutput(object):
+    """ Output of a service serialised incrementally - iterating over it returns subsequent chunks of the response
+    as they are produced rather than the whole of it built in memory first.
+    """
+    chunks = cy.declare(object, visibility='public') # type: object
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def getvalue(self):
+        """ Returns all the chunks joined, for callers that need the complete output after all.
+        Chunks may be bytes, e.g. if they were compressed, in which case the result is bytes too.
+        """
+        chunks = list(self.chunks)
+
+        for chunk in chunks:
+            if isinstance(chunk, bytes):
+                return b''.join(elem if isinstance(elem, bytes) else elem.encode('utf8') for elem in chunks)
+
+        return ''.join(chunks)
+
+# ################################################################################################################################
+
 @cy.cclass
 class SIODefault(object):
 
@@ -411,17 +442,17 @@ class Elem(object):
             raise NotImplementedError('{} - operation not implemented'.format(func))
         return _inner
 
-    from_json = Elem._not_implemented('Elem.from_json')
-    to_json   = Elem._not_implemented('Elem.to_json')
+    from_json = _not_implemented.__func__('Elem.from_json')
+    to_json   = _not_implemented.__func__('Elem.to_json')
 
-    from_xml  = Elem._not_implemented('Elem.from_xml')
-    to_xml    = Elem._not_implemented('Elem.to_xml')
+    from_xml  = _not_implemented.__func__('Elem.from_xml')
+    to_xml    = _not_implemented.__func__('Elem.to_xml')
 
-    from_csv  = Elem._not_implemented('Elem.from_csv')
-    to_csv    = Elem._not_implemented('Elem.to_csv')
+    from_csv  = _not_implemented.__func__('Elem.from_csv')
+    to_csv    = _not_implemented.__func__('Elem.to_csv')
 
-    from_dict  = Elem._not_implemented('Elem.from_dict')
-    to_dict    = Elem._not_implemented('Elem.to_dict')
+    from_dict  = _not_implemented.__func__('Elem.from_dict')
+    to_dict    = _not_implemented.__func__('Elem.to_dict')
 
 # ################################################################################################################################
 
@@ -1921,7 +1952,8 @@ class CySimpleIO(object):
         yield list(required_elems.keys())
         yield list(optional_elems.keys())
 
-        input_data:list = data if isinstance(data, (list, tuple)) else [data]
+        # Iterators are always treated as lists, possibly lazily producing items of data
+        input_data:object = data if isinstance(data, (list, tuple, Iterator)) else [data]
 
         # 1st item = is_required
         # 2nd item = elems dict
@@ -2122,6 +2154,138 @@ class CySimpleIO(object):
         else:
             raise ValueError('Unrecognised output data format `{}`'.format(data_format))
 
+# ################################################################################################################################
+
+    def _yield_output_json(self, data:object):
+
+        # Elements are converted the same way as in non-streamed JSON responses, i.e. through dicts
+        gen = self._yield_data_dicts(data, DATA_FORMAT_DICT)
+
+        # Ignore field names, not needed in JSON serialisation
+        next(gen)
+        next(gen)
+
+        encode = self.server_config.json_encoder.encode
+
+        # Wrap the response in a top-level element if needed
+        if self.definition._has_response_elem:
+            prefix = '{' + encode(self.definition._response_elem) + ': ['
+            suffix = ']}'
+        else:
+            prefix = '['
+            suffix = ']'
+
+        buff:list = [prefix]
+        buff_len:int = len(prefix)
+        separator:cy.unicode = ''
+        elem:cy.unicode
+
+        for data_dict in gen:
+            elem = separator + encode(data_dict)
+            buff.append(elem)
+            buff_len += len(elem)
+            separator = ', '
+
+            if buff_len >= stream_chunk_size:
+                yield ''.join(buff)
+                buff[:] = []
+                buff_len = 0
+
+        buff.append(suffix)
+        yield ''.join(buff)
+
+# ################################################################################################################################
+
+    def _yield_output_xml(self, data:object):
+        """ Yields bytes in the encoding declared for the response - they are never decoded because a chunk boundary
+        may fall in the middle of a multi-byte character.
+        """
+        # Elements are converted the same way as in non-streamed XML responses, i.e. through dicts
+        gen = self._yield_data_dicts(data, DATA_FORMAT_DICT)
+
+        # Ignore field names, not needed in XML serialisation
+        next(gen)
+        next(gen)
+
+        root:cy.unicode = self.definition._response_elem or 'response'
+        namespace:cy.unicode = self.definition._xml_config.namespace or ''
+        if namespace:
+            namespace = '{'+ namespace + '}'
+
+        encoding:cy.unicode = self.definition._xml_config.encoding
+        pretty_print:cy.bint = self.definition._xml_config.pretty_print
+        buff:BytesIO = BytesIO()
+
+        with xmlfile(buff, encoding=encoding) as xml_file:
+
+            if self.definition._xml_config.declaration:
+                xml_file.write_declaration()
+
+            with xml_file.element('{}{}'.format(namespace, root)):
+                for data_dict in gen:
+                    xml_item = Element('{}{}'.format(namespace, 'item'))
+                    self._convert_dict_to_xml(xml_item, namespace, data_dict)
+                    xml_file.write(xml_item, pretty_print=pretty_print)
+
+                    if buff.tell() >= stream_chunk_size:
+                        yield buff.getvalue()
+                        buff.seek(0)
+                        buff.truncate()
+
+        yield buff.getvalue()
+
+# ################################################################################################################################
+
+    def _yield_output_csv(self, data:object):
+
+        gen = self._yield_data_dicts(data, DATA_FORMAT_CSV)
+
+        # First, get the field names
+        required_field_names:list = next(gen)
+        optional_field_names:list = next(gen)
+
+        buff:StringIO = StringIO()
+        writer:DictWriter = DictWriter(
+            buff, required_field_names + optional_field_names, **self.definition._csv_config.writer_config)
+
+        if self.definition._csv_config.should_write_header:
+            writer.writeheader()
+
+        for data_dict in gen:
+            writer.writerow(data_dict)
+
+            if buff.tell() >= stream_chunk_size:
+                yield buff.getvalue()
+                buff.seek(0)
+                buff.truncate()
+
+        yield buff.getvalue()
+
+# ################################################################################################################################
+
+    @cy.returns(object)
+    def get_output_stream(self, data:object, data_format:cy.unicode) -> object:
+        """ Returns output serialised incrementally, as an iterator of strings, each of them being a subsequent chunk
+        of the complete output. Input data is an iterator too and it is not read until the output is iterated over,
+        which means that not all of the data needs to be held in memory at once. XML chunks are bytes,
+        already in the encoding that the response declares.
+        """
+        # No reason to continue if no SimpleIO output is declared
+        if not (self.definition.has_output_required or self.definition.has_output_optional):
+            return iter([''])
+
+        if data_format == DATA_FORMAT_JSON:
+            return self._yield_output_json(data)
+
+        elif data_format == DATA_FORMAT_XML:
+            return self._yield_output_xml(data)
+
+        elif data_format == DATA_FORMAT_CSV:
+            return self._yield_output_csv(data)
+
+        else:
+            raise ValueError('Unrecognised streamed output data format `{}`'.format(data_format))
+
 # ################################################################################################################################
 
     @cy.returns(object)
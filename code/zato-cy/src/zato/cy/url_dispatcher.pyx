@@ -10,11 +10,15 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import re as stdlib_re
+from collections import OrderedDict
 from datetime import datetime
 from logging import getLogger
 from operator import itemgetter
 from uuid import uuid4
 
+# Cython
+from libc.stdint cimport uint64_t
+
 # regex
 from regex import compile as re_compile
 
@@ -23,6 +27,7 @@ from zato.bunch import bunchify
 from zato.common.api import HTTP_SOAP, MISC, TRACE1
 
 http_any_internal = HTTP_SOAP.ACCEPT.ANY_INTERNAL
+url_match_cache_size = HTTP_SOAP.URL_MATCH_CACHE_SIZE
 
 # ################################################################################################################################
 
@@ -39,6 +44,16 @@ unused_marker = 'unused'
 
 _internal_url_path_indicator = '{}/zato/'.format(target_separator)
 
+# Characters which, if found in a part of a match target, mean that this part is a regular expression
+# rather than a literal value that could be used as a key in routing tables.
+_regex_meta_chars = frozenset('.^$*+?()[]\\|{}')
+
+# Matches alternatives of HTTP methods allowed, e.g. (GET|POST|PUT)
+_http_method_alternatives = re_compile(r'^\(([A-Z|]+)\)$')
+
+# Used as a key in routing tables to indicate that any value can be matched
+_route_any = object()
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -52,7 +67,7 @@ cdef class Matcher(object):
         public unicode pattern
         public object matcher
         object match_func
-        public bint is_static, is_internal
+        public bint is_static, is_internal, match_slash
         object _brace_pattern
         object _elem_re_template
         set ignore_http_methods
@@ -62,6 +77,7 @@ cdef class Matcher(object):
         # If True, we will include slashes in pattern matching,
         # otherwise they will not be taken into account.
         slash_pattern = '\/' if match_slash else ''
+        self.match_slash = bool(match_slash)
 
         # HTTP methods to ignore in case one is set for a particular HTTP channel
         self.ignore_http_methods = set(['CONNECT', 'DELETE', 'GET', 'HEAD', 'OPTIONS', 'PATCH', 'POST', 'PUT', 'TRACE'])
@@ -132,35 +148,331 @@ cdef class Matcher(object):
 # ################################################################################################################################
 # ################################################################################################################################
 
+cdef inline bint _is_literal(unicode value):
+    """ Returns True if the input part of a match target contains no regex characters.
+    """
+    cdef Py_UCS4 char
+
+    for char in value:
+        if char in _regex_meta_chars:
+            return False
+
+    return True
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+cdef class RouteNode(object):
+    """ A node in a tree of URL path segments. Each node points to its children, keyed by static path segments,
+    and to at most one child that matches any single segment, i.e. a {param} one.
+    """
+    cdef:
+        public dict static_children
+        public RouteNode param
+
+        # Channels whose patterns end at this node
+        public list items
+
+        # Channels whose patterns have this node's path as a prefix and whose remaining segments cannot be put in the tree,
+        # e.g. because they are regular expressions or parameters that may include slashes.
+        public list prefix_items
+
+    def __init__(self):
+        self.static_children = {}
+        self.param = None
+        self.items = []
+        self.prefix_items = []
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+cdef class URLRouter(object):
+    """ A routing tree of HTTP channels, keyed on SOAP action and HTTP method first and then on URL path segments.
+    It returns candidate channels for a match target, in the same order that they have in the channel list,
+    and each candidate is then confirmed by its own Matcher which also extracts path parameters.
+    The tree is a pre-filter only - channels are never returned if they could not match and they are always
+    returned in the order of precedence, which means that matching through the tree gives the same results
+    as trying each channel from the list in turn.
+    """
+    cdef:
+        public dict roots
+        public dict ranks
+
+    def __init__(self):
+        self.roots = {}
+        self.ranks = {}
+
+# ################################################################################################################################
+
+    cdef tuple _get_route(self, dict item):
+        """ Returns root keys and URL path segments under which a given channel should be kept.
+        """
+        cdef Matcher matcher = item['match_target_compiled']
+        cdef unicode soap_action, http_method, http_accept, url_path, segment
+        cdef list root_keys = []
+        cdef list segments = []
+        cdef bint is_prefix = False
+
+        soap_action, http_method, http_accept, url_path = matcher.pattern.split(target_separator, 3)
+
+        soap_action_key = soap_action if _is_literal(soap_action) else _route_any
+
+        if _is_literal(http_method):
+            http_method_keys = [http_method]
+        else:
+            alternatives = _http_method_alternatives.match(http_method)
+            http_method_keys = alternatives.group(1).split('|') if alternatives else [_route_any]
+
+        for http_method_key in http_method_keys:
+            root_keys.append((soap_action_key, http_method_key))
+
+        for segment in url_path.split('/'):
+
+            # A parameter that spans exactly one segment
+            if segment.startswith('{') and segment.endswith('}') and segment.count('{') == 1 and not matcher.match_slash:
+                segments.append(_route_any)
+
+            # A regular segment without any parameters or regex characters
+            elif _is_literal(segment):
+                segments.append(segment)
+
+            # Anything else means that this channel will be a candidate for all paths starting with what we have so far
+            else:
+                is_prefix = True
+                break
+
+        return root_keys, segments, is_prefix
+
+# ################################################################################################################################
+
+    cdef list _get_node_items(self, dict item, bint create):
+        """ Returns all lists that the input channel is, or should be, kept in.
+        """
+        cdef RouteNode node
+        cdef list out = []
+
+        root_keys, segments, is_prefix = self._get_route(item)
+
+        for root_key in root_keys:
+
+            node = self.roots.get(root_key)
+            if node is None:
+                if create:
+                    node = self.roots.setdefault(root_key, RouteNode())
+                else:
+                    continue
+
+            for segment in segments:
+                if segment is _route_any:
+                    if node.param is None:
+                        if create:
+                            node.param = RouteNode()
+                        else:
+                            break
+                    node = node.param
+                else:
+                    child = node.static_children.get(segment)
+                    if child is None:
+                        if create:
+                            child = node.static_children.setdefault(segment, RouteNode())
+                        else:
+                            break
+                    node = child
+
+            # We get here only if the whole path was found or created
+            else:
+                out.append(node.prefix_items if is_prefix else node.items)
+
+        return out
+
+# ################################################################################################################################
+
+    cpdef add(self, dict item):
+        """ Adds a new channel to the tree - set_order must be called afterwards to assign its precedence.
+        """
+        for items in self._get_node_items(item, True):
+            items.append(item)
+
+# ################################################################################################################################
+
+    cpdef remove(self, dict item):
+        """ Removes a channel from the tree, if it exists there at all.
+        """
+        cdef list items
+
+        for items in self._get_node_items(item, False):
+            for idx, elem in enumerate(items):
+                if elem is item:
+                    del items[idx]
+                    break
+
+        self.ranks.pop(id(item), None)
+
+# ################################################################################################################################
+
+    cpdef set_order(self, list channel_data):
+        """ Assigns precedence to each channel - the earlier it is on the list, the higher its precedence.
+        """
+        cdef Py_ssize_t idx
+        cdef dict ranks = {}
+
+        # A plain loop rather than a generator because closures are not supported in cpdef methods
+        for idx in range(len(channel_data)):
+            ranks[id(channel_data[idx])] = idx
+
+        self.ranks = ranks
+
+# ################################################################################################################################
+
+    cdef _collect(self, RouteNode node, list segments, Py_ssize_t idx, list out):
+        """ Collects all channels from the input node and its children that could match the input URL path segments.
+        """
+        cdef RouteNode child
+
+        if node.prefix_items:
+            out.extend(node.prefix_items)
+
+        if idx == len(segments):
+            out.extend(node.items)
+            return
+
+        segment = segments[idx]
+
+        child = node.static_children.get(segment)
+        if child is not None:
+            self._collect(child, segments, idx+1, out)
+
+        # Parameters never match empty segments
+        if node.param is not None and segment:
+            self._collect(node.param, segments, idx+1, out)
+
+# ################################################################################################################################
+
+    cpdef list get_candidates(self, unicode url_path, unicode soap_action, unicode http_method):
+        """ Returns all channels that may possibly match the input, in the order of their precedence.
+        """
+        cdef RouteNode node
+        cdef list out = []
+        cdef list segments = url_path.split('/')
+        cdef list by_rank
+        cdef dict ranks = self.ranks
+        cdef Py_ssize_t no_rank = len(ranks)
+
+        for root_key in ((soap_action, http_method), (soap_action, _route_any), (_route_any, http_method),
+            (_route_any, _route_any)):
+
+            node = self.roots.get(root_key)
+            if node is not None:
+                self._collect(node, segments, 0, out)
+
+        if len(out) > 1:
+
+            # The index in the middle is needed so that channels with the same rank are never compared themselves
+            by_rank = [(ranks.get(id(item), no_rank), idx, item) for idx, item in enumerate(out)]
+            by_rank.sort()
+            out = [elem[2] for elem in by_rank]
+
+        return out
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 cdef class CyURLData(object):
 
     cdef:
         public list channel_data
-        public dict url_path_cache
+        public URLRouter url_router
         bint has_trace1
 
-    def __init__(self, channel_data=None):
+        # An LRU cache of match targets already seen, static and with path parameters alike,
+        # each mapped to a (path parameters, channel, channel's match target) tuple.
+        public object url_match_cache
+        public long url_match_cache_max_size
+
+        # Match targets of each channel that are currently in cache - keyed by a channel's own match target
+        public dict url_match_cache_by_channel
+
+        public uint64_t url_match_cache_hits
+        public uint64_t url_match_cache_misses
+        public uint64_t url_match_cache_evictions
+
+    def __init__(self, channel_data=None, url_match_cache_max_size=url_match_cache_size):
         self.channel_data = channel_data
-        self.url_path_cache = {}
-        self.url_target_cache = {}
+        self.url_router = URLRouter()
         self.has_trace1 = logger.isEnabledFor(TRACE1)
 
+        self.url_match_cache = OrderedDict()
+        self.url_match_cache_max_size = url_match_cache_max_size
+        self.url_match_cache_by_channel = {}
+        self.url_match_cache_hits = 0
+        self.url_match_cache_misses = 0
+        self.url_match_cache_evictions = 0
+
+        for item in self.channel_data or []:
+            self.url_router.add(item)
+
+        self.url_router.set_order(self.channel_data or [])
+
 # ################################################################################################################################
 
-    cpdef _remove_from_cache(self, unicode match_target):
+    cdef _add_to_cache(self, unicode target, dict match, object item_bunch, unicode channel_match_target):
+        """ Adds a newly matched target to cache, evicting the least recently used one if there is no room left.
+        """
+        cdef set channel_targets
 
-        targets_to_remove = []
-        cached_targets = self.url_path_cache.keys()
+        if self.url_match_cache_max_size <= 0:
+            return
 
-        for target in cached_targets:
-            for item in self.channel_data:
-                matcher = item['match_target_compiled']
-                if matcher.pattern == match_target:
-                    if matcher.match(target) is not None:
-                        targets_to_remove.append(target)
+        if len(self.url_match_cache) >= self.url_match_cache_max_size:
+            old_target, (_, _, old_channel_match_target) = self.url_match_cache.popitem(last=False)
+            self.url_match_cache_by_channel[old_channel_match_target].discard(old_target)
+            self.url_match_cache_evictions += 1
+
+        # Store a copy so that our callers cannot modify what is in cache
+        self.url_match_cache[target] = (dict(match), item_bunch, channel_match_target)
+
+        channel_targets = self.url_match_cache_by_channel.get(channel_match_target)
+        if channel_targets is None:
+            channel_targets = self.url_match_cache_by_channel[channel_match_target] = set()
 
-        for target in targets_to_remove:
-            del self.url_path_cache[target]
+        channel_targets.add(target)
+
+# ################################################################################################################################
+
+    cpdef remove_from_cache_by_channel(self, unicode channel_match_target):
+        """ Removes from cache all the targets that a given channel was matched for.
+        """
+        for target in self.url_match_cache_by_channel.pop(channel_match_target, ()):
+            self.url_match_cache.pop(target, None)
+
+# ################################################################################################################################
+
+    cpdef remove_from_cache_by_matcher(self, Matcher matcher):
+        """ Removes from cache all the targets that a given matcher matches. Used when a new channel is created
+        because that channel may take precedence over the ones that some targets were previously matched for.
+        """
+        cdef list targets_to_remove = []
+
+        for target, (_, _, channel_match_target) in self.url_match_cache.items():
+            if matcher.match(target) is not None:
+                targets_to_remove.append((target, channel_match_target))
+
+        for target, channel_match_target in targets_to_remove:
+            del self.url_match_cache[target]
+            self.url_match_cache_by_channel[channel_match_target].discard(target)
+
+# ################################################################################################################################
+
+    cpdef dict get_cache_stats(self):
+        """ Returns statistics regarding the cache of matched targets.
+        """
+        return {
+            'size': len(self.url_match_cache),
+            'max_size': self.url_match_cache_max_size,
+            'hits': self.url_match_cache_hits,
+            'misses': self.url_match_cache_misses,
+            'evictions': self.url_match_cache_evictions,
+        }
 
 # ################################################################################################################################
 
@@ -170,10 +482,12 @@ cdef class CyURLData(object):
         """ Attemps to match the combination of SOAPt Action and URL path against
         the list of HTTP channel targets.
         """
-        cdef bint needs_user, has_target_in_cache=True
+        cdef bint needs_user
         cdef Matcher matcher
         cdef dict item
         cdef object item_bunch
+        cdef tuple cached
+        cdef list candidates
 
         cdef unicode target = ''
         target += soap_action
@@ -184,19 +498,17 @@ cdef class CyURLData(object):
         target += sep
         target += url_path
 
+        # Return from cache if already seen, marking the target as the most recently used one
         try:
-            self.url_target_cache[target]
-        except KeyError:
-            has_target_in_cache = False
-
-        # Return from cache if already seen
-        try:
-            ctx, channel_item = {}, self.url_path_cache[target]
-            return ctx, channel_item
+            cached = self.url_match_cache.pop(target)
         except KeyError:
+            self.url_match_cache_misses += 1
             needs_user = not url_path.startswith('/zato')
 
-            for item in self.channel_data:
+            # Only channels that could possibly match are checked, in the same order they have in self.channel_data
+            candidates = self.url_router.get_candidates(url_path, soap_action, http_method)
+
+            for item in candidates:
 
                 matcher = item['match_target_compiled']
                 if needs_user and matcher.is_internal:
@@ -209,14 +521,17 @@ cdef class CyURLData(object):
                         _log_trace1(_trace1, 'Matched target:`%s` with:`%r`', target, item)
 
                     item_bunch = _bunchify(item)
-
-                    # Cache that target but only if it's a static URL without dynamic variables
-                    if (not has_target_in_cache) and matcher.is_static:
-                        self.url_path_cache[target] = item_bunch
+                    self._add_to_cache(target, match, item_bunch, matcher.pattern)
 
                     return match, item_bunch
 
             return None, None
 
+        else:
+            self.url_match_cache_hits += 1
+            self.url_match_cache[target] = cached
+
+            return dict(cached[0]), cached[1]
+
 # ################################################################################################################################
 # ################################################################################################################################
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.common.api import DATA_FORMAT
+from zato.common.json_internal import loads as json_loads
+from zato.common.test import BaseSIOTestCase
+from zato.server.service import Service
+
+# Zato - Cython
+import zato.simpleio as compiled_simpleio
+
+# Zato - pure-Python
+import zato.cy.simpleio as pure_simpleio
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class StreamedResponse(BaseSIOTestCase):
+
+    # CySimpleIO objects can be created only in the compiled module
+    simpleio = compiled_simpleio
+
+    def _get_data(self, how_many):
+        for idx in range(how_many):
+            yield {'aaa': 'aaa-{}'.format(idx), 'bbb': str(idx)}
+
+# ################################################################################################################################
+
+    def test_response_json(self):
+        Int = self.simpleio.Int
+
+        class MyService(Service):
+            class SimpleIO:
+                output = 'aaa', Int('bbb'), '-ccc'
+
+        self.simpleio.CySimpleIO.attach_sio(self.get_server_config(), MyService)
+
+        data = self._get_data(3)
+        result = MyService._sio.get_output_stream(data, DATA_FORMAT.JSON)
+
+        self.assertListEqual(json_loads(''.join(result)), [
+            {'aaa': 'aaa-0', 'bbb': 0},
+            {'aaa': 'aaa-1', 'bbb': 1},
+            {'aaa': 'aaa-2', 'bbb': 2},
+        ])
+
+# ################################################################################################################################
+
+    def test_response_json_with_response_elem(self):
+        Int = self.simpleio.Int
+
+        class MyService(Service):
+            class SimpleIO:
+                output = 'aaa', Int('bbb'), '-ccc'
+                response_elem = 'my_response'
+
+        self.simpleio.CySimpleIO.attach_sio(self.get_server_config(), MyService)
+
+        # An iterator that returns no data at all is still an empty list
+        data = self._get_data(0)
+        result = MyService._sio.get_output_stream(data, DATA_FORMAT.JSON)
+
+        self.assertDictEqual(json_loads(''.join(result)), {'my_response': []})
+
+# ################################################################################################################################
+
+    def test_response_json_chunks(self):
+        Int = self.simpleio.Int
+
+        class MyService(Service):
+            class SimpleIO:
+                output = 'aaa', Int('bbb'), '-ccc'
+
+        self.simpleio.CySimpleIO.attach_sio(self.get_server_config(), MyService)
+
+        data = self._get_data(20000)
+        chunks = list(MyService._sio.get_output_stream(data, DATA_FORMAT.JSON))
+
+        # The output is large enough to be split into more than one chunk
+        self.assertGreater(len(chunks), 1)
+
+        result = json_loads(''.join(chunks))
+        self.assertEquals(len(result), 20000)
+        self.assertDictEqual(result[-1], {'aaa': 'aaa-19999', 'bbb': 19999})
+
+# ################################################################################################################################
+
+    def test_response_csv(self):
+        Int = self.simpleio.Int
+
+        class MyService(Service):
+            class SimpleIO:
+                output = 'aaa', Int('bbb'), '-ccc'
+                csv_delimiter = ';'
+
+        self.simpleio.CySimpleIO.attach_sio(self.get_server_config(), MyService)
+
+        data = self._get_data(2)
+        result = MyService._sio.get_output_stream(data, DATA_FORMAT.CSV)
+        lines = ''.join(result).splitlines()
+
+        self.assertListEqual(lines, ['aaa;bbb;ccc', 'aaa-0;0;', 'aaa-1;1;'])
+
+# ################################################################################################################################
+
+    def test_response_xml(self):
+        Int = self.simpleio.Int
+
+        class MyService(Service):
+            class SimpleIO:
+                output = 'aaa', Int('bbb'), '-ccc'
+                xml_pretty_print = False
+                xml_declaration = False
+                response_elem = 'my_response'
+
+        self.simpleio.CySimpleIO.attach_sio(self.get_server_config(), MyService)
+
+        data = self._get_data(2)
+        result = MyService._sio.get_output_stream(data, DATA_FORMAT.XML)
+
+        # XML is produced as bytes
+        self.assertEquals(b''.join(result), b'<my_response>' \
+            b'<item><aaa>aaa-0</aaa><bbb>0</bbb></item>' \
+            b'<item><aaa>aaa-1</aaa><bbb>1</bbb></item>' \
+            b'</my_response>')
+
+# ################################################################################################################################
+
+    def test_response_xml_multi_byte_chunks(self):
+
+        class MyService(Service):
+            class SimpleIO:
+                output = 'aaa',
+                xml_pretty_print = False
+                xml_declaration = False
+
+        self.simpleio.CySimpleIO.attach_sio(self.get_server_config(), MyService)
+
+        # Each of these characters needs two bytes in UTF-8 and each element is larger than a chunk
+        data = ({'aaa': 'żółć' * 20000} for _ in range(3))
+        chunks = list(MyService._sio.get_output_stream(data, DATA_FORMAT.XML))
+
+        self.assertGreater(len(chunks), 1)
+
+        for chunk in chunks:
+            self.assertIsInstance(chunk, bytes)
+
+        # The text is intact once the chunks are joined
+        result = b''.join(chunks).decode('utf8')
+        self.assertEquals(result, '<response>{}</response>'.format('<item><aaa>{}</aaa></item>'.format('żółć' * 20000) * 3))
+
+# ################################################################################################################################
+
+    def test_response_xml_encoding(self):
+
+        class MyService(Service):
+            class SimpleIO:
+                output = 'aaa',
+                xml_pretty_print = False
+                xml_encoding = 'ISO-8859-2'
+
+        self.simpleio.CySimpleIO.attach_sio(self.get_server_config(), MyService)
+
+        data = iter([{'aaa': 'żółć'}])
+        result = b''.join(MyService._sio.get_output_stream(data, DATA_FORMAT.XML))
+
+        # The encoding declared is the one that the output is in
+        self.assertEquals(result,
+            "<?xml version='1.0' encoding='ISO-8859-2'?>\n<response><item><aaa>żółć</aaa></item></response>".encode('iso-8859-2'))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class StreamedOutputTestCase(TestCase):
+
+    # The module that is tested - compiled with Cython or pure-Python
+    simpleio = compiled_simpleio
+
+    def test_streamed_output_getvalue(self):
+        output = self.simpleio.StreamedOutput(iter(['aaa', 'bbb', 'ccc']))
+        self.assertEquals(output.getvalue(), 'aaabbbccc')
+
+# ################################################################################################################################
+
+    def test_streamed_output_getvalue_bytes(self):
+
+        # Compressed responses consist of bytes chunks
+        output = self.simpleio.StreamedOutput(iter([b'aaa', b'bbb']))
+        self.assertEquals(output.getvalue(), b'aaabbb')
+
+        output = self.simpleio.StreamedOutput(iter(['aaa', b'bbb']))
+        self.assertEquals(output.getvalue(), b'aaabbb')
+
+# ################################################################################################################################
+
+    def test_streamed_output_iter(self):
+        output = self.simpleio.StreamedOutput(iter(['aaa', 'bbb']))
+        self.assertListEqual(list(output), ['aaa', 'bbb'])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class StreamedOutputPureTestCase(StreamedOutputTestCase):
+    simpleio = pure_simpleio
+
+# ################################################################################################################################
+# ################################################################################################################################
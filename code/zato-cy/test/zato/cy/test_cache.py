@@ -144,6 +144,50 @@ class CacheTestCace(TestCase):
         self.assertEquals(c.index(key2), 1)
         self.assertIsNone(c.index(key1))
 
+# ################################################################################################################################
+
+    def test_keys_by_position(self):
+
+        max_size = 3000
+        keys = ['key{}'.format(idx) for idx in range(max_size)]
+
+        c = Cache(max_size)
+
+        for key in keys:
+            c.set(key, key, 0.0, None)
+
+        # The most recently set key is always at the head
+        self.assertEquals(c.keys_by_position(), list(reversed(keys)))
+
+        # Enough promotions to make the cache renumber its internal sequence of keys a few times over
+        for idx in range(10000):
+            c.get(keys[idx % 7], None, False)
+
+        c.delete(keys[100])
+        c.delete(keys[0])
+
+        expected = [keys[(10000 - 1 - idx) % 7] for idx in range(7)]
+        expected.remove(keys[0])
+        expected.extend(key for key in reversed(keys[7:]) if key != keys[100])
+
+        self.assertEquals(len(c), max_size - 2)
+        self.assertEquals(c.keys_by_position(), expected)
+
+        for position, key in enumerate(expected):
+            self.assertEquals(c.index(key), position)
+
+        self.assertIsNone(c.index(keys[0]))
+        self.assertIsNone(c.index(keys[100]))
+
+        # Eviction removes the least recently used key
+        c.set('key-new-1', 'value', 0.0, None)
+        c.set('key-new-2', 'value', 0.0, None)
+        c.set('key-new-3', 'value', 0.0, None)
+
+        self.assertIsNone(c.index(keys[7]))
+        self.assertEquals(c.index('key-new-3'), 0)
+        self.assertEquals(c.index(expected[0]), 3)
+
 # ################################################################################################################################
 
     def test_set_already_exists_no_expiry(self):
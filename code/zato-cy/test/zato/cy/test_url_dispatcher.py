@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import main as unittest_main, TestCase
+
+# Zato
+from zato.common.util.url_dispatcher import get_match_target
+from zato.url_dispatcher import CyURLData, Matcher
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+http_methods_allowed_re = '(GET|POST|PUT|DELETE)'
+accept_any = 'haanyHTTP_SEPhaany'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class URLData(CyURLData):
+    """ Adds the channel list management methods that the server's URLData has.
+    """
+    def add_channel(self, name, url_path, method='', soap_action='', match_slash=False, is_internal=False):
+
+        match_target = get_match_target({
+            'http_method': method,
+            'soap_action': soap_action,
+            'url_path': url_path,
+        }, http_methods_allowed_re=http_methods_allowed_re)
+
+        item = {
+            'name': name,
+            'is_internal': is_internal,
+            'match_target': match_target,
+            'match_target_compiled': Matcher(match_target, match_slash),
+        }
+
+        self.channel_data.append(item)
+        self.url_router.add(item)
+        self.channel_data.sort(key=lambda item: (item['is_internal'], item['name']))
+        self.url_router.set_order(self.channel_data)
+
+        return item
+
+    def delete_channel(self, item):
+        self.channel_data.remove(item)
+        self.url_router.remove(item)
+
+    def match_name(self, url_path, method='GET', soap_action=''):
+        match, item = self.match(url_path, soap_action, method, accept_any, bool(soap_action))
+        return match, (item.name if item else None)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class URLRouterTestCase(TestCase):
+
+    def get_url_data(self):
+        url_data = URLData([])
+
+        url_data.add_channel('a.user', '/api/user/{user_id}')
+        url_data.add_channel('b.user.static', '/api/user/me')
+        url_data.add_channel('c.user.group', '/api/user/{user_id}/group/{group_id}', 'GET')
+        url_data.add_channel('d.file', '/api/file/{path}', match_slash=True)
+        url_data.add_channel('e.version', '/api/v1.0/info')
+        url_data.add_channel('f.soap', '/soap', 'POST', 'my.action')
+        url_data.add_channel('zato.ping', '/zato/ping', is_internal=True)
+
+        return url_data
+
+# ################################################################################################################################
+
+    def test_match_path_params(self):
+        url_data = self.get_url_data()
+
+        self.assertEquals(url_data.match_name('/api/user/123'), ({'user_id': '123'}, 'a.user'))
+        self.assertEquals(url_data.match_name('/api/user/123/group/456'), ({'user_id': '123', 'group_id': '456'},
+            'c.user.group'))
+        self.assertEquals(url_data.match_name('/api/file/a/b/c.txt'), ({'path': 'a/b/c.txt'}, 'd.file'))
+        self.assertEquals(url_data.match_name('/api/v1.0/info'), ({}, 'e.version'))
+        self.assertEquals(url_data.match_name('/zato/ping'), ({}, 'zato.ping'))
+
+# ################################################################################################################################
+
+    def test_match_precedence(self):
+        url_data = self.get_url_data()
+
+        # Both channels match but a.user comes first by name so it is the one returned
+        self.assertEquals(url_data.match_name('/api/user/me'), ({'user_id': 'me'}, 'a.user'))
+
+# ################################################################################################################################
+
+    def test_match_method_soap_action(self):
+        url_data = self.get_url_data()
+
+        self.assertEquals(url_data.match_name('/api/user/123/group/456', 'POST'), (None, None))
+        self.assertEquals(url_data.match_name('/soap', 'POST', 'my.action'), ({}, 'f.soap'))
+        self.assertEquals(url_data.match_name('/soap', 'POST', 'my.action2'), (None, None))
+        self.assertEquals(url_data.match_name('/soap', 'GET', 'my.action'), (None, None))
+
+# ################################################################################################################################
+
+    def test_no_match(self):
+        url_data = self.get_url_data()
+
+        self.assertEquals(url_data.match_name('/api/user'), (None, None))
+        self.assertEquals(url_data.match_name('/api/user/'), (None, None))
+        self.assertEquals(url_data.match_name('/api/unknown/123'), (None, None))
+
+# ################################################################################################################################
+
+    def test_delete(self):
+        url_data = self.get_url_data()
+
+        for item in url_data.channel_data[:]:
+            if item['name'] == 'a.user':
+                url_data.delete_channel(item)
+
+        self.assertEquals(url_data.match_name('/api/user/me'), ({}, 'b.user.static'))
+        self.assertEquals(url_data.match_name('/api/user/123'), (None, None))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class URLMatchCacheTestCase(TestCase):
+
+    def test_cache_hits_misses(self):
+        url_data = URLData([])
+        url_data.add_channel('a.user', '/api/user/{user_id}')
+
+        self.assertEquals(url_data.match_name('/api/user/123'), ({'user_id': '123'}, 'a.user'))
+        self.assertEquals(url_data.match_name('/api/user/123'), ({'user_id': '123'}, 'a.user'))
+        self.assertEquals(url_data.match_name('/api/user/456'), ({'user_id': '456'}, 'a.user'))
+
+        # Targets not matched are never cached
+        self.assertEquals(url_data.match_name('/api/unknown'), (None, None))
+        self.assertEquals(url_data.match_name('/api/unknown'), (None, None))
+
+        stats = url_data.get_cache_stats()
+        self.assertEquals(stats['size'], 2)
+        self.assertEquals(stats['hits'], 1)
+        self.assertEquals(stats['misses'], 4)
+        self.assertEquals(stats['evictions'], 0)
+
+# ################################################################################################################################
+
+    def test_cache_eviction(self):
+        url_data = URLData([], 2)
+        url_data.add_channel('a.user', '/api/user/{user_id}')
+
+        url_data.match_name('/api/user/1')
+        url_data.match_name('/api/user/2')
+
+        # Reading it makes 1 the most recently used one so 2 is evicted when 3 is added
+        url_data.match_name('/api/user/1')
+        url_data.match_name('/api/user/3')
+
+        self.assertEquals(sorted(url_data.url_match_cache), sorted([
+            ':::GET:::haanyHTTP_SEPhaany:::/api/user/1',
+            ':::GET:::haanyHTTP_SEPhaany:::/api/user/3',
+        ]))
+        self.assertEquals(url_data.get_cache_stats()['evictions'], 1)
+
+# ################################################################################################################################
+
+    def test_cache_invalidation(self):
+        url_data = URLData([])
+        user = url_data.add_channel('b.user', '/api/user/{user_id}')
+        url_data.add_channel('c.order', '/api/order/{order_id}')
+
+        url_data.match_name('/api/user/me')
+        url_data.match_name('/api/order/123')
+
+        # Deleting a channel removes only the targets it was matched for
+        url_data.delete_channel(user)
+        url_data.remove_from_cache_by_channel(user['match_target'])
+
+        self.assertEquals(url_data.get_cache_stats()['size'], 1)
+        self.assertEquals(url_data.match_name('/api/user/me'), (None, None))
+
+        # A new channel which takes precedence over an existing one evicts targets it could match
+        order_static = url_data.add_channel('a.order', '/api/order/123')
+        url_data.remove_from_cache_by_matcher(order_static['match_target_compiled'])
+
+        self.assertEquals(url_data.match_name('/api/order/123'), ({}, 'a.order'))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    unittest_main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -55,6 +55,7 @@ class Scheduler(BrokerMessageReceiver):
         self.config = config
         self.broker_client = None
         self.config.on_job_executed_cb = self.on_job_executed
+        self.config.on_jobs_executed_cb = self.on_jobs_executed
         self.sched = _Scheduler(self.config, self)
 
         # Broker connection
@@ -88,19 +89,16 @@ class Scheduler(BrokerMessageReceiver):
 
 # ################################################################################################################################
 
-    def on_job_executed(self, ctx, extra_data_format=ZATO_NONE):
-        """ Invoked by the underlying scheduler when a job is executed. Sends the actual execution request to the broker
-        so it can be picked up by one of the parallel server's broker clients.
+    def get_job_executed_msg(self, ctx, extra_data_format=ZATO_NONE):
+        """ Returns a broker message requesting that a service be invoked on behalf of a job described by ctx.
         """
-        name = ctx['name']
-
         payload = ctx['cb_kwargs']['extra']
         if isinstance(payload, bytes):
             payload = payload.decode('utf8')
 
         msg = {
             'action': SCHEDULER_MSG.JOB_EXECUTED.value,
-            'name':name,
+            'name':ctx['name'],
             'service': ctx['cb_kwargs']['service'],
             'payload':payload,
             'cid':ctx['cid'],
@@ -110,25 +108,65 @@ class Scheduler(BrokerMessageReceiver):
         if extra_data_format != ZATO_NONE:
             msg['data_format'] = extra_data_format
 
-        self.broker_client.invoke_async(msg)
+        return msg
 
-        if _has_debug:
-            msg = 'Sent a job execution request, name [{}], service [{}], extra [{}]'.format(
-                name, ctx['cb_kwargs']['service'], ctx['cb_kwargs']['extra'])
-            logger.debug(msg)
+# ################################################################################################################################
 
-        # Now, if it was a one-time job, it needs to be deactivated.
-        if ctx['type'] == SCHEDULER.JOB_TYPE.ONE_TIME:
+    def deactivate_one_time_jobs(self, ctx_list):
+        """ Deactivates in ODB all the one-time jobs from ctx_list, using a single request no matter how many there are.
+        """
+        id_list = [ctx['id'] for ctx in ctx_list if ctx['type'] == SCHEDULER.JOB_TYPE.ONE_TIME]
+
+        if id_list:
             msg = {
                 'action': SERVICE.PUBLISH.value,
-                'service': 'zato.scheduler.job.set-active-status',
-                'payload': {'id':ctx['id'], 'is_active':False},
+                'service': 'zato.scheduler.job.set-active-status-list',
+                'payload': {'id_list':id_list, 'is_active':False},
                 'cid': new_cid(),
                 'channel': CHANNEL.SCHEDULER_AFTER_ONE_TIME,
                 'data_format': DATA_FORMAT.JSON,
             }
             self.broker_client.publish(msg)
 
+# ################################################################################################################################
+
+    def on_job_executed(self, ctx, extra_data_format=ZATO_NONE):
+        """ Invoked by the underlying scheduler when a job is executed. Sends the actual execution request to the broker
+        so it can be picked up by one of the parallel server's broker clients.
+        """
+        self.broker_client.invoke_async(self.get_job_executed_msg(ctx, extra_data_format))
+
+        if _has_debug:
+            msg = 'Sent a job execution request, name [{}], service [{}], extra [{}]'.format(
+                ctx['name'], ctx['cb_kwargs']['service'], ctx['cb_kwargs']['extra'])
+            logger.debug(msg)
+
+        # Now, if it was a one-time job, it needs to be deactivated.
+        self.deactivate_one_time_jobs([ctx])
+
+# ################################################################################################################################
+
+    def on_jobs_executed(self, ctx_list, _batch_size=SCHEDULER.DISPATCH_BATCH_SIZE):
+        """ Invoked by the underlying scheduler with all the jobs that were due at the same time. Instead of sending
+        one broker message per job, they are sent in batches which servers fan out to individual services themselves.
+        """
+        if len(ctx_list) == 1:
+            return self.on_job_executed(ctx_list[0])
+
+        for idx in range(0, len(ctx_list), _batch_size):
+            batch = ctx_list[idx:idx+_batch_size]
+
+            self.broker_client.invoke_async({
+                'action': SCHEDULER_MSG.JOBS_EXECUTED.value,
+                'jobs': [self.get_job_executed_msg(ctx) for ctx in batch],
+            })
+
+            if _has_debug:
+                logger.debug('Sent a batch execution request for %d jobs `%s`', len(batch), [ctx['name'] for ctx in batch])
+
+        # All the one-time jobs need to be deactivated, again, in one go.
+        self.deactivate_one_time_jobs(ctx_list)
+
 # ################################################################################################################################
 
     def create_edit(self, action, job_data, **kwargs):
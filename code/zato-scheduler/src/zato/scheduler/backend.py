@@ -10,12 +10,11 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import datetime
+from heapq import heappop, heappush
+from itertools import count
 from logging import getLogger
 from traceback import format_exc
 
-# datetime
-from dateutil.rrule import rrule, SECONDLY
-
 # gevent
 import gevent # Imported directly so it can be mocked out in tests
 from gevent import lock, sleep
@@ -28,7 +27,7 @@ from future.utils import iterkeys, itervalues
 
 # Zato
 from zato.common.api import FILE_TRANSFER, SCHEDULER
-from zato.common.util.api import add_scheduler_jobs, add_startup_jobs, asbool, make_repr, new_cid, spawn_greenlet
+from zato.common.util.api import add_scheduler_jobs, add_startup_jobs, asbool, make_repr, new_cid
 
 # ################################################################################################################################
 
@@ -40,6 +39,11 @@ initial_sleep = 30
 
 # ################################################################################################################################
 
+def _timedelta_to_microseconds(value):
+    return (value.days * 86400 + value.seconds) * 10**6 + value.microseconds
+
+# ################################################################################################################################
+
 class Interval(object):
     def __init__(self, days=0, hours=0, minutes=0, seconds=0, in_seconds=0):
         self.days = days
@@ -93,10 +97,6 @@ class Job(object):
         else:
             self.start_time = self.get_start_time(start_time if start_time is not None else datetime.datetime.utcnow())
 
-        self.wait_sleep_time = 1
-        self.wait_iter_cb = None
-        self.wait_iter_cb_args = ()
-
         # TODO: Add skip_days, skip_hours and skip_dates
 
     def __str__(self):
@@ -166,8 +166,7 @@ class Job(object):
             return first_run_time
 
         else:
-            runs = rrule(SECONDLY, interval=int(self.interval.in_seconds), dtstart=start_time, count=self.max_repeats)
-            last_run_time = runs.before(now)
+            last_run_time = self.get_last_run_time(start_time, now)
             next_run_time = last_run_time + interval
 
             if next_run_time >= now:
@@ -189,6 +188,25 @@ class Job(object):
                     'Cannot compute start_time. Job `%s` max repeats reached at `%s` (UTC)',
                     self.name, self.max_repeats_reached_at)
 
+    def get_last_run_time(self, start_time, now):
+        """ Returns the time of the last run before now, computed arithmetically rather than by iterating over all the runs
+        since start_time, which for short intervals and old start times could mean millions of iterations. Takes max_repeats
+        into account and, as previously with dateutil's rrule, ignores microseconds of start_time.
+        """
+        start_time = start_time.replace(microsecond=0)
+
+        elapsed = _timedelta_to_microseconds(now - start_time)
+        interval = _timedelta_to_microseconds(datetime.timedelta(seconds=self.interval.in_seconds))
+
+        # Index of the last run that was strictly before now, the first run being at start_time itself ..
+        last_run_idx = (elapsed - 1) // interval
+
+        # .. though there may not have been that many runs allowed.
+        if self.max_repeats:
+            last_run_idx = min(last_run_idx, self.max_repeats - 1)
+
+        return start_time + datetime.timedelta(microseconds=interval * last_run_idx)
+
     def get_context(self):
         ctx = {
             'cid':new_cid(),
@@ -218,86 +236,37 @@ class Job(object):
         else:
             raise ValueError('Unsupported job type `{}` ({})'.format(self.type, self.name))
 
-    def _spawn(self, *args, **kwargs):
-        """ A thin wrapper so that it is easier to mock this method out in unit-tests.
+    def get_next_run_time(self, run_time, now):
+        """ Returns the absolute time of the job's next run given the time its previous run was scheduled for.
+        Interval-based jobs are always a multiple of their interval away from start_time, no matter how late
+        the previous run was actually dispatched, so they do not drift over time.
         """
-        return spawn_greenlet(*args, **kwargs)
-
-    def main_loop(self):
-
-        logger.info('Job entering main loop `%s`', self)
-
-        _sleep = gevent.sleep
-
-        try:
-            while self.keep_running:
-                try:
-                    self.current_run += 1
-
-                    # Perhaps we've already been executed enough times
-                    if self.max_repeats and self.current_run == self.max_repeats:
-                        self.keep_running = False
-                        self.max_repeats_reached = True
-                        self.max_repeats_reached_at = datetime.datetime.utcnow()
-
-                        if self.on_max_repeats_reached_cb:
-                            self.on_max_repeats_reached_cb(self)
-
-                    # Invoke callback in a new greenlet so it doesn't block the current one.
-                    self._spawn(self.callback, **{'ctx':self.get_context()})
-
-                except Exception:
-                    logger.warn(format_exc())
-
-                finally:
-                    # Pause the greenlet for however long is needed if it is not a one-off job
-                    if self.type == SCHEDULER.JOB_TYPE.ONE_TIME:
-                        return True
-                    else:
-                        _sleep(self.get_sleep_time(datetime.datetime.utcnow()))
-
-            logger.info('Job leaving main loop `%s` after %d iterations', self, self.current_run)
-
-        except Exception:
-            logger.warn(format_exc())
-
-        return True
-
-    def run(self):
-
-        # OK, we're ready
-        try:
-
-            # If we are a job that triggers file transfer channels we do not start
-            # unless our extra data is filled in. Otherwise, we would not trigger any transfer anyway.
-            if self.service == FILE_TRANSFER.SCHEDULER_SERVICE and (not self.extra):
-                logger.warn('Skipped file transfer job `%s` without extra set `%s` (%s)', self.name, self.extra, self.service)
-                return
-
-            if not self.start_time:
-                logger.warn('Job `%s` cannot start without start_time set', self.name)
-                return
-
-            logger.info('Job starting `%s`', self)
-
-            _utcnow = datetime.datetime.utcnow
-            _sleep = gevent.sleep
-
-            # If the job has a start time in the future, sleep until it's ready to go.
-            now = _utcnow()
-
-            while self.start_time > now:
-                _sleep(self.wait_sleep_time)
+        next_run_time = run_time + datetime.timedelta(seconds=self.get_sleep_time(run_time))
+
+        # The scheduler fell behind, e.g. the process was paused, so we skip the runs that were missed
+        # instead of executing all of them at once.
+        if next_run_time <= now:
+            if self.type == SCHEDULER.JOB_TYPE.INTERVAL_BASED:
+                missed = int((now - next_run_time).total_seconds() // self.interval.in_seconds) + 1
+                next_run_time += datetime.timedelta(seconds=self.interval.in_seconds * missed)
+            else:
+                next_run_time = now + datetime.timedelta(seconds=self.get_sleep_time(now))
 
-                if self.wait_iter_cb:
-                    self.wait_iter_cb(self.start_time, now, *self.wait_iter_cb_args)
+        return next_run_time
 
-                now = _utcnow()
+    def on_run(self):
+        """ Updates the job's state each time it is executed.
+        """
+        self.current_run += 1
 
-            self.main_loop()
+        # Perhaps we've already been executed enough times
+        if self.max_repeats and self.current_run == self.max_repeats:
+            self.keep_running = False
+            self.max_repeats_reached = True
+            self.max_repeats_reached_at = datetime.datetime.utcnow()
 
-        except Exception:
-            logger.warn(format_exc())
+            if self.on_max_repeats_reached_cb:
+                self.on_max_repeats_reached_cb(self)
 
 # ################################################################################################################################
 
@@ -306,11 +275,16 @@ class Scheduler(object):
         self.config = config
         self.api = api
         self.on_job_executed_cb = config.on_job_executed_cb
+        self.on_jobs_executed_cb = getattr(config, 'on_jobs_executed_cb', None)
         self.startup_jobs = config.startup_jobs
         self.odb = config.odb
         self.jobs = {}
-        self.job_greenlets = {}
         self.keep_running = True
+
+        # A min-heap of (next_run_time, sequence, job) elements, sorted by the absolute time each job should run at next.
+        # The sequence number makes sure that two jobs with the same next_run_time are never compared directly.
+        self.job_heap = []
+        self.job_heap_seq = count()
         self.lock = lock.RLock()
         self.sleep_time = 0.1
         self.iter_cb = None
@@ -359,15 +333,11 @@ class Scheduler(object):
         found = False
         job.keep_running = False
 
+        # There is no need to remove the job from self.job_heap - it will be skipped once it is popped off the heap
         if name in iterkeys(self.jobs):
             del self.jobs[name]
             found = True
 
-        if name in iterkeys(self.job_greenlets):
-            self.job_greenlets[name].kill(block=False, timeout=2.0)
-            del self.job_greenlets[name]
-            found = True
-
         return found
 
     def _unschedule_stop(self, job, message):
@@ -433,22 +403,94 @@ class Scheduler(object):
     def on_job_executed(self, ctx, unschedule_one_time=True):
         logger.debug('Executing `%s`, `%s`', ctx['name'], ctx)
         self.on_job_executed_cb(ctx)
+        self.after_job_executed(ctx, unschedule_one_time)
+
+    def after_job_executed(self, ctx, unschedule_one_time=True):
         self.job_log('Job executed `%s`, `%s`', ctx['name'], ctx)
 
         if ctx['type'] == SCHEDULER.JOB_TYPE.ONE_TIME and unschedule_one_time:
             self.unschedule_by_name(ctx['name'])
 
-    def _spawn(self, *args, **kwargs):
-        """ As in the Job class, this is a thin wrapper so that it is easier to mock this method out in unit-tests.
+    def on_jobs_executed(self, ctx_list):
+        """ Invoked with contexts of all the jobs that were due in the same iteration of the dispatch loop.
+        If there is a callback accepting all of them at once, they are handed over to it in a single call,
+        otherwise each job is executed individually.
         """
-        return spawn_greenlet(*args, **kwargs)
+        if self.on_jobs_executed_cb:
+            try:
+                self.on_jobs_executed_cb(ctx_list)
+            except Exception:
+                logger.warn(format_exc())
+            else:
+                for ctx in ctx_list:
+                    self.after_job_executed(ctx)
+        else:
+            for ctx in ctx_list:
+                try:
+                    self.on_job_executed(ctx)
+                except Exception:
+                    logger.warn(format_exc())
+
+    def _schedule(self, job, run_time):
+        """ Adds a job to the heap of jobs to run at run_time. Must be called with self.lock held.
+        """
+        heappush(self.job_heap, (run_time, next(self.job_heap_seq), job))
 
     def spawn_job(self, job):
-        """ Spawns a job's greenlet. Must be called with self.lock held.
+        """ Schedules a job's first run. Must be called with self.lock held.
         """
         job.callback = self.on_job_executed
         job.on_max_repeats_reached_cb = self.on_max_repeats_reached
-        self.job_greenlets[job.name] = self._spawn(job.run)
+
+        # If we are a job that triggers file transfer channels we do not start
+        # unless our extra data is filled in. Otherwise, we would not trigger any transfer anyway.
+        if job.service == FILE_TRANSFER.SCHEDULER_SERVICE and (not job.extra):
+            logger.warn('Skipped file transfer job `%s` without extra set `%s` (%s)', job.name, job.extra, job.service)
+            return
+
+        if not job.start_time:
+            logger.warn('Job `%s` cannot start without start_time set', job.name)
+            return
+
+        self._schedule(job, job.start_time)
+
+    def dispatch(self, now):
+        """ Executes all the jobs whose time has come, scheduling their next runs.
+        """
+        # Nothing is due yet, there is no need to take the lock
+        if not (self.job_heap and self.job_heap[0][0] <= now):
+            return
+
+        ctx_list = []
+
+        with self.lock:
+            while self.job_heap and self.job_heap[0][0] <= now:
+                run_time, _, job = heappop(self.job_heap)
+
+                # The job was unscheduled or edited in the meantime
+                if not job.keep_running or self.jobs.get(job.name) is not job:
+                    continue
+
+                try:
+                    job.on_run()
+                    ctx_list.append(job.get_context())
+
+                    if job.keep_running and job.type != SCHEDULER.JOB_TYPE.ONE_TIME:
+                        self._schedule(job, job.get_next_run_time(run_time, now))
+
+                except Exception:
+                    logger.warn(format_exc())
+
+        # All jobs due in this iteration are handed over in one greenlet so as not to block the dispatch loop
+        if ctx_list:
+            gevent.spawn(self.on_jobs_executed, ctx_list)
+
+    def get_sleep_time(self, now):
+        """ Returns for how long to sleep until the next job is due, though never more than self.sleep_time.
+        """
+        if self.job_heap:
+            return max(0, min((self.job_heap[0][0] - now).total_seconds(), self.sleep_time))
+        return self.sleep_time
 
     def init_jobs(self):
         sleep(initial_sleep) # To make sure that at least one server is running if the environment was started from quickstart scripts
@@ -469,7 +511,7 @@ class Scheduler(object):
             self.init_jobs()
 
             _sleep = self.sleep
-            _sleep_time = self.sleep_time
+            _utcnow = datetime.datetime.utcnow
 
             with self.lock:
                 for job in sorted(itervalues(self.jobs)):
@@ -484,7 +526,8 @@ class Scheduler(object):
             logger.info('Scheduler started')
 
             while self.keep_running:
-                _sleep(_sleep_time)
+                self.dispatch(_utcnow())
+                _sleep(self.get_sleep_time(_utcnow()))
 
                 if self.iter_cb:
                     self.iter_cb(*self.iter_cb_args)
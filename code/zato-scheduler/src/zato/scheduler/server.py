@@ -44,6 +44,7 @@ class Config(object):
         self.startup_jobs = []
         self.odb = None
         self.on_job_executed_cb = None
+        self.on_jobs_executed_cb = None
         self.stats_enabled = None
         self.job_log_level = 'info'
         self.broker_client = None
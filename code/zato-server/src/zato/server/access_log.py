@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from collections import deque
+from logging import INFO
+from traceback import format_exc
+
+# gevent
+from gevent import sleep
+from gevent.event import Event
+
+# pytz
+from pytz import UTC
+
+# tzlocal
+from tzlocal import get_localzone
+
+# ################################################################################################################################
+
+if 0:
+    from datetime import datetime
+    from logging import Logger
+
+    datetime = datetime
+    Logger = Logger
+
+# ################################################################################################################################
+
+logger = logging.getLogger(__name__)
+
+# ################################################################################################################################
+
+ACCESS_LOG_DT_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+
+# ################################################################################################################################
+
+class ON_FULL:
+    BLOCK = 'block'
+    DROP = 'drop'
+
+# ################################################################################################################################
+
+class AccessLogWriter(object):
+    """ Collects HTTP access log entries in a bounded ring buffer and writes them out in background, in batches,
+    which means that requests never need to format log records or wait for file I/O. Each entry is a tuple of
+    remote address, CID, response time, channel name, request timestamp (UTC), method, path, HTTP version,
+    status code, user agent and response size. If the buffer is full, new entries either replace the oldest ones
+    or wait until there is room for them again.
+    """
+    # How many entries to keep in memory
+    buffer_size = 10000
+
+    # How many entries to write out at once
+    batch_size = 100
+
+    # How often to write out entries, in seconds, if there are fewer of them than batch_size
+    flush_interval = 1.0
+
+    def __init__(self, access_logger, buffer_size=None, batch_size=None, flush_interval=None, on_full=ON_FULL.DROP,
+        local_zone=None):
+        # type: (Logger, int, int, float, str, object) -> None
+
+        self.access_logger = access_logger
+        self.buffer_size = buffer_size or self.buffer_size
+        self.batch_size = batch_size or self.batch_size
+        self.flush_interval = flush_interval or self.flush_interval
+        self.should_block = on_full == ON_FULL.BLOCK
+        self.local_zone = local_zone or get_localzone()
+        self.keep_running = True
+
+        # Oldest entries are dropped automatically when new ones are appended to a full buffer
+        self.buffer = deque(maxlen=self.buffer_size)
+
+        # Set when there are enough entries for a batch to be written out
+        self.has_batch = Event()
+
+        # Set each time entries are taken out of the buffer
+        self.has_room = Event()
+
+        # How many entries were dropped since the last time it was logged
+        self.dropped = 0
+
+        # Request timestamps have a resolution of one second in the access log
+        # so their string representations can be reused for all the requests in the same second.
+        self._cached_second = None     # type: datetime
+        self._cached_timestamps = None # type: tuple
+
+# ################################################################################################################################
+
+    def push(self, entry):
+        """ Called for each HTTP request that should be written to the access log.
+        """
+        # type: (tuple) -> None
+
+        if len(self.buffer) == self.buffer_size:
+
+            if self.should_block:
+                while len(self.buffer) == self.buffer_size:
+                    self.has_batch.set()
+                    self.has_room.clear()
+                    self.has_room.wait()
+            else:
+                self.dropped += 1
+
+        self.buffer.append(entry)
+
+        if len(self.buffer) >= self.batch_size:
+            self.has_batch.set()
+
+# ################################################################################################################################
+
+    def _get_timestamps(self, request_ts_utc):
+        # type: (datetime) -> tuple
+
+        second = request_ts_utc.replace(microsecond=0)
+
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_timestamps = (
+                second.strftime(ACCESS_LOG_DT_FORMAT),
+                second.replace(tzinfo=UTC).astimezone(self.local_zone).strftime(ACCESS_LOG_DT_FORMAT),
+            )
+
+        return self._cached_timestamps
+
+# ################################################################################################################################
+
+    def _write_entry(self, entry, _INFO=INFO):
+        # type: (tuple) -> None
+
+        remote_ip, cid, resp_time, channel_name, request_ts_utc, method, path, http_version, status_code, \
+            user_agent, response_size = entry
+
+        req_timestamp_utc, req_timestamp = self._get_timestamps(request_ts_utc)
+
+        record = self.access_logger.makeRecord(self.access_logger.name, _INFO, '', 0, '', None, None, extra={
+            'remote_ip': remote_ip,
+            'cid_resp_time': '%s/%s' % (cid, resp_time),
+            'channel_name': channel_name,
+            'req_timestamp_utc': req_timestamp_utc,
+            'req_timestamp': req_timestamp,
+            'method': method,
+            'path': path,
+            'http_version': http_version,
+            'status_code': status_code,
+            'response_size': response_size,
+            'user_agent': user_agent,
+        })
+
+        self.access_logger.handle(record)
+
+# ################################################################################################################################
+
+    def flush(self):
+        """ Writes out all the entries collected so far, in batches.
+        """
+        buffer = self.buffer
+
+        while buffer:
+
+            for _ in range(min(self.batch_size, len(buffer))):
+                self._write_entry(buffer.popleft())
+
+            # Let any requests waiting for room in the buffer continue,
+            # and let other greenlets run before the next batch is written out.
+            self.has_room.set()
+            sleep(0)
+
+        if self.dropped:
+            logger.warn('HTTP access log buffer was full, dropped %s entries (%s)', self.dropped, self.buffer_size)
+            self.dropped = 0
+
+# ################################################################################################################################
+
+    def run(self):
+        """ Writes out access log entries until told to stop.
+        """
+        while self.keep_running:
+            self.has_batch.wait(self.flush_interval)
+            self.has_batch.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                logger.warn('Could not write HTTP access log entries, e:`%s`', format_exc())
+
+# ################################################################################################################################
+
+    def stop(self):
+        """ Stops the writer's loop and writes out whatever has not been written yet.
+        """
+        self.keep_running = False
+
+        try:
+            self.flush()
+        except Exception:
+            logger.warn('Could not write HTTP access log entries on stop, e:`%s`', format_exc())
+
+# ################################################################################################################################
@@ -21,6 +21,7 @@ from uuid import uuid4
 
 # gevent
 import gevent.monkey # Needed for Cassandra
+from gevent import joinall, spawn
 
 # Paste
 from paste.util.converters import asbool
@@ -56,6 +57,8 @@ from zato.server.base.parallel.subprocess_.ftp import FTPIPC
 from zato.server.base.parallel.subprocess_.ibm_mq import IBMMQIPC
 from zato.server.base.parallel.subprocess_.outconn_sftp import SFTPIPC
 from zato.server.sso import SSOTool
+from zato.server.access_log import AccessLogWriter, ON_FULL as ACCESS_LOG_ON_FULL
+from zato.server.stats import ServiceStatsAggregator
 
 # ################################################################################################################################
 
@@ -91,9 +94,6 @@ kvdb_logger = logging.getLogger('zato_kvdb')
 
 # ################################################################################################################################
 
-megabyte = 10**6
-
-# ################################################################################################################################
 # ################################################################################################################################
 
 class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
@@ -138,6 +138,9 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         self.cluster = None
         self.cluster_id = None # type: int
         self.kvdb = None # type: KVDB
+        self.service_stats = None # type: ServiceStatsAggregator
+        self.access_log_writer = None # type: AccessLogWriter
+        self.access_log_push = None
         self.startup_jobs = None # type: dict
         self.worker_store = None # type: WorkerStore
         self.service_store = None # type: ServiceStore
@@ -161,7 +164,6 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         self.pid = None # type: int
         self.sync_internal = None # type: bool
         self.ipc_api = IPCAPI()
-        self.fifo_response_buffer_size = None # type: int # Will be in megabytes
         self.is_first_worker = None # type: bool
         self.shmem_size = -1.0
         self.server_startup_ipc = ServerStartupIPC()
@@ -413,6 +415,20 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         # TimeUtil needs self.kvdb so it can be set now
         self.time_util = TimeUtil(self.kvdb)
 
+        # Statistics of services are collected in memory and flushed to KVDB periodically
+        self.service_stats = ServiceStatsAggregator(
+            self.kvdb, float(self.fs_server_config.stats.get('flush_interval', ServiceStatsAggregator.flush_interval)))
+
+        # HTTP access log entries are formatted and written out in background, in batches
+        logging_config = self.fs_server_config.get('logging') or {}
+        self.access_log_writer = AccessLogWriter(
+            self.access_logger,
+            int(logging_config.get('http_access_log_buffer_size') or AccessLogWriter.buffer_size),
+            int(logging_config.get('http_access_log_batch_size') or AccessLogWriter.batch_size),
+            float(logging_config.get('http_access_log_flush_interval') or AccessLogWriter.flush_interval),
+            logging_config.get('http_access_log_on_full') or ACCESS_LOG_ON_FULL.DROP)
+        self.access_log_push = self.access_log_writer.push
+
         # Service sources
         self.service_sources = []
         for name in open(os.path.join(self.repo_location, self.fs_server_config.main.service_sources)):
@@ -431,9 +447,6 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
 
             self.user_config[get_user_config_name(file_name)] = conf
 
-        # Convert size of FIFO response buffers to megabytes
-        self.fifo_response_buffer_size = int(float(self.fs_server_config.misc.fifo_response_buffer_size) * megabyte)
-
         locally_deployed = self.maybe_on_first_worker(server, self.kvdb.conn)
 
         return locally_deployed
@@ -577,6 +590,7 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         self.rate_limiting.cluster_id = self.cluster_id
         self.rate_limiting.global_lock_func = self.zato_lock_manager
         self.rate_limiting.sql_session_func = self.odb.session
+        self.rate_limiting.exact_lease_size = int(self.fs_server_config.misc.get('rate_limiting_exact_lease_size') or 0)
 
         # Set up rate limiting for ConfigDict-based objects, which includes everything except for:
         # * services  - configured in ServiceStore
@@ -706,6 +720,14 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         self.ipc_api.on_message_callback = self.worker_store.on_ipc_message
         spawn_greenlet(self.ipc_api.run)
 
+        # Service statistics
+        if self.component_enabled.stats:
+            spawn_greenlet(self.service_stats.run)
+
+        # HTTP access log
+        if self.needs_access_log:
+            spawn_greenlet(self.access_log_writer.run)
+
         self.startup_callable_tool.invoke(SERVER_STARTUP.PHASE.AFTER_STARTED, kwargs={
             'server': self,
         })
@@ -838,6 +860,28 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         """
         return self.worker_store.cache_api.get_cache(cache_type, cache_name).set(key, value)
 
+# ################################################################################################################################
+
+    def _invoke_pid(self, service, request, pid, timeout, *args, **kwargs):
+        """ Invokes a service in one of current server's processes, returning a dictionary describing the result.
+        """
+        response = {
+            'is_ok': False,
+            'pid_data': None,
+            'error_info': None
+        }
+
+        try:
+            is_ok, pid_data = self.invoke_by_pid(service, request, pid, timeout=timeout, *args, **kwargs)
+            response['is_ok'] = is_ok
+            response['pid_data' if is_ok else 'error_info'] = pid_data
+
+        except Exception:
+            e = format_exc()
+            response['error_info'] = e
+
+        return response
+
 # ################################################################################################################################
 
     def invoke_all_pids(self, service, request, timeout=5, *args, **kwargs):
@@ -854,23 +898,17 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             # Underlying IPC needs strings on input instead of None
             request = request or ''
 
+            # Invoke all the processes concurrently ..
+            greenlets = {}
             for pid in pids:
-                response = {
-                    'is_ok': False,
-                    'pid_data': None,
-                    'error_info': None
-                }
+                greenlets[pid] = spawn(self._invoke_pid, service, request, pid, timeout, *args, **kwargs)
+
+            # .. and wait for all of them to reply, each invocation observes its own timeout.
+            joinall(list(greenlets.values()))
 
-                try:
-                    is_ok, pid_data = self.invoke_by_pid(service, request, pid, timeout=timeout, *args, **kwargs)
-                    response['is_ok'] = is_ok
-                    response['pid_data' if is_ok else 'error_info'] = pid_data
+            for pid, greenlet in greenlets.items():
+                out[pid] = greenlet.value
 
-                except Exception:
-                    e = format_exc()
-                    response['error_info'] = e
-                finally:
-                    out[pid] = response
         except Exception:
             logger.warn('PID invocation error `%s`', format_exc())
         finally:
@@ -881,8 +919,7 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
     def invoke_by_pid(self, service, request, target_pid, *args, **kwargs):
         """ Invokes a service in a worker process by the latter's PID.
         """
-        return self.ipc_api.invoke_by_pid(service, request, self.cluster.name, self.name, target_pid,
-            self.fifo_response_buffer_size, *args, **kwargs)
+        return self.ipc_api.invoke_by_pid(service, request, self.cluster.name, self.name, target_pid, *args, **kwargs)
 
 # ################################################################################################################################
 
@@ -1070,6 +1107,14 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             # Close ZeroMQ-based IPC
             self.ipc_api.close()
 
+            # Store statistics not flushed yet
+            if self.component_enabled.stats:
+                self.service_stats.stop()
+
+            # Write out HTTP access log entries not written yet
+            if self.needs_access_log:
+                self.access_log_writer.stop()
+
             # WSX connections for this server cleanup
             self.cleanup_wsx(True)
 
@@ -11,7 +11,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 # stdlib
 from datetime import datetime
 from http.client import INTERNAL_SERVER_ERROR, responses
-from logging import getLogger, INFO
+from logging import getLogger
 from traceback import format_exc
 
 # pytz
@@ -28,13 +28,12 @@ from past.builtins import unicode
 from zato.common.api import NO_REMOTE_ADDRESS
 from zato.common.util.api import new_cid
 
-# ################################################################################################################################
-
-logger = getLogger(__name__)
+# Zato - Cython
+from zato.simpleio import StreamedOutput
 
 # ################################################################################################################################
 
-ACCESS_LOG_DT_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+logger = getLogger(__name__)
 
 # ################################################################################################################################
 
@@ -42,15 +41,14 @@ class HTTPHandler(object):
     """ Handles incoming HTTP requests.
     """
     def on_wsgi_request(self, wsgi_environ, start_response, _new_cid=new_cid, _local_zone=get_localzone(),
-        _utcnow=datetime.utcnow, _INFO=INFO, _UTC=UTC, _ACCESS_LOG_DT_FORMAT=ACCESS_LOG_DT_FORMAT,
-        _no_remote_address=NO_REMOTE_ADDRESS, **kwargs):
+        _utcnow=datetime.utcnow, _UTC=UTC, _no_remote_address=NO_REMOTE_ADDRESS, **kwargs):
         """ Handles incoming HTTP requests.
         """
         cid = kwargs.get('cid', _new_cid())
         request_ts_utc = _utcnow()
         wsgi_environ['zato.local_tz'] = _local_zone
         wsgi_environ['zato.request_timestamp_utc'] = request_ts_utc
-        wsgi_environ['zato.request_timestamp'] = request_ts_local = request_ts_utc.replace(tzinfo=_UTC).astimezone(_local_zone)
+        wsgi_environ['zato.request_timestamp'] = request_ts_utc.replace(tzinfo=_UTC).astimezone(_local_zone)
 
         wsgi_environ['zato.http.response.headers'] = {'X-Zato-CID': cid}
 
@@ -86,27 +84,62 @@ class HTTPHandler(object):
 
         start_response(wsgi_environ['zato.http.response.status'], iteritems(wsgi_environ['zato.http.response.headers']))
 
+        # Streamed responses have no Content-Length so they are sent to clients with chunked transfer encoding
+        is_streamed = isinstance(payload, StreamedOutput)
+
         if isinstance(payload, unicode):
             payload = payload.encode('utf-8')
 
+        access_log_entry = None
+
         if self.needs_access_log:
 
             # Either log all HTTP requests or make sure that current path
             # is not in a list of paths to ignore.
             if self.needs_all_access_log or wsgi_environ['PATH_INFO'] not in self.access_log_ignore:
 
-                self.access_logger_log(_INFO, '', None, None, {
-                    'remote_ip': remote_addr,
-                    'cid_resp_time': '%s/%s' % (cid, (_utcnow() - request_ts_utc).total_seconds()),
-                    'channel_name': channel_name,
-                    'req_timestamp_utc': request_ts_utc.strftime(_ACCESS_LOG_DT_FORMAT),
-                    'req_timestamp': request_ts_local.strftime(_ACCESS_LOG_DT_FORMAT),
-                    'method': wsgi_environ['REQUEST_METHOD'],
-                    'path': wsgi_environ['PATH_INFO'],
-                    'http_version': wsgi_environ['SERVER_PROTOCOL'],
-                    'status_code': wsgi_environ['zato.http.response.status'].split()[0],
-                    'response_size': len(payload),
-                    'user_agent': wsgi_environ.get('HTTP_USER_AGENT', '(None)'),
-                })
+                # Entries are formatted and written out in background by the access log writer,
+                # the response size is always the last element of the tuple.
+                access_log_entry = (
+                    remote_addr,
+                    cid,
+                    (_utcnow() - request_ts_utc).total_seconds(),
+                    channel_name,
+                    request_ts_utc,
+                    wsgi_environ['REQUEST_METHOD'],
+                    wsgi_environ['PATH_INFO'],
+                    wsgi_environ['SERVER_PROTOCOL'],
+                    wsgi_environ['zato.http.response.status'].split()[0],
+                    wsgi_environ.get('HTTP_USER_AGENT', '(None)'),
+                    None if is_streamed else len(payload),
+                )
+
+                # The size of a streamed response is known only after it has been sent
+                if not is_streamed:
+                    self.access_log_push(access_log_entry)
+
+        if is_streamed:
+            return self._yield_streamed_payload(payload, access_log_entry)
 
         return [payload]
+
+# ################################################################################################################################
+
+    def _yield_streamed_payload(self, payload, access_log_entry):
+        """ Sends subsequent chunks of a streamed response and logs its access log entry, if any, once all of it is sent.
+        Chunks that are bytes, e.g. XML in the encoding its response declares, are sent as they are, possibly split
+        in the middle of a multi-byte character, and only text chunks are encoded, to UTF-8.
+        """
+        response_size = 0
+
+        for chunk in payload:
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode('utf-8')
+
+            # Empty chunks would mark the end of a response with chunked transfer encoding
+            if chunk:
+                response_size += len(chunk)
+                yield chunk
+
+        if access_log_entry:
+            self.access_log_push(access_log_entry[:-1] + (response_size,))
@@ -17,6 +17,7 @@ from copy import deepcopy
 from datetime import datetime
 from errno import ENOENT
 from inspect import isclass
+from itertools import count
 from os.path import abspath, join as path_join
 from shutil import rmtree
 from tempfile import gettempdir
@@ -47,7 +48,7 @@ from zato.broker import BrokerMessageReceiver
 from zato.bunch import Bunch
 from zato.common import broker_message
 from zato.common.api import CHANNEL, CONNECTION, DATA_FORMAT, FILE_TRANSFER, GENERIC as COMMON_GENERIC, \
-     HTTP_SOAP_SERIALIZATION_TYPE, IPC, KVDB, NOTIF, PUBSUB, RATE_LIMIT, SEC_DEF_TYPE, simple_types, URL_TYPE, TRACE1, \
+     HTTP_SOAP_SERIALIZATION_TYPE, IPC, NOTIF, PUBSUB, RATE_LIMIT, SEC_DEF_TYPE, simple_types, URL_TYPE, TRACE1, \
      ZATO_NONE, ZATO_ODB_POOL_NAME, ZMQ
 from zato.common.broker_message import code_to_name, GENERIC as BROKER_MSG_GENERIC, SERVICE
 from zato.common.const import SECRETS
@@ -56,7 +57,7 @@ from zato.common.json_internal import loads
 from zato.common.match import Matcher
 from zato.common.odb.api import PoolStore, SessionWrapper
 from zato.common.util.api import get_tls_ca_cert_full_path, get_tls_key_cert_full_path, get_tls_from_payload, \
-     import_module_from_path, new_cid, pairwise, parse_extra_into_dict, parse_tls_channel_security_definition, \
+     get_worker_pids, import_module_from_path, new_cid, pairwise, parse_extra_into_dict, parse_tls_channel_security_definition, \
      start_connectors, store_tls, update_apikey_username_to_channel, update_bind_port, visit_py_source
 from zato.server.base.parallel.subprocess_.api import StartConfig as SubprocessStartConfig
 from zato.server.base.worker.common import WorkerImpl
@@ -119,6 +120,12 @@ if 0:
 
 _data_format_dict = DATA_FORMAT.DICT
 
+# Worker store methods that other worker processes of the same server may invoke through IPC
+_ipc_worker_store_methods = {'on_ipc_invoke_service_with_target'}
+
+# How long, in seconds, to wait for another worker process to confirm it received a message with a target
+_target_hand_over_timeout = 2
+
 # ################################################################################################################################
 
 pickup_conf_item_prefix = 'zato.pickup'
@@ -193,6 +200,12 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
         # Which targets this server supports
         self.target_matcher = Matcher()
 
+        # Used to choose, in a round-robin manner, which worker process should handle the next invocation with a target
+        self.target_pid_counter = count()
+
+        # PIDs of all the worker processes of our server, refreshed each time a message cannot be handed over to one of them
+        self.target_pids = []
+
         # To expedite look-ups
         self._simple_types = simple_types
 
@@ -1030,6 +1043,10 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
           'parse_with': config.get('parse_with'),
           'should_read_on_pickup': config.get('read_on_pickup', True),
           'should_parse_on_pickup': config.get('parse_on_pickup', False),
+          'should_stream_on_pickup': config.get('stream_on_pickup', False),
+          'stream_batch_size': config.get('stream_batch_size') or FILE_TRANSFER.DEFAULT.STREAM_BATCH_SIZE,
+          'callback_concurrency': config.get('callback_concurrency') or FILE_TRANSFER.DEFAULT.CALLBACK_CONCURRENCY,
+          'callback_timeout': config.get('callback_timeout') or FILE_TRANSFER.DEFAULT.CALLBACK_TIMEOUT,
           'should_delete_after_pickup': config.get('delete_after_pickup', True),
           'is_case_sensitive': config.get('is_case_sensitive', True),
           'is_line_by_line': config.get('is_line_by_line', False),
@@ -1636,37 +1653,24 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
         target = zato_ctx.get('zato.request_ctx.target', '')
         cid = msg['cid']
 
-        if target:
+        # Messages handed over to us by the first worker process were already checked there
+        if target and not kwargs.get('is_target_dispatched'):
 
             if not self.target_matcher.is_allowed(target):
                 # It's not an error - we just don't accept this target
                 logger.debug('Invocation target `%s` not allowed (%s), CID:%s', target, msg['service'], cid)
                 return
 
-            # We can in theory handle this request but there's still some work first. Our server can be composed
-            # of more than 1 gunicorn worker and each of them receives the messages directed to concrete targets.
-            # Hence we must first check out if another worker from our server didn't beat us to it already.
-            # Everything must be done with a distributed server-wide lock so that workers don't
-            # interrupt each other.
-            else:
-                lock = KVDB.LOCK_ASYNC_INVOKE_WITH_TARGET_PATTERN.format(self.server.fs_server_config.main.token, cid)
-                processed_key = KVDB.ASYNC_INVOKE_PROCESSED_FLAG_PATTERN.format(self.server.fs_server_config.main.token, cid)
-
-                with self.server.zato_lock_manager(lock):
-                    processed = self.server.kvdb.conn.get(processed_key)
-
-                    # Ok, already processed
-                    if processed == KVDB.ASYNC_INVOKE_PROCESSED_FLAG_PATTERN:
-                        return
+            # We can in theory handle this request but our server can be composed of more than 1 gunicorn worker
+            # and each of them receives the messages directed to concrete targets. Only the first worker accepts them,
+            # handing each message over to one of the workers, possibly itself, through local IPC. This makes
+            # sure that each message is processed once without any distributed locks or flags in KVDB.
+            if not self.server.is_first_worker:
+                return
 
-                    # We are first, set the processed flag. The flag expires in 5 minutes
-                    # which is an arbitrary number huge enough to make sure other workers
-                    # within our own server will be able to receive the async message
-                    # we are about to process. Note that we don't set the flag after the processing
-                    # is finished because even if there is any error along the invocation won't be repeated,
-                    # hence we do it here already.
-                    else:
-                        self.server.kvdb.conn.set(processed_key, KVDB.ASYNC_INVOKE_PROCESSED_FLAG_PATTERN, 300)
+            # If the message cannot be handed over, we handle it ourselves rather than lose it
+            if self.hand_over_to_target_pid(msg, channel, action):
+                return
 
         wsgi_environ = {
             'zato.request_ctx.async_msg':msg,
@@ -1692,10 +1696,17 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
             logger.warn(msg)
             raise Exception(msg)
 
-        service.update_handle(self._set_service_response_data(kwargs.get('serialize', True)), service, payload,
-            channel, data_format, transport, self.server, self.broker_client, self, cid,
-            self.worker_config.simple_io, job_type=msg.get('job_type'), wsgi_environ=wsgi_environ,
-            environ=msg.get('environ'))
+        try:
+            service.update_handle(self._set_service_response_data(kwargs.get('serialize', True)), service, payload,
+                channel, data_format, transport, self.server, self.broker_client, self, cid,
+                self.worker_config.simple_io, job_type=msg.get('job_type'), wsgi_environ=wsgi_environ,
+                environ=msg.get('environ'))
+        finally:
+            if service.is_poolable:
+                self.server.service_store.release_instance(service)
+
+        # This is read only now because releasing a poolable service's instance may have replaced a streamed payload
+        response_payload = service.response.payload
 
         # Invoke the callback, if any.
         if msg.get('is_async') and msg.get('callback'):
@@ -1703,7 +1714,7 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
             cb_msg = {}
             cb_msg['action'] = SERVICE.PUBLISH.value
             cb_msg['service'] = msg['callback']
-            cb_msg['payload'] = service.response.payload
+            cb_msg['payload'] = response_payload
             cb_msg['cid'] = new_cid()
             cb_msg['channel'] = CHANNEL.INVOKE_ASYNC_CALLBACK
             cb_msg['data_format'] = data_format
@@ -1714,7 +1725,7 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
             self.broker_client.invoke_async(cb_msg)
 
         if kwargs.get('needs_response'):
-            return service.response.payload
+            return response_payload
 
 # ################################################################################################################################
 
@@ -1729,6 +1740,16 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
 
         return self.on_message_invoke_service(msg, CHANNEL.SCHEDULER, 'SCHEDULER_JOB_EXECUTED', args)
 
+    def on_broker_msg_SCHEDULER_JOBS_EXECUTED(self, msg, args=None):
+        """ Receives a batch of jobs that were due at the same time and invokes each one's service in a new greenlet.
+        """
+        for job_msg in msg.jobs:
+
+            # Only the batch itself was pre-processed when it was received, each of its jobs needs to be too
+            job_msg = self.preprocess_msg(job_msg)
+
+            gevent.spawn(self.on_broker_msg_SCHEDULER_JOB_EXECUTED, job_msg, args)
+
     def on_broker_msg_CHANNEL_ZMQ_MESSAGE_RECEIVED(self, msg, args=None):
         return self.on_message_invoke_service(msg, CHANNEL.ZMQ, 'CHANNEL_ZMQ_MESSAGE_RECEIVED', args)
 
@@ -2410,6 +2431,61 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
     def on_broker_msg_OUTGOING_ZMQ_DELETE(self, msg):
         self.zmq_out_api.delete(msg.name)
 
+# ################################################################################################################################
+
+    def get_next_target_pid(self):
+        """ Returns PID of the worker process that should handle the next invocation with a target.
+        """
+        if not self.target_pids:
+            self.target_pids = get_worker_pids()
+
+        return self.target_pids[next(self.target_pid_counter) % len(self.target_pids)]
+
+# ################################################################################################################################
+
+    def hand_over_to_target_pid(self, msg, channel, action, _timeout=_target_hand_over_timeout):
+        """ Hands a message with a target over to the next worker process of our server. Returns True if another process
+        confirmed it received the message and False if our own process should handle it.
+        """
+        target_pid = self.get_next_target_pid()
+
+        if target_pid == self.server.pid:
+            return False
+
+        # We wait for a confirmation that the message was received, though not for the message to be processed ..
+        response = self.server.invoke_by_pid('on_ipc_invoke_service_with_target', {
+            'msg': msg,
+            'channel': channel,
+            'action': action,
+        }, target_pid, timeout=_timeout, action=IPC.ACTION.INVOKE_WORKER_STORE)
+
+        if response and response[0]:
+            return True
+
+        # .. and if there is none, the process may not exist anymore, in which case the list of PIDs needs to be built anew.
+        # Note that the message may have been received after all, e.g. if the other process is very busy, in which case
+        # it will be handled twice rather than never.
+        logger.warn('Handling message locally, could not hand it over to PID `%s` (%s), cid:`%s`', target_pid, response,
+            msg['cid'])
+
+        self.target_pids = []
+        return False
+
+# ################################################################################################################################
+
+    def on_ipc_invoke_service_with_target(self, data):
+        """ Invoked through IPC by the first worker process of our server with a message for a target we support.
+        The message is processed in a new greenlet so that the first worker process can be told right away that it was received.
+        """
+        gevent.spawn(self._invoke_service_with_target, data)
+        return 'true'
+
+    def _invoke_service_with_target(self, data):
+        try:
+            self.on_message_invoke_service(data['msg'], data['channel'], data['action'], is_target_dispatched=True)
+        except Exception:
+            logger.warn('Could not invoke service with target, cid:`%s`, e:`%s`', data['msg']['cid'], format_exc())
+
 # ################################################################################################################################
 
     def on_ipc_message(self, msg, success=IPC.STATUS.SUCCESS, failure=IPC.STATUS.FAILURE):
@@ -2421,18 +2497,25 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
         # We get here if there is no target_pid or if there is one and it matched that of ours.
 
         try:
-            response = self.invoke(msg.service, msg.payload, channel=CHANNEL.IPC, data_format=msg.data_format)
+            # Messages to the worker store itself point to one of its methods rather than to a service
+            if msg.action == IPC.ACTION.INVOKE_WORKER_STORE:
+                if msg.service not in _ipc_worker_store_methods:
+                    raise ValueError('Worker store method `{}` cannot be invoked through IPC'.format(msg.service))
+                response = getattr(self, msg.service)(msg.payload)
+            else:
+                response = self.invoke(msg.service, msg.payload, channel=CHANNEL.IPC, data_format=msg.data_format)
             status = success
         except Exception:
             response = format_exc()
             status = failure
-        finally:
-            data = '{};{}'.format(status, response)
+
+        # There is no one to reply to if the message was sent in background
+        if not msg.reply_to_tag:
+            return
 
         try:
-            with open(msg.reply_to_fifo, 'wb') as fifo:
-                fifo.write(data if isinstance(data, bytes) else data.encode('utf'))
+            self.server.ipc_api.send_reply(msg.reply_to_tag, msg.request_id, status, '{}'.format(response))
         except Exception:
-            logger.warn('Could not write to FIFO, m:`%s`, r:`%s`, s:`%s`, e:`%s`', msg, response, status, format_exc())
+            logger.warn('Could not send IPC reply, m:`%s`, r:`%s`, s:`%s`, e:`%s`', msg, response, status, format_exc())
 
 # ################################################################################################################################
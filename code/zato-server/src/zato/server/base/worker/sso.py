@@ -53,4 +53,10 @@ class SSO(WorkerImpl):
     def on_broker_msg_SSO_LINK_AUTH_DELETE(self, msg):
         self.server.sso_api.user.on_broker_msg_SSO_LINK_AUTH_DELETE(msg.auth_type, msg.auth_id)
 
+# ################################################################################################################################
+
+    def on_broker_msg_SSO_SESSION_INVALIDATE(self, msg):
+        if self.server.is_sso_enabled:
+            self.server.sso_api.user.on_broker_msg_SSO_SESSION_INVALIDATE(msg.ust, msg.user_id)
+
 # ################################################################################################################################
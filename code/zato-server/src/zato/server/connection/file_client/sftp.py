@@ -17,8 +17,10 @@ from zato.server.connection.file_client.base import BaseFileClient, PathAccessEx
 # ################################################################################################################################
 
 if 0:
+    from typing import BinaryIO
     from zato.server.connection.sftp import SFTPIPCFacade, SFTPInfo
 
+    BinaryIO = BinaryIO
     SFTPIPCFacade = SFTPIPCFacade
     SFTPInfo = SFTPInfo
 
@@ -66,6 +68,15 @@ class SFTPFileClient(BaseFileClient):
         # (str) -> str
         return self.conn.read(path)
 
+# ################################################################################################################################
+
+    @ensure_path_exists
+    def get_as_file_object(self, path, file_object):
+        # type: (str, BinaryIO) -> None
+
+        # The file is downloaded directly to disk, without reading it into memory first
+        self.conn.download_file(path, file_object.name)
+
 # ################################################################################################################################
 
     @ensure_path_exists
@@ -12,13 +12,19 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import logging
 from gzip import GzipFile
 from hashlib import sha256
-from http.client import BAD_REQUEST, FORBIDDEN, INTERNAL_SERVER_ERROR, METHOD_NOT_ALLOWED, NOT_FOUND, UNAUTHORIZED
+from http.client import BAD_REQUEST, FORBIDDEN, INTERNAL_SERVER_ERROR, METHOD_NOT_ALLOWED, NOT_FOUND, NOT_MODIFIED, \
+     UNAUTHORIZED
 from io import StringIO
+from itertools import chain
 from traceback import format_exc
+from zlib import compressobj, DEFLATED, MAX_WBITS
 
 # Django
 from django.http import QueryDict
 
+# gevent
+from gevent.event import Event
+
 # Paste
 from paste.util.converters import asbool
 
@@ -33,7 +39,7 @@ from past.builtins import basestring, unicode
 from zato.common.api import CHANNEL, DATA_FORMAT, JSON_RPC, HTTP_SOAP, RATE_LIMIT, SEC_DEF_TYPE, SIMPLE_IO, TRACE1, \
      URL_PARAMS_PRIORITY, URL_TYPE, ZATO_ERROR, ZATO_NONE, ZATO_OK
 from zato.common.exception import HTTP_RESPONSES
-from zato.common.json_internal import dumps, loads
+from zato.common.json_internal import dumps
 from zato.common.json_schema import DictError as JSONSchemaDictError, ValidationException as JSONSchemaValidationException
 from zato.common.rate_limiting.common import AddressNotAllowed, BaseException as RateLimitingException, RateLimitReached
 from zato.common.util.api import payload_from_request
@@ -42,6 +48,9 @@ from zato.server.connection.http_soap import BadRequest, ClientHTTPError, Forbid
      TooManyRequests, Unauthorized
 from zato.server.service.internal import AdminService
 
+# Zato - Cython
+from zato.simpleio import StreamedOutput
+
 stack_format = None
 
 # ################################################################################################################################
@@ -96,6 +105,9 @@ for code, response in HTTP_RESPONSES.items():
 
 soap_doc = """<?xml version='1.0' encoding='UTF-8'?><soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns="https://zato.io/ns/20130518"><soap:Body>{body}</soap:Body></soap:Envelope>""" # noqa
 
+# Streamed responses are wrapped in SOAP envelopes by sending what comes before and after their body separately
+soap_doc_prefix, soap_doc_suffix = soap_doc.split('{body}')
+
 # ################################################################################################################################
 
 zato_message_soap = """<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns="https://zato.io/ns/20130518">
@@ -162,16 +174,24 @@ def get_client_error_wrapper(transport, data_format):
 
 # ################################################################################################################################
 
+# How long, in seconds, to wait for another greenlet to produce a response to the same request before invoking
+# a service on our own. Requests that are cached wait for each other so as not to invoke the same service
+# for the same request concurrently.
+_cache_in_flight_timeout = 60
+
+# ################################################################################################################################
+
 class _CachedResponse(object):
     """ A wrapper for responses served from caches.
     """
-    __slots__ = ('payload', 'content_type', 'headers', 'status_code')
+    __slots__ = ('payload', 'content_type', 'headers', 'status_code', 'etag')
 
-    def __init__(self, payload, content_type, headers, status_code):
+    def __init__(self, payload, content_type, headers, status_code, etag):
         self.payload = payload
         self.content_type = content_type
         self.headers = headers
         self.status_code = status_code
+        self.etag = etag
 
 # ################################################################################################################################
 
@@ -359,13 +379,17 @@ class RequestDispatcher(object):
                 wsgi_environ['zato.http.response.headers'].update(response.headers)
                 wsgi_environ['zato.http.response.status'] = _status_response[response.status_code]
 
-                if channel_item['content_encoding'] == 'gzip':
+                if channel_item['content_encoding'] == 'gzip' and response.status_code != NOT_MODIFIED:
 
-                    s = _stringio()
-                    with _gzipfile(fileobj=s, mode='w') as f:
-                        f.write(response.payload)
-                    response.payload = s.getvalue()
-                    s.close()
+                    # Streamed responses are compressed chunk by chunk too
+                    if isinstance(response.payload, StreamedOutput):
+                        response.payload = StreamedOutput(self._yield_gzip_chunks(response.payload))
+                    else:
+                        s = _stringio()
+                        with _gzipfile(fileobj=s, mode='w') as f:
+                            f.write(response.payload)
+                        response.payload = s.getvalue()
+                        s.close()
 
                     wsgi_environ['zato.http.response.headers']['Content-Encoding'] = 'gzip'
 
@@ -452,6 +476,22 @@ class RequestDispatcher(object):
             logger.error(response)
             return response
 
+# ################################################################################################################################
+
+    def _yield_gzip_chunks(self, payload, _gzip_wbits=MAX_WBITS | 16):
+        """ Compresses a streamed response to the gzip format incrementally.
+        """
+        compressor = compressobj(9, DEFLATED, _gzip_wbits)
+
+        for chunk in payload:
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode('utf8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+
+        yield compressor.flush()
+
 # ################################################################################################################################
 
     def _on_rate_limiting_exception(self, cid, e, channel_item, _json=DATA_FORMAT.JSON, _json_rpc=JSON_RPC.PREFIX.CHANNEL):
@@ -479,6 +519,10 @@ class RequestHandler(object):
         self.server = server
         self.use_soap_envelope = asbool(self.server.fs_server_config.misc.use_soap_envelope) # type: bool
 
+        # Cache keys of requests whose responses are being produced at the moment, each mapped to an event
+        # set once the response is available in the cache.
+        self.cache_in_flight = {} # type: dict
+
 # ################################################################################################################################
 
     def _set_response_data(self, service, **kwargs):
@@ -547,8 +591,8 @@ class RequestHandler(object):
 
 # ################################################################################################################################
 
-    def get_response_from_cache(self, service, raw_request, channel_item, channel_params, wsgi_environ, _loads=loads,
-        _CachedResponse=_CachedResponse, _HashCtx=_HashCtx, _sha256=sha256, split_re=regex_compile('........?').findall):
+    def get_response_from_cache(self, service, raw_request, channel_item, channel_params, wsgi_environ,
+        _HashCtx=_HashCtx, _sha256=sha256, split_re=regex_compile('........?').findall):
         """ Returns a cached response for incoming request or None if there is nothing cached for it.
         By default, an incoming request's hash is calculated by sha256 over a concatenation of:
           * WSGI REQUEST_METHOD   # E.g. GET or POST
@@ -570,32 +614,74 @@ class RequestHandler(object):
         cache_key = 'http-channel-%s-%s' % (channel_item['id'], hash_value)
 
         # We have the key so now we can check if there is any matching response already stored in cache
-        response = self.server.get_from_cache(channel_item['cache_type'], channel_item['cache_name'], cache_key)
+        return cache_key, self._get_cached_response(channel_item, cache_key)
+
+# ################################################################################################################################
 
-        # If there is any response, we can now load into a format that our callers expect
-        if response:
-            response = _loads(response)
-            response = _CachedResponse(response['payload'], response['content_type'], response['headers'],
-                response['status_code'])
+    def _get_cached_response(self, channel_item, cache_key, _CachedResponse=_CachedResponse):
+        """ Returns a response cached under a given key or None if there is none.
+        """
+        response = self.server.get_from_cache(channel_item['cache_type'], channel_item['cache_name'], cache_key)
 
-        return cache_key, response
+        # Responses are cached as tuples that need no parsing - anything else was cached in an earlier format
+        # and it is ignored, which means that it will be overwritten with a new response.
+        if isinstance(response, tuple):
+            return _CachedResponse(*response)
 
 # ################################################################################################################################
 
-    def set_response_in_cache(self, channel_item, key, response, _dumps=dumps, _py3=PY3):
+    def set_response_in_cache(self, channel_item, key, response, _sha256=sha256):
         """ Caches responses from this channel's invocation for as long as the cache is configured to keep it.
+        Each is stored as a tuple of payload, ready to be sent as it is, content type, headers, status code and ETag.
+        """
+        payload = response.payload
+        if isinstance(payload, unicode):
+            payload = payload.encode('utf8')
+
+        etag = '"%s"' % _sha256(payload).hexdigest()
+        response.headers['ETag'] = etag
+
+        self.server.set_in_cache(channel_item['cache_type'], channel_item['cache_name'], key, (
+            payload,
+            response.content_type,
+            tuple(response.headers.items()),
+            int(response.status_code),
+            etag,
+        ))
+
+# ################################################################################################################################
+
+    def _is_not_modified(self, wsgi_environ, etag):
+        """ Returns True if a client already has a response with a given ETag.
         """
-        self.server.set_in_cache(channel_item['cache_type'], channel_item['cache_name'], key, _dumps({
-            'payload': response.payload,
-            'content_type': response.content_type,
-            'headers': response.headers,
-            'status_code': response.status_code.value if _py3 else response.status_code,
-        }))
+        if_none_match = wsgi_environ.get('HTTP_IF_NONE_MATCH')
+
+        if not (if_none_match and etag):
+            return False
+
+        if if_none_match.strip() == '*':
+            return True
+
+        # Weak comparison is used, as required for If-None-Match by RFC 7232
+        for value in if_none_match.split(','):
+            value = value.strip()
+            if value.startswith('W/'):
+                value = value[2:]
+            if value == etag:
+                return True
+
+        return False
+
+# ################################################################################################################################
+
+    def _get_not_modified_response(self, response, etag, _CachedResponse=_CachedResponse):
+        return _CachedResponse(b'', response.content_type, (('ETag', etag),), NOT_MODIFIED, etag)
 
 # ################################################################################################################################
 
     def handle(self, cid, url_match, channel_item, wsgi_environ, raw_request, worker_store, simple_io_config, post_data,
-            path_info, soap_action, channel_type=CHANNEL.HTTP_SOAP, _response_404=response_404):
+            path_info, soap_action, channel_type=CHANNEL.HTTP_SOAP, _response_404=response_404,
+            _in_flight_timeout=_cache_in_flight_timeout):
         """ Create a new instance of a service and invoke it.
         """
         service, is_active = self.server.service_store.new_instance(channel_item.service_impl_name)
@@ -609,26 +695,67 @@ class RequestHandler(object):
         else:
             channel_params = None
 
+        # Set to an event if it is us who produces a response that other requests for the same cache key may wait for
+        in_flight = None
+
         # If caching is configured for this channel, we need to first check if there is no response already
         if channel_item['cache_type']:
             cache_key, response = self.get_response_from_cache(service, raw_request, channel_item, channel_params, wsgi_environ)
+
+            # If no response is cached but another request is already producing it, we wait for that request
+            # to finish instead of invoking the same service concurrently. If it does not finish in time
+            # or its response could not be cached, we invoke the service ourselves.
+            if not response:
+                other_in_flight = self.cache_in_flight.get(cache_key)
+                if other_in_flight:
+                    other_in_flight.wait(_in_flight_timeout)
+                    response = self._get_cached_response(channel_item, cache_key)
+                else:
+                    in_flight = self.cache_in_flight[cache_key] = Event()
+
             if response:
+
+                # The service will not be invoked so it can be returned to the pool immediately
+                if service.is_poolable:
+                    self.server.service_store.release_instance(service)
+
+                # The client may already have this very response
+                if self._is_not_modified(wsgi_environ, response.etag):
+                    return self._get_not_modified_response(response, response.etag)
+
                 return response
 
         # Add any path params matched to WSGI environment so it can be easily accessible later on
         wsgi_environ['zato.http.path_params'] = url_match
 
         # No cache for this channel or no cached response, invoke the service then.
-        response = service.update_handle(self._set_response_data, service, raw_request,
-            channel_type, channel_item.data_format, channel_item.transport, self.server, worker_store.broker_client,
-            worker_store, cid, simple_io_config, wsgi_environ=wsgi_environ,
-            url_match=url_match, channel_item=channel_item, channel_params=channel_params,
-            merge_channel_params=channel_item.merge_url_params_req,
-            params_priority=channel_item.params_pri)
-
-        # Cache the response if needed (cache_key was already created on return from get_response_from_cache)
-        if channel_item['cache_type']:
-            self.set_response_in_cache(channel_item, cache_key, response)
+        try:
+            try:
+                response = service.update_handle(self._set_response_data, service, raw_request,
+                    channel_type, channel_item.data_format, channel_item.transport, self.server, worker_store.broker_client,
+                    worker_store, cid, simple_io_config, wsgi_environ=wsgi_environ,
+                    url_match=url_match, channel_item=channel_item, channel_params=channel_params,
+                    merge_channel_params=channel_item.merge_url_params_req,
+                    params_priority=channel_item.params_pri)
+            finally:
+                if service.is_poolable:
+                    self.server.service_store.release_instance(service)
+
+            # Cache the response if needed (cache_key was already created on return from get_response_from_cache),
+            # unless it is a streamed one which we would have to read in full first.
+            if channel_item['cache_type'] and not isinstance(response.payload, StreamedOutput):
+                self.set_response_in_cache(channel_item, cache_key, response)
+
+                etag = response.headers['ETag']
+                if self._is_not_modified(wsgi_environ, etag):
+                    return self._get_not_modified_response(response, etag)
+
+        finally:
+
+            # Let any other requests waiting for our response know that it is already available
+            if in_flight:
+                del self.cache_in_flight[cache_key]
+                in_flight.set()
 
         # Having used the cache or not, we can return the response now
         return response
@@ -683,7 +810,7 @@ class RequestHandler(object):
                 else:
                     response.payload = self._get_xml_admin_payload(service_instance, zato_message_template, None)
         else:
-            if not isinstance(response.payload, basestring):
+            if not isinstance(response.payload, (basestring, StreamedOutput)):
                 if isinstance(response.payload, dict) and data_format in (DATA_FORMAT.JSON, DATA_FORMAT.DICT):
                     response.payload = dumps(response.payload)
                 else:
@@ -692,7 +819,10 @@ class RequestHandler(object):
         if transport == URL_TYPE.SOAP:
             if not isinstance(service_instance, AdminService):
                 if self.use_soap_envelope:
-                    response.payload = soap_doc.format(body=response.payload)
+                    if isinstance(response.payload, StreamedOutput):
+                        response.payload = StreamedOutput(chain([soap_doc_prefix], response.payload, [soap_doc_suffix]))
+                    else:
+                        response.payload = soap_doc.format(body=response.payload)
 
 # ################################################################################################################################
 
@@ -22,7 +22,7 @@ from six import PY2
 
 # Zato
 from zato.bunch import Bunch
-from zato.common.api import CONNECTION, DATA_FORMAT, MISC, RATE_LIMIT, SEC_DEF_TYPE, URL_TYPE, ZATO_NONE
+from zato.common.api import CONNECTION, DATA_FORMAT, HTTP_SOAP, MISC, RATE_LIMIT, SEC_DEF_TYPE, URL_TYPE, ZATO_NONE
 from zato.common.vault_ import VAULT
 from zato.common.broker_message import code_to_name, SECURITY, VAULT as VAULT_BROKER_MSG
 from zato.common.dispatch import dispatcher
@@ -88,7 +88,8 @@ class URLData(CyURLData, OAuthDataStore):
                  openstack_config=None, xpath_sec_config=None, tls_channel_sec_config=None, tls_key_cert_config=None, \
                  vault_conn_sec_config=None, kvdb=None, broker_client=None, odb=None, json_pointer_store=None, xpath_store=None,
                  jwt_secret=None, vault_conn_api=None):
-        super(URLData, self).__init__(channel_data)
+        super(URLData, self).__init__(channel_data,
+            int(worker.server.fs_server_config.http.get('url_match_cache_size', HTTP_SOAP.URL_MATCH_CACHE_SIZE)))
         self.worker = worker # type: WorkerStore
         self.url_sec = url_sec
         self.basic_auth_config = basic_auth_config # type: dict
@@ -695,7 +696,9 @@ class URLData(CyURLData, OAuthDataStore):
 
         # No error, let's delete channel info
         if match_idx != ZATO_NONE:
-            self.channel_data.pop(match_idx)
+            old_data = self.channel_data.pop(match_idx)
+            self.url_router.remove(old_data)
+            self.remove_from_cache_by_channel(old_data['match_target'])
 
 # ################################################################################################################################
 
@@ -1218,7 +1221,7 @@ class URLData(CyURLData, OAuthDataStore):
 
     def sort_channel_data(self):
         """ Sorts channel items by name and then re-arranges the result so that user-facing services are closer to the begining
-        of the list which makes it faster to look them up - searches in the list are O(n).
+        of the list. The order of the list is the order of precedence in which channels are matched.
         """
         channel_data = []
         user_services = []
@@ -1238,6 +1241,9 @@ class URLData(CyURLData, OAuthDataStore):
 
         self.channel_data[:] = channel_data
 
+        # The routing tree needs to know the new order of precedence
+        self.url_router.set_order(self.channel_data)
+
 # ################################################################################################################################
 
     def _channel_item_from_msg(self, msg, match_target, old_data={}):
@@ -1302,9 +1308,11 @@ class URLData(CyURLData, OAuthDataStore):
         match_target = get_match_target(msg, http_methods_allowed_re=self.worker.server.http_methods_allowed_re)
         channel_item = self._channel_item_from_msg(msg, match_target, old_data)
         self.channel_data.append(channel_item)
+        self.url_router.add(channel_item)
         self.url_sec[match_target] = self._sec_info_from_msg(msg)
 
-        self._remove_from_cache(match_target)
+        # The new channel may take precedence over other ones for some of the targets already in cache
+        self.remove_from_cache_by_matcher(channel_item['match_target_compiled'])
         self.sort_channel_data()
 
         # Set up rate limiting
@@ -1325,7 +1333,7 @@ class URLData(CyURLData, OAuthDataStore):
         }, http_methods_allowed_re=self.worker.server.http_methods_allowed_re)
 
         # Delete from URL cache
-        self._remove_from_cache(old_match_target)
+        self.remove_from_cache_by_channel(old_match_target)
 
         # In case of an internal error, we won't have the match all
         match_idx = ZATO_NONE
@@ -1336,6 +1344,7 @@ class URLData(CyURLData, OAuthDataStore):
         # No error, let's delete channel info
         if match_idx != ZATO_NONE:
             old_data = self.channel_data.pop(match_idx)
+            self.url_router.remove(old_data)
         else:
             old_data = {}
 
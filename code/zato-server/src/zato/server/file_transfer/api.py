@@ -17,11 +17,13 @@ from importlib import import_module
 from mimetypes import guess_type as guess_mime_type
 from re import IGNORECASE
 from sys import maxsize
+from time import monotonic
 from traceback import format_exc
 
 # gevent
-from gevent import sleep
+from gevent import sleep, Timeout
 from gevent.lock import RLock
+from gevent.pool import Pool
 
 # globre
 import globre
@@ -86,6 +88,37 @@ source_type_to_snapshot_maker_class = {
 # Under Linux, we prefer to use inotify instead of snapshots.
 prefer_inotify = is_linux
 
+# Types of targets that callbacks are invoked for
+callback_target_service = 'service'
+callback_target_topic = 'topic'
+callback_target_outconn_rest = 'outconn_rest'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CallbackResult(object):
+    """ Outcome of a single callback invoked for a file transfer event.
+    """
+    __slots__ = ('target_type', 'target', 'is_ok', 'error', 'time')
+
+    def __init__(self, target_type, target):
+        # type: (str, object) -> None
+        self.target_type = target_type
+        self.target = target
+        self.is_ok = False # type: bool
+        self.error = None  # type: str
+        self.time = None   # type: float
+
+    def to_dict(self):
+        # type: () -> dict
+        return {
+            'target_type': self.target_type,
+            'target': self.target,
+            'is_ok': self.is_ok,
+            'error': self.error,
+            'time': self.time,
+        }
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -316,7 +349,10 @@ class FileTransferAPI(object):
 # ################################################################################################################################
 
     def invoke_callbacks(self, event, service_list, topic_list, outconn_rest_list):
-        # type: (FileTransferEvent, list, list, list) -> None
+        """ Invokes all the callbacks for an event concurrently, waiting for all of them to complete
+        and returning a list of their results.
+        """
+        # type: (FileTransferEvent, list, list, list) -> list
 
         config = self.worker_store.get_channel_file_transfer_config(event.channel_name)
 
@@ -331,39 +367,85 @@ class FileTransferAPI(object):
             'has_raw_data': event.has_raw_data,
             'has_data': event.has_data,
             'parse_error': event.parse_error,
+            'is_batch': event.is_batch,
+            'batch_idx': event.batch_idx,
+            'is_last_batch': event.is_last_batch,
             'config': config,
         }
 
-        # Services
-        self.invoke_service_callbacks(service_list, request)
+        # Each callback is a target of a given type and a function to invoke the target with ..
+        callback_list = []
+
+        # .. services ..
+        for item in service_list: # type: str
+            callback_list.append((callback_target_service, item, self.server.invoke))
+
+        # .. topics ..
+        for item in topic_list: # type: str
+            callback_list.append((callback_target_topic, item, self.server.invoke))
+
+        # .. REST outgoing connections.
+        for item_id in outconn_rest_list: # type: int
+            callback_list.append((callback_target_outconn_rest, item_id, self._invoke_rest_outconn_callback))
+
+        if not callback_list:
+            return []
+
+        concurrency = int(config.get('callback_concurrency') or FILE_TRANSFER.DEFAULT.CALLBACK_CONCURRENCY)
+        timeout = float(config.get('callback_timeout') or FILE_TRANSFER.DEFAULT.CALLBACK_TIMEOUT)
+
+        # No more than this many callbacks will be running at a time,
+        # so a slow target delays only its own invocation rather than all the others.
+        pool = Pool(concurrency)
+
+        result_list = []
+
+        for target_type, target, func in callback_list:
+            result = CallbackResult(target_type, target)
+            result_list.append(result)
+            pool.spawn(self._invoke_callback, result, func, request, timeout)
 
-        # Topics
-        self.invoke_topic_callbacks(topic_list, request)
+        pool.join()
 
-        # REST outgoing connections
-        self.invoke_rest_outconn_callbacks(outconn_rest_list, request)
+        self._log_callback_results(event, result_list)
+
+        return result_list
 
 # ################################################################################################################################
 
-    def invoke_service_callbacks(self, service_list, request):
-        # type: (list, dict) -> None
+    def _invoke_callback(self, result, func, request, timeout):
+        # type: (CallbackResult, object, dict, float) -> None
 
-        for item in service_list: # type: str
-            try:
-                spawn_greenlet(self.server.invoke, item, request)
-            except Exception:
-                logger.warn(format_exc())
+        start = monotonic()
+
+        timer = Timeout(timeout)
+        timer.start()
+
+        try:
+            func(result.target, request)
+        except Timeout as e:
+            result.error = 'Timed out after {}s'.format(timeout) if e is timer else format_exc()
+        except Exception:
+            result.error = format_exc()
+        else:
+            result.is_ok = True
+        finally:
+            timer.close()
+            result.time = round(monotonic() - start, 4)
 
 # ################################################################################################################################
 
-    def invoke_topic_callbacks(self, topic_list, request):
-        # type: (list, dict) -> None
+    def _log_callback_results(self, event, result_list):
+        # type: (FileTransferEvent, list) -> None
 
-        for item in topic_list: # type: str
-            try:
-                spawn_greenlet(self.server.invoke, item, request)
-            except Exception:
-                logger.warn(format_exc())
+        error_list = [elem.to_dict() for elem in result_list if not elem.is_ok]
+
+        if error_list:
+            logger.warn('File transfer callbacks for `%s` (%s) failed; errors:%s/%s `%s`',
+                event.full_path, event.channel_name, len(error_list), len(result_list), error_list)
+        else:
+            logger.debug('File transfer callbacks for `%s` (%s) completed `%s`',
+                event.full_path, event.channel_name, [elem.to_dict() for elem in result_list])
 
 # ################################################################################################################################
 
@@ -377,8 +459,8 @@ class FileTransferAPI(object):
 
         if ping_response.status_code != OK:
 
-            logger.warn('Could not ping file transfer connection for `%s` (%s); config:`%s`, r:`%s`, h:`%s`',
-                request['full_path'], request['config'].name, item.config, ping_response.text, ping_response.headers)
+            raise ValueError('Could not ping file transfer connection for `{}` ({}); config:`{}`, r:`{}`, h:`{}`'.format(
+                request['full_path'], request['config'].name, item.config, ping_response.text, ping_response.headers))
 
         else:
 
@@ -395,20 +477,17 @@ class FileTransferAPI(object):
                 'X-Zato-Mime-Type': mime_type,
             }
 
+            # Streamed files are sent in batches, each in a separate request
+            if request['is_batch']:
+                headers['X-Zato-Batch-Index'] = str(request['batch_idx'])
+                headers['X-Zato-Is-Last-Batch'] = str(request['is_last_batch'])
+
             response = item.conn.post(cid, payload, params, headers=headers) # type: Response
 
             if response.status_code != OK:
-                logger.warn('Could not send file `%s` (%s) to `%s` (p:`%s`, h:`%s`), r:`%s`, h:`%s`',
+                raise ValueError('Could not send file `{}` ({}) to `{}` (p:`{}`, h:`{}`), r:`{}`, h:`{}`'.format(
                     request['full_path'], request['config'].name, item.config, params, headers,
-                    response.text, response.headers)
-
-# ################################################################################################################################
-
-    def invoke_rest_outconn_callbacks(self, outconn_rest_list, request):
-        # type: (list, dict) -> None
-
-        for item_id in outconn_rest_list: # type: int
-            spawn_greenlet(self._invoke_rest_outconn_callback, item_id, request)
+                    response.text, response.headers))
 
 # ################################################################################################################################
 
@@ -12,8 +12,13 @@ from io import StringIO
 from logging import getLogger
 from traceback import format_exc
 
+# gevent
+from gevent import spawn
+
 # Zato
+from zato.common.api import FILE_TRANSFER
 from zato.common.util.api import hot_deploy, spawn_greenlet
+from zato.server.file_transfer.stream import mark_last, yield_batches, yield_lines
 
 if 0:
     from zato.server.file_transfer.observer.base import BaseObserver, PathCreatedEvent
@@ -40,7 +45,7 @@ class FileTransferEvent(object):
     """ Encapsulates information about a file picked up from file system.
     """
     __slots__ = ('base_dir', 'file_name', 'full_path', 'channel_name', 'ts_utc', 'raw_data', 'data', 'has_raw_data', 'has_data',
-        'parse_error')
+        'parse_error', 'is_batch', 'batch_idx', 'is_last_batch')
 
     def __init__(self):
         self.base_dir = None      # type: str
@@ -53,6 +58,9 @@ class FileTransferEvent(object):
         self.has_raw_data = False # type: bool
         self.has_data = False     # type: bool
         self.parse_error = None   # type: str
+        self.is_batch = False     # type: bool
+        self.batch_idx = None     # type: int
+        self.is_last_batch = None # type: bool
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -122,6 +130,14 @@ class FileTransferEventHandler:
                     self.config.should_delete_after_pickup)
                 return
 
+            # Streamed files are read, parsed and handed over to callbacks in batches ..
+            if self.config.get('should_stream_on_pickup'):
+                self._handle_stream(event, snapshot_maker)
+
+                # .. and cleanup takes place only after all of the batches have been processed.
+                self.manager.post_handle(event, self.config, observer, snapshot_maker)
+                return
+
             if self.config.should_read_on_pickup:
 
                 if snapshot_maker:
@@ -146,8 +162,9 @@ class FileTransferEventHandler:
                         event.parse_error = exception
                         logger.warn('File transfer parsing error (%s) e:`%s`', self.config.name, exception)
 
-            # Invokes all callbacks for the event
-            spawn_greenlet(self.manager.invoke_callbacks, event, self.config.service_list, self.config.topic_list,
+            # Invokes all callbacks for the event in background - they report their own errors
+            # so there is no need to wait for any of them here.
+            spawn(self.manager.invoke_callbacks, event, self.config.service_list, self.config.topic_list,
                 self.config.outconn_rest_list)
 
             # Performs cleanup actions
@@ -159,5 +176,67 @@ class FileTransferEventHandler:
 
     on_modified = on_created
 
+# ################################################################################################################################
+
+    def _handle_stream(self, event, snapshot_maker):
+        # type: (FileTransferEvent, BaseSnapshotMaker) -> None
+
+        batch_size = self.config.get('stream_batch_size') or FILE_TRANSFER.DEFAULT.STREAM_BATCH_SIZE
+        batch_size = int(batch_size)
+
+        if self.config.should_parse_on_pickup:
+            parser_name = self.config.parse_with
+            parser = self.manager.get_parser(parser_name)
+        else:
+            parser_name = None
+            parser = None
+
+        f = snapshot_maker.open_file(event.full_path) if snapshot_maker else open(event.full_path, 'rb')
+
+        # Index of the next batch to be read
+        batch_idx = 0
+
+        try:
+            lines = yield_lines(f, self.config.data_encoding)
+
+            for (raw_data, records), is_last_batch in mark_last(yield_batches(lines, batch_size, parser, parser_name)):
+
+                event.raw_data = raw_data
+                event.has_raw_data = True
+                event.is_batch = True
+                event.batch_idx = batch_idx
+                event.is_last_batch = is_last_batch
+
+                if parser:
+                    event.data = records
+                    event.has_data = True
+
+                # Callbacks are invoked synchronously, i.e. all of them need to complete before the next batch is read,
+                # which bounds the memory used no matter how large the file is.
+                self.manager.invoke_callbacks(event, self.config.service_list, self.config.topic_list,
+                    self.config.outconn_rest_list)
+
+                batch_idx += 1
+
+        except Exception:
+            exception = format_exc()
+            logger.warn('File transfer streaming error (%s) e:`%s`', self.config.name, exception)
+
+            # Let the callbacks know that no more batches are to be expected
+            event.raw_data = ''
+            event.data = singleton
+            event.has_raw_data = False
+            event.has_data = False
+            event.parse_error = exception
+            event.is_batch = True
+            event.batch_idx = batch_idx
+            event.is_last_batch = True
+
+            self.manager.invoke_callbacks(event, self.config.service_list, self.config.topic_list,
+                self.config.outconn_rest_list)
+
+        finally:
+            f.close()
+
 # ################################################################################################################################
 # ################################################################################################################################
@@ -241,7 +241,7 @@ class BaseObserver:
 
                 try:
 
-                    # The latest snapshot ..
+                    # The latest snapshot - this is the only time in each iteration that the path is listed ..
                     new_snapshot = snapshot_maker.get_snapshot(path, is_recursive, False, False)
 
                     # .. difference between the old and new will return, in particular, new or modified files ..
@@ -258,8 +258,12 @@ class BaseObserver:
                         full_event_path = os.path.join(path, path_modified)
                         handler_func(FileModifiedEvent(full_event_path), self, snapshot_maker)
 
-                    # .. a new snapshot which will be treated as the old one in the next iteration
-                    snapshot = snapshot_maker.get_snapshot(path, is_recursive, False, True)
+                    # .. the snapshot is stored only if anything changed, otherwise what is stored is still valid ..
+                    if diff.has_changes:
+                        snapshot_maker.store_snapshot(new_snapshot)
+
+                    # .. and it will be treated as the old one in the next iteration.
+                    snapshot = new_snapshot
 
                 # Note that this will be caught only with local files not with FTP, SFTP etc.
                 except FileNotFoundError as e:
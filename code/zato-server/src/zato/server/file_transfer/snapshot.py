@@ -8,8 +8,10 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 import os
+from contextlib import closing
 from datetime import datetime
 from logging import getLogger
+from tempfile import NamedTemporaryFile
 from traceback import format_exc
 
 # dateutil
@@ -26,11 +28,13 @@ from zato.server.connection.file_client.sftp import SFTPFileClient
 
 if 0:
     from bunch import Bunch
+    from typing import BinaryIO
     from zato.server.connection.ftp import FTPStore
     from zato.server.file_transfer.api import FileTransferAPI
     from zato.server.file_transfer.observer.base import BaseObserver
 
     BaseObserver = BaseObserver
+    BinaryIO = BinaryIO
     Bunch = Bunch
     FileTransferAPI = FileTransferAPI
     FTPStore = FTPStore
@@ -132,9 +136,9 @@ class DirSnapshot:
 # ################################################################################################################################
 
 class DirSnapshotDiff:
-    """ A difference between two DirSnapshot objects, i.e. all the files created and modified.
+    """ A difference between two DirSnapshot objects, i.e. all the files created, modified and deleted.
     """
-    __slots__ = 'files_created', 'files_modified'
+    __slots__ = 'files_created', 'files_modified', 'files_deleted'
 
     def __init__(self, previous_snapshot, current_snapshot):
         # type: (DirSnapshot, DirSnapshot)
@@ -143,15 +147,19 @@ class DirSnapshotDiff:
         # These will be new for sure ..
         self.files_created = set()
 
-        # .. used to prepare a list of files that were potentially modified.
+        # .. used to prepare a list of files that were potentially modified ..
         self.files_modified = set()
 
+        # .. and these do not exist anymore.
+        self.files_deleted = set()
+
         # We require for both snapshots to exist, otherwise we just return.
         if not (previous_snapshot and current_snapshot):
             return
 
-        # New files ..
+        # New and deleted files ..
         self.files_created = set(current_snapshot.file_data) - set(previous_snapshot.file_data)
+        self.files_deleted = set(previous_snapshot.file_data) - set(current_snapshot.file_data)
 
         # .. now, go through each file in the current snapshot and compare its timestamps and file size
         # with what was found the previous time. If either is different,
@@ -169,6 +177,14 @@ class DirSnapshotDiff:
                 if size_differs or last_modified_differs:
                     self.files_modified.add(current.name)
 
+# ################################################################################################################################
+
+    @property
+    def has_changes(self):
+        """ Returns True if the two snapshots differ in any way, i.e. if the current one needs to be stored.
+        """
+        return bool(self.files_created or self.files_modified or self.files_deleted)
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -196,6 +212,11 @@ class AbstractSnapshotMaker:
     def get_file_data(self, *args, **kwargs):
         raise NotImplementedError('Must be implemented in subclasses')
 
+# ################################################################################################################################
+
+    def open_file(self, *args, **kwargs):
+        raise NotImplementedError('Must be implemented in subclasses')
+
 # ################################################################################################################################
 
     def store_snapshot(self, snapshot):
@@ -239,6 +260,12 @@ class LocalSnapshotMaker(AbstractSnapshotMaker):
         with open(path, 'rb') as f:
             return f.read()
 
+# ################################################################################################################################
+
+    def open_file(self, path):
+        # type: (str) -> BinaryIO
+        return open(path, 'rb')
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -303,42 +330,44 @@ class BaseSnapshotMaker(AbstractSnapshotMaker):
 
 # ################################################################################################################################
 
-    def get_snapshot(self, path, ignored_is_recursive, is_initial, needs_store):
-        # type: (str, bool) -> DirSnapshot
-
-        # We are not sure yet if we are to need it.
-        session = None
+    def _get_snapshot_name(self, path):
+        # type: (str) -> str
 
         # A combination of our channel's ID and directory we are checking is unique
-        name = '{}; {}'.format(self.channel_config.id, path)
+        return '{}; {}'.format(self.channel_config.id, path)
 
-        try:
-            # If we otherwise know that we will access the database,
-            # we can create a new SQL session here.
-            if needs_store:
-                session = self.odb.session()
-                wrapper = self.transfer_wrapper_class(session, self.file_transfer_api.server.cluster_id)
+# ################################################################################################################################
 
+    def get_snapshot(self, path, ignored_is_recursive, is_initial, needs_store):
+        # type: (str, bool) -> DirSnapshot
+
+        try:
             # If this is the observer's initial snapshot ..
             if is_initial:
 
                 # .. we need to check if we may perhaps have it in the ODB ..
-                already_existing = wrapper.get(name)
+                with closing(self.odb.session()) as session:
+                    wrapper = self.transfer_wrapper_class(session, self.file_transfer_api.server.cluster_id)
+                    already_existing = wrapper.get(self._get_snapshot_name(path))
 
                 # .. if we do, we can return it ..
                 if already_existing:
                     return DirSnapshot.from_sql_dict(path, already_existing)
 
-                # .. otherwise, we return the current state of the remote resource.
+                # .. otherwise, we return the current state of the remote resource,
+                # storing it first so that it can be diffed against the next time we start.
                 else:
-                    return self._get_current_snapshot(path)
+                    snapshot = self._get_current_snapshot(path)
+                    if needs_store:
+                        self.store_snapshot(snapshot)
+                    return snapshot
 
             # .. this is not the initial snapshot so we need to make one ..
             snapshot = self._get_current_snapshot(path)
 
             # .. store it if we are told to ..
             if needs_store:
-                wrapper.store(name, snapshot.to_json())
+                self.store_snapshot(snapshot)
 
             # .. and return the result to our caller.
             return snapshot
@@ -351,9 +380,13 @@ class BaseSnapshotMaker(AbstractSnapshotMaker):
             logger.warn('Exception caught in get_snapshot (%s), e:`%s`', self.channel_config.source_type, format_exc())
             raise
 
-        finally:
-            if session:
-                session.close()
+# ################################################################################################################################
+
+    def store_snapshot(self, snapshot):
+        # type: (DirSnapshot) -> None
+        with closing(self.odb.session()) as session:
+            wrapper = self.transfer_wrapper_class(session, self.file_transfer_api.server.cluster_id)
+            wrapper.store(self._get_snapshot_name(snapshot.path), snapshot.to_json())
 
 # ################################################################################################################################
 
@@ -361,6 +394,25 @@ class BaseSnapshotMaker(AbstractSnapshotMaker):
         # type: (str) -> bytes
         return self.file_client.get(path)
 
+# ################################################################################################################################
+
+    def open_file(self, path):
+        # type: (str) -> BinaryIO
+
+        # Remote files are downloaded in chunks to a temporary file, deleted when the file object is closed,
+        # which means that they can be processed the same way local ones are.
+        f = NamedTemporaryFile(prefix='zato-file-transfer-')
+
+        try:
+            self.file_client.get_as_file_object(path, f)
+            f.flush()
+            f.seek(0)
+        except Exception:
+            f.close()
+            raise
+        else:
+            return f
+
 # ################################################################################################################################
 # ################################################################################################################################
 
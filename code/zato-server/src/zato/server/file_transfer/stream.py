@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from mmap import ACCESS_READ, mmap
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from typing import BinaryIO, Callable, Iterator
+
+    BinaryIO = BinaryIO
+    Callable = Callable
+    Iterator = Iterator
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# Parsers that accept an iterator of lines rather than a single string
+line_iter_parser_list = {'py:csv.reader'}
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def yield_lines(f, encoding):
+    """ Yields decoded lines from a file object opened in binary mode. The file is memory-mapped so only the pages
+    currently being read need to be resident in memory, no matter how large the file is.
+    """
+    # type: (BinaryIO, str) -> Iterator
+
+    # Empty files cannot be memory-mapped
+    if not os.fstat(f.fileno()).st_size:
+        return
+
+    mapped = mmap(f.fileno(), 0, access=ACCESS_READ)
+
+    try:
+        for line in iter(mapped.readline, b''): # type: bytes
+            yield line.decode(encoding)
+    finally:
+        mapped.close()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LineRecorder(object):
+    """ Passes lines through to a parser while keeping the ones consumed so far, which lets each batch of records
+    be accompanied by the raw data it was parsed from.
+    """
+    __slots__ = ('lines', 'consumed')
+
+    def __init__(self, lines):
+        # type: (Iterator) -> None
+        self.lines = lines
+        self.consumed = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.lines)
+        self.consumed.append(line)
+        return line
+
+    def pop_consumed(self):
+        # type: () -> str
+        out = ''.join(self.consumed)
+        self.consumed = []
+        return out
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def yield_batches(lines, batch_size, parser=None, parser_name=None):
+    """ Yields (raw_data, records) tuples, each with up to batch_size records. Without a parser, each line is a record.
+    Parsers such as csv.reader receive all the lines as an iterator, any other is invoked for each non-empty line
+    on its own, e.g. JSON Lines can be parsed with json.loads.
+    """
+    # type: (Iterator, int, Callable, str) -> Iterator
+
+    recorder = LineRecorder(lines)
+
+    if parser is None:
+        records = recorder
+    elif parser_name in line_iter_parser_list:
+        records = parser(recorder)
+    else:
+        records = (parser(line) for line in recorder if line.strip())
+
+    batch = []
+
+    for record in records:
+        batch.append(record)
+
+        if len(batch) == batch_size:
+            yield recorder.pop_consumed(), batch
+            batch = []
+
+    # Any remaining records, or trailing data that did not produce any
+    raw_data = recorder.pop_consumed()
+    if batch or raw_data:
+        yield raw_data, batch
+
+# ################################################################################################################################
+
+def mark_last(iterable):
+    """ Yields (item, is_last) tuples, reading one item ahead of what is being returned.
+    """
+    # type: (Iterator) -> Iterator
+
+    iterator = iter(iterable)
+
+    try:
+        previous = next(iterator)
+    except StopIteration:
+        return
+
+    for item in iterator:
+        yield previous, False
+        previous = item
+
+    yield previous, True
+
+# ################################################################################################################################
+# ################################################################################################################################
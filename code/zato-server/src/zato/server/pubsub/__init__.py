@@ -18,6 +18,7 @@ from traceback import format_exc
 
 # gevent
 from gevent import sleep, spawn
+from gevent.event import Event
 from gevent.lock import RLock
 
 # Texttable
@@ -95,6 +96,14 @@ _sub_role = (PUBSUB.ROLE.PUBLISHER_SUBSCRIBER.id, PUBSUB.ROLE.SUBSCRIBER.id)
 _update_attrs = ('data', 'size', 'expiration', 'priority', 'pub_correl_id', 'in_reply_to', 'mime_type',
     'expiration', 'expiration_time')
 
+# Keys that each element of data_list given to publish_many may set on its own, the same ones that a single publication
+# through REST may use. Everything else, e.g. zato_ctx or deliver_to_sk, is always taken from top-level metadata.
+_data_list_elem_keys = ('data', 'msg_id', 'has_gd', 'priority', 'expiration', 'mime_type', 'correl_id', 'in_reply_to',
+    'ext_client_id', 'ext_pub_time')
+
+# Messages published to services always use GD so their elements cannot set it
+_data_list_elem_keys_service = tuple(elem for elem in _data_list_elem_keys if elem != 'has_gd')
+
 # ################################################################################################################################
 
 _ps_default = PUBSUB.DEFAULT
@@ -165,6 +174,10 @@ class PubSub(object):
         self.log_if_deliv_server_not_found = self.server.fs_server_config.pubsub.log_if_deliv_server_not_found
         self.log_if_wsx_deliv_server_not_found = self.server.fs_server_config.pubsub.log_if_wsx_deliv_server_not_found
 
+        # The dictionaries below are read much more often than they are changed so they are never modified in place.
+        # Instead, each change, always made with self.lock held, replaces a dictionary with a new, updated, copy,
+        # which means that readers do not need to acquire self.lock. Use self._cow_update to change them.
+
         self.subscriptions_by_topic = {}       # Topic name     -> List of Subscription objects
         self._subscriptions_by_sub_key = {}    # Sub key        -> Subscription object
         self.sub_key_servers = {}              # Sub key        -> Server/PID handling it
@@ -178,6 +191,11 @@ class PubSub(object):
         self.topic_name_to_id = {}             # Topic name     -> Topic ID
         self.pub_buffer_gd = {}                # Topic ID       -> GD message buffered for that topic
         self.pub_buffer_non_gd = {}            # Topic ID       -> Non-GD message buffered for that topic
+        self.topics_with_msg = set()           # Topic IDs with messages published since the last sync with tasks
+
+        # Set each time a message is published to a topic, which lets the notification loop
+        # wake up only when there is something for it to do.
+        self.topics_with_msg_event = Event()
 
         self.pubsub_tool_by_sub_key = {}       # Sub key        -> PubSubTool object
         self.pubsub_tools = []                 # A list of PubSubTool objects, each containing delivery tasks
@@ -211,6 +229,10 @@ class PubSub(object):
         # Manages access to service hooks
         self.hook_tool = HookTool(self.server, HookCtx, hook_type_to_method, self.invoke_service)
 
+        # How many messages at most self.publish_many publishes in one go
+        self.publish_many_chunk_size = int(self.server.fs_server_config.pubsub.get('publish_many_chunk_size') or
+            PUBSUB.DEFAULT.PUBLISH_MANY_CHUNK_SIZE)
+
         spawn_greenlet(self.trigger_notify_pubsub_tasks)
 
 # ################################################################################################################################
@@ -221,6 +243,24 @@ class PubSub(object):
         self.emit_about_to_access_sub_sk({'sub_sk':sorted(self._subscriptions_by_sub_key), 'stack':get_current_stack()})
         return self._subscriptions_by_sub_key
 
+# ################################################################################################################################
+
+    def _cow_update(self, attr_name, to_set=None, to_delete=None):
+        """ Replaces one of the copy-on-write dictionaries with its copy that has keys from to_set added
+        and keys from to_delete removed. Must be called with self.lock held.
+        """
+        # type: (str, dict, list) -> dict
+        new = dict(getattr(self, attr_name))
+
+        if to_set:
+            new.update(to_set)
+
+        for key in to_delete or []:
+            new.pop(key, None)
+
+        setattr(self, attr_name, new)
+        return new
+
 # ################################################################################################################################
 
     def incr_pubsub_msg_counter(self, endpoint_id):
@@ -244,21 +284,20 @@ class PubSub(object):
 # ################################################################################################################################
 
     def get_subscriptions_by_topic(self, topic_name, require_backlog_messages=False):
-        with self.lock:
-            subs = self.subscriptions_by_topic.get(topic_name, [])
-            if require_backlog_messages:
-                out = []
-                for item in subs:
-                    if self.sync_backlog.has_messages_by_sub_key(item.sub_key):
-                        out.append(item)
-                return out
-            else:
-                return subs
+        subs = self.subscriptions_by_topic.get(topic_name, [])
+        if require_backlog_messages:
+            out = []
+            for item in subs:
+                if self.sync_backlog.has_messages_by_sub_key(item.sub_key):
+                    out.append(item)
+            return out
+        else:
+            return subs
 
 # ################################################################################################################################
 
     def _get_subscription_by_sub_key(self, sub_key):
-        """ Low-level implementation of self.get_subscription_by_sub_key, must be called with self.lock held.
+        """ Low-level implementation of self.get_subscription_by_sub_key.
         """
         # type: (str) -> Subscription
         return self.subscriptions_by_sub_key[sub_key]
@@ -267,29 +306,26 @@ class PubSub(object):
 
     def get_subscription_by_sub_key(self, sub_key):
         # type: (str) -> Subscription
-        with self.lock:
-            try:
-                return self._get_subscription_by_sub_key(sub_key)
-            except KeyError:
-                return None
+        try:
+            return self._get_subscription_by_sub_key(sub_key)
+        except KeyError:
+            return None
 
 # ################################################################################################################################
 
     def get_subscription_by_id(self, sub_id):
         # type: (str) -> Subscription
-        with self.lock:
-            for sub in itervalues(self.subscriptions_by_sub_key):
-                if sub.id == sub_id:
-                    return sub
+        for sub in itervalues(self.subscriptions_by_sub_key):
+            if sub.id == sub_id:
+                return sub
 
 # ################################################################################################################################
 
     def get_subscription_by_ext_client_id(self, ext_client_id):
         # type: (str) -> Subscription
-        with self.lock:
-            for sub in itervalues(self.subscriptions_by_sub_key):
-                if sub.ext_client_id == ext_client_id:
-                    return sub
+        for sub in itervalues(self.subscriptions_by_sub_key):
+            if sub.ext_client_id == ext_client_id:
+                return sub
 
 # ################################################################################################################################
 
@@ -350,8 +386,7 @@ class PubSub(object):
 
     def has_sub_key(self, sub_key):
         # type: (str) -> bool
-        with self.lock:
-            return sub_key in self.subscriptions_by_sub_key
+        return sub_key in self.subscriptions_by_sub_key
 
 # ################################################################################################################################
 
@@ -363,7 +398,7 @@ class PubSub(object):
 # ################################################################################################################################
 
     def _len_subscribers(self, topic_name):
-        """ Low-level implementation of self.len_subscribers, must be called with self.lock held.
+        """ Low-level implementation of self.len_subscribers.
         """
         # type: (str) -> int
         return len(self.subscriptions_by_topic[topic_name])
@@ -374,8 +409,7 @@ class PubSub(object):
         """ Returns the amount of subscribers for a given topic.
         """
         # type: (str) -> int
-        with self.lock:
-            return self._len_subscribers(topic_name)
+        return self._len_subscribers(topic_name)
 
 # ################################################################################################################################
 
@@ -383,76 +417,64 @@ class PubSub(object):
         """ Returns True if input topic has at least one subscriber.
         """
         # type: (str) -> bool
-        with self.lock:
-            return self._len_subscribers(topic_name) > 0
+        return self._len_subscribers(topic_name) > 0
 
 # ################################################################################################################################
 
     def has_topic_by_name(self, topic_name):
         # type: (str) -> bool
-        with self.lock:
-            try:
-                self._get_topic_by_name(topic_name)
-            except KeyError:
-                return False
-            else:
-                return True
+        try:
+            self._get_topic_by_name(topic_name)
+        except KeyError:
+            return False
+        else:
+            return True
 
 # ################################################################################################################################
 
     def has_topic_by_id(self, topic_id):
         # type: (int) -> bool
-        with self.lock:
-            try:
-                self.topics[topic_id]
-            except KeyError:
-                return False
-            else:
-                return True
+        return topic_id in self.topics
 
 # ################################################################################################################################
 
     def get_endpoint_by_id(self, endpoint_id):
         # type: (int) -> Endpoint
-        with self.lock:
-            return self.endpoints[endpoint_id]
+        return self.endpoints[endpoint_id]
 
 # ################################################################################################################################
 
     def get_endpoint_by_name(self, endpoint_name):
         # type: (str) -> Endpoint
-        with self.lock:
-            for endpoint in self.endpoints.values():
-                if endpoint.name == endpoint_name:
-                    return endpoint
-            else:
-                raise KeyError('Could not find endpoint by name `{}` among `{}`'.format(endpoint_name, self.endpoints))
+        endpoints = self.endpoints
+
+        for endpoint in endpoints.values():
+            if endpoint.name == endpoint_name:
+                return endpoint
+        else:
+            raise KeyError('Could not find endpoint by name `{}` among `{}`'.format(endpoint_name, endpoints))
 
 # ################################################################################################################################
 
     def get_endpoint_id_by_sec_id(self, sec_id):
         # type: (int) -> int
-        with self.lock:
-            return self.sec_id_to_endpoint_id[sec_id]
+        return self.sec_id_to_endpoint_id[sec_id]
 
 # ################################################################################################################################
 
     def get_endpoint_id_by_ws_channel_id(self, ws_channel_id):
-        with self.lock:
-            return self.ws_channel_id_to_endpoint_id[ws_channel_id]
+        return self.ws_channel_id_to_endpoint_id[ws_channel_id]
 
 # ################################################################################################################################
 
     def get_endpoint_by_ws_channel_id(self, ws_channel_id):
-        with self.lock:
-            endpoint_id = self.ws_channel_id_to_endpoint_id[ws_channel_id]
-            return self.endpoints[endpoint_id]
+        endpoint_id = self.ws_channel_id_to_endpoint_id[ws_channel_id]
+        return self.endpoints[endpoint_id]
 
 # ################################################################################################################################
 
     def get_endpoint_id_by_service_id(self, service_id):
-        with self.lock:
-            return self.service_id_to_endpoint_id[service_id]
+        return self.service_id_to_endpoint_id[service_id]
 
 # ################################################################################################################################
 
@@ -462,8 +484,7 @@ class PubSub(object):
 # ################################################################################################################################
 
     def get_topic_id_by_name(self, topic_name):
-        with self.lock:
-            return self._get_topic_id_by_name(topic_name)
+        return self._get_topic_id_by_name(topic_name)
 
 # ################################################################################################################################
 
@@ -483,32 +504,29 @@ class PubSub(object):
 # ################################################################################################################################
 
     def get_topic_by_name(self, topic_name):
-        with self.lock:
-            return self._get_topic_by_name(topic_name)
+        return self._get_topic_by_name(topic_name)
 
 # ################################################################################################################################
 
     def _get_topic_by_id(self, topic_id):
-        """ Low-level implementation of self.get_topic_by_id, must be called with self.lock held.
+        """ Low-level implementation of self.get_topic_by_id.
         """
         return self.topics[topic_id]
 
 # ################################################################################################################################
 
     def get_topic_by_id(self, topic_id):
-        with self.lock:
-            return self._get_topic_by_id(topic_id)
+        return self._get_topic_by_id(topic_id)
 
 # ################################################################################################################################
 
     def get_topic_name_by_sub_key(self, sub_key):
-        with self.lock:
-            return self._get_subscription_by_sub_key(sub_key).topic_name
+        return self._get_subscription_by_sub_key(sub_key).topic_name
 
 # ################################################################################################################################
 
     def _get_endpoint_by_id(self, endpoint_id):
-        """ Returns an endpoint by ID, must be called with self.lock held.
+        """ Returns an endpoint by ID.
         """
         return self.endpoints[endpoint_id]
 
@@ -516,9 +534,8 @@ class PubSub(object):
 
     def get_sub_key_to_topic_name_dict(self, sub_key_list):
         out = {}
-        with self.lock:
-            for sub_key in sub_key_list:
-                out[sub_key] = self._get_subscription_by_sub_key(sub_key).topic_name
+        for sub_key in sub_key_list:
+            out[sub_key] = self._get_subscription_by_sub_key(sub_key).topic_name
 
         return out
 
@@ -530,31 +547,29 @@ class PubSub(object):
 # ################################################################################################################################
 
     def get_topic_by_sub_key(self, sub_key):
-        with self.lock:
-            return self._get_topic_by_sub_key(sub_key)
+        return self._get_topic_by_sub_key(sub_key)
 
 # ################################################################################################################################
 
     def get_topic_list_by_sub_key_list(self, sk_list):
         out = {}
-        with self.lock:
-            for sub_key in sk_list:
-                out[sub_key] = self._get_topic_by_sub_key(sub_key)
+        for sub_key in sk_list:
+            out[sub_key] = self._get_topic_by_sub_key(sub_key)
         return out
 
 # ################################################################################################################################
 
     def _create_endpoint(self, config):
-        self.endpoints[config.id] = Endpoint(config)
+        self._cow_update('endpoints', {config.id: Endpoint(config)})
 
         if config['security_id']:
-            self.sec_id_to_endpoint_id[config['security_id']] = config.id
+            self._cow_update('sec_id_to_endpoint_id', {config['security_id']: config.id})
 
         if config.get('ws_channel_id'):
-            self.ws_channel_id_to_endpoint_id[config['ws_channel_id']] = config.id
+            self._cow_update('ws_channel_id_to_endpoint_id', {config['ws_channel_id']: config.id})
 
         if config.get('service_id'):
-            self.service_id_to_endpoint_id[config['service_id']] = config.id
+            self._cow_update('service_id_to_endpoint_id', {config['service_id']: config.id})
 
 # ################################################################################################################################
 
@@ -565,7 +580,10 @@ class PubSub(object):
 # ################################################################################################################################
 
     def _delete_endpoint(self, endpoint_id):
-        del self.endpoints[endpoint_id]
+        if endpoint_id not in self.endpoints:
+            raise KeyError(endpoint_id)
+
+        self._cow_update('endpoints', to_delete=[endpoint_id])
 
         sec_id = None
         ws_chan_id = None
@@ -587,13 +605,13 @@ class PubSub(object):
                 break
 
         if sec_id:
-            del self.sec_id_to_endpoint_id[sec_id]
+            self._cow_update('sec_id_to_endpoint_id', to_delete=[sec_id])
 
         if ws_chan_id:
-            del self.ws_channel_id_to_endpoint_id[ws_chan_id]
+            self._cow_update('ws_channel_id_to_endpoint_id', to_delete=[ws_chan_id])
 
         if service_id:
-            del self.service_id_to_endpoint_id[service_id]
+            self._cow_update('service_id_to_endpoint_id', to_delete=[service_id])
 
 # ################################################################################################################################
 
@@ -623,10 +641,11 @@ class PubSub(object):
         """
         sub = Subscription(config)
 
-        existing_by_topic = self.subscriptions_by_topic.setdefault(config.topic_name, [])
-        existing_by_topic.append(sub)
+        # Lists of subscriptions are not modified in place either
+        existing_by_topic = self.subscriptions_by_topic.get(config.topic_name, [])
+        self._cow_update('subscriptions_by_topic', {config.topic_name: existing_by_topic + [sub]})
 
-        self.subscriptions_by_sub_key[config.sub_key] = sub
+        self._cow_update('_subscriptions_by_sub_key', {config.sub_key: sub})
 
 # ################################################################################################################################
 
@@ -649,7 +668,10 @@ class PubSub(object):
         """ Deletes a subscription from the list of subscription. By default, it is not an error to call
         the method with an invalid sub_key. Must be invoked with self.lock held.
         """
-        sub = self.subscriptions_by_sub_key.pop(sub_key, _invalid) # type: Subscription
+        sub = self.subscriptions_by_sub_key.get(sub_key, _invalid) # type: Subscription
+        if sub is not _invalid:
+            self._cow_update('_subscriptions_by_sub_key', to_delete=[sub_key])
+
         if sub is _invalid and (not ignore_missing):
             raise KeyError('No such sub_key `%s`', sub_key)
         else:
@@ -736,8 +758,8 @@ class PubSub(object):
         config.meta_store_frequency = self.topic_meta_store_frequency
 
         topic = Topic(config, self.server.name, self.server.pid)
-        self.topics[config.id] = topic
-        self.topic_name_to_id[config.name] = config.id
+        self._cow_update('topics', {config.id: topic})
+        self._cow_update('topic_name_to_id', {config.name: config.id})
 
         logger.info('Created topic object `%s` (id:%s) on server `%s` (pid:%s)', topic.name, topic.id,
             topic.server_name, topic.server_pid)
@@ -765,13 +787,12 @@ class PubSub(object):
         while now < until:
 
             # We have it, good
-            with self.lock:
-                try:
-                    self._get_topic_by_name(name)
-                except KeyError:
-                    pass # No such topic
-                else:
-                    return True
+            try:
+                self._get_topic_by_name(name)
+            except KeyError:
+                pass # No such topic
+            else:
+                return True
 
             # No such topic, let us sleep for a moment
             sleep(1)
@@ -784,9 +805,16 @@ class PubSub(object):
 
     def _delete_topic(self, topic_id, topic_name):
         # type: (int, str) -> list
-        del self.topic_name_to_id[topic_name]
-        subscriptions_by_topic = self.subscriptions_by_topic.pop(topic_name, [])
-        del self.topics[topic_id]
+        if topic_name not in self.topic_name_to_id:
+            raise KeyError(topic_name)
+
+        if topic_id not in self.topics:
+            raise KeyError(topic_id)
+
+        self._cow_update('topic_name_to_id', to_delete=[topic_name])
+        subscriptions_by_topic = self.subscriptions_by_topic.get(topic_name, [])
+        self._cow_update('subscriptions_by_topic', to_delete=[topic_name])
+        self._cow_update('topics', to_delete=[topic_id])
 
         logger.info('Deleted topic object `%s` (%s), subs:`%s`',
             topic_name, topic_id, [elem.sub_key for elem in subscriptions_by_topic])
@@ -808,10 +836,10 @@ class PubSub(object):
 
     def edit_topic(self, del_name, config):
         with self.lock:
-            subscriptions_by_topic = self.subscriptions_by_topic.pop(del_name, [])
+            subscriptions_by_topic = self.subscriptions_by_topic.get(del_name, [])
             self._delete_topic(config.id, del_name)
             self._create_topic_object(config)
-            self.subscriptions_by_topic[config.name] = subscriptions_by_topic
+            self._cow_update('subscriptions_by_topic', {config.name: subscriptions_by_topic})
 
 # ################################################################################################################################
 
@@ -883,8 +911,7 @@ class PubSub(object):
     def get_topics(self):
         """ Returns all topics in existence.
         """
-        with self.lock:
-            return self.topics
+        return self.topics
 
 # ################################################################################################################################
 
@@ -892,10 +919,9 @@ class PubSub(object):
         """ Returns all topics to which endpoint_id can subscribe.
         """
         out = []
-        with self.lock:
-            for topic in self.topics.values():
-                if self.is_allowed_sub_topic_by_endpoint_id(topic.name, endpoint_id):
-                    out.append(topic)
+        for topic in self.topics.values():
+            if self.is_allowed_sub_topic_by_endpoint_id(topic.name, endpoint_id):
+                out.append(topic)
 
         return out
 
@@ -913,8 +939,7 @@ class PubSub(object):
     def is_subscribed_to(self, endpoint_id, topic_name):
         """ Returns True if the endpoint is subscribed to the named topic.
         """
-        with self.lock:
-            return self._is_subscribed_to(endpoint_id, topic_name)
+        return self._is_subscribed_to(endpoint_id, topic_name)
 
 # ################################################################################################################################
 
@@ -1004,7 +1029,7 @@ class PubSub(object):
         sub = self._get_subscription_by_sub_key(config['sub_key'])
         config['endpoint_id'] = sub.endpoint_id
         config['endpoint_name'] = self._get_endpoint_by_id(sub.endpoint_id)
-        self.sub_key_servers[config['sub_key']] = SubKeyServer(config)
+        self._cow_update('sub_key_servers', {config['sub_key']: SubKeyServer(config)})
 
         endpoint_type = config['endpoint_type']
 
@@ -1032,17 +1057,13 @@ class PubSub(object):
 # ################################################################################################################################
 
     def get_sub_key_server(self, sub_key, default=None):
-        with self.lock:
-            return self._get_sub_key_server(sub_key, default)
+        return self._get_sub_key_server(sub_key, default)
 
 # ################################################################################################################################
 
     def get_delivery_server_by_sub_key(self, sub_key, needs_lock=True):
-        if needs_lock:
-            with self.lock:
-                return self._get_sub_key_server(sub_key)
-        else:
-            return self._get_sub_key_server(sub_key)
+        # Input needs_lock is kept for backward compatibility only because no lock is needed to read self.sub_key_servers
+        return self._get_sub_key_server(sub_key)
 
 # ################################################################################################################################
 
@@ -1055,7 +1076,7 @@ class PubSub(object):
                 logger.info(msg, sub_key, sub_key_server.server_name, sub_key_server.server_pid)
                 logger_zato.info(msg, sub_key, sub_key_server.server_name, sub_key_server.server_pid)
 
-                del self.sub_key_servers[sub_key]
+                self._cow_update('sub_key_servers', to_delete=[sub_key])
             else:
                 logger.info('Could not find sub_key `%s` while deleting sub_key server, current `%s` `%s`',
                     sub_key, self.server.name, self.server.pid)
@@ -1067,12 +1088,7 @@ class PubSub(object):
         which we must remove from our config because without this client they are no longer usable (until the client reconnects).
         """
         with self.lock:
-            for sub_key in config.sub_key_list:
-                self.sub_key_servers.pop(sub_key, None)
-                for server_info in self.sub_key_servers.values():
-                    if server_info.sub_key == sub_key:
-                        del self.sub_key_servers[sub_key]
-                        break
+            self._cow_update('sub_key_servers', to_delete=config.sub_key_list)
 
 # ################################################################################################################################
 
@@ -1246,11 +1262,10 @@ class PubSub(object):
                 # Delete subscription metadata from local pubsub, note that we use .get
                 # instead of deleting directly because this dictionary will be empty
                 # right after a server starts but before any client for that topic (such as WSX) connects to it.
-                subscriptions_by_topic = self.subscriptions_by_topic.get(topic_name, [])
-
-                for sub in subscriptions_by_topic[:]:
-                    if sub.sub_key in sub_keys:
-                        subscriptions_by_topic.remove(sub)
+                if topic_name in self.subscriptions_by_topic:
+                    subscriptions_by_topic = [sub for sub in self.subscriptions_by_topic[topic_name] if
+                        sub.sub_key not in sub_keys]
+                    self._cow_update('subscriptions_by_topic', {topic_name: subscriptions_by_topic})
 
                 for sub_key in sub_keys:
 
@@ -1325,27 +1340,24 @@ class PubSub(object):
         """ Returns a hook for messages to be invoked right before they are about to be delivered
         or None if such a hook is not defined for sub_key's topic.
         """
-        with self.lock:
-            sub = self.get_subscription_by_sub_key(sub_key)
-            return self._get_topic_by_name(sub.topic_name).before_delivery_hook_service_invoker
+        sub = self.get_subscription_by_sub_key(sub_key)
+        return self._get_topic_by_name(sub.topic_name).before_delivery_hook_service_invoker
 
 # ################################################################################################################################
 
     def get_on_subscribed_hook(self, sub_key):
         """ Returns a hook triggered when a new subscription is made to a particular topic.
         """
-        with self.lock:
-            sub = self.get_subscription_by_sub_key(sub_key)
-            return self._get_topic_by_name(sub.topic_name).on_subscribed_service_invoker
+        sub = self.get_subscription_by_sub_key(sub_key)
+        return self._get_topic_by_name(sub.topic_name).on_subscribed_service_invoker
 
 # ################################################################################################################################
 
     def get_on_unsubscribed_hook(self, sub_key=None, sub=None):
         """ Returns a hook triggered when a client unsubscribes from a topic.
         """
-        with self.lock:
-            sub = sub or self.get_subscription_by_sub_key(sub_key)
-            return self._get_topic_by_name(sub.topic_name).on_unsubscribed_service_invoker
+        sub = sub or self.get_subscription_by_sub_key(sub_key)
+        return self._get_topic_by_name(sub.topic_name).on_unsubscribed_service_invoker
 
 # ################################################################################################################################
 
@@ -1353,9 +1365,8 @@ class PubSub(object):
         """ Returns a hook that sends outgoing SOAP Suds connections-based messages or None if there is no such hook
         for sub_key's topic.
         """
-        with self.lock:
-            sub = self.get_subscription_by_sub_key(sub_key)
-            return self._get_topic_by_name(sub.topic_name).on_outgoing_soap_invoke_invoker
+        sub = self.get_subscription_by_sub_key(sub_key)
+        return self._get_topic_by_name(sub.topic_name).on_outgoing_soap_invoke_invoker
 
 # ################################################################################################################################
 
@@ -1490,6 +1501,11 @@ class PubSub(object):
         else:
             topic.sync_has_non_gd_msg = value
 
+        # Let the notification loop know that there is a new message for this topic
+        if value:
+            self.topics_with_msg.add(topic_id)
+            self.topics_with_msg_event.set()
+
         self.emit_set_sync_has_msg({
             'topic_id': topic_id,
             'is_gd': is_gd,
@@ -1539,9 +1555,9 @@ class PubSub(object):
 
 # ################################################################################################################################
 
-    def trigger_notify_pubsub_tasks(self):
-        """ A background greenlet which periodically lets delivery tasks that there are perhaps
-        new GD messages for the topic this class represents.
+    def trigger_notify_pubsub_tasks(self, _max_wait_time=5.0):
+        """ A background greenlet which lets delivery tasks know that there are new messages for topics they subscribe to.
+        It sleeps until a message is published, and then it looks only at the topics that actually received messages.
         """
 
         # Local aliases
@@ -1553,10 +1569,12 @@ class PubSub(object):
 
         _new_cid      = new_cid
         _spawn        = spawn
-        _sleep        = sleep
         _self_lock    = self.lock
-        _self_topics  = self.topics
         _keep_running = self.keep_running
+        _utcnow_as_ms = utcnow_as_ms
+
+        _self_topics_with_msg       = self.topics_with_msg
+        _self_topics_with_msg_event = self.topics_with_msg_event
 
         _logger_info      = logger.info
         _logger_warn      = logger.warn
@@ -1616,24 +1634,45 @@ class PubSub(object):
 
 # ################################################################################################################################
 
+        # How long to wait for new messages in the next iteration
+        wait_time = _max_wait_time
+
         # Loop forever or until stopped
         while _keep_running:
 
-            # Sleep for a while before continuing - the call to sleep is here because this while loop is quite long
-            # so it would be inconvenient to have it down below.
-            _sleep(0.01)
+            # Wait until there is a new message published or until it is time to sync a topic that received one earlier.
+            # The call to wait is here because this while loop is quite long so it would be inconvenient to have it down below.
+            _self_topics_with_msg_event.wait(wait_time)
 
             # Blocks other pub/sub processes for a moment
             with _self_lock:
 
+                # Any messages published from now on will set the event again
+                _self_topics_with_msg_event.clear()
+
                 # Will map a few temporary objects down below
                 topic_id_dict = {}
 
-                # Get all topics ..
-                for _topic in _self_topics.values(): # type: Topic
+                # Unless a topic below needs to be synced sooner, this is how long we will wait in the next iteration
+                wait_time = _max_wait_time
+                now = _utcnow_as_ms()
+
+                # Topics are a copy-on-write dictionary so we need to read it in each iteration
+                _self_topics = self.topics
+
+                # Get all topics with new messages ..
+                for topic_id in list(_self_topics_with_msg):
+
+                    _topic = _self_topics.get(topic_id) # type: Topic
 
-                    # Does the topic require task synchronization now?
+                    # .. the topic may have been deleted in the meantime ..
+                    if not _topic:
+                        _self_topics_with_msg.discard(topic_id)
+                        continue
+
+                    # Does the topic require task synchronization now? If not, make sure we wake up when it does.
                     if not _topic.needs_task_sync():
+                        wait_time = min(wait_time, max(0, _topic.task_sync_interval - (now - _topic.last_synced)))
                         continue
                     else:
                         _topic.update_task_sync_time()
@@ -1641,6 +1680,7 @@ class PubSub(object):
                     # OK, the time has come for this topic to sync its state with subscribers
                     # but still skip it if we know that there have been no messages published to it since the last time.
                     if not (_topic.sync_has_gd_msg or _topic.sync_has_non_gd_msg):
+                        _self_topics_with_msg.discard(topic_id)
                         continue
 
                     # There are some messages, let's see if there are subscribers ..
@@ -1655,6 +1695,12 @@ class PubSub(object):
                     # .. if there are any subscriptions at all, we store that information for later use.
                     if subs:
                         topic_id_dict[_topic.id] = (_topic.name, subs)
+                        _self_topics_with_msg.discard(topic_id)
+
+                    # .. otherwise, the messages are kept until there are subscriptions to deliver them to,
+                    # which we will check again after the topic's sync interval.
+                    else:
+                        wait_time = min(wait_time, _topic.task_sync_interval)
 
 
                 # OK, if we had any subscriptions for at least one topic and there are any messages waiting,
@@ -1774,6 +1820,7 @@ class PubSub(object):
         # If input name is a topic, let us just use it
         if self.has_topic_by_name(name):
             topic_name = name
+            data_list_elem_keys = _data_list_elem_keys
 
             # There is no particular Zato context if the topic name is not really a service name
             zato_ctx = None
@@ -1802,6 +1849,7 @@ class PubSub(object):
 
             # Messages published to services always use GD
             has_gd = True
+            data_list_elem_keys = _data_list_elem_keys_service
 
             # Subscribe the default service delivery endpoint to messages from this topic
             endpoint = self.get_endpoint_by_name(PUBSUB.SERVICE_SUBSCRIBER.NAME)
@@ -1826,11 +1874,8 @@ class PubSub(object):
         user_ctx = kwargs.get('user_ctx')
         zato_ctx = zato_ctx or kwargs.get('zato_ctx')
 
-        response = self.invoke_service('zato.pubsub.publish.publish', {
-            'topic_name': topic_name,
-            'data': data,
-            'data_list': data_list,
-            'msg_id': msg_id,
+        # Metadata that applies to all the messages published, unless a message from data_list has its own
+        msg_metadata = {
             'has_gd': has_gd,
             'priority': priority,
             'expiration': expiration,
@@ -1839,15 +1884,93 @@ class PubSub(object):
             'in_reply_to': in_reply_to,
             'ext_client_id': ext_client_id,
             'ext_pub_time': ext_pub_time,
-            'endpoint_id': endpoint_id,
             'reply_to_sk': reply_to_sk,
             'deliver_to_sk': deliver_to_sk,
             'user_ctx': user_ctx,
             'zato_ctx': zato_ctx,
-        }, serialize=False)
+        }
+
+        if data_list:
+            data_list = [self._get_data_list_elem(elem, msg_metadata, data_list_elem_keys) for elem in data_list]
+
+        request = {
+            'topic_name': topic_name,
+            'data': data,
+            'data_list': data_list,
+            'msg_id': msg_id,
+            'endpoint_id': endpoint_id,
+        }
+        request.update(msg_metadata)
+
+        response = self.invoke_service('zato.pubsub.publish.publish', request, serialize=False)
+
+        # A list of message IDs is returned if there were multiple messages on input
+        if data_list:
+            msg_id_list = response.response.get('msg_id_list')
+            if msg_id_list:
+                return msg_id_list
+            else:
+                msg_id = response.response.get('msg_id')
+                return [msg_id] if msg_id else []
 
         return response.response['msg_id']
 
+# ################################################################################################################################
+
+    def _get_data_list_elem(self, elem, msg_metadata, elem_keys):
+        """ Turns an element of data_list into a dictionary describing a single message to publish,
+        using input metadata for any of the message's keys that are not given explicitly. Only keys from elem_keys
+        are taken from the element, all the other ones are ignored.
+        """
+        # type: (object, dict, tuple) -> dict
+        if isinstance(elem, dict):
+            out = {}
+            for key in elem_keys:
+                value = elem.get(key)
+                if value is not None:
+                    out[key] = value
+        else:
+            out = {'data': elem}
+
+        for key, value in iteritems(msg_metadata):
+            if value is not None and out.get(key) is None:
+                out[key] = value
+
+        return out
+
+# ################################################################################################################################
+
+    def publish_many(self, name, data_list, chunk_size=None, *args, **kwargs):
+        """ Publishes multiple messages to input name, which may point either to a topic or service.
+        Each element of data_list is either data to publish or a dictionary with data and metadata of a message,
+        e.g. {'data':'my data', 'priority':7}, and all the other keyword arguments are the same as in self.publish.
+        Messages are published in chunks of up to chunk_size elements - each chunk is a single invocation
+        of the publishing service, with a single permission check and, for GD messages, a single SQL transaction.
+        Returns a list of IDs of messages published, in the same order as in data_list - messages that a topic's
+        before-publish hook skipped have no IDs so the list is shorter than data_list in such a case. If a chunk cannot
+        be published, the exception is propagated to our caller and no further chunks are published but the ones
+        published before it are not rolled back. Only keys that a single publication through REST may use are taken
+        from each element of data_list, e.g. zato_ctx is always the same for all the messages.
+        POST /zato/pubsub/topic/{topic_name} {"data_list":[...]}
+        """
+        chunk_size = chunk_size or self.publish_many_chunk_size
+
+        kwargs.pop('data', None)
+        out = []
+        chunk = []
+
+        for elem in data_list:
+            chunk.append(elem)
+
+            if len(chunk) == chunk_size:
+                out.extend(self.publish(name, data_list=chunk, *args, **kwargs))
+                chunk = []
+
+        if chunk:
+            out.extend(self.publish(name, data_list=chunk, *args, **kwargs))
+
+        return out
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -18,6 +18,7 @@ from traceback import format_exc
 
 # gevent
 from gevent import sleep, spawn
+from gevent.event import Event
 from gevent.lock import RLock
 from gevent.thread import getcurrent
 
@@ -98,6 +99,11 @@ class DeliveryTask(object):
         self.last_iter_run = utcnow_as_ms()
         self.delivery_interval = self.sub_config.task_delivery_interval / 1000.0
         self.delivery_max_retry = self.sub_config.delivery_max_retry
+
+        # Set by PubSubTool each time new messages are added to our delivery list - we sleep on it
+        # rather than periodically checking whether there is anything to deliver.
+        self.wake_event = Event()
+
         self.previous_delivery_method = self.sub_config.delivery_method
         self.python_id = str(hex(id(self)))
         self.py_object = '<empty>'
@@ -351,22 +357,31 @@ class DeliveryTask(object):
 
 # ################################################################################################################################
 
-    def _should_wake(self, _now=utcnow_as_ms):
-        """ Returns True if the task should be woken up g. because its time has come already to process messages,
-        assumming there are any waiting for it.
+    def wake(self):
+        """ Lets the task know that there are new messages in its delivery list.
+        """
+        self.wake_event.set()
+
+# ################################################################################################################################
+
+    def _get_wait_time(self, _now=utcnow_as_ms):
+        """ Returns for how many seconds the task should still wait before it can deliver messages, i.e. 0 if its time
+        has come already, assuming there are any messages waiting for it.
         """
         now = _now()
         diff = round(now - self.last_iter_run, 2)
 
         if diff >= self.delivery_interval:
-            if self.delivery_list:
-                logger.info('Waking task:%s now:%s last:%s diff:%s interval:%s len-list:%d',
-                    self.sub_key, now, self.last_iter_run, diff, self.delivery_interval, len(self.delivery_list))
-                return True
+            logger.info('Waking task:%s now:%s last:%s diff:%s interval:%s len-list:%d',
+                self.sub_key, now, self.last_iter_run, diff, self.delivery_interval, len(self.delivery_list))
+            return 0
+        else:
+            return self.delivery_interval - diff
 
 # ################################################################################################################################
 
-    def run(self, default_sleep_time=0.1, _status=PUBSUB.RUN_DELIVERY_STATUS, _notify_methods=_notify_methods):
+    def run(self, default_sleep_time=0.1, idle_wait_time=5.0, _status=PUBSUB.RUN_DELIVERY_STATUS,
+        _notify_methods=_notify_methods):
         """ Runs the delivery task's main loop.
         """
         # Fill out Python-level metadata first
@@ -412,7 +427,21 @@ class DeliveryTask(object):
                     sleep(5)
                     continue
 
-                if self._should_wake():
+                # There is nothing to deliver so we wait until we are woken up by PubSubTool. Note that there are no
+                # other greenlets running in between the check and the call to clear so no wake-up will be lost.
+                # The timeout is only a safety net, e.g. for messages added to the delivery list by other means.
+                if not self.delivery_list:
+                    self.wake_event.clear()
+                    self.wake_event.wait(idle_wait_time)
+                    continue
+
+                # There are messages but we delivered others only a moment ago so we need to wait for our turn
+                wait_time = self._get_wait_time()
+
+                if wait_time:
+                    sleep(wait_time)
+
+                else:
 
                     with self.delivery_lock:
 
@@ -447,11 +476,6 @@ class DeliveryTask(object):
                             logger_zato.warn(msg)
                             sleep(sleep_time)
 
-                else:
-
-                    # Wait for our turn
-                    sleep(default_sleep_time)
-
 # ################################################################################################################################
 
         except Exception:
@@ -466,6 +490,7 @@ class DeliveryTask(object):
         if self.keep_running:
             logger.info('Stopping delivery task for sub_key:`%s`', self.sub_key)
             self.keep_running = False
+            self.wake_event.set()
 
             self.pubsub.log_subscriptions_by_sub_key('DeliveryTask.stop')
             self.pubsub.log_subscriptions_by_topic_name('DeliveryTask.stop')
@@ -844,6 +869,8 @@ class PubSubTool(object):
     def _add_non_gd_messages_by_sub_key(self, sub_key, messages):
         """ Low-level implementation of add_non_gd_messages_by_sub_key, must be called with a lock for input sub_key.
         """
+        has_msg = False
+
         for msg in messages:
 
             # Ignore messages that are replies meant to be delievered only to sub_keys
@@ -857,6 +884,10 @@ class PubSubTool(object):
                     continue
 
             self.delivery_lists[sub_key].add(NonGDMessage(sub_key, self.server_name, self.server_pid, msg))
+            has_msg = True
+
+        if has_msg:
+            self._wake_delivery_task(sub_key)
 
 # ################################################################################################################################
 
@@ -1000,6 +1031,19 @@ class PubSubTool(object):
         logger.info('Pushing %d GD message{}to task:%s msg_ids:%s'.format(
             ' ' if count==1 else 's '), count, sub_key, msg_ids)
 
+        if count:
+            self._wake_delivery_task(sub_key)
+
+# ################################################################################################################################
+
+    def _wake_delivery_task(self, sub_key):
+        """ Wakes up the delivery task for sub_key after new messages were added to its delivery list.
+        """
+        # The task may not be registered yet if we are called while it is still being created
+        task = self.delivery_tasks.get(sub_key) # type: DeliveryTask
+        if task:
+            task.wake()
+
 # ################################################################################################################################
 
     def _enqueue_gd_messages_by_sub_key(self, sub_key, gd_msg_list):
@@ -56,6 +56,7 @@ from zato.server.service.reqresp import AMQPRequestData, Cloud, Definition, IBMM
 
 # Zato - Cython
 from zato.cy.reqresp.response import Response
+from zato.simpleio import StreamedOutput
 
 # Not used here in this module but it's convenient for callers to be able to import everything from a single namespace
 from zato.simpleio import AsIs, CSV, Bool, Date, DateTime, Dict, Decimal, DictList, Elem as SIOElem, Float, Int, List, \
@@ -388,6 +389,9 @@ class Service(object):
     # JSON Schema validator attached only if service declares a schema to use
     _json_schema_validator = None # type: JSONSchemaValidator
 
+    # Services may opt in to having their instances recycled by ServiceStore instead of being created each time
+    is_poolable = False # type: bool
+
     def __init__(self, _get_logger=logging.getLogger, _Bunch=Bunch, _Request=Request, _Response=Response,
             _DictNav=DictNav, _ListNav=ListNav, _Outgoing=Outgoing, _WMQFacade=WMQFacade, _ZMQFacade=ZMQFacade,
             *ignored_args, **ignored_kwargs):
@@ -451,6 +455,34 @@ class Service(object):
             self._worker_store.def_kafka,
         )
 
+    def _reset_for_pool(self, _Bunch=Bunch, _Request=Request, _Response=Response):
+        """ Clears per-invocation state of a poolable service before ServiceStore hands the same instance out again.
+        Request and response objects are always new so callers still holding the previous ones are not affected.
+        Services that keep their own state across attributes of self should not be made poolable.
+        """
+        self.server = None
+        self.broker_client = None
+        self.channel = None
+        self.chan = None
+        self.cid = None
+        self.in_reply_to = None
+        self.data_format = None
+        self.transport = None
+        self.wsgi_environ = None
+        self.job_type = None
+        self.environ = _Bunch()
+        self.request = _Request(self.logger)
+        self.response = _Response(self.logger)
+        self.msg = None
+        self.time = None
+        self.patterns = None
+        self.user_config = None
+        self.cache = None
+        self.invocation_time = None
+        self.handle_return_time = None
+        self.processing_time_raw = None
+        self.processing_time = None
+
     @staticmethod
     def get_name_static(class_):
         return Service.get_name(class_)
@@ -664,7 +696,7 @@ class Service(object):
                         self.wsgi_environ['zato.http.remote_addr'])
 
                 if service.server.component_enabled.stats:
-                    service.usage = service.kvdb.conn.incr('{}{}'.format(KVDB.SERVICE_USAGE, service.name))
+                    service.usage = service.server.service_stats.on_invoked(service.name)
                 service.invocation_time = _utcnow()
 
                 # Check if there is a JSON Schema validator attached to the service and if so,
@@ -805,7 +837,15 @@ class Service(object):
                     if raise_timeout:
                         raise
             else:
-                out = self.update_handle(*invoke_args, **kwargs)
+                try:
+                    out = self.update_handle(*invoke_args, **kwargs)
+                finally:
+                    if service.is_poolable:
+                        self.server.service_store.release_instance(service)
+
+                # Streamed responses of poolable services are replaced with ones that release the instance only at their end
+                if service.is_poolable and isinstance(out, StreamedOutput):
+                    out = service.response.payload
 
                 if kwargs.get('skip_response_elem') and hasattr(out, 'keys'):
                     keys = list(iterkeys(out))
@@ -898,8 +938,7 @@ class Service(object):
         return cid
 
     def post_handle(self, _get_response_value=get_response_value, _utcnow=datetime.utcnow,
-        _service_time_basic=KVDB.SERVICE_TIME_BASIC, _service_time_raw=KVDB.SERVICE_TIME_RAW,
-        _service_time_raw_by_minute=KVDB.SERVICE_TIME_RAW_BY_MINUTE):
+        _req_resp_sample=KVDB.REQ_RESP_SAMPLE):
         """ An internal method executed after the service has completed and has
         a response ready to return. Updates its statistics and, optionally, stores
         a sample request/response pair.
@@ -919,21 +958,8 @@ class Service(object):
 
             self.processing_time = int(round(proc_time))
 
-            with self.kvdb.conn.pipeline() as pipe:
-
-                pipe.hset('%s%s' % (_service_time_basic, self.name), 'last', self.processing_time)
-                pipe.rpush('%s%s' % (_service_time_raw, self.name), self.processing_time)
-
-                key = '%s%s:%s' % (_service_time_raw_by_minute,
-                    self.name, self.handle_return_time.strftime('%Y:%m:%d:%H:%M'))
-                pipe.rpush(key, self.processing_time)
-
-                # .. we'll have 5 minutes (5 * 60 seconds = 300 seconds)
-                # to aggregate processing times for a given minute and then it will expire
-
-                # Note that we need Redis 2.1.3+ otherwise the key has just been overwritten
-                pipe.expire(key, 300)
-                pipe.execute()
+            # This is only collected in memory here - it will be flushed to KVDB in background
+            self.server.service_stats.on_processed(self.name, self.processing_time, self.handle_return_time)
 
         #
         # Sample requests/responses
@@ -958,7 +984,7 @@ class Service(object):
                 'req': req,
                 'resp':_get_response_value(self.response), # TODO: Don't parse it here and a moment later below
             }
-            self.kvdb.conn.hmset(key, data)
+            self.kvdb.conn.hmset('%s%s' % (_req_resp_sample, self.name), data)
 
         #
         # Slow responses
@@ -61,7 +61,7 @@ class AdminSIO(object):
 
 class GetListAdminSIO(object):
     namespace = zato_namespace
-    input_optional = (Int('cur_page'), Bool('paginate'), 'query')
+    input_optional = (Int('cur_page'), Bool('paginate'), 'query', 'after', Bool('needs_total'))
 
 # ################################################################################################################################
 
@@ -165,6 +165,9 @@ class AdminService(Service):
 class Ping(AdminService):
     """ A ping service, useful for API testing.
     """
+    # It keeps no state of its own so its instances can be reused across invocations
+    is_poolable = True
+
     class SimpleIO(AdminSIO):
         output_required = ('pong',)
         response_elem = 'zato_ping_response'
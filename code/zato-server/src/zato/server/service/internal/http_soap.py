@@ -589,3 +589,16 @@ class GetURLSecurity(AdminService):
         self.response.content_type = 'application/json'
 
 # ################################################################################################################################
+
+class GetURLMatchCacheStats(AdminService):
+    """ Returns statistics of the cache of URL paths matched to channels in the current worker.
+    """
+    class SimpleIO(AdminSIO):
+        request_elem = 'zato_http_soap_get_url_match_cache_stats_request'
+        response_elem = 'zato_http_soap_get_url_match_cache_stats_response'
+        output_required = Integer('size'), Integer('max_size'), Integer('hits'), Integer('misses'), Integer('evictions')
+
+    def handle(self):
+        self.response.payload = self.server.worker_store.request_dispatcher.url_data.get_cache_stats()
+
+# ################################################################################################################################
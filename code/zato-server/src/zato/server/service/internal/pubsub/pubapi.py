@@ -21,7 +21,7 @@ from future.utils import itervalues
 from zato.common.api import CHANNEL, CONTENT_TYPE, PUBSUB
 from zato.common.exception import BadRequest, Forbidden, PubSubSubscriptionExists
 from zato.common.util.auth import parse_basic_auth
-from zato.server.service import AsIs, Int, Service
+from zato.server.service import AsIs, Int, List, Service
 from zato.server.service.internal.pubsub.subscription import CreateWSXSubscription
 
 # ################################################################################################################################
@@ -35,10 +35,10 @@ class BaseSIO:
 # ################################################################################################################################
 
 class TopicSIO(BaseSIO):
-    input_optional = ('data', AsIs('msg_id'), 'has_gd', Int('priority'),
+    input_optional = ('data', List('data_list'), AsIs('msg_id'), 'has_gd', Int('priority'),
         Int('expiration'), 'mime_type', AsIs('correl_id'), 'in_reply_to', AsIs('ext_client_id'), 'ext_pub_time',
         'sub_key')
-    output_optional = (AsIs('msg_id'),)
+    output_optional = (AsIs('msg_id'), List('msg_id_list'))
 
 # ################################################################################################################################
 
@@ -103,9 +103,10 @@ class TopicService(_PubSubService):
 
     def _publish(self, endpoint_id):
         """ POST /zato/pubsub/topic/{topic_name} {"data":"my data", ...}
+        POST /zato/pubsub/topic/{topic_name} {"data_list":[{"data":"my data", ...}, ...], ...}
         """
         # We always require some data on input
-        if not self.request.input.data:
+        if not (self.request.input.data or self.request.input.data_list):
             raise BadRequest(self.cid, 'No data sent on input')
 
         # Ignore the header set by curl and similar tools
@@ -126,7 +127,12 @@ class TopicService(_PubSubService):
             'endpoint_id': endpoint_id,
         }
 
-        return self.pubsub.publish(input.topic_name, **ctx)
+        # A batch of messages to publish, each possibly with its own metadata, in which case we return a list of message IDs
+        if input.data_list:
+            ctx.pop('data')
+            return self.pubsub.publish_many(input.topic_name, input.data_list, **ctx)
+        else:
+            return self.pubsub.publish(input.topic_name, **ctx)
 
 # ################################################################################################################################
 
@@ -155,7 +161,12 @@ class TopicService(_PubSubService):
             response = dumps(self._get_messages(endpoint_id))
             self.response.payload = response
         else:
-            self.response.payload.msg_id = self._publish(endpoint_id)
+            response = self._publish(endpoint_id)
+
+            if self.request.input.data_list:
+                self.response.payload.msg_id_list = response
+            else:
+                self.response.payload.msg_id = response
 
 # ################################################################################################################################
 
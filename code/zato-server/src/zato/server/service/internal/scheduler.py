@@ -25,6 +25,7 @@ from zato.common.exception import ZatoException
 from zato.common.odb.model import Cluster, Job, CronStyleJob, IntervalBasedJob,\
      Service
 from zato.common.odb.query import job_by_id, job_by_name, job_list
+from zato.server.service import List
 from zato.server.service.internal import AdminService, AdminSIO, GetListAdminSIO
 
 # ################################################################################################################################
@@ -393,3 +394,30 @@ class SetActiveStatus(AdminService):
 
 # ################################################################################################################################
 # ################################################################################################################################
+
+class SetActiveStatusList(AdminService):
+    """ Actives or deactivates a list of jobs in a single ODB update.
+    """
+    name = _service_name_prefix + 'set-active-status-list'
+
+    class SimpleIO(AdminSIO):
+        request_elem = 'zato_scheduler_job_set_active_status_list_request'
+        response_elem = 'zato_scheduler_job_set_active_status_list_response'
+        input_required = (List('id_list'), 'is_active')
+
+    def handle(self):
+        with closing(self.odb.session()) as session:
+            try:
+                session.query(Job).\
+                    filter(Job.id.in_(self.request.input.id_list)).\
+                    update({'is_active': self.request.input.is_active}, synchronize_session=False)
+                session.commit()
+
+            except Exception:
+                session.rollback()
+                self.logger.error('Could not update is_active status of `%s`, e:`%s`', self.request.input.id_list, format_exc())
+
+                raise
+
+# ################################################################################################################################
+# ################################################################################################################################
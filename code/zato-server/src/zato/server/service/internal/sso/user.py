@@ -410,10 +410,11 @@ class Search(_CtxInputUsing):
         input_required = ('ust', 'current_app')
         input_optional = (AsIs('user_id'), 'username', 'email', 'display_name', 'first_name', 'middle_name', 'last_name',
             'sign_up_status', 'approval_status', Bool('paginate'), Int('cur_page'), Int('page_size'), 'name_op',
-            'is_name_exact')
+            'is_name_exact', 'after', Bool('needs_total'))
         output_required = ('status',)
         output_optional = BaseSIO.output_optional + (Int('total'), Int('num_pages'), Int('page_size'), Int('cur_page'),
-            'has_next_page', 'has_prev_page', Int('next_page'), Int('prev_page'), List('result'))
+            'has_next_page', 'has_prev_page', Int('next_page'), Int('prev_page'), List('result'), 'next_after',
+            Bool('total_is_approximate'))
         default_value = _invalid
 
 # ################################################################################################################################
@@ -54,7 +54,7 @@ from zato.server.service import after_handle_hooks, after_job_hooks, before_hand
 from zato.server.service.internal import AdminService
 
 # Zato - Cython
-from zato.simpleio import CySimpleIO
+from zato.simpleio import CySimpleIO, StreamedOutput
 
 # Python 2/3 compatibility
 from past.builtins import basestring
@@ -262,6 +262,10 @@ class ServiceStore(object):
         self.patterns_matcher = Matcher()
         self.needs_post_deploy_attr = 'needs_post_deploy'
 
+        # Idle instances of services that declare themselves poolable, keyed by impl_name
+        self.instance_pool = {}
+        self.instance_pool_max_size = 100
+
         if self.is_testing:
             self._testing_worker_store =  _TestingWorkerStore()
             self._testing_worker_store.worker_config = _TestingWorkerConfig()
@@ -291,6 +295,7 @@ class ServiceStore(object):
             del self.impl_name_to_id[impl_name]
             del self.name_to_impl_name[name]
             del self.services[impl_name]
+            self.instance_pool.pop(impl_name, None)
 
 # ################################################################################################################################
 
@@ -550,7 +555,51 @@ class ServiceStore(object):
         """
         # type: (str, object, object) -> (Service, bool)
         _info = self.services[impl_name]
-        return _info['service_class'](*args, **kwargs), _info['is_active']
+        service_class = _info['service_class']
+
+        # Poolable services are taken from the pool if there is an idle instance already. No other greenlet
+        # can obtain the same instance until it is explicitly released back to the pool.
+        if service_class.is_poolable:
+            pool = self.instance_pool.get(impl_name)
+            if pool:
+                return pool.pop(), _info['is_active']
+
+        return service_class(*args, **kwargs), _info['is_active']
+
+# ################################################################################################################################
+
+    def release_instance(self, service):
+        """ Returns an instance of a poolable service to the pool once its invocation is complete. A streamed response
+        is produced only while the caller iterates over it, possibly still using the instance, which is why in that case
+        the response's payload is replaced with one that releases the instance after all of it has been iterated over.
+        """
+        # type: (Service) -> None
+        response = service.response
+
+        if isinstance(response.payload, StreamedOutput):
+            response.payload = StreamedOutput(self._yield_and_release_instance(response.payload, service))
+        else:
+            self._release_instance(service)
+
+    def _yield_and_release_instance(self, payload, service):
+        try:
+            for chunk in payload:
+                yield chunk
+        finally:
+            self._release_instance(service)
+
+    def _release_instance(self, service):
+        # type: (Service) -> None
+        _info = self.services.get(service.impl_name)
+
+        # The service may have been redeployed or deleted in the meantime, in which case the instance is discarded
+        if not _info or _info['service_class'] is not service.__class__:
+            return
+
+        pool = self.instance_pool.setdefault(service.impl_name, [])
+        if len(pool) < self.instance_pool_max_size:
+            service._reset_for_pool()
+            pool.append(service)
 
 # ################################################################################################################################
 
@@ -736,6 +785,9 @@ class ServiceStore(object):
                 self.services[item.impl_name]['is_active'] = item.is_active
                 self.services[item.impl_name]['slow_threshold'] = item.slow_threshold
 
+                # Any pooled instances belong to the previous version of the service's class
+                self.instance_pool.pop(item.impl_name, None)
+
                 self.id_to_impl_name[service_id] = item.impl_name
                 self.impl_name_to_id[item.impl_name] = service_id
                 self.name_to_impl_name[item.name] = item.impl_name
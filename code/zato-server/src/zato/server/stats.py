@@ -10,15 +10,25 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import logging
+from datetime import datetime, timedelta
+from traceback import format_exc
 
 # dateutil
 from dateutil.rrule import MINUTELY, rrule
 
+# gevent
+from gevent import sleep
+
+# Python 2/3 compatibility
+from future.utils import iteritems
+
 # Zato
 from zato.common.api import KVDB
 
 logger = logging.getLogger(__name__)
 
+# ################################################################################################################################
+
 class MaintenanceTool(object):
     """ A tool for performing maintenance-related tasks, such as deleting the statistics.
     """
@@ -33,3 +43,178 @@ class MaintenanceTool(object):
                     p.delete(key)
 
             p.execute()
+
+# ################################################################################################################################
+
+class ServiceStatsAggregator(object):
+    """ Collects usage and processing times of services in memory and periodically flushes them to KVDB
+    in a single pipeline, which means that invoking a service never needs a round trip to KVDB for statistics.
+    Data is stored under the same keys as previously by each service so the statistics services
+    that read it do not need to be changed.
+    """
+    # How often to flush statistics, in seconds
+    flush_interval = 2.0
+
+    # How long per-minute keys live for - the minute they are for needs to be aggregated by then
+    raw_by_minute_expire = 300
+
+    # How many processing times, per service or per service and minute, to keep at most if they cannot be flushed,
+    # e.g. because KVDB is down, so that memory use does not grow with each invocation until it is up again.
+    max_raw_times_kept = 10000
+
+    def __init__(self, kvdb, flush_interval=None):
+        self.kvdb = kvdb
+        self.flush_interval = flush_interval or self.flush_interval
+        self.keep_running = True
+
+        # Service name -> usage as of the last flush, as returned by KVDB
+        self.usage_flushed = {}
+
+        # Service name -> invocations since the last flush
+        self.usage = {}
+
+        # Service name -> processing time of the last invocation
+        self.last_time = {}
+
+        # Service name -> processing times since the last flush
+        self.raw_times = {}
+
+        # (Service name, minute) -> processing times since the last flush
+        self.raw_times_by_minute = {}
+
+# ################################################################################################################################
+
+    def on_invoked(self, name):
+        """ Called each time a service is invoked, returns its overall usage so far.
+        """
+        usage = self.usage.get(name, 0) + 1
+        self.usage[name] = usage
+
+        return self.usage_flushed.get(name, 0) + usage
+
+# ################################################################################################################################
+
+    def on_processed(self, name, processing_time, handle_return_time):
+        """ Called each time a service returns, with the time it took to process a request, in milliseconds.
+        """
+        self.last_time[name] = processing_time
+
+        raw_times = self.raw_times.get(name)
+        if raw_times is None:
+            raw_times = self.raw_times[name] = []
+        raw_times.append(processing_time)
+
+        minute = handle_return_time.replace(second=0, microsecond=0)
+
+        raw_times_by_minute = self.raw_times_by_minute.get((name, minute))
+        if raw_times_by_minute is None:
+            raw_times_by_minute = self.raw_times_by_minute[(name, minute)] = []
+        raw_times_by_minute.append(processing_time)
+
+# ################################################################################################################################
+
+    def flush(self, _utcnow=datetime.utcnow):
+        """ Stores in KVDB everything collected since the previous flush.
+        """
+        # Swap current data for new containers first, before any I/O takes place,
+        # so that services can keep on adding new data in the meantime.
+        usage, self.usage = self.usage, {}
+        last_time, self.last_time = self.last_time, {}
+        raw_times, self.raw_times = self.raw_times, {}
+        raw_times_by_minute, self.raw_times_by_minute = self.raw_times_by_minute, {}
+
+        if not usage and not raw_times:
+            return
+
+        try:
+            self._flush(usage, last_time, raw_times, raw_times_by_minute)
+        except Exception:
+
+            # Pipelines run as transactions so the data was not stored - it is put back, to be flushed again
+            # along with whatever was added in the meantime, and the caller learns of the error.
+            self._restore(usage, last_time, raw_times, raw_times_by_minute, _utcnow)
+            raise
+
+# ################################################################################################################################
+
+    def _flush(self, usage, last_time, raw_times, raw_times_by_minute):
+
+        # Order of service names is needed to match them with results of INCRBY later on
+        usage_names = []
+
+        with self.kvdb.conn.pipeline() as pipe:
+
+            for name, value in iteritems(usage):
+                usage_names.append(name)
+                pipe.incrby('{}{}'.format(KVDB.SERVICE_USAGE, name), value)
+
+            for name, value in iteritems(last_time):
+                pipe.hset('{}{}'.format(KVDB.SERVICE_TIME_BASIC, name), 'last', value)
+
+            for name, values in iteritems(raw_times):
+                pipe.rpush('{}{}'.format(KVDB.SERVICE_TIME_RAW, name), *values)
+
+            for (name, minute), values in iteritems(raw_times_by_minute):
+                key = '{}{}:{}'.format(KVDB.SERVICE_TIME_RAW_BY_MINUTE, name, minute.strftime('%Y:%m:%d:%H:%M'))
+                pipe.rpush(key, *values)
+
+                # Note that we need Redis 2.1.3+ otherwise the key has just been overwritten
+                pipe.expire(key, self.raw_by_minute_expire)
+
+            result = pipe.execute()
+
+        for name, value in zip(usage_names, result):
+            self.usage_flushed[name] = int(value)
+
+# ################################################################################################################################
+
+    def _restore(self, usage, last_time, raw_times, raw_times_by_minute, _utcnow=datetime.utcnow):
+        """ Merges data that could not be flushed with data collected since it was swapped out. Only the newest
+        processing times are kept and per-minute ones are dropped once their keys would have expired in KVDB anyway.
+        """
+        max_raw_times_kept = self.max_raw_times_kept
+        oldest_minute = _utcnow() - timedelta(seconds=self.raw_by_minute_expire)
+
+        for name, value in iteritems(usage):
+            self.usage[name] = self.usage.get(name, 0) + value
+
+        # Processing times of invocations that took place in the meantime are newer than the ones being restored
+        for name, value in iteritems(last_time):
+            self.last_time.setdefault(name, value)
+
+        for name, values in iteritems(raw_times):
+            self.raw_times[name] = (values + self.raw_times.get(name, []))[-max_raw_times_kept:]
+
+        for key, values in iteritems(raw_times_by_minute):
+
+            # The minute is over for long enough for no one to aggregate it anymore
+            if key[1] < oldest_minute:
+                continue
+
+            self.raw_times_by_minute[key] = (values + self.raw_times_by_minute.get(key, []))[-max_raw_times_kept:]
+
+# ################################################################################################################################
+
+    def run(self):
+        """ Flushes statistics to KVDB until told to stop.
+        """
+        while self.keep_running:
+            sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.warn('Could not flush service statistics, e:`%s`', format_exc())
+
+# ################################################################################################################################
+
+    def stop(self):
+        """ Stops the flushing loop and stores whatever has not been flushed yet.
+        """
+        self.keep_running = False
+
+        try:
+            self.flush()
+        except Exception:
+            logger.warn('Could not flush service statistics on stop, e:`%s`', format_exc())
+
+# ################################################################################################################################
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from time import monotonic
+from unittest import main, TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import sleep, Timeout
+
+# Zato
+from zato.common.api import FILE_TRANSFER
+from zato.server.file_transfer.api import FileTransferAPI
+from zato.server.file_transfer.event import FileTransferEvent
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _WorkerStore(object):
+    def __init__(self, config):
+        self.config = config
+
+    def get_channel_file_transfer_config(self, channel_name):
+        return self.config
+
+# ################################################################################################################################
+
+class _Server(object):
+    """ Invokes callbacks by their names, keeping track of how many of them are running at a time.
+    """
+    def __init__(self, callbacks):
+        self.callbacks = callbacks
+        self.invoked = []
+        self.running = 0
+        self.max_running = 0
+
+    def invoke(self, name, request):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+
+        try:
+            self.callbacks[name]()
+            self.invoked.append(name)
+        finally:
+            self.running -= 1
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CallbackTestCase(TestCase):
+
+    def get_event(self):
+        event = FileTransferEvent()
+        event.base_dir = '/test'
+        event.file_name = 'a.txt'
+        event.full_path = '/test/a.txt'
+        event.channel_name = 'my.channel'
+        return event
+
+    def invoke_callbacks(self, callbacks, **config):
+        self.server = _Server(callbacks)
+        api = FileTransferAPI(self.server, _WorkerStore(Bunch(config)))
+
+        return api.invoke_callbacks(self.get_event(), sorted(callbacks), [], [])
+
+# ################################################################################################################################
+
+    def test_no_callbacks(self):
+        self.assertListEqual(self.invoke_callbacks({}), [])
+
+# ################################################################################################################################
+
+    def test_all_ok(self):
+        result_list = self.invoke_callbacks({'service.1': lambda: None, 'service.2': lambda: None})
+
+        self.assertListEqual([elem.target for elem in result_list], ['service.1', 'service.2'])
+
+        for result in result_list:
+            self.assertEqual(result.target_type, 'service')
+            self.assertTrue(result.is_ok)
+            self.assertIsNone(result.error)
+            self.assertIsNotNone(result.time)
+
+# ################################################################################################################################
+
+    def test_concurrency_limit(self):
+        callbacks = dict(('service.{}'.format(idx), lambda: sleep(0.01)) for idx in range(6))
+        result_list = self.invoke_callbacks(callbacks, callback_concurrency=2)
+
+        # All the callbacks were invoked but no more than two at a time
+        self.assertEqual(self.server.max_running, 2)
+        self.assertTrue(all(elem.is_ok for elem in result_list))
+
+# ################################################################################################################################
+
+    def test_concurrency_limit_default(self):
+        callbacks = dict(('service.{}'.format(idx), lambda: sleep(0.01)) for idx in range(15))
+        self.invoke_callbacks(callbacks)
+
+        self.assertEqual(self.server.max_running, FILE_TRANSFER.DEFAULT.CALLBACK_CONCURRENCY)
+        self.assertEqual(len(self.server.invoked), 15)
+
+# ################################################################################################################################
+
+    def test_timeout(self):
+        callbacks = {
+            'service.1': lambda: None,
+            'service.2': lambda: sleep(5),
+            'service.3': lambda: sleep(0.01),
+        }
+
+        start = monotonic()
+
+        with self.assertLogs('zato.server.file_transfer.api', 'WARNING') as ctx:
+            result_list = self.invoke_callbacks(callbacks, callback_concurrency=2, callback_timeout=0.1)
+
+        # We did not wait for the slow callback to complete ..
+        self.assertLess(monotonic() - start, 1)
+
+        # .. it was the only one that timed out ..
+        self.assertFalse(result_list[1].is_ok)
+        self.assertEqual(result_list[1].error, 'Timed out after 0.1s')
+
+        # .. and the other ones completed, including the one that had to wait for a free slot in the pool.
+        self.assertTrue(result_list[0].is_ok)
+        self.assertTrue(result_list[2].is_ok)
+        self.assertListEqual(sorted(self.server.invoked), ['service.1', 'service.3'])
+
+        # The timeout was logged
+        self.assertEqual(len(ctx.output), 1)
+        self.assertIn('errors:1/3', ctx.output[0])
+
+# ################################################################################################################################
+
+    def test_callback_timeout_of_its_own(self):
+
+        def callback():
+            with Timeout(0.01):
+                sleep(1)
+
+        result_list = self.invoke_callbacks({'service.1': callback}, callback_timeout=10)
+
+        # A Timeout raised by the callback itself is reported as any other exception would be
+        self.assertFalse(result_list[0].is_ok)
+        self.assertIn('Traceback', result_list[0].error)
+
+# ################################################################################################################################
+
+    def test_error(self):
+
+        def callback():
+            raise Exception('Test exception')
+
+        result_list = self.invoke_callbacks({'service.1': callback, 'service.2': lambda: None})
+
+        self.assertFalse(result_list[0].is_ok)
+        self.assertIn('Test exception', result_list[0].error)
+        self.assertTrue(result_list[1].is_ok)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
+# ################################################################################################################################
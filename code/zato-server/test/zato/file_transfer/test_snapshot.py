@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from datetime import datetime
+from unittest import main, TestCase
+
+# Zato
+from zato.server.file_transfer.snapshot import DirSnapshot, DirSnapshotDiff
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class DirSnapshotDiffTestCase(TestCase):
+
+    def get_snapshot(self, *file_list):
+        snapshot = DirSnapshot('/test')
+        snapshot.add_file_list([{
+            'name': name,
+            'size': size,
+            'last_modified': datetime(2020, 1, 1, 12, 0, 0),
+        } for name, size in file_list])
+
+        return snapshot
+
+# ################################################################################################################################
+
+    def test_no_changes(self):
+        previous = self.get_snapshot(('a.txt', 1), ('b.txt', 2))
+        current = self.get_snapshot(('a.txt', 1), ('b.txt', 2))
+
+        diff = DirSnapshotDiff(previous, current)
+
+        self.assertFalse(diff.has_changes)
+
+# ################################################################################################################################
+
+    def test_changes(self):
+        previous = self.get_snapshot(('a.txt', 1), ('b.txt', 2))
+        current = self.get_snapshot(('b.txt', 22), ('c.txt', 3))
+
+        diff = DirSnapshotDiff(previous, current)
+
+        self.assertTrue(diff.has_changes)
+        self.assertSetEqual(diff.files_created, {'c.txt'})
+        self.assertSetEqual(diff.files_modified, {'b.txt'})
+        self.assertSetEqual(diff.files_deleted, {'a.txt'})
+
+# ################################################################################################################################
+
+    def test_deleted_only(self):
+        previous = self.get_snapshot(('a.txt', 1), ('b.txt', 2))
+        current = self.get_snapshot(('a.txt', 1))
+
+        diff = DirSnapshotDiff(previous, current)
+
+        # A deleted file does not trigger any events but the snapshot still needs to be stored
+        self.assertTrue(diff.has_changes)
+        self.assertFalse(diff.files_created)
+        self.assertFalse(diff.files_modified)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from csv import reader as csv_reader
+from json import loads
+from tempfile import TemporaryFile
+from unittest import main, TestCase
+
+# Zato
+from zato.server.file_transfer.stream import mark_last, yield_batches, yield_lines
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class StreamTestCase(TestCase):
+
+    def get_file(self, data):
+        f = TemporaryFile()
+        f.write(data)
+        f.flush()
+        f.seek(0)
+
+        return f
+
+# ################################################################################################################################
+
+    def test_yield_lines(self):
+        with self.get_file('aaa\nbbb\nccc'.encode('utf8')) as f:
+            self.assertListEqual(list(yield_lines(f, 'utf8')), ['aaa\n', 'bbb\n', 'ccc'])
+
+# ################################################################################################################################
+
+    def test_yield_lines_empty_file(self):
+        with self.get_file(b'') as f:
+            self.assertListEqual(list(yield_lines(f, 'utf8')), [])
+
+# ################################################################################################################################
+
+    def test_yield_batches_no_parser(self):
+        lines = iter(['aaa\n', 'bbb\n', 'ccc\n'])
+        result = list(yield_batches(lines, 2))
+
+        self.assertListEqual(result, [
+            ('aaa\nbbb\n', ['aaa\n', 'bbb\n']),
+            ('ccc\n', ['ccc\n']),
+        ])
+
+# ################################################################################################################################
+
+    def test_yield_batches_csv(self):
+
+        # The second record spans two lines
+        lines = iter(['a,1\n', 'b,"2\n', '22"\n', 'c,3\n'])
+        result = list(yield_batches(lines, 2, csv_reader, 'py:csv.reader'))
+
+        self.assertListEqual(result, [
+            ('a,1\nb,"2\n22"\n', [['a', '1'], ['b', '2\n22']]),
+            ('c,3\n', [['c', '3']]),
+        ])
+
+# ################################################################################################################################
+
+    def test_yield_batches_per_line_parser(self):
+        lines = iter(['{"a":1}\n', '\n', '{"a":2}\n'])
+        result = list(yield_batches(lines, 10, loads, 'py:json.loads'))
+
+        self.assertListEqual(result, [
+            ('{"a":1}\n\n{"a":2}\n', [{'a':1}, {'a':2}]),
+        ])
+
+# ################################################################################################################################
+
+    def test_mark_last(self):
+        self.assertListEqual(list(mark_last([])), [])
+        self.assertListEqual(list(mark_last([1])), [(1, True)])
+        self.assertListEqual(list(mark_last([1, 2, 3])), [(1, False), (2, False), (3, True)])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
+# ################################################################################################################################
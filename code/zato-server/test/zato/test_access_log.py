@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from datetime import datetime
+from logging import getLogger, Handler, INFO
+from unittest import TestCase
+
+# pytz
+from pytz import UTC
+
+# Zato
+from zato.server.access_log import AccessLogWriter
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _TestHandler(Handler):
+    def __init__(self):
+        super(_TestHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class AccessLogWriterTestCase(TestCase):
+
+    def get_writer(self, buffer_size):
+        handler = _TestHandler()
+
+        access_logger = getLogger('zato_access_log.test')
+        access_logger.handlers[:] = [handler]
+        access_logger.setLevel(INFO)
+        access_logger.propagate = False
+
+        return AccessLogWriter(access_logger, buffer_size, 2, local_zone=UTC), handler
+
+    def get_entry(self, cid, request_ts_utc):
+        return ('127.0.0.1', cid, 0.1, 'my.channel', request_ts_utc, 'GET', '/test', 'HTTP/1.1', '200', 'my-agent', 123)
+
+# ################################################################################################################################
+
+    def test_flush(self):
+        writer, handler = self.get_writer(10)
+
+        writer.push(self.get_entry('cid.1', datetime(2020, 1, 2, 3, 4, 5, 123)))
+        writer.push(self.get_entry('cid.2', datetime(2020, 1, 2, 3, 4, 5, 456)))
+        writer.push(self.get_entry('cid.3', datetime(2020, 1, 2, 3, 4, 6)))
+        writer.flush()
+
+        self.assertEqual(len(handler.records), 3)
+
+        record1, record2, record3 = handler.records
+
+        self.assertEqual(record1.cid_resp_time, 'cid.1/0.1')
+        self.assertEqual(record1.req_timestamp, '02/Jan/2020:03:04:05 +0000')
+        self.assertEqual(record1.response_size, 123)
+
+        # Requests within the same second share their timestamps
+        self.assertIs(record1.req_timestamp, record2.req_timestamp)
+        self.assertEqual(record3.req_timestamp, '02/Jan/2020:03:04:06 +0000')
+
+# ################################################################################################################################
+
+    def test_drop_oldest(self):
+        writer, handler = self.get_writer(2)
+
+        for idx in range(5):
+            writer.push(self.get_entry('cid.{}'.format(idx), datetime(2020, 1, 2, 3, 4, 5)))
+
+        writer.flush()
+
+        self.assertListEqual([elem.cid_resp_time for elem in handler.records], ['cid.3/0.1', 'cid.4/0.1'])
+        self.assertEqual(writer.dropped, 0)
+
+# ################################################################################################################################
+# ################################################################################################################################
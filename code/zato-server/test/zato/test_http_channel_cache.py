@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from http.client import NOT_MODIFIED, OK
+from io import BytesIO
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import sleep, spawn
+
+# Zato
+from zato.common.api import URL_PARAMS_PRIORITY, ZATO_NONE
+from zato.common.json_internal import dumps
+from zato.server.connection.http_soap.channel import RequestDispatcher, RequestHandler
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Service(object):
+    """ Produces the same response each time it is invoked, optionally taking some time to do it or failing.
+    """
+    get_request_hash = None
+
+    def __init__(self, service_store):
+        self.service_store = service_store
+        self.is_poolable = service_store.is_poolable
+
+    def get_name(self):
+        return 'my.service'
+
+    def update_handle(self, *ignored_args, **ignored_kwargs):
+        self.service_store.invoked += 1
+        sleep(self.service_store.invoke_time)
+
+        if self.service_store.invoked in self.service_store.fail_on:
+            raise Exception('Test exception')
+
+        return Bunch(payload='{"a":1}', content_type='application/json', headers={'X-My-Header': 'abc'}, status_code=OK)
+
+# ################################################################################################################################
+
+class _ServiceStore(object):
+    def __init__(self, is_poolable):
+        self.is_poolable = is_poolable
+        self.invoke_time = 0
+        self.fail_on = set()
+        self.invoked = 0
+        self.released = []
+
+    def new_instance(self, impl_name):
+        return _Service(self), True
+
+    def release_instance(self, service):
+        self.released.append(service)
+
+# ################################################################################################################################
+
+class _Server(object):
+    def __init__(self, is_poolable=False):
+        self.fs_server_config = Bunch(misc=Bunch(use_soap_envelope=False))
+        self.service_store = _ServiceStore(is_poolable)
+        self.cache = {}
+
+    def get_from_cache(self, cache_type, cache_name, key):
+        return self.cache.get(key)
+
+    def set_in_cache(self, cache_type, cache_name, key, value):
+        self.cache[key] = value
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class RequestHandlerCacheTestCase(TestCase):
+
+    def get_channel_item(self):
+        return Bunch(id=1, service_impl_name='my.service', merge_url_params_req=True, url_params_pri=URL_PARAMS_PRIORITY.DEFAULT,
+            cache_type='memory', cache_name='default', data_format='json', transport='plain_http', params_pri=None)
+
+    def handle(self, handler, **wsgi_environ):
+        wsgi_environ.update({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/test'})
+        return handler.handle('my.cid', {}, self.get_channel_item(), wsgi_environ, '', Bunch(broker_client=None), None,
+            None, '/test', '')
+
+# ################################################################################################################################
+
+    def test_hit(self):
+        handler = RequestHandler(_Server())
+
+        response = self.handle(handler)
+        etag = response.headers['ETag']
+
+        # Each response is cached as a tuple of everything that is needed to send it, with its payload in bytes ..
+        cached, = handler.server.cache.values()
+        self.assertTupleEqual(cached, (b'{"a":1}', 'application/json', (('X-My-Header', 'abc'), ('ETag', etag)), OK, etag))
+
+        # .. and it is returned as it was cached, without invoking the service again.
+        response = self.handle(handler)
+        self.assertEqual(handler.server.service_store.invoked, 1)
+
+        self.assertIs(response.payload, cached[0])
+        self.assertEqual(response.content_type, cached[1])
+        self.assertIs(response.headers, cached[2])
+        self.assertEqual(response.status_code, cached[3])
+        self.assertEqual(response.etag, cached[4])
+
+# ################################################################################################################################
+
+    def test_entry_in_old_format(self):
+        handler = RequestHandler(_Server())
+        self.handle(handler)
+
+        # Responses used to be cached as JSON documents ..
+        key, = handler.server.cache
+        handler.server.cache[key] = dumps({'payload': '{"a":1}', 'content_type': 'application/json', 'headers': {},
+            'status_code': OK})
+
+        # .. which are treated as if nothing was cached and overwritten with a new response.
+        response = self.handle(handler)
+        self.assertEqual(handler.server.service_store.invoked, 2)
+        self.assertEqual(response.payload, '{"a":1}')
+        self.assertIsInstance(handler.server.cache[key], tuple)
+
+# ################################################################################################################################
+
+    def test_concurrent_misses(self):
+        handler = RequestHandler(_Server())
+        handler.server.service_store.invoke_time = 0.05
+
+        greenlets = [spawn(self.handle, handler) for _ in range(5)]
+        responses = [greenlet.get() for greenlet in greenlets]
+
+        # The service was invoked once and all the other requests received its response from the cache
+        self.assertEqual(handler.server.service_store.invoked, 1)
+        self.assertEqual(responses[0].payload, '{"a":1}')
+
+        for response in responses[1:]:
+            self.assertEqual(response.payload, b'{"a":1}')
+
+        self.assertDictEqual(handler.cache_in_flight, {})
+
+# ################################################################################################################################
+
+    def test_concurrent_misses_first_fails(self):
+        handler = RequestHandler(_Server())
+        handler.server.service_store.invoke_time = 0.05
+        handler.server.service_store.fail_on.add(1)
+
+        greenlets = [spawn(self.handle, handler) for _ in range(3)]
+        for greenlet in greenlets:
+            greenlet.join()
+
+        # The request that invoked the service first failed ..
+        self.assertIsInstance(greenlets[0].exception, Exception)
+
+        # .. so the ones waiting for it invoked the service on their own ..
+        for greenlet in greenlets[1:]:
+            self.assertTrue(greenlet.successful())
+            self.assertIn(greenlet.value.payload, ('{"a":1}', b'{"a":1}'))
+
+        self.assertEqual(handler.server.service_store.invoked, 3)
+
+        # .. and none of them is considered to be still in progress.
+        self.assertDictEqual(handler.cache_in_flight, {})
+
+# ################################################################################################################################
+
+    def test_not_modified(self):
+        handler = RequestHandler(_Server())
+        etag = self.handle(handler).headers['ETag']
+
+        for if_none_match in (etag, 'W/' + etag, '"abc", ' + etag, '*'):
+            response = self.handle(handler, HTTP_IF_NONE_MATCH=if_none_match)
+
+            self.assertEqual(response.status_code, NOT_MODIFIED)
+            self.assertEqual(response.payload, b'')
+            self.assertTupleEqual(response.headers, (('ETag', etag),))
+
+        # Another ETag means that the response is returned in full
+        response = self.handle(handler, HTTP_IF_NONE_MATCH='"abc"')
+        self.assertEqual(response.status_code, OK)
+        self.assertEqual(response.payload, b'{"a":1}')
+
+        self.assertEqual(handler.server.service_store.invoked, 1)
+
+# ################################################################################################################################
+
+    def test_not_modified_on_miss(self):
+        server = _Server()
+        etag = self.handle(RequestHandler(server)).headers['ETag']
+
+        # A client that has a response may receive a 304 even from a server that has nothing in its cache yet
+        server.cache.clear()
+        response = self.handle(RequestHandler(server), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, NOT_MODIFIED)
+        self.assertEqual(response.payload, b'')
+        self.assertEqual(server.service_store.invoked, 2)
+
+# ################################################################################################################################
+
+    def test_pooled_instance_released_on_hit(self):
+        handler = RequestHandler(_Server(is_poolable=True))
+
+        self.handle(handler)
+        self.handle(handler)
+
+        # Both instances were returned to the pool, including the one that was not invoked because of a cache hit
+        self.assertEqual(handler.server.service_store.invoked, 1)
+        self.assertEqual(len(handler.server.service_store.released), 2)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _URLData(object):
+    def __init__(self, channel_item):
+        self.channel_item = channel_item
+        self.url_sec = {'my.target': Bunch(sec_def=ZATO_NONE, sec_use_rbac=False)}
+
+    def match(self, *ignored):
+        return {}, self.channel_item
+
+# ################################################################################################################################
+
+class _RequestHandler(object):
+    def __init__(self, response):
+        self.response = response
+
+    def handle(self, *ignored):
+        return self.response
+
+# ################################################################################################################################
+
+class NotModifiedCompressionTestCase(TestCase):
+
+    def test_not_modified_is_not_compressed(self):
+
+        channel_item = Bunch(is_active=True, match_target='my.target', content_encoding='gzip', transport='plain_http',
+            data_format='json')
+
+        response = RequestHandler._get_not_modified_response(None, Bunch(content_type='application/json'), '"abc"')
+        dispatcher = RequestDispatcher(Bunch(sso_api=None), _URLData(channel_item), None, _RequestHandler(response),
+            http_methods_allowed=['GET'])
+
+        wsgi_environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': '/test',
+            'wsgi.input': BytesIO(),
+            'zato.http.response.headers': {},
+        }
+
+        # Even though the channel compresses its responses, a 304 is returned with no payload at all
+        self.assertEqual(dispatcher.dispatch('my.cid', None, wsgi_environ, None), b'')
+        self.assertTrue(wsgi_environ['zato.http.response.status'].startswith('304'))
+        self.assertDictEqual(wsgi_environ['zato.http.response.headers'], {'Content-Type': 'application/json', 'ETag': '"abc"'})
+
+# ################################################################################################################################
+# ################################################################################################################################
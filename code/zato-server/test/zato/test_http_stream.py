@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.server.base.parallel.http import HTTPHandler
+from zato.simpleio import StreamedOutput
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _HTTPHandler(HTTPHandler):
+    def __init__(self):
+        self.access_log = []
+
+    def access_log_push(self, entry):
+        self.access_log.append(entry)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class StreamedPayloadTestCase(TestCase):
+
+    def test_bytes_are_sent_as_they_are(self):
+        handler = _HTTPHandler()
+
+        # Each character needs two bytes in UTF-16 and one of them is split between two chunks ..
+        data = '<?xml version="1.0" encoding="UTF-16"?><a>żółć</a>'.encode('utf-16')
+        payload = StreamedOutput(iter([data[:51], data[51:]]))
+
+        # .. and the response still consists of exactly the same bytes, not re-encoded in any way.
+        result = list(handler._yield_streamed_payload(payload, ('my.entry', None)))
+        self.assertListEqual(result, [data[:51], data[51:]])
+        self.assertEqual(b''.join(result).decode('utf-16'), '<?xml version="1.0" encoding="UTF-16"?><a>żółć</a>')
+
+        # The response's size is logged once all of it was sent
+        self.assertListEqual(handler.access_log, [('my.entry', len(data))])
+
+# ################################################################################################################################
+
+    def test_text_is_encoded(self):
+        handler = _HTTPHandler()
+
+        payload = StreamedOutput(iter(['żółć', '', b'abc']))
+        result = list(handler._yield_streamed_payload(payload, None))
+
+        # Text chunks are encoded to UTF-8 and empty ones are skipped because they would end the response
+        self.assertListEqual(result, ['żółć'.encode('utf8'), b'abc'])
+        self.assertListEqual(handler.access_log, [])
+
+# ################################################################################################################################
+# ################################################################################################################################
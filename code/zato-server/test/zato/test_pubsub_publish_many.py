@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common.json_internal import loads
+from zato.server.pubsub import PubSub
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _PubSub(PubSub):
+    """ Publishes messages to a list rather than through the publishing service, optionally failing for a given chunk.
+    """
+    def __init__(self, publish_many_chunk_size):
+        self.server = Bunch(default_internal_pubsub_endpoint_id=1, service_store=Bunch(has_service=lambda name: True))
+        self.publish_many_chunk_size = publish_many_chunk_size
+        self.requests = []
+        self.fail_on_request = None
+        self.topics = {'my.topic'}
+
+    def has_topic_by_name(self, name):
+        return name in self.topics
+
+    def is_allowed_pub_topic_by_endpoint_id(self, topic_name, endpoint_id):
+        return True
+
+    def create_topic_for_service(self, service_name, topic_name):
+        self.topics.add(topic_name)
+
+    def get_endpoint_by_name(self, name):
+        return Bunch(id=2, name=name)
+
+    def is_subscribed_to(self, endpoint_id, topic_name):
+        return True
+
+    def invoke_service(self, name, request, serialize=True):
+
+        if len(self.requests) == self.fail_on_request:
+            raise Exception('Test exception')
+
+        self.requests.append(request)
+
+        msg_id_list = ['msg.{}'.format(elem['data']) for elem in request['data_list']]
+        return Bunch(response={'msg_id_list': msg_id_list})
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class PublishManyTestCase(TestCase):
+
+    def get_chunk_sizes(self, pubsub):
+        return [len(request['data_list']) for request in pubsub.requests]
+
+# ################################################################################################################################
+
+    def test_chunk_boundaries(self):
+
+        for how_many, expected in (
+            (1,  [1]),
+            (4,  [4]),
+            (5,  [5]),
+            (6,  [5, 1]),
+            (10, [5, 5]),
+            (11, [5, 5, 1]),
+            ):
+            pubsub = _PubSub(5)
+            msg_id_list = pubsub.publish_many('my.topic', list(range(how_many)))
+
+            self.assertListEqual(self.get_chunk_sizes(pubsub), expected)
+
+            # Message IDs are returned in the same order that data was given in
+            self.assertListEqual(msg_id_list, ['msg.{}'.format(idx) for idx in range(how_many)])
+
+# ################################################################################################################################
+
+    def test_no_data(self):
+        pubsub = _PubSub(5)
+
+        self.assertListEqual(pubsub.publish_many('my.topic', []), [])
+        self.assertListEqual(pubsub.requests, [])
+
+# ################################################################################################################################
+
+    def test_chunk_size_given_on_input(self):
+        pubsub = _PubSub(5)
+        pubsub.publish_many('my.topic', range(7), chunk_size=3)
+
+        self.assertListEqual(self.get_chunk_sizes(pubsub), [3, 3, 1])
+
+# ################################################################################################################################
+
+    def test_generator_input(self):
+        pubsub = _PubSub(2)
+        msg_id_list = pubsub.publish_many('my.topic', (idx for idx in range(3)))
+
+        self.assertListEqual(self.get_chunk_sizes(pubsub), [2, 1])
+        self.assertListEqual(msg_id_list, ['msg.0', 'msg.1', 'msg.2'])
+
+# ################################################################################################################################
+
+    def test_metadata(self):
+        pubsub = _PubSub(5)
+        pubsub.publish_many('my.topic', ['a', {'data':'b', 'priority':7}], priority=3, has_gd=True)
+
+        data_list = pubsub.requests[0]['data_list']
+
+        # Keyword arguments are defaults for all the messages unless a message has its own metadata
+        self.assertEqual(data_list[0]['data'], 'a')
+        self.assertEqual(data_list[0]['priority'], 3)
+        self.assertEqual(data_list[1]['data'], 'b')
+        self.assertEqual(data_list[1]['priority'], 7)
+
+        for elem in data_list:
+            self.assertTrue(elem['has_gd'])
+
+# ################################################################################################################################
+
+    def test_metadata_not_allowed_in_elements(self):
+        pubsub = _PubSub(5)
+        pubsub.publish_many('my.topic', [{
+            'data': 'a',
+            'msg_id': 'my.msg.id',
+            'has_gd': True,
+            'zato_ctx': '{"target_service_name":"zato.ping"}',
+            'user_ctx': 'my.user.ctx',
+            'deliver_to_sk': ['zpsk.1'],
+            'reply_to_sk': ['zpsk.2'],
+            'group_id': 'my.group.id',
+        }], user_ctx='my.user.ctx.default')
+
+        # Only keys that a single publication may set are taken from an element, other ones are ignored
+        elem = pubsub.requests[0]['data_list'][0]
+        self.assertDictEqual(elem, {
+            'data': 'a',
+            'msg_id': 'my.msg.id',
+            'has_gd': True,
+            'user_ctx': 'my.user.ctx.default',
+        })
+
+# ################################################################################################################################
+
+    def test_metadata_not_allowed_in_elements_service(self):
+        pubsub = _PubSub(5)
+        pubsub.publish_many('my.service', [{
+            'data': 'a',
+            'has_gd': False,
+            'zato_ctx': '{"target_service_name":"zato.ping"}',
+        }])
+
+        # An element cannot change which service a message is delivered to, nor can it turn off GD for it
+        elem = pubsub.requests[0]['data_list'][0]
+        self.assertTrue(elem['has_gd'])
+        self.assertDictEqual(loads(elem['zato_ctx']), {'target_service_name': 'my.service'})
+
+# ################################################################################################################################
+
+    def test_partial_failure(self):
+        pubsub = _PubSub(5)
+        pubsub.fail_on_request = 2
+
+        # The third chunk cannot be published ..
+        self.assertRaises(Exception, pubsub.publish_many, 'my.topic', range(20))
+
+        # .. so no chunks after it were attempted, but the ones before it were published.
+        self.assertListEqual(self.get_chunk_sizes(pubsub), [5, 5])
+        self.assertListEqual([elem['data'] for request in pubsub.requests for elem in request['data_list']], list(range(10)))
+
+# ################################################################################################################################
+# ################################################################################################################################
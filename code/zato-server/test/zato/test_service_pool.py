@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import sleep, Timeout
+
+# Zato
+from zato.server.base.parallel import ParallelServer
+from zato.server.service import Service
+from zato.server.service.store import ServiceStore, _TestingWorkerConfig, _TestingWorkerStore
+from zato.simpleio import StreamedOutput
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# ParallelServer needs to be imported before services, this is for pyflakes
+ParallelServer = ParallelServer
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class MyPoolableService(Service):
+    is_poolable = True
+
+class MyService(Service):
+    pass
+
+class MyCaller(Service):
+    pass
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ServicePoolTestCase(TestCase):
+
+    def setUp(self):
+        self.service_store = ServiceStore({})
+        self.add_service(MyPoolableService)
+        self.add_service(MyService)
+
+    def set_up_class(self, service_class):
+
+        # This is what the store would set during deployment
+        service_class.get_name()
+        service_class._worker_store = _TestingWorkerStore()
+        service_class._worker_config = _TestingWorkerConfig()
+        service_class.component_enabled_ibm_mq = False
+        service_class.component_enabled_zeromq = False
+        service_class.component_enabled_sms = False
+        service_class.component_enabled_target_matcher = False
+        service_class.component_enabled_invoke_matcher = False
+
+    def add_service(self, service_class):
+        self.set_up_class(service_class)
+        self.service_store.services[service_class.get_impl_name()] = {'service_class': service_class, 'is_active': True}
+
+    def new_instance(self, service_class=MyPoolableService):
+        service, _ = self.service_store.new_instance(service_class.get_impl_name())
+        return service
+
+    def get_pool(self, service_class=MyPoolableService):
+        return self.service_store.instance_pool.get(service_class.get_impl_name(), [])
+
+    def get_caller(self, update_handle):
+        self.set_up_class(MyCaller)
+
+        caller = MyCaller()
+        caller.server = Bunch(service_store=self.service_store)
+        caller.update_handle = update_handle
+        return caller
+
+# ################################################################################################################################
+
+    def test_reuse(self):
+
+        service = self.new_instance()
+        service.cid = 'my.cid'
+        response = service.response
+
+        self.service_store.release_instance(service)
+        self.assertListEqual(self.get_pool(), [service])
+
+        # The same instance is handed out again ..
+        self.assertIs(self.new_instance(), service)
+        self.assertListEqual(self.get_pool(), [])
+
+        # .. with no state left over from its previous invocation.
+        self.assertIsNone(service.cid)
+        self.assertIsNot(service.response, response)
+
+# ################################################################################################################################
+
+    def test_instance_held_by_one_caller(self):
+
+        # Until an instance is released, no one else can obtain it
+        service1 = self.new_instance()
+        service2 = self.new_instance()
+
+        self.assertIsNot(service1, service2)
+
+# ################################################################################################################################
+
+    def test_not_poolable(self):
+
+        service = self.new_instance(MyService)
+        self.assertIsNot(self.new_instance(MyService), service)
+        self.assertListEqual(self.get_pool(MyService), [])
+
+# ################################################################################################################################
+
+    def test_pool_max_size(self):
+
+        self.service_store.instance_pool_max_size = 3
+
+        services = [self.new_instance() for _ in range(5)]
+        for service in services:
+            self.service_store.release_instance(service)
+
+        # Instances above the limit are discarded
+        self.assertListEqual(self.get_pool(), services[:3])
+
+# ################################################################################################################################
+
+    def test_redeployed_service(self):
+
+        service = self.new_instance()
+
+        class MyPoolableService2(MyPoolableService):
+            pass
+
+        # A new version of the service's class was deployed while the old instance was in use ..
+        self.service_store.services[MyPoolableService.get_impl_name()]['service_class'] = MyPoolableService2
+
+        # .. so the old instance is not put back in the pool.
+        self.service_store.release_instance(service)
+        self.assertListEqual(self.get_pool(), [])
+
+# ################################################################################################################################
+
+    def test_deleted_service(self):
+
+        service = self.new_instance()
+        del self.service_store.services[MyPoolableService.get_impl_name()]
+
+        self.service_store.release_instance(service)
+        self.assertListEqual(self.get_pool(), [])
+
+# ################################################################################################################################
+
+    def test_release_after_error(self):
+
+        def update_handle(*ignored, **ignored_kwargs):
+            raise Exception('Test exception')
+
+        caller = self.get_caller(update_handle)
+
+        self.assertRaises(Exception, caller.invoke_by_impl_name, MyPoolableService.get_impl_name())
+
+        # The instance was released even though the service raised an exception
+        self.assertEqual(len(self.get_pool()), 1)
+
+# ################################################################################################################################
+
+    def test_release_after_success(self):
+
+        def update_handle(*ignored, **ignored_kwargs):
+            return 'ok'
+
+        caller = self.get_caller(update_handle)
+
+        self.assertEqual(caller.invoke_by_impl_name(MyPoolableService.get_impl_name()), 'ok')
+        self.assertEqual(caller.invoke_by_impl_name(MyPoolableService.get_impl_name()), 'ok')
+
+        # Both invocations used the same instance
+        self.assertEqual(len(self.get_pool()), 1)
+
+# ################################################################################################################################
+
+    def test_no_release_after_timeout(self):
+
+        def update_handle(*ignored, **ignored_kwargs):
+            sleep(1)
+
+        caller = self.get_caller(update_handle)
+
+        self.assertRaises(Timeout, caller.invoke_by_impl_name, MyPoolableService.get_impl_name(), timeout=0.01)
+
+        # The greenlet of a service that timed out may have been killed at any point so its instance is not reused
+        self.assertListEqual(self.get_pool(), [])
+
+# ################################################################################################################################
+
+    def test_release_after_stream(self):
+
+        service = self.new_instance()
+        response = service.response
+        response.payload = StreamedOutput(iter(['a', 'b']))
+
+        # The response is not produced yet so the instance cannot be reused ..
+        self.service_store.release_instance(service)
+        self.assertListEqual(self.get_pool(), [])
+
+        chunks = iter(response.payload)
+        self.assertEqual(next(chunks), 'a')
+        self.assertListEqual(self.get_pool(), [])
+
+        # .. until all of it has been iterated over.
+        self.assertListEqual(list(chunks), ['b'])
+        self.assertListEqual(self.get_pool(), [service])
+
+# ################################################################################################################################
+
+    def test_release_after_stream_invoked(self):
+
+        def update_handle(set_response_func, service, *ignored, **ignored_kwargs):
+            service.response.payload = StreamedOutput(iter(['a', 'b']))
+            return service.response.payload
+
+        caller = self.get_caller(update_handle)
+        out = caller.invoke_by_impl_name(MyPoolableService.get_impl_name())
+
+        # The caller receives a response that returns the instance to the pool only once it has been read
+        self.assertListEqual(self.get_pool(), [])
+        self.assertEqual(out.getvalue(), 'ab')
+        self.assertEqual(len(self.get_pool()), 1)
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+# Zato
+from zato.common.api import KVDB
+from zato.server.stats import ServiceStatsAggregator
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Pipeline(object):
+    """ Applies commands to a dict standing in for KVDB, unless it is told to fail.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignored):
+        pass
+
+    def incrby(self, key, value):
+        self.commands.append(('incrby', key, value))
+
+    def hset(self, key, field, value):
+        self.commands.append(('hset', key, field, value))
+
+    def rpush(self, key, *values):
+        self.commands.append(('rpush', key, values))
+
+    def expire(self, key, value):
+        self.commands.append(('expire', key, value))
+
+    def execute(self):
+        if self.conn.should_fail:
+            raise Exception('Test exception')
+
+        data = self.conn.data
+        result = []
+
+        for command in self.commands:
+            name, key = command[:2]
+
+            if name == 'incrby':
+                data[key] = data.get(key, 0) + command[2]
+            elif name == 'hset':
+                data.setdefault(key, {})[command[2]] = command[3]
+            elif name == 'rpush':
+                data.setdefault(key, []).extend(command[2])
+
+            result.append(data.get(key))
+
+        return result
+
+# ################################################################################################################################
+
+class _Conn(object):
+    def __init__(self):
+        self.data = {}
+        self.should_fail = False
+
+    def pipeline(self):
+        return _Pipeline(self)
+
+# ################################################################################################################################
+
+class _KVDB(object):
+    def __init__(self):
+        self.conn = _Conn()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ServiceStatsAggregatorTestCase(TestCase):
+
+    def setUp(self):
+        self.kvdb = _KVDB()
+        self.stats = ServiceStatsAggregator(self.kvdb)
+        self.now = datetime(2020, 1, 2, 3, 4, 5)
+
+    def utcnow(self):
+        return self.now
+
+    def invoke(self, name, processing_time, now=None):
+        usage = self.stats.on_invoked(name)
+        self.stats.on_processed(name, processing_time, now or self.now)
+
+        return usage
+
+# ################################################################################################################################
+
+    def test_aggregate(self):
+
+        self.assertEqual(self.invoke('my.service', 10), 1)
+        self.assertEqual(self.invoke('my.service', 20), 2)
+        self.assertEqual(self.invoke('my.service.2', 30), 1)
+
+        self.assertDictEqual(self.stats.usage, {'my.service': 2, 'my.service.2': 1})
+        self.assertDictEqual(self.stats.last_time, {'my.service': 20, 'my.service.2': 30})
+        self.assertDictEqual(self.stats.raw_times, {'my.service': [10, 20], 'my.service.2': [30]})
+
+        minute = self.now.replace(second=0)
+        self.assertDictEqual(self.stats.raw_times_by_minute, {('my.service', minute): [10, 20], ('my.service.2', minute): [30]})
+
+        # Nothing was sent to KVDB yet
+        self.assertDictEqual(self.kvdb.conn.data, {})
+
+# ################################################################################################################################
+
+    def test_flush(self):
+        self.invoke('my.service', 10)
+        self.invoke('my.service', 20)
+        self.stats.flush()
+
+        data = self.kvdb.conn.data
+
+        self.assertEqual(data[KVDB.SERVICE_USAGE + 'my.service'], 2)
+        self.assertDictEqual(data[KVDB.SERVICE_TIME_BASIC + 'my.service'], {'last': 20})
+        self.assertListEqual(data[KVDB.SERVICE_TIME_RAW + 'my.service'], [10, 20])
+        self.assertListEqual(data[KVDB.SERVICE_TIME_RAW_BY_MINUTE + 'my.service:2020:01:02:03:04'], [10, 20])
+
+        self.assertDictEqual(self.stats.usage, {})
+        self.assertDictEqual(self.stats.raw_times, {})
+
+        # Overall usage takes into account what was flushed
+        self.assertEqual(self.invoke('my.service', 30), 3)
+
+        self.stats.flush()
+        self.assertEqual(data[KVDB.SERVICE_USAGE + 'my.service'], 3)
+        self.assertListEqual(data[KVDB.SERVICE_TIME_RAW + 'my.service'], [10, 20, 30])
+
+# ################################################################################################################################
+
+    def test_flush_failure(self):
+        self.invoke('my.service', 10)
+        self.invoke('my.service', 20)
+
+        self.kvdb.conn.should_fail = True
+        self.assertRaises(Exception, self.stats.flush, self.utcnow)
+
+        # Nothing is lost if a flush fails ..
+        self.assertDictEqual(self.stats.usage, {'my.service': 2})
+        self.assertDictEqual(self.stats.raw_times, {'my.service': [10, 20]})
+
+        # .. and data added after a failure is merged with what could not be flushed.
+        self.invoke('my.service', 30)
+
+        self.kvdb.conn.should_fail = False
+        self.stats.flush()
+
+        data = self.kvdb.conn.data
+
+        self.assertEqual(data[KVDB.SERVICE_USAGE + 'my.service'], 3)
+        self.assertDictEqual(data[KVDB.SERVICE_TIME_BASIC + 'my.service'], {'last': 30})
+        self.assertListEqual(data[KVDB.SERVICE_TIME_RAW + 'my.service'], [10, 20, 30])
+        self.assertListEqual(data[KVDB.SERVICE_TIME_RAW_BY_MINUTE + 'my.service:2020:01:02:03:04'], [10, 20, 30])
+
+# ################################################################################################################################
+
+    def test_restore_keeps_newer_data(self):
+        self.invoke('my.service', 10)
+
+        usage, last_time, raw_times, raw_times_by_minute = self.stats.usage, self.stats.last_time, self.stats.raw_times, \
+            self.stats.raw_times_by_minute
+
+        self.stats.usage, self.stats.last_time, self.stats.raw_times, self.stats.raw_times_by_minute = {}, {}, {}, {}
+
+        # This is what services do while a flush is in progress ..
+        self.invoke('my.service', 20)
+
+        # .. and this is what a failed flush puts back.
+        self.stats._restore(usage, last_time, raw_times, raw_times_by_minute, self.utcnow)
+
+        self.assertDictEqual(self.stats.usage, {'my.service': 2})
+        self.assertDictEqual(self.stats.last_time, {'my.service': 20})
+        self.assertDictEqual(self.stats.raw_times, {'my.service': [10, 20]})
+
+# ################################################################################################################################
+
+    def test_restore_limits(self):
+
+        self.stats.max_raw_times_kept = 3
+        self.kvdb.conn.should_fail = True
+
+        for idx in range(5):
+            self.invoke('my.service', idx)
+
+        self.assertRaises(Exception, self.stats.flush, self.utcnow)
+
+        for idx in range(5, 7):
+            self.invoke('my.service', idx)
+
+        self.assertRaises(Exception, self.stats.flush, self.utcnow)
+
+        minute = self.now.replace(second=0)
+
+        # Only the newest processing times are kept if they cannot be flushed ..
+        self.assertDictEqual(self.stats.raw_times, {'my.service': [4, 5, 6]})
+        self.assertDictEqual(self.stats.raw_times_by_minute, {('my.service', minute): [4, 5, 6]})
+
+        # .. though usage is not affected by it.
+        self.assertDictEqual(self.stats.usage, {'my.service': 7})
+
+# ################################################################################################################################
+
+    def test_restore_drops_expired_minutes(self):
+
+        self.kvdb.conn.should_fail = True
+
+        self.invoke('my.service', 10, self.now - timedelta(minutes=10))
+        self.invoke('my.service', 20, self.now - timedelta(minutes=1))
+
+        self.assertRaises(Exception, self.stats.flush, self.utcnow)
+
+        # Per-minute times are not kept for minutes that no one would aggregate anymore ..
+        minute = (self.now - timedelta(minutes=1)).replace(second=0)
+        self.assertDictEqual(self.stats.raw_times_by_minute, {('my.service', minute): [20]})
+
+        # .. but they are still kept among all the other processing times.
+        self.assertDictEqual(self.stats.raw_times, {'my.service': [10, 20]})
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from itertools import count
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import sleep
+
+# mock
+from mock import patch
+
+# Zato
+from zato.common.api import IPC
+from zato.server.base.parallel import ParallelServer
+from zato.server.base.worker import WorkerStore
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# ParallelServer needs to be imported before WorkerStore, this is for pyflakes
+ParallelServer = ParallelServer
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _IPCAPI(object):
+    def __init__(self):
+        self.replies = []
+
+    def send_reply(self, reply_to_tag, request_id, status, response):
+        self.replies.append((reply_to_tag, request_id, status, response))
+
+# ################################################################################################################################
+
+class _WorkerStore(object):
+    """ Has only the parts of a worker store that IPC messages may reach.
+    """
+    on_ipc_message = WorkerStore.on_ipc_message
+
+    def __init__(self):
+        self.server = Bunch(pid=123, ipc_api=_IPCAPI())
+        self.invoked = []
+
+    def on_ipc_invoke_service_with_target(self, data):
+        self.invoked.append(('on_ipc_invoke_service_with_target', data))
+        return 'ok'
+
+    def on_broker_msg_SERVICE_DELETE(self, data):
+        self.invoked.append(('on_broker_msg_SERVICE_DELETE', data))
+
+# ################################################################################################################################
+
+class _Server(object):
+    """ Responds to hand-overs of messages with a target as if it were other worker processes.
+    """
+    def __init__(self, responses):
+        self.pid = 1
+        self.responses = responses
+        self.invoked = []
+
+    def invoke_by_pid(self, service, request, target_pid, **kwargs):
+        self.invoked.append(target_pid)
+        return self.responses.get(target_pid)
+
+# ################################################################################################################################
+
+class _TargetWorkerStore(object):
+    """ Has only the parts of a worker store that dispatch messages with a target.
+    """
+    get_next_target_pid = WorkerStore.get_next_target_pid
+    hand_over_to_target_pid = WorkerStore.hand_over_to_target_pid
+    on_ipc_invoke_service_with_target = WorkerStore.on_ipc_invoke_service_with_target
+    _invoke_service_with_target = WorkerStore._invoke_service_with_target
+
+    def __init__(self, responses=None):
+        self.server = _Server(responses or {})
+        self.target_pid_counter = count()
+        self.target_pids = []
+        self.invoked = []
+
+    def on_message_invoke_service(self, msg, channel, action, **kwargs):
+        self.invoked.append(msg)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class WorkerStoreIPCTestCase(TestCase):
+
+    def get_msg(self, service):
+        return Bunch(action=IPC.ACTION.INVOKE_WORKER_STORE, service=service, payload={'a': 1}, target_pid=123,
+            reply_to_tag='my.tag', request_id='my.request.id', data_format=None)
+
+# ################################################################################################################################
+
+    def test_invoke_allowed_method(self):
+        worker_store = _WorkerStore()
+        worker_store.on_ipc_message(self.get_msg('on_ipc_invoke_service_with_target'))
+
+        self.assertListEqual(worker_store.invoked, [('on_ipc_invoke_service_with_target', {'a': 1})])
+        self.assertListEqual(worker_store.server.ipc_api.replies, [('my.tag', 'my.request.id', IPC.STATUS.SUCCESS, 'ok')])
+
+# ################################################################################################################################
+
+    def test_invoke_method_not_allowed(self):
+        worker_store = _WorkerStore()
+
+        for name in ('on_broker_msg_SERVICE_DELETE', 'on_ipc_message', '__init__'):
+            worker_store.on_ipc_message(self.get_msg(name))
+
+        # None of the methods was invoked and each message was replied to with an error
+        self.assertListEqual(worker_store.invoked, [])
+        self.assertEqual(len(worker_store.server.ipc_api.replies), 3)
+
+        for _, _, status, response in worker_store.server.ipc_api.replies:
+            self.assertEqual(status, IPC.STATUS.FAILURE)
+            self.assertIn('cannot be invoked through IPC', response)
+
+# ################################################################################################################################
+
+    def test_other_target_pid(self):
+        worker_store = _WorkerStore()
+
+        msg = self.get_msg('on_ipc_invoke_service_with_target')
+        msg.target_pid = 456
+
+        worker_store.on_ipc_message(msg)
+
+        self.assertListEqual(worker_store.invoked, [])
+        self.assertListEqual(worker_store.server.ipc_api.replies, [])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class TargetPIDTestCase(TestCase):
+
+    def get_msg(self):
+        return {'cid': 'my.cid', 'service': 'my.service', 'payload': 'my.payload'}
+
+# ################################################################################################################################
+
+    @patch('zato.server.base.worker.get_worker_pids', return_value=[1, 2, 3])
+    def test_pids_are_cached(self, get_worker_pids):
+        worker_store = _TargetWorkerStore()
+
+        # Worker processes are looked up only once ..
+        self.assertListEqual([worker_store.get_next_target_pid() for _ in range(7)], [1, 2, 3, 1, 2, 3, 1])
+        self.assertEqual(get_worker_pids.call_count, 1)
+
+        # .. until there is a reason to look them up again.
+        worker_store.target_pids = []
+        worker_store.get_next_target_pid()
+        self.assertEqual(get_worker_pids.call_count, 2)
+
+# ################################################################################################################################
+
+    @patch('zato.server.base.worker.get_worker_pids', return_value=[1, 2])
+    def test_hand_over(self, get_worker_pids):
+        worker_store = _TargetWorkerStore({2: (True, True)})
+
+        # Our own PID is first so we handle the message ourselves ..
+        self.assertFalse(worker_store.hand_over_to_target_pid(self.get_msg(), 'my.channel', 'my.action'))
+        self.assertListEqual(worker_store.server.invoked, [])
+
+        # .. and the next one is handed over.
+        self.assertTrue(worker_store.hand_over_to_target_pid(self.get_msg(), 'my.channel', 'my.action'))
+        self.assertListEqual(worker_store.server.invoked, [2])
+        self.assertListEqual(worker_store.target_pids, [1, 2])
+
+# ################################################################################################################################
+
+    @patch('zato.server.base.worker.get_worker_pids', return_value=[2, 3])
+    def test_hand_over_failure(self, get_worker_pids):
+
+        # Process 2 does not confirm it received the message, e.g. because it does not exist anymore,
+        # which is (False, None) if the request timed out and None if it could not be sent at all.
+        for response in ((False, None), None):
+            worker_store = _TargetWorkerStore({2: response})
+
+            with self.assertLogs('zato.server.base.worker', 'WARNING'):
+                is_handed_over = worker_store.hand_over_to_target_pid(self.get_msg(), 'my.channel', 'my.action')
+
+            # The message is handled locally and the PIDs will be looked up again for the next one
+            self.assertFalse(is_handed_over)
+            self.assertListEqual(worker_store.target_pids, [])
+
+# ################################################################################################################################
+
+    def test_receive_hand_over(self):
+        worker_store = _TargetWorkerStore()
+
+        # Receiving a message is confirmed before the message is processed ..
+        response = worker_store.on_ipc_invoke_service_with_target({'msg': self.get_msg(), 'channel': 'c', 'action': 'a'})
+        self.assertEqual(response, 'true')
+        self.assertListEqual(worker_store.invoked, [])
+
+        # .. which happens in background.
+        sleep(0.01)
+        self.assertListEqual(worker_store.invoked, [self.get_msg()])
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -131,7 +131,7 @@ class SearchCtx(object):
     """ A container for SSO user search parameters.
     """
     __slots__ = ('user_id', 'username', 'email', 'display_name', 'first_name', 'middle_name', 'last_name', 'sign_up_status',
-        'approval_status', 'paginate', 'cur_page', 'page_size', 'name_op', 'is_name_exact')
+        'approval_status', 'paginate', 'cur_page', 'page_size', 'name_op', 'is_name_exact', 'after', 'needs_total')
 
     def __init__(self):
 
@@ -153,6 +153,10 @@ class SearchCtx(object):
         self.name_op = const.search.and_
         self.is_name_exact = True
 
+        # Keyset pagination - a username to return users after and whether to count all results at all
+        self.after = not_given
+        self.needs_total = True
+
 # ################################################################################################################################
 
 class SignupCtx(object):
@@ -16,9 +16,19 @@ from logging import getLogger
 from traceback import format_exc
 from uuid import uuid4
 
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import sleep
+from gevent.lock import RLock
+
 # ipaddress
 from ipaddress import ip_address
 
+# SQLAlchemy
+from sqlalchemy import bindparam
+
 # Python 2/3 compatibility
 from past.builtins import unicode
 
@@ -28,6 +38,7 @@ from zato.common.audit import audit_pii
 from zato.common.json_internal import dumps
 from zato.common.odb.model import SSOSession as SessionModel
 from zato.common.crypto.totp_ import TOTPManager
+from zato.common.util.api import spawn_greenlet
 from zato.sso import const, status_code, Session as SessionEntity, ValidationError
 from zato.sso.attr import AttrAPI
 from zato.sso.odb.query import get_session_by_ext_id, get_session_by_ust, get_session_list_by_user_id, get_user_by_id, \
@@ -44,14 +55,10 @@ if typing.TYPE_CHECKING:
     # stdlib
     from typing import Callable
 
-    # Bunch
-    from bunch import Bunch
-
     # Zato
     from zato.common.odb.model import SSOUser
 
     # For pyflakes
-    Bunch = Bunch
     Callable = Callable
     SSOUser = SSOUser
 
@@ -71,6 +78,10 @@ SessionModelDelete = SessionModelTable.delete
 _dummy_password='dummy.{}'.format(uuid4().hex)
 _ext_sec_type_supported = SEC_DEF_TYPE.BASIC_AUTH, SEC_DEF_TYPE.JWT
 
+# Defaults for configuration keys that may be missing in sso.conf files of existing environments
+_default_cache_ttl = 10 # In seconds
+_default_renew_flush_interval = 5 # In seconds
+
 # ################################################################################################################################
 
 class LoginCtx(object):
@@ -147,6 +158,19 @@ class SessionAPI(object):
         self.is_sqlite = None
         self.interaction_max_len = 100
 
+        # Sessions recently verified against ODB, keyed by their decrypted USTs, each value being a two-element list
+        # of the session's details and the time until which they can be used without looking them up in ODB again ..
+        self.verified_cache = {}
+        self.verified_cache_ttl = timedelta(seconds=sso_conf.session.get('cache_ttl', _default_cache_ttl))
+
+        # .. renewals of these sessions, also keyed by USTs, which are yet to be saved in ODB ..
+        self.pending_renewals = {}
+        self.renew_flush_interval = sso_conf.session.get('renew_flush_interval', _default_renew_flush_interval)
+
+        # .. and whether the cache is used at all, which is set in self.set_up_cache.
+        self.use_cache = False
+        self.cache_lock = RLock()
+
 # ################################################################################################################################
 
     def post_configure(self, func, is_sqlite):
@@ -154,6 +178,145 @@ class SessionAPI(object):
         self.odb_session_func = func
         self.is_sqlite = is_sqlite
 
+# ################################################################################################################################
+
+    def set_up_cache(self):
+        """ Enables the cache of verified sessions, unless it is disabled in configuration, and starts a background greenlet
+        saving their renewals in ODB and purging expired entries. Must be called only in servers - other processes, e.g. CLI ones,
+        will neither receive notifications that cached sessions changed nor stay up long enough for the renewals to be saved.
+        """
+        if self.verified_cache_ttl:
+            self.use_cache = True
+            spawn_greenlet(self._flush_pending_renewals_forever)
+
+# ################################################################################################################################
+
+    def _get_cached_session(self, ust, now):
+        """ Returns a session by its UST from the cache of verified ones or None if it is not there or it is no longer valid.
+        """
+        # type: (unicode, datetime) -> Bunch
+        with self.cache_lock:
+            item = self.verified_cache.get(ust)
+            if item:
+                sso_info, cached_until = item
+                if cached_until > now and sso_info.expiration_time > now:
+                    return sso_info
+                else:
+                    del self.verified_cache[ust]
+
+# ################################################################################################################################
+
+    def _cache_session(self, ust, sso_info, now, _opaque=GENERIC.ATTR_NAME):
+        """ Adds to the cache a session that was just read from ODB, returning the cached version of it.
+        """
+        # type: (unicode, object, datetime) -> Bunch
+
+        # Sessions without opaque attributes are not turned into dicts by the underlying query
+        if not isinstance(sso_info, dict):
+            sso_info = Bunch(sso_info._asdict())
+
+        with self.cache_lock:
+
+            # ODB may still contain data older than this server's renewal that has not been saved yet
+            pending = self.pending_renewals.get(ust)
+            if pending:
+                sso_info.expiration_time, sso_info[_opaque] = pending
+
+            self.verified_cache[ust] = [sso_info, now + self.verified_cache_ttl]
+
+        return sso_info
+
+# ################################################################################################################################
+
+    def _add_pending_renewal(self, ust, sso_info, expiration_time, opaque, _opaque=GENERIC.ATTR_NAME):
+        """ Renews a cached session in RAM, to be saved in ODB the next time pending renewals are flushed.
+        """
+        # type: (unicode, Bunch, datetime, dict)
+        with self.cache_lock:
+            sso_info.expiration_time = expiration_time
+            sso_info[_opaque] = opaque
+            self.pending_renewals[ust] = (expiration_time, opaque)
+
+# ################################################################################################################################
+
+    def flush_pending_renewals(self, _opaque=GENERIC.ATTR_NAME):
+        """ Saves in ODB all the renewals of sessions that have taken place since the previous flush,
+        no matter how many there were, using a single UPDATE statement.
+        """
+        with self.cache_lock:
+            if not self.pending_renewals:
+                return
+            pending, self.pending_renewals = self.pending_renewals, {}
+
+        params = [{
+            'b_ust': ust,
+            'b_expiration_time': expiration_time,
+            'b_opaque': dumps(opaque),
+        } for ust, (expiration_time, opaque) in pending.items()]
+
+        try:
+            with closing(self.odb_session_func()) as session:
+                session.execute(
+                    SessionModelUpdate().values({
+                        'expiration_time': bindparam('b_expiration_time'),
+                        _opaque: bindparam('b_opaque'),
+                }).where(
+                    SessionModelTable.c.ust==bindparam('b_ust')
+                ), params)
+                session.commit()
+        except Exception:
+            logger.warn('Could not save %d session renewal(s), e:`%s`', len(params), format_exc())
+
+            # Put them back for the next flush, unless newer ones were added in the meantime
+            with self.cache_lock:
+                for ust, value in pending.items():
+                    self.pending_renewals.setdefault(ust, value)
+
+# ################################################################################################################################
+
+    def purge_verified_cache(self, _now=datetime.utcnow):
+        """ Removes from the cache of verified sessions all the ones that would have to be looked up in ODB again anyway,
+        so that sessions that are not verified anymore, e.g. because their users never logged out, are not kept forever.
+        """
+        now = _now()
+
+        with self.cache_lock:
+            for ust, (sso_info, cached_until) in list(self.verified_cache.items()):
+                if cached_until <= now or sso_info.expiration_time <= now:
+                    del self.verified_cache[ust]
+
+# ################################################################################################################################
+
+    def _flush_pending_renewals_forever(self):
+        while True:
+            sleep(self.renew_flush_interval)
+            try:
+                self.flush_pending_renewals()
+                self.purge_verified_cache()
+            except Exception:
+                logger.warn('Exception in pending renewals flusher, e:`%s`', format_exc())
+
+# ################################################################################################################################
+
+    def invalidate_cache(self, ust=None, user_id=None, needs_decrypt=True):
+        """ Removes from the cache of verified sessions either a single one, by its UST, or all sessions of a given user.
+        """
+        # type: (unicode, unicode, bool)
+        if not self.use_cache:
+            return
+
+        with self.cache_lock:
+
+            if ust:
+                ust = self.decrypt_func(ust) if needs_decrypt else ust
+                self.verified_cache.pop(ust, None)
+                self.pending_renewals.pop(ust, None)
+
+            if user_id:
+                for _ust, (sso_info, _ignored) in list(self.verified_cache.items()):
+                    if sso_info.user_id == user_id:
+                        del self.verified_cache[_ust]
+
 # ################################################################################################################################
 
     def _check_credentials(self, ctx, user_password):
@@ -650,8 +813,14 @@ class SessionAPI(object):
         now = _now()
         ctx = VerifyCtx(self.decrypt_func(ust) if needs_decrypt else ust, remote_addr, current_app)
 
-        # Look up user and raise exception if not found by input UST
-        sso_info = self._get_session_by_ust(session, ctx.ust, now)
+        # Sessions that were recently verified do not need to be looked up in ODB ..
+        sso_info = self._get_cached_session(ctx.ust, now) if self.use_cache else None
+
+        # .. otherwise, look up user and raise exception if not found by input UST.
+        if not sso_info:
+            sso_info = self._get_session_by_ust(session, ctx.ust, now)
+            if sso_info and self.use_cache:
+                sso_info = self._cache_session(ctx.ust, sso_info, now)
 
         # Invalid UST or the session has already expired but in either case
         # we can not access it.
@@ -677,13 +846,19 @@ class SessionAPI(object):
                 # Set a new expiration time
                 expiration_time = now + timedelta(minutes=self.sso_conf.session.expiry)
 
-                session.execute(
-                    SessionModelUpdate().values({
-                        'expiration_time': expiration_time,
-                        GENERIC.ATTR_NAME: dumps(opaque),
-                }).where(
-                    SessionModelTable.c.ust==ctx.ust
-                ))
+                # With the cache in use, the new expiration time will be saved in ODB along with other renewals ..
+                if self.use_cache:
+                    self._add_pending_renewal(ctx.ust, sso_info, expiration_time, opaque)
+
+                # .. otherwise, it is saved immediately.
+                else:
+                    session.execute(
+                        SessionModelUpdate().values({
+                            'expiration_time': expiration_time,
+                            GENERIC.ATTR_NAME: dumps(opaque),
+                    }).where(
+                        SessionModelTable.c.ust==ctx.ust
+                    ))
                 return expiration_time
             else:
                 # Indicate success
@@ -857,11 +1032,14 @@ class SessionAPI(object):
             # Check that the session and user exist ..
             if self._get(session, ust, current_app, remote_addr, 'logout', needs_decrypt=False, renew=False, skip_sec=skip_sec):
 
-                # .. and if so, delete the session now.
+                # .. and if so, delete the session now ..
                 session.execute(
                     SessionModelDelete().\
                     where(SessionModelTable.c.ust==ust)
                 )
                 session.commit()
 
+                # .. making sure that it is no longer in our cache either.
+                self.invalidate_cache(ust, needs_decrypt=False)
+
 # ################################################################################################################################
@@ -29,6 +29,7 @@ from past.builtins import basestring, unicode
 # Zato
 from zato.common.api import RATE_LIMIT, SEC_DEF_TYPE, TOTP
 from zato.common.audit import audit_pii
+from zato.common.broker_message import SSO as BROKER_MSG_SSO
 from zato.common.crypto.api import CryptoManager
 from zato.common.crypto.totp_ import TOTPManager
 from zato.common.exception import BadRequest
@@ -39,7 +40,7 @@ from zato.sso.attr import AttrAPI
 from zato.sso.odb.query import get_linked_auth_list, get_sign_up_status_by_token, get_user_by_id, get_user_by_linked_sec, \
      get_user_by_username, get_user_by_ust
 from zato.sso.session import LoginCtx, SessionAPI
-from zato.sso.user_search import SSOSearch
+from zato.sso.user_search import create_search_table, set_user_search_tokens, SSOSearch
 from zato.sso.util import check_credentials, check_remote_app_exists, make_data_secret, make_password_secret, new_confirm_token, \
      set_password, validate_password
 
@@ -75,6 +76,9 @@ linked_auth_supported = SEC_DEF_TYPE.BASIC_AUTH, SEC_DEF_TYPE.JWT
 sso_search = SSOSearch()
 sso_search.set_up()
 
+# Total numbers of results of user searches with keyset pagination are capped at this many rows, unless configured otherwise
+_default_search_count_limit = 1000
+
 # ################################################################################################################################
 
 _utcnow = datetime.utcnow
@@ -280,6 +284,18 @@ class UserAPI(object):
         self.is_sqlite = is_sqlite
         self.session.post_configure(func, is_sqlite)
 
+        # Environments upgraded from a version without the search index do not have its table yet. Other servers
+        # may be creating it at the same time, in which case one of them may fail, which is not an error.
+        try:
+            with closing(self.odb_session_func()) as session:
+                create_search_table(session)
+        except Exception:
+            logger.warn('Could not create SSO user search table, e:`%s`', format_exc())
+
+        # Verified sessions may be cached only if we are running in a server which will receive notifications about changes
+        if self.server:
+            self.session.set_up_cache()
+
         if needs_auth_link:
 
             # Maps all auth types that SSO users can be linked with to their server definitions
@@ -414,6 +430,45 @@ class UserAPI(object):
 
         return user_model
 
+# ################################################################################################################################
+
+    def _set_user_search_tokens(self, session, user_pk, user):
+        """ Indexes for search all names of a user, given as an object with upper-cased name attributes.
+        """
+        set_user_search_tokens(session, user_pk, {
+            attr_name: getattr(user, attr_name_upper) for attr_name, attr_name_upper in _name_attrs.items()})
+
+# ################################################################################################################################
+
+    def rebuild_search_index(self, batch_size=1000):
+        """ Builds from scratch tokens of all users' names in the search index, e.g. for users that were created
+        before the index existed. Users are processed in batches, each one in its own transaction.
+        """
+        columns = [UserModel.id] + [getattr(UserModel, attr_name_upper) for attr_name_upper in _name_attrs.values()]
+        last_pk = 0
+        total = 0
+
+        with closing(self.odb_session_func()) as session:
+            while True:
+                batch = session.query(*columns).\
+                    filter(UserModel.id > last_pk).\
+                    order_by(UserModel.id).\
+                    limit(batch_size).\
+                    all()
+
+                if not batch:
+                    break
+
+                for user in batch:
+                    self._set_user_search_tokens(session, user.id, user)
+
+                session.commit()
+
+                last_pk = batch[-1].id
+                total += len(batch)
+
+        return total
+
 # ################################################################################################################################
 
     def _require_super_user(self, cid, ust, current_app, remote_addr):
@@ -495,6 +550,10 @@ class UserAPI(object):
             ctx.data.pop('password', None)
 
             session.add(user)
+
+            # Flush the session to learn the user's primary key that search index rows point to
+            session.flush()
+            self._set_user_search_tokens(session, user.id, user)
             session.commit()
 
             user_id = user.user_id
@@ -747,6 +806,9 @@ class UserAPI(object):
             if not user:
                 raise ValidationError(status_code.common.invalid_operation, False)
 
+            # Not all databases enforce ON DELETE CASCADE so search index rows are deleted explicitly
+            set_user_search_tokens(session, user.id, dict.fromkeys(_name_attrs))
+
             # Users cannot delete themselves
             if not skip_sec:
                 if user_id == current_session.user_id:
@@ -762,6 +824,9 @@ class UserAPI(object):
                 msg = 'Expected for rows_matched to be 1 instead of %d, user_id:`%s`, username:`%s`'
                 logger.warn(msg, rows_matched, user_id, username)
 
+            # The user's sessions were deleted along with the user so they must not be used from cache either
+            self._invalidate_sessions(user_id=user_id)
+
             # After deleting the user from ODB, we can remove a reference to this account
             # from the map of linked accounts.
             for auth_id_link_map in self.auth_id_link_map.values(): # type: dict
@@ -849,6 +914,8 @@ class UserAPI(object):
             )
             session.commit()
 
+        self._invalidate_sessions(user_id=user_id)
+
 # ################################################################################################################################
 
     def login(self, cid, username, password, current_app, remote_addr, user_agent=None,
@@ -882,7 +949,30 @@ class UserAPI(object):
         # PII audit comes first
         audit_pii.info(cid, 'user.logout', extra={'current_app':current_app, 'remote_addr':remote_addr})
 
-        return self.session.logout(ust, current_app, remote_addr, skip_sec=skip_sec)
+        result = self.session.logout(ust, current_app, remote_addr, skip_sec=skip_sec)
+        self._invalidate_sessions(ust=ust)
+
+        return result
+
+# ################################################################################################################################
+
+    def _invalidate_sessions(self, ust=None, user_id=None):
+        """ Removes from caches of verified sessions, in this and all the other servers, a session by its (encrypted) UST
+        or all sessions of a user, e.g. because the user was just locked and the sessions must not be accepted anymore.
+        """
+        self.session.invalidate_cache(ust, user_id)
+
+        if self.server:
+            self.server.broker_client.publish({
+                'action': BROKER_MSG_SSO.SESSION_INVALIDATE.value,
+                'ust': ust,
+                'user_id': user_id,
+            })
+
+# ################################################################################################################################
+
+    def on_broker_msg_SSO_SESSION_INVALIDATE(self, ust, user_id):
+        self.session.invalidate_cache(ust, user_id)
 
 # ################################################################################################################################
 
@@ -1023,8 +1113,22 @@ class UserAPI(object):
                     values(data).\
                     where(UserModelTable.c.user_id==_user_id)
                 )
+
+                # If any names changed, the search index needs to reflect it
+                names = {}
+                for attr_name, attr_name_upper in _name_attrs.items():
+                    if attr_name in data:
+                        names[attr_name] = data.get(attr_name_upper)
+
+                if names:
+                    user_pk = session.query(UserModel.id).filter(UserModel.user_id==_user_id).scalar()
+                    set_user_search_tokens(session, user_pk, names)
+
                 session.commit()
 
+            # Cached sessions contain user attributes, including the ones session checks depend on
+            self._invalidate_sessions(user_id=_user_id)
+
 # ################################################################################################################################
 
     def update_current_user(self, cid, data, current_ust, current_app, remote_addr):
@@ -1058,6 +1162,8 @@ class UserAPI(object):
         set_password(self.odb_session_func, self.encrypt_func, self.hash_func, self.sso_conf, user_id, password,
             must_change, password_expiry)
 
+        self._invalidate_sessions(user_id=user_id)
+
 # ################################################################################################################################
 
     def reset_totp_key(self, cid, current_ust, user_id, key, key_label, current_app, remote_addr, skip_sec=False):
@@ -1405,6 +1511,8 @@ class UserAPI(object):
 
             session.commit()
 
+        self._invalidate_sessions(user_id=user_id)
+
         return auth_id
 
 # ################################################################################################################################
@@ -1511,11 +1619,19 @@ class UserAPI(object):
                 if value is not not_given:
                     config[name] = value
 
+        # Results are ordered by usernames if there is a key to start after, even if it is an empty one, i.e. the first page
+        if ctx.after is not not_given:
+            config['after'] = ctx.after or ''
+            config['needs_total'] = ctx.needs_total
+            config['count_limit'] = self.sso_conf.search.get('count_limit', _default_search_count_limit)
+
         with closing(self.odb_session_func()) as session:
 
             # Output dictionary with all the data found, if any, along with pagination metadata
             out = {
                 'total': None,
+                'total_is_approximate': None,
+                'next_after': None,
                 'num_pages': None,
                 'page_size': None,
                 'cur_page': None,
@@ -1538,6 +1654,8 @@ class UserAPI(object):
             out['has_prev_page'] = sql_result.has_prev_page
             out['next_page'] = sql_result.next_page
             out['prev_page'] = sql_result.prev_page
+            out['next_after'] = sql_result.next_after
+            out['total_is_approximate'] = sql_result.total_is_approximate
 
             # .. and append any data found.
             for sql_item in sql_result.result:
@@ -8,15 +8,18 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+# stdlib
+from logging import getLogger
+
 # SQALchemy
-from sqlalchemy import asc, desc
+from sqlalchemy import asc, desc, exists, func, select
 from sqlalchemy.sql import and_ as sql_and, or_ as sql_or
 
 # Python 2/3 compatibility
 from past.builtins import basestring
 
 # Zato
-from zato.common.odb.model import SSOUser
+from zato.common.odb.model import SSOUser, SSOUserSearch
 from zato.common.odb.query import query_wrapper
 from zato.common.util.sql import search as util_search
 from zato.sso import const
@@ -24,10 +27,76 @@ from zato.sso.odb.query import _user_basic_columns
 
 # ################################################################################################################################
 
+logger = getLogger('zato')
+
+# ################################################################################################################################
+
 _does_not_exist = object()
 
 # ################################################################################################################################
 
+UserSearchTable = SSOUserSearch.__table__
+UserSearchTableDelete = UserSearchTable.delete
+UserSearchTableInsert = UserSearchTable.insert
+
+# How many characters each token in the search index consists of
+search_token_len = 3
+
+# ################################################################################################################################
+
+def get_search_tokens(value, _token_len=search_token_len):
+    """ Returns a set of all the tokens that an upper-cased value is indexed by. Values shorter than a token have none.
+    """
+    value = value.upper()
+    return set(value[idx:idx+_token_len] for idx in range(len(value) - _token_len + 1))
+
+# ################################################################################################################################
+
+def set_user_search_tokens(session, user_pk, names):
+    """ Replaces in the search index all tokens of a user's names with new ones. Names are a dict of name types,
+    e.g. display_name, to their values, with a value of None meaning that a user no longer has a given name.
+    The caller is responsible for committing the session.
+    """
+    session.execute(UserSearchTableDelete().where(sql_and(
+        UserSearchTable.c.user_id==user_pk,
+        UserSearchTable.c.name_type.in_(list(names)),
+    )))
+
+    rows = []
+
+    for name_type, value in names.items():
+        if value:
+            for token in get_search_tokens(value):
+                rows.append({
+                    'user_id': user_pk,
+                    'name_type': name_type,
+                    'token': token,
+                })
+
+    if rows:
+        session.execute(UserSearchTableInsert(), rows)
+
+# ################################################################################################################################
+
+def create_search_table(session):
+    """ Creates the table of the search index unless it already exists, e.g. in ODBs of environments upgraded
+    from a version without the index.
+    """
+    UserSearchTable.create(session.get_bind(), checkfirst=True)
+
+# ################################################################################################################################
+
+def is_search_index_complete(session, _token_len=search_token_len):
+    """ Returns True if each user with a name long enough to be indexed has at least one token in the index,
+    which is not the case for users created before the index existed until the index is rebuilt.
+    """
+    has_name = sql_or(*(func.length(column) >= _token_len for column in SSOSearch.name_columns.values()))
+    has_tokens = exists().where(SSOUserSearch.user_id==SSOUser.id)
+
+    return session.query(SSOUser.id).filter(has_name).filter(~has_tokens).first() is None
+
+# ################################################################################################################################
+
 name_op_allowed = set(const.search())
 name_op_sa = {
     const.search.and_: sql_and,
@@ -70,18 +139,13 @@ class SSOSearch(object):
         'last_name': SSOUser.last_name_upper,
     }
 
-    # Maps columns and exactness flags to sqlalchemy-level functions that look up data
+    # Maps columns to sqlalchemy-level functions that look up data by exact names,
+    # the ones that look it up by substrings are built in self._get_where_name_contains.
     name_column_op = {
-
-        (SSOUser.display_name_upper, True): SSOUser.display_name_upper.__eq__,
-        (SSOUser.first_name_upper, True)  : SSOUser.first_name_upper.__eq__,
-        (SSOUser.middle_name_upper, True) : SSOUser.middle_name_upper.__eq__,
-        (SSOUser.last_name_upper, True)   : SSOUser.last_name_upper.__eq__,
-
-        (SSOUser.display_name_upper, False): SSOUser.display_name_upper.contains,
-        (SSOUser.first_name_upper, False)  : SSOUser.first_name_upper.contains,
-        (SSOUser.middle_name_upper, False) : SSOUser.middle_name_upper.contains,
-        (SSOUser.last_name_upper, False)   : SSOUser.last_name_upper.contains,
+        SSOUser.display_name_upper: SSOUser.display_name_upper.__eq__,
+        SSOUser.first_name_upper  : SSOUser.first_name_upper.__eq__,
+        SSOUser.middle_name_upper : SSOUser.middle_name_upper.__eq__,
+        SSOUser.last_name_upper   : SSOUser.last_name_upper.__eq__,
     }
 
     # What columns to use for non-name criteria
@@ -99,6 +163,9 @@ class SSOSearch(object):
         self.out_columns = []
         self.order_by = OrderBy()
 
+        # Substring searches do not use the index until it is known to contain all users, None = not checked yet
+        self.is_index_complete = None
+
 # ################################################################################################################################
 
     def set_up(self):
@@ -177,7 +244,7 @@ class SSOSearch(object):
                 value = value.strip()
                 if not value:
                     raise ValueError('Value must not be empty, key `{}`'.format(column_key))
-                name_criteria_raw.append((self.name_columns[column_key], value.upper()))
+                name_criteria_raw.append((column_key, self.name_columns[column_key], value.upper()))
 
         # Name operator is needed only if name is given on input
         if name_op:
@@ -194,14 +261,39 @@ class SSOSearch(object):
         # At this point we know all name-related input is correct and we have both criteria
         # and an operator to joined them with.
         if name_criteria_raw:
-            for column, value in name_criteria_raw:
-                func = self.name_column_op[(column, name_exact)]
-                name_criteria.append(func(value))
+            for column_key, column, value in name_criteria_raw:
+                if name_exact:
+                    name_criteria.append(self.name_column_op[column](value))
+                else:
+                    name_criteria.append(self._get_where_name_contains(column_key, column, value))
 
             name_where = name_op(*name_criteria)
 
         return name_where
 
+# ################################################################################################################################
+
+    def _get_where_name_contains(self, name_type, column, value):
+        """ Constructs a WHERE clause to look up users whose name of a given type contains value.
+        """
+        tokens = get_search_tokens(value)
+
+        # Values shorter than a single token cannot be looked up in the index, and neither can any values
+        # if some of the users are not in the index yet.
+        if not (tokens and self.is_index_complete):
+            return column.contains(value)
+
+        # Users that have all the tokens of value in a given name ..
+        user_pk_list = select([SSOUserSearch.user_id]).\
+            where(SSOUserSearch.name_type==name_type).\
+            where(SSOUserSearch.token.in_(sorted(tokens))).\
+            group_by(SSOUserSearch.user_id).\
+            having(func.count()==len(tokens))
+
+        # .. are very likely to contain value but, e.g. 'ABCD' and 'CDAB' have the same tokens as 'CDABC',
+        # so it needs to be confirmed against each candidate's actual name.
+        return sql_and(SSOUser.id.in_(user_pk_list), column.contains(value))
+
 # ################################################################################################################################
 
     def _get_where_non_name(self, config):
@@ -287,18 +379,40 @@ class SSOSearch(object):
 
         return where
 
+# ################################################################################################################################
+
+    def _set_is_index_complete(self, session):
+        """ Checks if all users are in the search index. Once they are, it stays this way because the index
+        is updated along with each user.
+        """
+        is_index_complete = is_search_index_complete(session)
+
+        if not is_index_complete and self.is_index_complete is None:
+            logger.warn('SSO user search index is incomplete, users will be looked up by substrings of their names ' \
+                'without it until `zato sso rebuild-search-index` is run')
+
+        self.is_index_complete = is_index_complete
+
 # ################################################################################################################################
 
     def search(self, session, config):
         """ Looks up users with the configuration given on input.
         """
+        if 'name' in config and not self.is_index_complete:
+            self._set_is_index_complete(session)
+
         # WHERE clause
         where = self._get_where(config)
 
-        # ORDER BY clause
-        order_by = config.get('order_by')
-        order_by = self._get_order_by(order_by) if order_by else self.order_by.default
+        # ORDER BY clause - with a key to start after, each page begins right after the last username of the previous one
+        if config.get('after') is not None:
+            order_by = [asc(SSOUser.username)]
+        else:
+            order_by = config.get('order_by')
+            order_by = self._get_order_by(order_by) if order_by else self.order_by.default
 
         return util_search(self.sql_search_func, config, [], session, None, order_by, where, False)
 
 # ################################################################################################################################
+
+# ################################################################################################################################
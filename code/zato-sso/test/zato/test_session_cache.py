@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.common.json_internal import loads
+from zato.common.odb.model import SSOSession as SessionModel
+from zato.sso.session import SessionAPI
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_now = datetime(2020, 1, 2, 3, 4, 5)
+_ust = 'my.ust'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _TestSessionAPI(SessionAPI):
+    """ Reads sessions from a dictionary rather than ODB, keeping track of how many times they were read.
+    """
+    def __init__(self, *args, **kwargs):
+        super(_TestSessionAPI, self).__init__(*args, **kwargs)
+        self.odb_sessions = {}
+        self.odb_lookups = 0
+
+    def _get_session_by_ust(self, session, ust, now):
+        self.odb_lookups += 1
+        sso_info = self.odb_sessions.get(ust)
+        if sso_info and sso_info.expiration_time > now:
+            return Bunch(sso_info)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SessionCacheTestCase(TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        SessionModel.__table__.create(engine)
+        self.odb_session_func = sessionmaker(bind=engine)
+
+        sso_conf = Bunch(session=Bunch(expiry=60, cache_ttl=10))
+
+        self.api = _TestSessionAPI(sso_conf, lambda data: data, lambda data: data, None, None)
+        self.api.post_configure(self.odb_session_func, True)
+        self.api.use_cache = True
+
+        self.api.odb_sessions[_ust] = Bunch(ust=_ust, user_id='my.user.id', expiration_time=_now + timedelta(minutes=60),
+            opaque1={})
+
+# ################################################################################################################################
+
+    def get(self, now, renew=False):
+        return self.api._get(None, _ust, 'CRM', '127.0.0.1', 'test', renew=renew, needs_attrs=True, skip_sec=not renew,
+            _now=lambda: now)
+
+# ################################################################################################################################
+
+    def test_cache_hit(self):
+
+        self.get(_now)
+        self.get(_now + timedelta(seconds=5))
+        self.get(_now + timedelta(seconds=9))
+
+        # Only the first call looked up the session in ODB
+        self.assertEqual(self.api.odb_lookups, 1)
+        self.assertIn(_ust, self.api.verified_cache)
+
+# ################################################################################################################################
+
+    def test_cache_expiry(self):
+
+        self.get(_now)
+        self.get(_now + timedelta(seconds=11))
+
+        # The cached entry was no longer valid so ODB was consulted again
+        self.assertEqual(self.api.odb_lookups, 2)
+
+# ################################################################################################################################
+
+    def test_cache_session_expiry(self):
+
+        # The session expires before its cached entry would
+        self.api.odb_sessions[_ust].expiration_time = _now + timedelta(seconds=3)
+
+        self.get(_now)
+        self.assertRaises(Exception, self.get, _now + timedelta(seconds=5))
+        self.assertEqual(self.api.odb_lookups, 2)
+        self.assertNotIn(_ust, self.api.verified_cache)
+
+# ################################################################################################################################
+
+    def test_purge_verified_cache(self):
+
+        self.get(_now)
+
+        self.api.odb_sessions['my.ust.2'] = Bunch(ust='my.ust.2', user_id='my.user.id.2',
+            expiration_time=_now + timedelta(minutes=60), opaque1={})
+        self.api._get(None, 'my.ust.2', 'CRM', '127.0.0.1', 'test', skip_sec=True, _now=lambda: _now + timedelta(seconds=5))
+
+        # Only the entry cached first is past its TTL
+        self.api.purge_verified_cache(_now=lambda: _now + timedelta(seconds=12))
+        self.assertListEqual(list(self.api.verified_cache), ['my.ust.2'])
+
+        self.api.purge_verified_cache(_now=lambda: _now + timedelta(seconds=20))
+        self.assertDictEqual(self.api.verified_cache, {})
+
+# ################################################################################################################################
+
+    def test_flush_pending_renewals(self):
+
+        session = self.odb_session_func()
+        session.add(SessionModel(id=1, ust=_ust, creation_time=_now, expiration_time=_now + timedelta(minutes=60),
+            remote_addr='127.0.0.1', user_agent='', auth_type='', auth_principal='', opaque1='{}', user_id=1))
+        session.commit()
+
+        self.api._run_user_checks = lambda *ignored: None
+        expiration_time = self.get(_now + timedelta(minutes=30), renew=True)
+
+        # Renewals are kept in RAM until they are flushed ..
+        self.assertEqual(expiration_time, _now + timedelta(minutes=90))
+        self.assertIn(_ust, self.api.pending_renewals)
+        self.assertEqual(self.api.verified_cache[_ust][0].expiration_time, expiration_time)
+
+        # .. which saves them in ODB.
+        self.api.flush_pending_renewals()
+        self.assertDictEqual(self.api.pending_renewals, {})
+
+        row = session.query(SessionModel).filter(SessionModel.ust==_ust).one()
+        session.refresh(row)
+
+        self.assertEqual(row.expiration_time, expiration_time)
+        self.assertEqual(len(loads(row.opaque1)['session_state_change_list']), 1)
+
+        session.close()
+
+# ################################################################################################################################
+
+    def test_flush_pending_renewals_error(self):
+
+        def odb_session_func():
+            raise Exception('Test exception')
+
+        self.api.odb_session_func = odb_session_func
+        self.api._add_pending_renewal(_ust, Bunch(), _now, {})
+
+        # Renewals that could not be saved are kept for the next flush
+        self.api.flush_pending_renewals()
+        self.assertEqual(self.api.pending_renewals[_ust], (_now, {}))
+
+# ################################################################################################################################
+
+    def test_invalidate_on_logout(self):
+
+        now = datetime.utcnow()
+        self.api.odb_sessions[_ust].expiration_time = now + timedelta(minutes=60)
+
+        # Log in, in the sense that the session is verified and cached ..
+        self.api._get(None, _ust, 'CRM', '127.0.0.1', 'test', skip_sec=True, _now=lambda: now)
+        self.assertIn(_ust, self.api.verified_cache)
+
+        # .. and log out, which must remove the session from the cache.
+        self.api.logout(_ust, 'CRM', '127.0.0.1', skip_sec=True)
+        self.assertNotIn(_ust, self.api.verified_cache)
+
+# ################################################################################################################################
+
+    def test_invalidate_by_user_id(self):
+
+        self.get(_now)
+        self.api.invalidate_cache(user_id='my.user.id')
+
+        self.assertDictEqual(self.api.verified_cache, {})
+
+# ################################################################################################################################
+# ################################################################################################################################
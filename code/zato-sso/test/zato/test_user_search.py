@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2020, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from datetime import datetime
+from unittest import TestCase
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.common.odb.model import SSOUser, SSOUserSearch
+from zato.sso.user_search import create_search_table, get_search_tokens, is_search_index_complete, set_user_search_tokens, \
+     SSOSearch
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_now = datetime(2020, 1, 2, 3, 4, 5)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class UserSearchTestCase(TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        SSOUser.__table__.create(engine)
+
+        self.session = sessionmaker(bind=engine)()
+        create_search_table(self.session)
+
+        self.sso_search = SSOSearch()
+        self.sso_search.set_up()
+
+        display_names = ['Alice Smith', 'Bob Smithson', 'Carol Jones', 'Dave Abcd', 'Eve Cdabc', 'Frank Smith']
+
+        for idx, display_name in enumerate(display_names, 1):
+            self.add_user(idx, display_name)
+
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+# ################################################################################################################################
+
+    def add_user(self, idx, display_name, needs_search_tokens=True):
+        user = SSOUser()
+        user.id = idx
+        user.user_id = 'user.id.{}'.format(idx)
+        user.username = 'user.{}'.format(idx)
+        user.is_active = True
+        user.is_internal = False
+        user.is_super_user = False
+        user.is_locked = False
+        user.creation_ctx = '{}'
+        user.approval_status = 'approved'
+        user.approval_status_mod_time = _now
+        user.approval_status_mod_by = 'test'
+        user.password = 'test'
+        user.password_is_set = True
+        user.password_must_change = False
+        user.password_last_set = _now
+        user.password_expiry = _now
+        user.sign_up_status = 'final'
+        user.sign_up_time = _now
+        user.sign_up_confirm_token = 'token.{}'.format(idx)
+        user.display_name = display_name
+        user.display_name_upper = display_name.upper()
+        user.is_totp_enabled = False
+
+        self.session.add(user)
+        self.session.flush()
+
+        if needs_search_tokens:
+            set_user_search_tokens(self.session, user.id, {'display_name': user.display_name_upper})
+
+# ################################################################################################################################
+
+    def search(self, **config):
+        result = self.sso_search.search(self.session, config)
+        return result, [elem.username for elem in result.result]
+
+# ################################################################################################################################
+
+    def test_get_search_tokens(self):
+        self.assertSetEqual(get_search_tokens('abcd'), {'ABC', 'BCD'})
+        self.assertSetEqual(get_search_tokens('aaaa'), {'AAA'})
+        self.assertSetEqual(get_search_tokens('abc'), {'ABC'})
+        self.assertSetEqual(get_search_tokens('ab'), set())
+        self.assertSetEqual(get_search_tokens(''), set())
+
+# ################################################################################################################################
+
+    def test_set_user_search_tokens(self):
+
+        set_user_search_tokens(self.session, 1, {'display_name': 'ABCD'})
+        tokens = self.session.query(SSOUserSearch.token).filter(SSOUserSearch.user_id==1).all()
+        self.assertSetEqual(set(elem.token for elem in tokens), {'ABC', 'BCD'})
+
+        # No value means that all the tokens of a name are deleted
+        set_user_search_tokens(self.session, 1, {'display_name': None})
+        self.assertEqual(self.session.query(SSOUserSearch).filter(SSOUserSearch.user_id==1).count(), 0)
+
+# ################################################################################################################################
+
+    def test_get_where_name_contains(self):
+
+        # Users whose names have all the tokens are found ..
+        _, usernames = self.search(name={'display_name': 'smith'}, is_name_exact=False, name_op='and')
+        self.assertSetEqual(set(usernames), {'user.1', 'user.2', 'user.6'})
+
+        # .. but only if they really contain the value, even though 'DAVE ABCD' has all the tokens of 'CDAB'.
+        _, usernames = self.search(name={'display_name': 'cdab'}, is_name_exact=False, name_op='and')
+        self.assertListEqual(usernames, ['user.5'])
+
+        # Values shorter than a single token are looked up without the index
+        _, usernames = self.search(name={'display_name': 'es'}, is_name_exact=False, name_op='and')
+        self.assertListEqual(usernames, ['user.3'])
+
+        _, usernames = self.search(name={'display_name': 'xyz'}, is_name_exact=False, name_op='and')
+        self.assertListEqual(usernames, [])
+
+# ################################################################################################################################
+
+    def test_search_keyset(self):
+
+        # The first page is requested with an empty key ..
+        result, usernames = self.search(after='', page_size=2, approval_status='approved')
+        self.assertListEqual(usernames, ['user.1', 'user.2'])
+        self.assertEqual(result.next_after, 'user.2')
+
+        pages = [usernames]
+
+        # .. and each next one continues after the last username of the previous one.
+        while result.has_next_page:
+            result, usernames = self.search(after=result.next_after, page_size=2, approval_status='approved', needs_total=False)
+            pages.append(usernames)
+
+        self.assertListEqual(pages, [['user.1', 'user.2'], ['user.3', 'user.4'], ['user.5', 'user.6']])
+        self.assertIsNone(result.next_after)
+
+# ################################################################################################################################
+
+    def test_search_keyset_name_contains(self):
+        result, usernames = self.search(after='user.1', page_size=1, name={'display_name': 'smith'}, is_name_exact=False,
+            name_op='and', count_limit=1)
+
+        self.assertListEqual(usernames, ['user.2'])
+        self.assertEqual(result.next_after, 'user.2')
+        self.assertTrue(result.total_is_approximate)
+
+# ################################################################################################################################
+
+    def test_create_search_table(self):
+
+        # The table already exists so nothing happens
+        create_search_table(self.session)
+        count = self.session.query(SSOUserSearch).filter(SSOUserSearch.user_id==1).count()
+        self.assertEqual(count, len(get_search_tokens('Alice Smith')))
+
+# ################################################################################################################################
+
+    def test_index_incomplete(self):
+
+        # Users whose names are too short to have any tokens do not make the index incomplete ..
+        self.add_user(7, 'Al', False)
+        self.assertTrue(is_search_index_complete(self.session))
+
+        # .. unlike users created before the index existed.
+        self.add_user(8, 'Grace Smith', False)
+        self.assertFalse(is_search_index_complete(self.session))
+
+        # Such users are still found, without the index ..
+        with self.assertLogs('zato', 'WARNING'):
+            _, usernames = self.search(name={'display_name': 'smith'}, is_name_exact=False, name_op='and')
+
+        self.assertSetEqual(set(usernames), {'user.1', 'user.2', 'user.6', 'user.8'})
+        self.assertFalse(self.sso_search.is_index_complete)
+
+        # .. until the index is rebuilt, after which it is used again.
+        set_user_search_tokens(self.session, 8, {'display_name': 'GRACE SMITH'})
+
+        _, usernames = self.search(name={'display_name': 'smith'}, is_name_exact=False, name_op='and')
+        self.assertSetEqual(set(usernames), {'user.1', 'user.2', 'user.6', 'user.8'})
+        self.assertTrue(self.sso_search.is_index_complete)
+
+# ################################################################################################################################
+# ################################################################################################################################